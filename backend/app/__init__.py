@@ -3,19 +3,22 @@ Inicialização da aplicação AdamChat.
 """
 import os
 import logging
-from flask import Flask, jsonify, redirect, url_for, request, send_from_directory
+from flask import Flask, jsonify, redirect, url_for, request
 from flask_sqlalchemy import SQLAlchemy
 from flask_migrate import Migrate
 from flask_cors import CORS
 from flask_jwt_extended import JWTManager
 from flasgger import Swagger, swag_from
 from werkzeug.exceptions import HTTPException
+from werkzeug.security import safe_join
 from app.config.app_config import get_config
 from app.extensions import socketio, db, migrate, jwt
 from app.middlewares.system_middleware import system_middleware, check_maintenance_mode
 from app.middlewares.swagger_middleware import swagger_middleware
 from app.db import init_db
 from app.swagger_config import init_swagger
+from app.utils.helpers import JSONEncoder
+from app.utils.file_serving import serve_file, content_etag
 from datetime import datetime
 
 # Inicialização das extensões
@@ -46,6 +49,9 @@ def create_app(config_name='development'):
     app = Flask(__name__)
     app.config.from_object(get_config(config_name))
 
+    # Datas nativas (BSON) e ObjectId serializados em ISO 8601 / string
+    app.json_encoder = JSONEncoder
+
     # Inicializar CORS
     CORS(app, resources={r"/api/*": {"origins": "*"}},
          supports_credentials=True)
@@ -108,7 +114,11 @@ def create_app(config_name='development'):
 
     @app.route('/static/<path:path>')
     def send_static(path):
-        return send_from_directory('static', path)
+        filepath = safe_join(os.path.join(app.root_path, 'static'), path)
+        if not filepath or not os.path.isfile(filepath):
+            return jsonify({'error': 'Arquivo não encontrado'}), 404
+        # Arquivos nomeados pelo hash do conteúdo são imutáveis
+        return serve_file(filepath, immutable=content_etag(filepath) is not None)
 
     # Importar e registrar blueprints existentes
     try:
@@ -11,6 +11,99 @@ celery = Celery(
     backend=os.environ.get('CELERY_RESULT_BACKEND', 'redis://redis:6379/0')
 )
 
+# Fila de baixa prioridade para tarefas de manutenção (título e resumo das
+# conversas, extração de documentos, coleta de lixo do armazenamento). Deve ser
+# consumida por um worker separado, para não competir com o tráfego interativo:
+#   celery -A app.celery_worker.celery worker -Q conversation_background -c 1
+BACKGROUND_QUEUE = os.environ.get(
+    'CELERY_BACKGROUND_QUEUE', 'conversation_background')
+
+# Fila da ingestão dos uploads (tipo, miniatura, antivírus). Com antivírus
+# configurado os downloads aguardam a ingestão, que por isso não pode esperar
+# pelas tarefas de manutenção:
+#   celery -A app.celery_worker.celery worker -Q uploads -c 2
+UPLOAD_QUEUE = os.environ.get('CELERY_UPLOAD_QUEUE', 'uploads')
+
+# Intervalo (em segundos) da varredura de arquivamento de conversas inativas.
+# Requer o agendador: celery -A app.celery_worker.celery beat
+ARCHIVE_INTERVAL_SECONDS = int(os.environ.get('ARCHIVE_INTERVAL_SECONDS', 3600))
+
+# Intervalo (em segundos) da consulta em lote das exportações pendentes no
+# Canva; o backoff de cada job é aplicado sobre essa frequência.
+CANVA_POLL_INTERVAL_SECONDS = int(
+    os.environ.get('CANVA_POLL_INTERVAL_SECONDS', 5))
+
+# Intervalo (em segundos) da reconciliação dos contadores de uso de armazenamento
+STORAGE_RECONCILE_INTERVAL_SECONDS = int(
+    os.environ.get('STORAGE_RECONCILE_INTERVAL_SECONDS', 86400))
+
+# Intervalo (em segundos) da coleta de lixo de arquivos órfãos e temporários
+STORAGE_GC_INTERVAL_SECONDS = int(
+    os.environ.get('STORAGE_GC_INTERVAL_SECONDS', 3600))
+
+# Intervalo (em segundos) da varredura que reagenda extrações de documentos
+# falhas ou interrompidas
+DOCUMENT_RESCHEDULE_INTERVAL_SECONDS = int(
+    os.environ.get('DOCUMENT_RESCHEDULE_INTERVAL_SECONDS', 300))
+
+# Intervalo (em segundos) da varredura que reagenda ingestões de uploads
+# pendentes ou interrompidas
+UPLOAD_RESCHEDULE_INTERVAL_SECONDS = int(
+    os.environ.get('UPLOAD_RESCHEDULE_INTERVAL_SECONDS', 300))
+
+# Intervalo (em segundos) da varredura que reagenda exportações de eBooks
+# pendentes sem tarefa ou interrompidas
+EXPORT_RESCHEDULE_INTERVAL_SECONDS = int(
+    os.environ.get('EXPORT_RESCHEDULE_INTERVAL_SECONDS', 300))
+
+celery.conf.update(
+    imports=(
+        'app.tasks.conversation_tasks',
+        'app.tasks.ebook_tasks',
+        'app.tasks.export_tasks',
+        'app.tasks.canva_tasks',
+        'app.tasks.document_tasks',
+        'app.tasks.storage_tasks',
+        'app.tasks.upload_tasks',
+    ),
+    task_routes={
+        'conversation.*': {'queue': BACKGROUND_QUEUE},
+        'documents.*': {'queue': BACKGROUND_QUEUE},
+        'storage.*': {'queue': BACKGROUND_QUEUE},
+        'uploads.*': {'queue': UPLOAD_QUEUE},
+    },
+    beat_schedule={
+        'archive-idle-conversations': {
+            'task': 'conversation.archive_idle',
+            'schedule': ARCHIVE_INTERVAL_SECONDS,
+        },
+        'poll-canva-exports': {
+            'task': 'canva.poll_exports',
+            'schedule': CANVA_POLL_INTERVAL_SECONDS,
+        },
+        'reconcile-storage-usage': {
+            'task': 'storage.reconcile_usage',
+            'schedule': STORAGE_RECONCILE_INTERVAL_SECONDS,
+        },
+        'storage-gc': {
+            'task': 'storage.gc',
+            'schedule': STORAGE_GC_INTERVAL_SECONDS,
+        },
+        'reschedule-documents': {
+            'task': 'documents.reschedule',
+            'schedule': DOCUMENT_RESCHEDULE_INTERVAL_SECONDS,
+        },
+        'reschedule-uploads': {
+            'task': 'uploads.reschedule',
+            'schedule': UPLOAD_RESCHEDULE_INTERVAL_SECONDS,
+        },
+        'reschedule-exports': {
+            'task': 'export.reschedule',
+            'schedule': EXPORT_RESCHEDULE_INTERVAL_SECONDS,
+        },
+    },
+)
+
 # Importação tardia para evitar problemas de circularidade
 
 
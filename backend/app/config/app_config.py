@@ -25,6 +25,21 @@ class Config:
     EMERGENCY_TOKEN = os.environ.get(
         'EMERGENCY_TOKEN', 'emergency_token_change_in_production')
 
+    # Armazenamento de arquivos (S3 ou serviço compatível, como o MinIO)
+    USE_S3 = os.environ.get('USE_S3', 'false').lower() == 'true'
+    S3_BUCKET = os.environ.get('S3_BUCKET')
+    S3_REGION = os.environ.get('S3_REGION')
+    S3_ENDPOINT_URL = os.environ.get('S3_ENDPOINT_URL')
+    S3_CREATE_BUCKET = os.environ.get(
+        'S3_CREATE_BUCKET', 'false').lower() == 'true'
+    AWS_ACCESS_KEY = os.environ.get('AWS_ACCESS_KEY')
+    AWS_SECRET_KEY = os.environ.get('AWS_SECRET_KEY')
+    S3_MULTIPART_THRESHOLD = int(os.environ.get(
+        'S3_MULTIPART_THRESHOLD', 8 * 1024 * 1024))
+    S3_MULTIPART_CHUNKSIZE = int(os.environ.get(
+        'S3_MULTIPART_CHUNKSIZE', 8 * 1024 * 1024))
+    S3_MAX_CONCURRENCY = int(os.environ.get('S3_MAX_CONCURRENCY', 10))
+
 
 class DevelopmentConfig(Config):
     """Configuração de desenvolvimento"""
@@ -12,6 +12,10 @@ class StorageItem(db.Model):
     seja em armazenamento local ou no S3.
     """
     __tablename__ = 'storage_items'
+    __table_args__ = (
+        # Listagens e arquivos recentes do usuário
+        db.Index('ix_storage_items_user_recent', 'user_id', 'deleted', 'created_at'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     filename = db.Column(db.String(255), nullable=False)
@@ -25,6 +29,8 @@ class StorageItem(db.Model):
     size_bytes = db.Column(db.BigInteger, nullable=False)
     # Metadados adicionais
     file_metadata = db.Column(db.JSON, nullable=True)
+    # SHA-256 do conteúdo (blob compartilhado entre itens idênticos)
+    content_hash = db.Column(db.String(64), nullable=True, index=True)
 
     # Campos de status
     # Arquivos temporários podem ser limpos automaticamente
@@ -47,7 +53,8 @@ class StorageItem(db.Model):
     updated_at = db.Column(db.DateTime, onupdate=datetime.utcnow)
 
     def __init__(self, filename, storage_path, content_type, size_bytes, user_id,
-                 public_url=None, file_metadata=None, is_temporary=False, expires_at=None):
+                 public_url=None, file_metadata=None, is_temporary=False, expires_at=None,
+                 content_hash=None):
         self.filename = filename
         self.storage_path = storage_path
         self.public_url = public_url
@@ -56,6 +63,7 @@ class StorageItem(db.Model):
         self.file_metadata = file_metadata
         self.is_temporary = is_temporary
         self.expires_at = expires_at
+        self.content_hash = content_hash
         self.user_id = user_id
 
     def __repr__(self):
@@ -75,3 +83,31 @@ class StorageItem(db.Model):
             'created_at': self.created_at.isoformat(),
             'updated_at': self.updated_at.isoformat() if self.updated_at else None
         }
+
+
+class StorageUsage(db.Model):
+    """
+    Resumo do uso de armazenamento por usuário e tipo de conteúdo
+
+    Mantido na mesma transação dos uploads e exclusões de StorageItem
+    (app.services.storage_usage_service), para que o dashboard não precise
+    agregar storage_items a cada acesso. A reconciliação periódica corrige
+    eventuais divergências.
+    """
+    __tablename__ = 'storage_usage'
+
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    content_type = db.Column(db.String(50), primary_key=True)
+    file_count = db.Column(db.BigInteger, nullable=False, default=0)
+    total_bytes = db.Column(db.BigInteger, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, nullable=False,
+                           default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    def __init__(self, user_id, content_type, file_count=0, total_bytes=0):
+        self.user_id = user_id
+        self.content_type = content_type
+        self.file_count = file_count
+        self.total_bytes = total_bytes
+
+    def __repr__(self):
+        return f'<StorageUsage {self.user_id}/{self.content_type}: {self.file_count} arquivos>'
@@ -18,6 +18,7 @@ SUBSCRIPTION_PLANS = {
         "max_resolution": "512x512",
         "advanced_models": False,
         "support_priority": "low",
+        "parallel_generations": 2,
         "price": 0.0,
     },
     "pro": {
@@ -32,6 +33,7 @@ SUBSCRIPTION_PLANS = {
         "max_resolution": "1024x1024",
         "advanced_models": True,
         "support_priority": "medium",
+        "parallel_generations": 4,
         "price": 29.99,
     },
     "enterprise": {
@@ -46,6 +48,7 @@ SUBSCRIPTION_PLANS = {
         "max_resolution": "2048x2048",
         "advanced_models": True,
         "support_priority": "high",
+        "parallel_generations": 8,
         "price": 99.99,
     }
 }
@@ -125,6 +128,10 @@ class Subscription:
         """Verifica se o usuário pode utilizar uma funcionalidade específica"""
         return SUBSCRIPTION_PLANS.get(self.plan, {}).get(feature, False)
 
+    def get_parallel_generations(self):
+        """Retorna quantas gerações de conteúdo o plano permite em paralelo"""
+        return SUBSCRIPTION_PLANS.get(self.plan, {}).get("parallel_generations", 1)
+
     def get_plan_details(self):
         """Retorna os detalhes completos do plano atual"""
         return SUBSCRIPTION_PLANS.get(self.plan, {})
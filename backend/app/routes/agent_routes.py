@@ -3,7 +3,10 @@ from flask import Blueprint, request, jsonify, current_app
 from app.db import get_db
 from bson import ObjectId
 from functools import wraps
-from datetime import datetime
+from app.utils.date_utils import utcnow
+from app.services.prompt_template_service import (
+    compile_agent_template, invalidate_agent, PromptTemplateError
+)
 
 agent_bp = Blueprint("agent_bp", __name__)
 
@@ -115,6 +118,19 @@ def create_agent():
             prompt_template:
               type: string
               example: "Você é um assistente médico e deve responder apenas perguntas sobre saúde."
+              description: Template Jinja2 com os slots message, context, files e few_shots
+            few_shots:
+              type: array
+              items:
+                type: object
+                properties:
+                  input:
+                    type: string
+                  output:
+                    type: string
+            variables:
+              type: object
+              description: Valores padrão das variáveis livres do template
             settings:
               type: object
               properties:
@@ -138,6 +154,8 @@ def create_agent():
     # Campos opcionais
     description = data.get("description", "")
     prompt_template = data.get("prompt_template", "")
+    few_shots = data.get("few_shots", [])
+    variables = data.get("variables", {})
     settings = data.get("settings", {})
 
     # Verificar se o nome é único
@@ -152,11 +170,19 @@ def create_agent():
         "display_name": name,
         "description": description,
         "prompt_template": prompt_template,
+        "few_shots": few_shots,
+        "variables": variables,
         "settings": settings,
-        "created_at": datetime.utcnow().isoformat(),
-        "updated_at": datetime.utcnow().isoformat()
+        "created_at": utcnow(),
+        "updated_at": utcnow()
     }
 
+    # Pré-compila o template e calcula versão e tokens uma única vez
+    try:
+        agent.update(compile_agent_template(agent))
+    except PromptTemplateError as e:
+        return jsonify({"error": str(e)}), 400
+
     # Inserir o agente no banco
     result = db.agents.insert_one(agent)
 
@@ -195,6 +221,19 @@ def update_agent(agent_id):
             prompt_template:
               type: string
               example: "Você é um assistente médico e deve responder apenas perguntas sobre saúde."
+              description: Template Jinja2 com os slots message, context, files e few_shots
+            few_shots:
+              type: array
+              items:
+                type: object
+                properties:
+                  input:
+                    type: string
+                  output:
+                    type: string
+            variables:
+              type: object
+              description: Valores padrão das variáveis livres do template
             settings:
               type: object
               properties:
@@ -221,12 +260,12 @@ def update_agent(agent_id):
         update_fields["display_name"] = data["name"]
 
     # Campos opcionais
-    for field in ["description", "prompt_template", "settings"]:
+    for field in ["description", "prompt_template", "few_shots", "variables", "settings"]:
         if field in data:
             update_fields[field] = data[field]
 
     # Marcar como atualizado
-    update_fields["updated_at"] = datetime.utcnow().isoformat()
+    update_fields["updated_at"] = utcnow()
 
     # Verificar se o agente existe
     db = get_db()
@@ -242,9 +281,20 @@ def update_agent(agent_id):
             if existing_agent:
                 return jsonify({"error": f"Já existe um agente com o nome '{data['name']}'."}), 400
 
+        # Recompila o template se algum campo que o compõe mudou
+        template_fields = ("description", "prompt_template", "few_shots", "variables")
+        if any(field in update_fields for field in template_fields):
+            merged = dict(agent)
+            merged.update(update_fields)
+            try:
+                update_fields.update(compile_agent_template(merged))
+            except PromptTemplateError as e:
+                return jsonify({"error": str(e)}), 400
+
         # Atualizar o agente
         db.agents.update_one({"_id": ObjectId(agent_id)},
                              {"$set": update_fields})
+        invalidate_agent(agent["name"])
 
         # Retornar o agente atualizado
         updated_agent = db.agents.find_one({"_id": ObjectId(agent_id)})
@@ -276,11 +326,14 @@ def delete_agent(agent_id):
     try:
         db = get_db()
 
+        agent = db.agents.find_one({"_id": ObjectId(agent_id)}, {"name": 1})
         result = db.agents.delete_one({"_id": ObjectId(agent_id)})
 
         if result.deleted_count == 0:
             return jsonify({"error": "Agente não encontrado."}), 404
 
+        invalidate_agent(agent["name"])
+
         return jsonify({"message": "Agente excluído com sucesso."}), 200
     except Exception as e:
         return jsonify({"error": str(e)}), 400
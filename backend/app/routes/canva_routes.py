@@ -4,6 +4,7 @@ from app.services.canva_service import (
     list_templates, create_canva_design, apply_template,
     export_design_from_canva, get_canva_config
 )
+from app.services.canva_export_service import get_canva_export
 import logging
 
 logger = logging.getLogger(__name__)
@@ -44,6 +45,9 @@ def get_config_route():
 def list_templates_route():
     """
     Lista os templates disponíveis no Canva.
+
+    O catálogo é servido do cache e revalidado em segundo plano; os previews
+    são servidos como miniaturas locais (thumbnail_url).
     ---
     tags:
       - Canva
@@ -71,17 +75,22 @@ def list_templates_route():
                 properties:
                   id:
                     type: string
-                  name:
+                  nome:
+                    type: string
+                  descricao:
+                    type: string
+                  preview_url:
                     type: string
                   thumbnail_url:
                     type: string
-                  category:
+                    description: Miniatura local (ausente até a primeira atualização)
+                  categoria:
                     type: string
       500:
         description: Erro ao listar templates.
     """
     try:
-        category = request.args.get("category")
+        category = request.args.get("category", "ebook")
         limit = request.args.get("limit", 10, type=int)
 
         templates = list_templates(category, limit)
@@ -244,13 +253,16 @@ def export_design_route(design_id):
               example: "123e4567-e89b-12d3-a456-426614174000"
     responses:
       200:
-        description: Design exportado com sucesso.
+        description: Exportação iniciada; acompanhe em /canva/exports/<canva_export_id>.
         schema:
           type: object
           properties:
-            export_id:
+            canva_export_id:
               type: string
-            url:
+            status:
+              type: string
+              enum: ["pendente", "concluido", "falha"]
+            download_url:
               type: string
             format:
               type: string
@@ -272,3 +284,43 @@ def export_design_route(design_id):
     except Exception as e:
         logger.error(f"Erro ao exportar design {design_id} do Canva: {str(e)}")
         return jsonify({"error": "Erro ao exportar design do Canva."}), 500
+
+
+@canva_bp.route("/canva/exports/<canva_export_id>", methods=["GET"])
+def get_canva_export_route(canva_export_id):
+    """
+    Obtém o status de uma exportação do Canva.
+    ---
+    tags:
+      - Canva
+    parameters:
+      - name: canva_export_id
+        in: path
+        type: string
+        required: true
+        description: ID do job de exportação no Canva
+    responses:
+      200:
+        description: Status da exportação.
+        schema:
+          type: object
+          properties:
+            canva_export_id:
+              type: string
+            status:
+              type: string
+              enum: ["pendente", "concluido", "falha"]
+            download_url:
+              type: string
+            attempts:
+              type: integer
+            next_poll_at:
+              type: string
+              format: date-time
+      404:
+        description: Exportação não encontrada.
+    """
+    export_info = get_canva_export(canva_export_id)
+    if not export_info:
+        return jsonify({"error": "Exportação não encontrada."}), 404
+    return jsonify(export_info), 200
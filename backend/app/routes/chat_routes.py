@@ -26,16 +26,28 @@ Exemplo de migração:
 
 Documentação completa em /apidocs
 """
-from flask import Blueprint, request, jsonify, current_app, make_response
+from flask import Blueprint, request, jsonify, current_app, make_response, Response
 from app.db import get_db
 from app.services.genai_service import GenAIService
 from app.services.agent_service import get_prompt_instructions
+from app.services.prompt_template_service import get_cached_agent
+from app.services.document_index_service import build_context
+from app.services.conversation_export_service import (
+    stream_ndjson, stream_zip, import_ndjson, import_zip
+)
+from app.services.conversation_summary_service import schedule_background_jobs
+from app.services.archive_service import (
+    ensure_hot, delete_archived, get_storage_metrics
+)
 from bson import ObjectId
 from pymongo import DESCENDING
 import time
 import json
+import zipfile
 from functools import wraps
-from datetime import datetime
+from app.utils.date_utils import (
+    utcnow, parse_range_args, build_range_filter, in_range
+)
 
 chat_bp = Blueprint("chat_bp", __name__)
 
@@ -56,20 +68,6 @@ def get_provider_config(provider_name: str) -> dict:
     return provider
 
 
-def get_agent_template(agent_name: str) -> str:
-    """
-    Busca o template customizado do agente na coleção agents.
-    Retorna o template se encontrado; se não, retorna o campo 'description' como fallback.
-    """
-    db = get_db()
-    agent = db.agents.find_one({"name": agent_name.lower()}, {
-                               "_id": 0, "prompt_template": 1, "description": 1})
-    if agent:
-        # Se o campo prompt_template existir e não estiver vazio, usa-o; caso contrário, usa description.
-        return agent.get("prompt_template") or agent.get("description")
-    return None
-
-
 def validate_request_data(f):
     """Decorator para validar dados da requisição"""
     @wraps(f)
@@ -131,6 +129,18 @@ def list_conversations():
         type: integer
         required: false
         description: Offset para paginação
+      - name: since
+        in: query
+        type: string
+        format: date-time
+        required: false
+        description: Retorna apenas conversas atualizadas a partir desta data (ISO 8601)
+      - name: until
+        in: query
+        type: string
+        format: date-time
+        required: false
+        description: Retorna apenas conversas atualizadas até esta data (ISO 8601)
     responses:
       200:
         description: Lista de conversas do usuário
@@ -144,12 +154,21 @@ def list_conversations():
     limit = int(request.args.get("limit", 20))
     offset = int(request.args.get("offset", 0))
 
+    try:
+        since, until = parse_range_args(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    query = {"user_id": user_id}
+    updated_range = build_range_filter(since, until)
+    if updated_range:
+        query["updated_at"] = updated_range
+
     db = get_db()
-    total_conversations = db.conversations.count_documents(
-        {"user_id": user_id})
+    total_conversations = db.conversations.count_documents(query)
 
     conversations = list(db.conversations.find(
-        {"user_id": user_id},
+        query,
         {"_id": 1, "title": 1, "created_at": 1, "updated_at": 1, "last_message": 1}
     ).sort("updated_at", DESCENDING).skip(offset).limit(limit))
 
@@ -206,7 +225,7 @@ def create_conversation():
     user_id = data.get("user_id")
     title = data.get("title", "Nova conversa")
 
-    now = datetime.utcnow().isoformat()
+    now = utcnow()
 
     db = get_db()
     conversation = {
@@ -264,6 +283,9 @@ def get_conversation(conversation_id):
         db = get_db()
         # Define a projeção para excluir mensagens se necessário
         projection = None if include_messages else {"history": 0}
+        if include_messages:
+            # Conversas arquivadas são reidratadas antes de ler o histórico
+            ensure_hot(conversation_id, db=db)
 
         conversation = db.conversations.find_one(
             {"_id": ObjectId(conversation_id)}, projection)
@@ -316,7 +338,7 @@ def update_conversation(conversation_id):
             return jsonify({"error": "title é obrigatório."}), 400
 
         db = get_db()
-        now = datetime.utcnow().isoformat()
+        now = utcnow()
 
         result = db.conversations.update_one(
             {"_id": ObjectId(conversation_id)},
@@ -373,6 +395,9 @@ def delete_conversation(conversation_id):
         if result.deleted_count == 0:
             return jsonify({"error": "Falha ao excluir a conversa."}), 500
 
+        if conversation.get("archived"):
+            delete_archived(conversation_id, db=db)
+
         current_app.logger.info(
             f"Conversa {conversation_id} excluída para usuário {user_id}")
 
@@ -381,6 +406,176 @@ def delete_conversation(conversation_id):
         return jsonify({"error": str(e)}), 400
 
 
+@chat_bp.route("/conversations/storage", methods=["GET"])
+def conversations_storage_metrics():
+    """
+    Métricas de armazenamento das conversas (coleção quente x arquivo comprimido).
+
+    ---
+    tags:
+      - Chat
+    parameters:
+      - name: user_id
+        in: query
+        type: string
+        required: false
+        description: Restringe as contagens a um usuário
+    responses:
+      200:
+        description: Contagens, bytes e taxa de compressão por camada
+    """
+    try:
+        return jsonify(get_storage_metrics(request.args.get("user_id"))), 200
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+# --------------------------
+# Endpoints de Exportação e Importação
+# --------------------------
+
+def _export_response(user_id, conversation_id=None):
+    """Monta a resposta de exportação em streaming (NDJSON ou ZIP)"""
+    export_format = request.args.get("format", "ndjson").lower()
+    if export_format not in ("ndjson", "zip"):
+        return jsonify({"error": "Formato inválido. Use 'ndjson' ou 'zip'."}), 400
+
+    suffix = conversation_id or user_id
+    if export_format == "zip":
+        response = Response(stream_zip(user_id, conversation_id),
+                            mimetype="application/zip")
+        filename = f"conversations-{suffix}.zip"
+    else:
+        response = Response(stream_ndjson(user_id, conversation_id),
+                            mimetype="application/x-ndjson")
+        filename = f"conversations-{suffix}.ndjson"
+
+    response.headers["Content-Disposition"] = f"attachment; filename={filename}"
+    response.headers["Cache-Control"] = "no-cache"
+    response.headers["X-Accel-Buffering"] = "no"
+    return response
+
+
+@chat_bp.route("/conversations/export", methods=["GET"])
+def export_conversations():
+    """
+    Exporta todas as conversas de um usuário em streaming.
+
+    ---
+    tags:
+      - Chat
+    parameters:
+      - name: user_id
+        in: query
+        type: string
+        required: true
+        description: ID do usuário
+      - name: format
+        in: query
+        type: string
+        enum: ["ndjson", "zip"]
+        required: false
+        description: ndjson (uma linha por registro) ou zip (NDJSON + arquivos anexados)
+    responses:
+      200:
+        description: Arquivo de exportação em streaming
+      400:
+        description: Erro de validação
+    """
+    user_id = request.args.get("user_id")
+    if not user_id:
+        return jsonify({"error": "user_id é obrigatório"}), 400
+
+    return _export_response(user_id)
+
+
+@chat_bp.route("/conversations/<conversation_id>/export", methods=["GET"])
+def export_conversation(conversation_id):
+    """
+    Exporta uma conversa específica em streaming.
+
+    ---
+    tags:
+      - Chat
+    parameters:
+      - name: conversation_id
+        in: path
+        type: string
+        required: true
+        description: ID da conversa
+      - name: format
+        in: query
+        type: string
+        enum: ["ndjson", "zip"]
+        required: false
+        description: ndjson (uma linha por registro) ou zip (NDJSON + arquivos anexados)
+    responses:
+      200:
+        description: Arquivo de exportação em streaming
+      404:
+        description: Conversa não encontrada
+    """
+    try:
+        db = get_db()
+        conversation = db.conversations.find_one(
+            {"_id": ObjectId(conversation_id)}, {"user_id": 1})
+    except Exception as e:
+        return jsonify({"error": str(e)}), 400
+
+    if not conversation:
+        return jsonify({"error": "Conversa não encontrada."}), 404
+
+    return _export_response(conversation.get("user_id"), conversation_id)
+
+
+@chat_bp.route("/conversations/import", methods=["POST"])
+def import_conversations():
+    """
+    Importa conversas a partir de uma exportação NDJSON ou ZIP.
+
+    ---
+    tags:
+      - Chat
+    consumes:
+      - application/x-ndjson
+      - multipart/form-data
+    parameters:
+      - name: user_id
+        in: query
+        type: string
+        required: false
+        description: Usuário que receberá as conversas (padrão, o da exportação)
+      - name: file
+        in: formData
+        type: file
+        required: false
+        description: Arquivo .ndjson ou .zip (alternativa ao corpo NDJSON)
+    responses:
+      201:
+        description: Conversas importadas
+      400:
+        description: Arquivo inválido
+    """
+    user_id = request.args.get("user_id") or request.form.get("user_id")
+
+    try:
+        if "file" in request.files:
+            upload = request.files["file"]
+            if zipfile.is_zipfile(upload.stream):
+                upload.stream.seek(0)
+                stats = import_zip(upload.stream, user_id=user_id)
+            else:
+                upload.stream.seek(0)
+                stats = import_ndjson(upload.stream, user_id=user_id)
+        else:
+            stats = import_ndjson(request.stream, user_id=user_id)
+    except (ValueError, KeyError, zipfile.BadZipFile) as e:
+        return jsonify({"error": f"Arquivo de importação inválido: {str(e)}"}), 400
+
+    current_app.logger.info(f"Conversas importadas: {stats}")
+    return jsonify({"message": "Importação concluída.", "imported": stats}), 201
+
+
 # --------------------------
 # Endpoints de Mensagens
 # --------------------------
@@ -409,17 +604,33 @@ def get_messages(conversation_id):
         type: integer
         required: false
         description: Offset para paginação
+      - name: since
+        in: query
+        type: string
+        format: date-time
+        required: false
+        description: Retorna apenas mensagens enviadas a partir desta data (ISO 8601)
+      - name: until
+        in: query
+        type: string
+        format: date-time
+        required: false
+        description: Retorna apenas mensagens enviadas até esta data (ISO 8601)
     responses:
       200:
         description: Lista de mensagens da conversa
+      400:
+        description: Erro de validação
       404:
         description: Conversa não encontrada
     """
     try:
         limit = int(request.args.get("limit", 50))
         offset = int(request.args.get("offset", 0))
+        since, until = parse_range_args(request.args)
 
         db = get_db()
+        ensure_hot(conversation_id, db=db)
         conversation = db.conversations.find_one(
             {"_id": ObjectId(conversation_id)},
             {"history": 1, "_id": 0}
@@ -429,6 +640,9 @@ def get_messages(conversation_id):
             return jsonify({"error": "Conversa não encontrada."}), 404
 
         history = conversation.get("history", [])
+        if since or until:
+            history = [msg for msg in history
+                       if in_range(msg.get("timestamp"), since, until)]
         total_messages = len(history)
 
         # Aplicar paginação
@@ -493,6 +707,9 @@ def send_message(conversation_id):
             max_tokens:
               type: integer
               example: 2048
+            variables:
+              type: object
+              description: Valores para as variáveis do template do agente
     responses:
       200:
         description: Resposta da IA
@@ -514,6 +731,7 @@ def send_message(conversation_id):
     provider_version = data.get("providerVersion", "").lower()
     user_msg_id = data.get("userMsgId", f"msg-{int(time.time())}")
     max_tokens = data.get("max_tokens", 2048)
+    template_variables = data.get("variables") or {}
 
     # Busca a configuração do provider
     provider_config_doc = get_provider_config(gpt_provider)
@@ -544,21 +762,17 @@ def send_message(conversation_id):
     # Atualizar configuração para incluir max_tokens
     provider_config["max_tokens"] = max_tokens
 
-    # Se um agente for informado, busca seu template customizado
-    agent_template = None
+    db = get_db()
+
+    # Se um agente for informado, busca o documento (em cache) com o template pré-compilado
+    agent_doc = None
     if agent:
-        agent_template = get_agent_template(agent)
-        if not agent_template:
+        agent_doc = get_cached_agent(db, agent)
+        if not agent_doc or not (agent_doc.get("prompt_template") or agent_doc.get("description")):
             return jsonify({"error": f"Agente '{agent}' não está configurado."}), 400
 
     try:
-        full_prompt = get_prompt_instructions(
-            message, custom_template=agent_template)
-    except Exception as e:
-        return jsonify({"error": str(e)}), 400
-
-    db = get_db()
-    try:
+        ensure_hot(conversation_id, db=db)
         conversation = db.conversations.find_one(
             {"_id": ObjectId(conversation_id)})
         if not conversation:
@@ -566,12 +780,23 @@ def send_message(conversation_id):
     except Exception as e:
         return jsonify({"error": str(e)}), 400
 
+    try:
+        attached_files = [f.get("original_filename")
+                          for f in conversation.get("files", []) if f.get("original_filename")]
+        # Apenas os trechos dos anexos relevantes para a mensagem
+        context = build_context(conversation, message, db=db)
+        full_prompt = get_prompt_instructions(
+            message, agent=agent_doc, context=context, files=attached_files,
+            variables=template_variables)
+    except Exception as e:
+        return jsonify({"error": str(e)}), 400
+
     # Preparar a mensagem do usuário
     user_message = {
         "id": user_msg_id,
         "sender": "user",
         "text": message,
-        "timestamp": datetime.utcnow().isoformat(),
+        "timestamp": utcnow(),
         "agent": agent,
         "gpt": gpt_provider
     }
@@ -603,7 +828,7 @@ def send_message(conversation_id):
         "id": f"resp-{int(time.time())}",
         "sender": "ai",
         "text": ai_response_text,
-        "timestamp": datetime.utcnow().isoformat(),
+        "timestamp": utcnow(),
         "agent": agent,
         "gpt": gpt_provider,
         "parentId": user_msg_id
@@ -615,7 +840,7 @@ def send_message(conversation_id):
     history.append(ai_message)
 
     # Atualizar a conversa
-    now = datetime.utcnow().isoformat()
+    now = utcnow()
     preview = ai_message["text"][:100] + \
         "..." if len(ai_message["text"]) > 100 else ai_message["text"]
 
@@ -630,6 +855,10 @@ def send_message(conversation_id):
         }
     )
 
+    # Título e resumo são gerados em segundo plano, fora do caminho interativo
+    schedule_background_jobs(
+        conversation_id, conversation.get("title"), len(history))
+
     current_app.logger.info(
         f"Mensagem adicionada à conversa {conversation_id}, resposta gerada pelo {gpt_provider}")
 
@@ -664,7 +893,7 @@ def clear_messages(conversation_id):
     """
     try:
         db = get_db()
-        now = datetime.utcnow().isoformat()
+        now = utcnow()
 
         # Verificar se a conversa existe
         conversation = db.conversations.find_one(
@@ -672,11 +901,17 @@ def clear_messages(conversation_id):
         if not conversation:
             return jsonify({"error": "Conversa não encontrada."}), 404
 
-        # Limpar o histórico da conversa
+        # Limpar o histórico da conversa (e o arquivo, se estiver arquivada)
         result = db.conversations.update_one(
             {"_id": ObjectId(conversation_id)},
-            {"$set": {"history": [], "updated_at": now, "last_message": ""}}
+            {"$set": {"history": [], "updated_at": now, "last_message": ""},
+             # O resumo e as tarefas agendadas referem-se às mensagens removidas
+             "$unset": {"archived": "", "archived_at": "", "message_count": "",
+                        "summary": "", "summary_message_count": "",
+                        "summary_updated_at": "", "background_jobs": ""}}
         )
+        if conversation.get("archived"):
+            delete_archived(conversation_id, db=db)
 
         if result.matched_count == 0:
             return jsonify({"error": "Falha ao limpar o histórico de mensagens."}), 500
@@ -48,7 +48,7 @@ def dashboard(user_data):
     # Busca as últimas 5 imagens geradas
     recent_images = list(db.images.find(
         {"user_id": user_id},
-        {"_id": 1, "description": 1, "url": 1, "created_at": 1}
+        {"_id": 1, "description": 1, "url": 1, "thumbnail_url": 1, "created_at": 1}
     ).sort("created_at", -1).limit(5))
 
     # Busca os últimos 5 vídeos gerados (se existir a coleção)
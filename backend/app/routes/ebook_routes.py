@@ -3,8 +3,13 @@ from flask import Blueprint, request, jsonify
 from app.services.ebook_service import (
     create_ebook, get_ebook, get_ebook_status,
     update_ebook_status, update_ebook_metadata,
-    finalize_ebook, list_ebooks
+    finalize_ebook, list_ebooks, claim_chapter_generation,
+    set_chapter_generation_task, release_chapter_generation
 )
+from app.services.ebook_pipeline_service import (
+    start_pipeline, set_pipeline_task, get_pipeline, fail_pipeline
+)
+from app.utils.date_utils import parse_range_args
 import logging
 
 logger = logging.getLogger(__name__)
@@ -30,6 +35,9 @@ def create_ebook_route():
             tema:
               type: string
               example: "Inteligência Artificial"
+            user_id:
+              type: string
+              description: Dono do eBook
     responses:
       201:
         description: eBook criado com sucesso.
@@ -54,7 +62,7 @@ def create_ebook_route():
         return jsonify({"error": "Campo 'tema' é obrigatório."}), 400
 
     try:
-        ebook_id = create_ebook(tema)
+        ebook_id = create_ebook(tema, user_id=data.get("user_id"))
         return jsonify({
             "ebook_id": ebook_id,
             "message": "eBook criado com sucesso"
@@ -235,6 +243,182 @@ def update_metadata_route(ebook_id):
     return jsonify({"message": "Metadados atualizados com sucesso."}), 200
 
 
+@ebook_bp.route("/ebook/<ebook_id>/capitulos/gerar", methods=["POST"])
+def generate_chapters_route(ebook_id):
+    """
+    Gera o conteúdo de todos os capítulos do eBook em paralelo (tarefa em segundo plano).
+
+    A concorrência é limitada pelo plano do usuário. O progresso de cada
+    capítulo é exposto em GET /ebook/{ebook_id}/status.
+    ---
+    tags:
+      - eBook
+    parameters:
+      - name: ebook_id
+        in: path
+        type: string
+        required: true
+        description: ID do eBook
+      - in: body
+        name: body
+        required: false
+        schema:
+          type: object
+          properties:
+            provider:
+              type: string
+              example: "chatgpt"
+            version:
+              type: string
+              example: "v4"
+            regenerar:
+              type: boolean
+              description: Gera novamente também os capítulos já concluídos
+            force:
+              type: boolean
+              description: Inicia mesmo se houver uma geração marcada como em andamento
+    responses:
+      202:
+        description: Geração iniciada.
+      404:
+        description: eBook não encontrado.
+      409:
+        description: Já existe uma geração em andamento.
+    """
+    from app.tasks.ebook_tasks import generate_ebook_chapters_task
+
+    data = request.get_json(silent=True) or {}
+
+    ebook = get_ebook(ebook_id)
+    if not ebook:
+        return jsonify({"error": "eBook não encontrado."}), 404
+    if not (ebook.get("metadata") or {}).get("capitulos"):
+        return jsonify({"error": "O eBook ainda não possui capítulos definidos."}), 400
+
+    if not claim_chapter_generation(ebook_id, force=bool(data.get("force"))):
+        return jsonify({"error": "Já existe uma geração de capítulos ou pipeline em andamento."}), 409
+
+    try:
+        task = generate_ebook_chapters_task.delay(
+            ebook_id,
+            provider=data.get("provider", "chatgpt"),
+            version=data.get("version", "v4"),
+            # O limite do plano é o do dono do eBook, não o informado na requisição
+            user_id=ebook.get("user_id"),
+            only_pending=not data.get("regenerar", False)
+        )
+    except Exception as e:
+        logger.error(f"Erro ao agendar geração de capítulos: {str(e)}")
+        release_chapter_generation(ebook_id, "erro")
+        return jsonify({"error": "Erro ao agendar a geração de capítulos."}), 500
+
+    set_chapter_generation_task(ebook_id, task.id)
+    return jsonify({"message": "Geração de capítulos iniciada.", "task_id": task.id}), 202
+
+
+@ebook_bp.route("/ebook/<ebook_id>/pipeline", methods=["POST"])
+def start_pipeline_route(ebook_id):
+    """
+    Inicia ou retoma o pipeline completo do eBook em segundo plano.
+
+    Etapas já concluídas (e capítulos/imagens já gerados) são reaproveitadas.
+    ---
+    tags:
+      - eBook
+    parameters:
+      - name: ebook_id
+        in: path
+        type: string
+        required: true
+        description: ID do eBook
+      - in: body
+        name: body
+        required: false
+        schema:
+          type: object
+          properties:
+            provider:
+              type: string
+              example: "chatgpt"
+            version:
+              type: string
+              example: "v4"
+            image_service:
+              type: string
+              example: "openai"
+            qtd_capitulos:
+              type: integer
+              example: 5
+            template_id:
+              type: string
+            formatos:
+              type: array
+              items:
+                type: string
+              example: ["pdf", "epub"]
+            force:
+              type: boolean
+              description: Inicia mesmo se houver uma execução marcada como em andamento
+    responses:
+      202:
+        description: Pipeline agendado.
+      404:
+        description: eBook não encontrado.
+      409:
+        description: Pipeline ou geração de capítulos já em andamento.
+    """
+    from app.tasks.ebook_tasks import enqueue_pipeline
+
+    data = request.get_json(silent=True) or {}
+    options = {key: data.get(key) for key in (
+        "provider", "version", "image_service", "image_size",
+        "qtd_capitulos", "template_id", "formatos")}
+
+    try:
+        stages = start_pipeline(ebook_id, options, force=bool(data.get("force")))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 404
+
+    if stages is None:
+        return jsonify({"error": "O pipeline ou uma geração de capítulos deste eBook já está em andamento."}), 409
+
+    try:
+        result = enqueue_pipeline(ebook_id, stages)
+    except Exception as e:
+        logger.error(f"Erro ao agendar pipeline do eBook {ebook_id}: {str(e)}")
+        fail_pipeline(ebook_id, "Falha ao agendar o pipeline.")
+        return jsonify({"error": "Erro ao agendar o pipeline."}), 500
+
+    set_pipeline_task(ebook_id, result.id)
+    return jsonify({"message": "Pipeline agendado.", "task_id": result.id,
+                    "etapas": stages}), 202
+
+
+@ebook_bp.route("/ebook/<ebook_id>/pipeline", methods=["GET"])
+def get_pipeline_route(ebook_id):
+    """
+    Retorna o estado do pipeline do eBook, com checkpoints e tempos por etapa.
+    ---
+    tags:
+      - eBook
+    parameters:
+      - name: ebook_id
+        in: path
+        type: string
+        required: true
+        description: ID do eBook
+    responses:
+      200:
+        description: Estado do pipeline.
+      404:
+        description: eBook não encontrado.
+    """
+    pipeline = get_pipeline(ebook_id)
+    if pipeline is None:
+        return jsonify({"error": "eBook não encontrado."}), 404
+    return jsonify(pipeline), 200
+
+
 @ebook_bp.route("/ebook/<ebook_id>/finalizar", methods=["POST"])
 def finalizar_ebook_route(ebook_id):
     """
@@ -279,15 +463,34 @@ def list_ebooks_route():
         type: integer
         required: false
         description: 'Número de registros a pular (padrão: 0)'
+      - name: since
+        in: query
+        type: string
+        format: date-time
+        required: false
+        description: Retorna apenas eBooks criados a partir desta data (ISO 8601)
+      - name: until
+        in: query
+        type: string
+        format: date-time
+        required: false
+        description: Retorna apenas eBooks criados até esta data (ISO 8601)
     responses:
       200:
         description: Lista de eBooks.
+      400:
+        description: Parâmetros de data inválidos.
     """
+    try:
+        since, until = parse_range_args(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
     try:
         limit = request.args.get("limit", default=10, type=int)
         skip = request.args.get("skip", default=0, type=int)
 
-        ebooks = list_ebooks(limit=limit, skip=skip)
+        ebooks = list_ebooks(limit=limit, skip=skip, since=since, until=until)
         return jsonify(ebooks), 200
     except Exception as e:
         logger.error(f"Erro ao listar eBooks: {str(e)}")
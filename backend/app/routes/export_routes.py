@@ -1,9 +1,10 @@
 # backend/app/routes/export_routes.py
-from flask import Blueprint, request, jsonify, send_file
+from flask import Blueprint, request, jsonify
 from app.services.export_service import (
-    export_ebook, get_export_status, list_exports,
+    create_export, get_export_status, list_exports, delete_export, fail_export,
     EXPORT_FORMATS
 )
+from app.utils.file_serving import serve_file
 import logging
 import os
 
@@ -36,6 +37,10 @@ def get_formats_route():
 def export_ebook_route(ebook_id):
     """
     Exporta um eBook para o formato especificado.
+
+    A exportação roda em segundo plano; acompanhe o progresso em
+    /export/status/<export_id>. Se um artefato idêntico já existir no cache,
+    a resposta é imediata (200).
     ---
     tags:
       - Exportação
@@ -64,20 +69,30 @@ def export_ebook_route(ebook_id):
                 include_toc:
                   type: boolean
                   example: true
+                no_cache:
+                  type: boolean
+                  description: Ignora o cache e renderiza novamente
     responses:
       200:
-        description: eBook exportado com sucesso.
+        description: eBook exportado com sucesso (artefato do cache).
         schema:
           type: object
           properties:
             export_id:
               type: string
-            ebook_id:
-              type: string
             format:
               type: string
             status:
               type: string
+            progress:
+              type: integer
+            download_url:
+              type: string
+            cached:
+              type: boolean
+              description: true se um artefato idêntico foi reaproveitado
+      202:
+        description: Exportação enfileirada.
       400:
         description: Dados obrigatórios ausentes ou inválidos.
       404:
@@ -95,11 +110,18 @@ def export_ebook_route(ebook_id):
         }), 400
 
     try:
-        export_info = export_ebook(ebook_id, formato, options)
-        if not export_info:
-            return jsonify({"error": "Erro ao exportar eBook."}), 500
+        export_info = create_export(ebook_id, formato, options)
+        if export_info["status"] == "concluido":
+            return jsonify(export_info), 200
 
-        return jsonify(export_info), 200
+        from app.tasks.export_tasks import run_export_task
+        try:
+            run_export_task.delay(export_info["export_id"])
+        except Exception as e:
+            logger.error(f"Erro ao agendar a exportação {export_info['export_id']}: {str(e)}")
+            fail_export(export_info["export_id"], "Falha ao agendar a exportação.")
+            return jsonify({"error": "Erro ao agendar a exportação."}), 500
+        return jsonify(export_info), 202
     except ValueError as e:
         logger.error(f"Erro ao exportar eBook {ebook_id}: {str(e)}")
         return jsonify({"error": str(e)}), 404
@@ -137,10 +159,14 @@ def get_export_status_route(export_id):
               type: string
             progress:
               type: integer
-            url:
+              description: Percentual de conclusão (0-100)
+            progress_step:
+              type: string
+            download_url:
               type: string
             created_at:
-              type: number
+              type: string
+              format: date-time
       404:
         description: Exportação não encontrada.
       500:
@@ -187,10 +213,14 @@ def get_ebook_export_status_route(ebook_id):
               type: string
             progress:
               type: integer
-            url:
+              description: Percentual de conclusão (0-100)
+            progress_step:
+              type: string
+            download_url:
               type: string
             created_at:
-              type: number
+              type: string
+              format: date-time
       404:
         description: Nenhuma exportação encontrada para este eBook.
       500:
@@ -248,7 +278,8 @@ def list_ebook_exports_route(ebook_id):
                   url:
                     type: string
                   created_at:
-                    type: number
+                    type: string
+                    format: date-time
       500:
         description: Erro ao listar exportações.
     """
@@ -267,6 +298,10 @@ def list_ebook_exports_route(ebook_id):
 def download_export_route(export_id):
     """
     Faz o download de um arquivo de exportação.
+
+    Suporta requisições parciais (Range) e revalidação por ETag — o ETag é o
+    hash do conteúdo do artefato, então downloads interrompidos podem ser
+    retomados e clientes com o arquivo em cache recebem 304.
     ---
     tags:
       - Exportação
@@ -284,8 +319,16 @@ def download_export_route(export_id):
             schema:
               type: string
               format: binary
+      206:
+        description: Parte do arquivo (requisição com Range).
+      304:
+        description: Arquivo não modificado (If-None-Match).
+      400:
+        description: Exportação ainda não concluída.
       404:
         description: Exportação não encontrada ou arquivo não disponível.
+      410:
+        description: Artefato removido do cache; exporte novamente.
       500:
         description: Erro ao fazer download da exportação.
     """
@@ -294,21 +337,55 @@ def download_export_route(export_id):
         if not status:
             return jsonify({"error": "Exportação não encontrada."}), 404
 
-        if status.get("status") != "completed":
-            return jsonify({"error": "Exportação ainda não concluída."}), 400
+        if status.get("status") == "expirado":
+            return jsonify({"error": "Arquivo expirado. Exporte o eBook novamente."}), 410
+
+        if status.get("status") != "concluido":
+            return jsonify({
+                "error": "Exportação ainda não concluída.",
+                "progress": status.get("progress", 0)
+            }), 400
 
         filepath = status.get("filepath")
         if not filepath or not os.path.exists(filepath):
             return jsonify({"error": "Arquivo de exportação não encontrado."}), 404
 
-        filename = os.path.basename(filepath)
-        return send_file(
+        filename = f"{status.get('ebook_id')}.{status.get('format')}"
+        return serve_file(
             filepath,
+            mimetype="application/octet-stream",
+            etag=status.get("cache_key"),
             as_attachment=True,
-            download_name=filename,
-            mimetype="application/octet-stream"
+            download_name=filename
         )
     except Exception as e:
         logger.error(
             f"Erro ao fazer download da exportação {export_id}: {str(e)}")
         return jsonify({"error": "Erro ao fazer download da exportação."}), 500
+
+
+@export_bp.route("/export/<export_id>", methods=["DELETE"])
+def delete_export_route(export_id):
+    """
+    Remove uma exportação.
+
+    O artefato do cache só é apagado pela evição, quando nenhuma outra
+    exportação o referencia.
+    ---
+    tags:
+      - Exportação
+    parameters:
+      - name: export_id
+        in: path
+        type: string
+        required: true
+        description: ID da exportação
+    responses:
+      200:
+        description: Exportação removida.
+      404:
+        description: Exportação não encontrada.
+    """
+    if not delete_export(export_id):
+        return jsonify({"error": "Exportação não encontrada."}), 404
+    return jsonify({"message": "Exportação removida com sucesso."}), 200
@@ -1,13 +1,22 @@
 # backend/app/routes/image_routes.py
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, Response, stream_with_context
 from app.services.image_service import (
-    generate_image, regenerate_image, get_image
+    generate_image, regenerate_image, get_image, delete_image,
+    build_batch_jobs, generate_images_batch
 )
+from app.services.image_variant_service import select_variant
+from app.utils.file_serving import serve_file
 import logging
+import json
+import os
 
 logger = logging.getLogger(__name__)
 image_bp = Blueprint("image_bp", __name__)
 
+# /image/<id>/file muda de conteúdo quando as variantes ficam prontas; apenas
+# as URLs das variantes (endereçadas por conteúdo) são imutáveis
+IMAGE_FILE_MAX_AGE = int(os.environ.get('IMAGE_FILE_MAX_AGE', 300))
+
 
 @image_bp.route("/image/generate", methods=["POST"])
 def generate_image_route():
@@ -74,6 +83,73 @@ def generate_image_route():
         return jsonify({"error": "Erro ao gerar imagem."}), 500
 
 
+@image_bp.route("/image/generate/batch", methods=["POST"])
+def generate_images_batch_route():
+    """
+    Gera várias imagens em paralelo.
+
+    Aceita uma lista de descrições ou uma descrição com n variações. Os
+    resultados são enviados em NDJSON, um por linha, à medida que ficam
+    prontos; a última linha traz o resumo do lote.
+    ---
+    tags:
+      - Imagens
+    produces:
+      - application/x-ndjson
+    parameters:
+      - in: body
+        name: body
+        required: true
+        schema:
+          type: object
+          properties:
+            prompts:
+              type: array
+              items:
+                type: string
+            prompt:
+              type: string
+              example: "Capa de eBook sobre jardinagem, aquarela"
+            n:
+              type: integer
+              example: 4
+              description: Variações por descrição
+            service:
+              type: string
+              example: "openai"
+            size:
+              type: string
+              example: "1024x1024"
+    responses:
+      200:
+        description: Resultados em NDJSON (image_id/url ou error por índice, e {"done": true, "total", "saved"} ao final).
+      400:
+        description: Dados obrigatórios ausentes ou inválidos.
+    """
+    data = request.get_json()
+    if not data:
+        return jsonify({"error": "Dados JSON obrigatórios."}), 400
+
+    try:
+        jobs = build_batch_jobs(
+            data.get("prompts"), data.get("prompt"), data.get("n", 1))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    service = data.get("service", "openai")
+    size = data.get("size", "1024x1024")
+
+    def stream():
+        for result in generate_images_batch(jobs, service, size):
+            yield json.dumps(result, ensure_ascii=False) + "\n"
+
+    response = Response(stream_with_context(stream()),
+                        mimetype="application/x-ndjson")
+    response.headers["Cache-Control"] = "no-cache"
+    response.headers["X-Accel-Buffering"] = "no"
+    return response
+
+
 @image_bp.route("/image/regenerate", methods=["POST"])
 def regenerate_image_route():
     """
@@ -172,8 +248,24 @@ def get_image_route(image_id):
               type: string
             size:
               type: string
+            thumbnail_url:
+              type: string
+            variants:
+              type: array
+              items:
+                type: object
+                properties:
+                  width:
+                    type: integer
+                  format:
+                    type: string
+                  url:
+                    type: string
+                  bytes:
+                    type: integer
             created_at:
-              type: number
+              type: string
+              format: date-time
       404:
         description: Imagem não encontrada.
     """
@@ -186,3 +278,71 @@ def get_image_route(image_id):
     except Exception as e:
         logger.error(f"Erro ao obter imagem {image_id}: {str(e)}")
         return jsonify({"error": "Erro ao obter imagem."}), 500
+
+
+@image_bp.route("/image/<image_id>/file", methods=["GET"])
+def get_image_file_route(image_id):
+    """
+    Serve a variante mais adequada de uma imagem.
+
+    Escolhe a menor variante com largura >= w no melhor formato aceito pelo
+    cliente (AVIF, WebP); sem variantes, serve o PNG original.
+    ---
+    tags:
+      - Imagens
+    parameters:
+      - name: image_id
+        in: path
+        type: string
+        required: true
+        description: ID da imagem
+      - name: w
+        in: query
+        type: integer
+        required: false
+        description: Largura de exibição desejada em pixels
+    responses:
+      200:
+        description: Arquivo da imagem.
+      404:
+        description: Imagem não encontrada.
+    """
+    image = get_image(image_id)
+    if not image:
+        return jsonify({"error": "Imagem não encontrada."}), 404
+
+    path, mimetype = select_variant(
+        image, request.args.get("w", type=int), request.headers.get("Accept", ""))
+    path = os.path.abspath(path)
+    if not os.path.exists(path):
+        return jsonify({"error": "Arquivo da imagem não encontrado."}), 404
+
+    response = serve_file(path, mimetype=mimetype, max_age=IMAGE_FILE_MAX_AGE)
+    response.headers["Vary"] = "Accept"
+    return response
+
+
+@image_bp.route("/image/<image_id>", methods=["DELETE"])
+def delete_image_route(image_id):
+    """
+    Remove uma imagem.
+
+    O arquivo só é apagado quando nenhuma outra imagem tem o mesmo conteúdo.
+    ---
+    tags:
+      - Imagens
+    parameters:
+      - name: image_id
+        in: path
+        type: string
+        required: true
+        description: ID da imagem
+    responses:
+      200:
+        description: Imagem removida.
+      404:
+        description: Imagem não encontrada.
+    """
+    if not delete_image(image_id):
+        return jsonify({"error": "Imagem não encontrada."}), 404
+    return jsonify({"message": "Imagem removida com sucesso."}), 200
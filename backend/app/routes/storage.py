@@ -1,9 +1,6 @@
-from flask import Blueprint, request, jsonify, current_app, send_from_directory
+from flask import Blueprint, request, jsonify
 from flask_jwt_extended import jwt_required, get_jwt_identity
 import os
-import uuid
-import boto3
-from botocore.exceptions import NoCredentialsError
 from werkzeug.utils import secure_filename
 import mimetypes
 from datetime import datetime, timedelta
@@ -11,6 +8,14 @@ from app.models.user import User
 from app.models.storage import StorageItem
 from app.utils.token_manager import consume_tokens
 from app.extensions import db
+from app.services.blob_store import write_stream, register, acquire, release, CHUNK_SIZE
+from app.utils.file_serving import serve_file, content_etag
+from app.services.storage_usage_service import (
+    track_item_added, track_item_removed, get_usage)
+from app.services.storage_backend import (
+    get_storage_backend, get_backend_for_path, storage_namespace,
+    storage_namespace_for_path, LOCAL_STORAGE_FOLDER)
+import hashlib
 import logging
 
 storage_bp = Blueprint('storage', __name__)
@@ -19,8 +24,7 @@ logger = logging.getLogger(__name__)
 # Constantes para o sistema de armazenamento
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'mp4', 'webm', 'webp'}
 MAX_CONTENT_LENGTH = 50 * 1024 * 1024  # 50MB
-LOCAL_UPLOAD_FOLDER = os.path.join(os.path.dirname(
-    os.path.dirname(__file__)), 'static', 'uploads')
+LOCAL_UPLOAD_FOLDER = LOCAL_STORAGE_FOLDER
 
 # Garantir que a pasta de uploads local exista
 if not os.path.exists(LOCAL_UPLOAD_FOLDER):
@@ -31,33 +35,16 @@ def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
 
-def generate_presigned_url(object_name, expiration=3600):
-    """Gera uma URL pré-assinada para o S3"""
-    # Verificamos se o S3 está habilitado dentro da função
-    if not current_app.config.get('USE_S3', False):
-        return None
+def item_url(item):
+    """URL de acesso a um item (renova a URL pré-assinada dos objetos no S3)"""
+    if item.storage_path and item.storage_path.startswith('s3://'):
+        return get_backend_for_path(item.storage_path).url(item.storage_path)
+    return item.public_url
 
-    # Inicializamos o cliente S3 se necessário
-    s3_client = boto3.client(
-        's3',
-        region_name=current_app.config.get('S3_REGION'),
-        aws_access_key_id=current_app.config.get('AWS_ACCESS_KEY'),
-        aws_secret_access_key=current_app.config.get('AWS_SECRET_KEY')
-    )
 
-    try:
-        response = s3_client.generate_presigned_url(
-            'get_object',
-            Params={
-                'Bucket': current_app.config.get('S3_BUCKET'),
-                'Key': object_name
-            },
-            ExpiresIn=expiration
-        )
-        return response
-    except Exception as e:
-        logger.error(f"Erro ao gerar URL pré-assinada: {str(e)}")
-        return None
+def delete_stored_file(storage_path):
+    """Remove o arquivo físico de um item, local ou no S3"""
+    return get_backend_for_path(storage_path).delete(storage_path)
 
 
 @storage_bp.route('/upload', methods=['POST'])
@@ -95,10 +82,8 @@ def upload_file():
     if file_size > MAX_CONTENT_LENGTH:
         return jsonify({"error": f"Arquivo muito grande. Tamanho máximo: {MAX_CONTENT_LENGTH/(1024*1024)}MB"}), 400
 
-    # Cria um nome de arquivo único
     file_extension = file.filename.rsplit('.', 1)[1].lower()
     safe_filename = secure_filename(file.filename)
-    unique_filename = f"{uuid.uuid4().hex}_{safe_filename}"
 
     # Determina o tipo de conteúdo (imagem ou vídeo)
     mime_type = mimetypes.guess_type(file.filename)[0]
@@ -114,35 +99,36 @@ def upload_file():
     public_url = None
 
     try:
+        backend = get_storage_backend()
+        # Conteúdo idêntico é gravado uma vez por backend
+        namespace = storage_namespace(backend.name)
+
         # Armazenamento no S3 se habilitado
-        if current_app.config.get('USE_S3', False):
-            # Inicializa o cliente S3
-            s3_client = boto3.client(
-                's3',
-                region_name=current_app.config.get('S3_REGION'),
-                aws_access_key_id=current_app.config.get('AWS_ACCESS_KEY'),
-                aws_secret_access_key=current_app.config.get('AWS_SECRET_KEY')
-            )
-
-            # Upload para o S3
-            s3_client.upload_fileobj(
-                file,
-                current_app.config.get('S3_BUCKET'),
-                unique_filename,
-                ExtraArgs={
-                    'ContentType': mime_type,
-                    'ACL': 'private'  # Armazenamento privado
-                }
-            )
-
-            storage_path = f"s3://{current_app.config.get('S3_BUCKET')}/{unique_filename}"
-            public_url = generate_presigned_url(unique_filename)
+        if backend.name == "s3":
+            # O objeto é endereçado pelo SHA-256: conteúdo repetido não é reenviado
+            sha256 = hashlib.sha256()
+            for chunk in iter(lambda: file.stream.read(CHUNK_SIZE), b""):
+                sha256.update(chunk)
+            file.stream.seek(0)
+            content_hash = sha256.hexdigest()
+            object_name = f"{content_hash}.{file_extension}"
+
+            blob = acquire(namespace, content_hash)
+            if not blob:
+                # Upload multipart (partes em paralelo) para arquivos grandes
+                path = backend.save(file.stream, object_name, mime_type)
+                blob = register(namespace, content_hash, path, file_size)
+
+            storage_path = blob["path"]
+            public_url = backend.url(storage_path)
         else:
             # Armazenamento local
-            local_path = os.path.join(LOCAL_UPLOAD_FOLDER, unique_filename)
-            file.save(local_path)
-            storage_path = local_path
-            public_url = f"/api/storage/file/{unique_filename}"
+            blob = write_stream(
+                namespace, iter(lambda: file.stream.read(CHUNK_SIZE), b""),
+                backend.root, file_extension)
+            content_hash = blob["hash"]
+            storage_path = blob["path"]
+            public_url = backend.url(storage_path)
 
         # Criar registro no banco de dados
         storage_item = StorageItem(
@@ -152,10 +138,13 @@ def upload_file():
             content_type=content_type,
             size_bytes=file_size,
             file_metadata=metadata,
-            user_id=user_id
+            user_id=user_id,
+            content_hash=content_hash
         )
 
         db.session.add(storage_item)
+        # Contador de uso gravado na mesma transação do item
+        track_item_added(storage_item)
         db.session.commit()
 
         # Consumir tokens se necessário (opcional)
@@ -187,10 +176,15 @@ def get_file(filename):
     Retorna o arquivo solicitado
     Usado apenas quando o S3 não está habilitado
     """
-    if USE_S3:
-        return jsonify({"error": "Este endpoint não está disponível quando o S3 está habilitado"}), 404
+    # Arquivos gravados localmente antes da ativação do S3 continuam acessíveis
+    backend = get_backend_for_path(filename)
+    path = backend.find(filename)
+    if not path:
+        return jsonify({"error": "Arquivo não encontrado"}), 404
 
-    return send_from_directory(LOCAL_UPLOAD_FOLDER, filename)
+    # Nomes derivados do SHA-256 (blob_store): conteúdo imutável
+    return serve_file(path,
+                      immutable=content_etag(filename) is not None)
 
 
 @storage_bp.route('/items', methods=['GET'])
@@ -228,18 +222,11 @@ def list_user_items():
         # Processar resultados
         items = []
         for item in pagination.items:
-            # Renovar URL pré-assinada se necessário
-            url = item.public_url
-            if USE_S3 and item.storage_path.startswith('s3://'):
-                # Extrair o nome do objeto do caminho de armazenamento
-                object_name = item.storage_path.replace(
-                    f"s3://{S3_BUCKET}/", "")
-                url = generate_presigned_url(object_name)
-
             items.append({
                 "id": item.id,
                 "filename": item.filename,
-                "url": url,
+                # Renova a URL pré-assinada se necessário
+                "url": item_url(item),
                 "content_type": item.content_type,
                 "size_bytes": item.size_bytes,
                 "file_metadata": item.file_metadata,
@@ -279,23 +266,19 @@ def delete_item(item_id):
         physical_delete = request.args.get(
             'physical', 'false').lower() == 'true'
 
-        if physical_delete:
-            # Exclusão física do arquivo
-            if USE_S3 and item.storage_path.startswith('s3://'):
-                # Extrai o nome do objeto do S3
-                object_name = item.storage_path.replace(
-                    f"s3://{S3_BUCKET}/", "")
-
-                # Exclui o objeto do S3
-                s3_client.delete_object(
-                    Bucket=S3_BUCKET,
-                    Key=object_name
-                )
-            else:
-                # Exclusão local
-                local_path = item.storage_path
-                if os.path.exists(local_path):
-                    os.remove(local_path)
+        # Itens já excluídos logicamente não são descontados de novo
+        track_item_removed(item)
+
+        if physical_delete and item.content_hash:
+            # O arquivo só é apagado quando nenhum outro item o referencia
+            blob = release(storage_namespace_for_path(item.storage_path), item.content_hash)
+            if blob and blob["path"].startswith('s3://'):
+                # O blob_store já remove os arquivos locais
+                delete_stored_file(blob["path"])
+            db.session.delete(item)
+        elif physical_delete:
+            # Exclusão física do arquivo (local ou S3)
+            delete_stored_file(item.storage_path)
 
             # Exclui registro do banco
             db.session.delete(item)
@@ -325,21 +308,9 @@ def storage_dashboard():
     user_id = get_jwt_identity()
 
     try:
-        # Contagem total de arquivos
-        total_files = StorageItem.query.filter_by(
-            user_id=user_id, deleted=False).count()
-
-        # Uso total de armazenamento em bytes
-        storage_usage = db.session.query(db.func.sum(StorageItem.size_bytes))\
-            .filter_by(user_id=user_id, deleted=False).scalar() or 0
-
-        # Contagem por tipo de conteúdo
-        content_types = db.session.query(
-            StorageItem.content_type,
-            db.func.count(StorageItem.id),
-            db.func.sum(StorageItem.size_bytes)
-        ).filter_by(user_id=user_id, deleted=False)\
-            .group_by(StorageItem.content_type).all()
+        # Contadores mantidos a cada upload/exclusão (tabela storage_usage)
+        usage = get_usage(user_id)
+        storage_usage = usage["storage_usage_bytes"]
 
         # Arquivos recentes
         recent_files = StorageItem.query.filter_by(user_id=user_id, deleted=False)\
@@ -347,36 +318,20 @@ def storage_dashboard():
 
         recent_files_data = []
         for item in recent_files:
-            # Renovar URL pré-assinada se necessário
-            url = item.public_url
-            if USE_S3 and item.storage_path.startswith('s3://'):
-                object_name = item.storage_path.replace(
-                    f"s3://{S3_BUCKET}/", "")
-                url = generate_presigned_url(object_name)
-
             recent_files_data.append({
                 "id": item.id,
                 "filename": item.filename,
-                "url": url,
+                "url": item_url(item),
                 "content_type": item.content_type,
                 "size_bytes": item.size_bytes,
                 "created_at": item.created_at.isoformat()
             })
 
-        # Preparar resultado por tipo de conteúdo
-        type_stats = []
-        for content_type, count, size in content_types:
-            type_stats.append({
-                "content_type": content_type,
-                "count": count,
-                "size_bytes": size
-            })
-
         return jsonify({
-            "total_files": total_files,
+            "total_files": usage["total_files"],
             "storage_usage_bytes": storage_usage,
             "storage_usage_mb": round(storage_usage / (1024 * 1024), 2),
-            "type_stats": type_stats,
+            "type_stats": usage["type_stats"],
             "recent_files": recent_files_data
         }), 200
 
@@ -1,30 +1,29 @@
 # backend/app/routes/upload_routes.py
-from flask import Blueprint, request, jsonify, current_app, send_file
+from flask import Blueprint, request, jsonify, current_app
 from app.db import get_db
 from bson import ObjectId
 from werkzeug.utils import secure_filename
-from datetime import datetime
+from app.utils.date_utils import parse_range_args, build_range_filter
+from app.utils.file_serving import serve_file
+from app.services.upload_ingest_service import verification_status
+from app.services.upload_service import (
+    ALLOWED_FILE_EXTENSIONS, ALLOWED_IMAGE_EXTENSIONS,
+    FILE_UPLOAD_FOLDER, IMAGE_UPLOAD_FOLDER, TEMP_UPLOAD_FOLDER,
+    UploadError, UploadOffsetError, allowed_file, store_upload,
+    record_blob_upload, delete_upload_file, create_session, get_session, append_chunk, finalize_session, cancel_session
+)
 import os
-import uuid
-import mimetypes
 from functools import wraps
 
 upload_bp = Blueprint("upload_bp", __name__)
 
-# Configurações para upload
-ALLOWED_FILE_EXTENSIONS = {'pdf', 'doc', 'docx',
-                           'txt', 'csv', 'xls', 'xlsx', 'json', 'xml'}
-ALLOWED_IMAGE_EXTENSIONS = {'jpg', 'jpeg', 'png', 'gif', 'webp', 'svg'}
-MAX_CONTENT_LENGTH = 10 * 1024 * 1024  # 10MB limite
-
-# Configurar diretório de upload
-UPLOAD_FOLDER = os.environ.get('UPLOAD_FOLDER', 'uploads')
-FILE_UPLOAD_FOLDER = os.path.join(UPLOAD_FOLDER, 'files')
-IMAGE_UPLOAD_FOLDER = os.path.join(UPLOAD_FOLDER, 'images')
-
 # Criar diretórios se não existirem
 os.makedirs(FILE_UPLOAD_FOLDER, exist_ok=True)
 os.makedirs(IMAGE_UPLOAD_FOLDER, exist_ok=True)
+os.makedirs(TEMP_UPLOAD_FOLDER, exist_ok=True)
+
+# Intervalo sugerido (Retry-After) enquanto a verificação do upload não termina
+VERIFICATION_RETRY_SECONDS = 5
 
 
 def validate_request_data(f):
@@ -38,9 +37,17 @@ def validate_request_data(f):
     return decorated
 
 
-def allowed_file(filename, allowed_extensions):
-    """Verifica se o arquivo tem uma extensão permitida"""
-    return '.' in filename and filename.rsplit('.', 1)[1].lower() in allowed_extensions
+def _verification_response(upload):
+    """Resposta para uploads ainda não liberados pela verificação de segurança"""
+    status = verification_status(upload)
+    if status == "pendente":
+        response = jsonify({"error": "Arquivo em verificação de segurança.",
+                            "ingest_status": upload.get("ingest_status")})
+        response.headers["Retry-After"] = str(VERIFICATION_RETRY_SECONDS)
+        return response, 202
+    if status == "falha":
+        return jsonify({"error": "Não foi possível concluir a verificação de segurança do arquivo."}), 409
+    return None
 
 
 def format_upload(upload):
@@ -101,55 +108,16 @@ def upload_file():
             "error": f"Tipo de arquivo não permitido. Extensões permitidas: {', '.join(ALLOWED_FILE_EXTENSIONS)}"
         }), 400
 
-    # Gerar um nome único para o arquivo
+    # Salvar o arquivo (armazenado por conteúdo: repetições não ocupam disco)
     original_filename = secure_filename(file.filename)
-    file_extension = original_filename.rsplit(
-        '.', 1)[1].lower() if '.' in original_filename else ''
-    unique_filename = f"{uuid.uuid4().hex}.{file_extension}" if file_extension else f"{uuid.uuid4().hex}"
-    file_path = os.path.join(FILE_UPLOAD_FOLDER, unique_filename)
-
-    # Salvar o arquivo
-    file.save(file_path)
-
-    # Registrar no banco de dados
-    db = get_db()
-    upload_record = {
-        "user_id": user_id,
-        "original_filename": original_filename,
-        "filename": unique_filename,
-        "file_path": file_path,
-        "file_type": file.content_type or mimetypes.guess_type(original_filename)[0],
-        "file_size": os.path.getsize(file_path),
-        "upload_type": "file",
-        "created_at": datetime.utcnow().isoformat(),
-        "conversation_id": conversation_id
-    }
+    blob = store_upload(file.stream, original_filename)
 
-    result = db.uploads.insert_one(upload_record)
-
-    # Se a conversa foi especificada, adicionar referência do arquivo à conversa
-    if conversation_id:
-        try:
-            file_reference = {
-                "file_id": str(result.inserted_id),
-                "original_filename": original_filename,
-                "upload_type": "file",
-                "added_at": datetime.utcnow().isoformat()
-            }
-
-            db.conversations.update_one(
-                {"_id": ObjectId(conversation_id)},
-                {"$push": {"files": file_reference}}
-            )
-        except Exception as e:
-            current_app.logger.error(
-                f"Erro ao associar arquivo à conversa: {str(e)}")
+    # Registrar no banco de dados (e associar à conversa, se informada)
+    upload_record = record_blob_upload(
+        blob, user_id, original_filename, file.content_type, "file", conversation_id)
 
     # Retornar informações sobre o upload
-    upload = format_upload(upload_record)
-    upload["id"] = str(result.inserted_id)
-
-    return jsonify(upload), 201
+    return jsonify(format_upload(upload_record)), 201
 
 
 @upload_bp.route("/uploads/images", methods=["POST"])
@@ -202,55 +170,247 @@ def upload_image():
             "error": f"Tipo de imagem não permitido. Extensões permitidas: {', '.join(ALLOWED_IMAGE_EXTENSIONS)}"
         }), 400
 
-    # Gerar um nome único para a imagem
+    # Salvar a imagem (armazenada por conteúdo: repetições não ocupam disco)
     original_filename = secure_filename(image.filename)
-    file_extension = original_filename.rsplit(
-        '.', 1)[1].lower() if '.' in original_filename else ''
-    unique_filename = f"{uuid.uuid4().hex}.{file_extension}" if file_extension else f"{uuid.uuid4().hex}"
-    file_path = os.path.join(IMAGE_UPLOAD_FOLDER, unique_filename)
+    blob = store_upload(image.stream, original_filename)
 
-    # Salvar a imagem
-    image.save(file_path)
+    # Registrar no banco de dados (e associar à conversa, se informada)
+    upload_record = record_blob_upload(
+        blob, user_id, original_filename, image.content_type, "image", conversation_id)
 
-    # Registrar no banco de dados
-    db = get_db()
-    upload_record = {
-        "user_id": user_id,
-        "original_filename": original_filename,
-        "filename": unique_filename,
-        "file_path": file_path,
-        "file_type": image.content_type or mimetypes.guess_type(original_filename)[0],
-        "file_size": os.path.getsize(file_path),
-        "upload_type": "image",
-        "created_at": datetime.utcnow().isoformat(),
-        "conversation_id": conversation_id
+    # Retornar informações sobre o upload
+    return jsonify(format_upload(upload_record)), 201
+
+
+# --------------------------
+# Upload retomável (criar sessão -> PATCH blocos -> finalizar)
+# --------------------------
+
+def _session_headers(response, session):
+    response.headers["Upload-Offset"] = str(session["offset"])
+    response.headers["Upload-Length"] = str(session["total_size"])
+    response.headers["Cache-Control"] = "no-store"
+    return response
+
+
+def _format_session(session):
+    return {
+        "session_id": session["_id"],
+        "original_filename": session["original_filename"],
+        "upload_type": session["upload_type"],
+        "offset": session["offset"],
+        "total_size": session["total_size"],
+        "chunk_size": session["chunk_size"],
+        "status": session["status"],
+        "expires_at": session["expires_at"]
     }
 
-    result = db.uploads.insert_one(upload_record)
 
-    # Se a conversa foi especificada, adicionar referência da imagem à conversa
-    if conversation_id:
-        try:
-            image_reference = {
-                "file_id": str(result.inserted_id),
-                "original_filename": original_filename,
-                "upload_type": "image",
-                "added_at": datetime.utcnow().isoformat()
-            }
+@upload_bp.route("/uploads/sessions", methods=["POST"])
+def create_upload_session():
+    """
+    Cria uma sessão de upload retomável.
 
-            db.conversations.update_one(
-                {"_id": ObjectId(conversation_id)},
-                {"$push": {"files": image_reference}}
-            )
-        except Exception as e:
-            current_app.logger.error(
-                f"Erro ao associar imagem à conversa: {str(e)}")
+    Os blocos são enviados com PATCH /uploads/sessions/<id> (header
+    Upload-Offset) e o upload é concluído com POST .../finalize. Uma conexão
+    interrompida retoma do offset informado por HEAD /uploads/sessions/<id>.
+    ---
+    tags:
+      - Uploads
+    parameters:
+      - in: body
+        name: body
+        required: true
+        schema:
+          type: object
+          required:
+            - user_id
+            - filename
+            - size
+          properties:
+            user_id:
+              type: string
+            filename:
+              type: string
+              example: "relatorio.pdf"
+            size:
+              type: integer
+              description: Tamanho total do arquivo em bytes
+            upload_type:
+              type: string
+              enum: ["file", "image"]
+            content_type:
+              type: string
+            conversation_id:
+              type: string
+            sha256:
+              type: string
+              description: Hash do arquivo; se o usuário já enviou esse conteúdo, o upload é concluído sem envio
+    responses:
+      200:
+        description: Conteúdo já enviado pelo usuário; upload registrado sem transferência (campo upload)
+      201:
+        description: Sessão criada (chunk_size indica o tamanho máximo de cada bloco)
+      400:
+        description: Erro de validação, tipo de arquivo não permitido ou tamanho excedido
+    """
+    data = request.get_json() or {}
+    user_id = data.get("user_id")
+    if not user_id:
+        return jsonify({"error": "user_id é obrigatório."}), 400
 
-    # Retornar informações sobre o upload
-    upload = format_upload(upload_record)
-    upload["id"] = str(result.inserted_id)
+    try:
+        session = create_session(
+            user_id, data.get("filename"), data.get("size"),
+            data.get("upload_type", "file"), data.get("content_type"),
+            data.get("conversation_id"), data.get("sha256"))
+    except UploadError as e:
+        return jsonify({"error": str(e)}), 400
 
-    return jsonify(upload), 201
+    if session["status"] == "concluido":
+        result = _format_session(session)
+        result["upload"] = format_upload(session["upload"])
+        return jsonify(result), 200
+
+    response = jsonify(_format_session(session))
+    response.status_code = 201
+    response.headers["Location"] = f"{request.path}/{session['_id']}"
+    return _session_headers(response, session)
+
+
+@upload_bp.route("/uploads/sessions/<session_id>", methods=["HEAD", "GET"])
+def get_upload_session(session_id):
+    """
+    Consulta o offset atual de uma sessão de upload.
+    ---
+    tags:
+      - Uploads
+    parameters:
+      - name: session_id
+        in: path
+        type: string
+        required: true
+    responses:
+      200:
+        description: Sessão (headers Upload-Offset e Upload-Length)
+      404:
+        description: Sessão não encontrada
+    """
+    session = get_session(session_id)
+    if not session:
+        return jsonify({"error": "Sessão de upload não encontrada."}), 404
+    return _session_headers(jsonify(_format_session(session)), session)
+
+
+@upload_bp.route("/uploads/sessions/<session_id>", methods=["PATCH"])
+def upload_session_chunk(session_id):
+    """
+    Envia um bloco de uma sessão de upload.
+
+    O corpo é o conteúdo bruto do bloco (application/offset+octet-stream),
+    gravado direto no disco em pedaços.
+    ---
+    tags:
+      - Uploads
+    consumes:
+      - application/offset+octet-stream
+    parameters:
+      - name: session_id
+        in: path
+        type: string
+        required: true
+      - name: Upload-Offset
+        in: header
+        type: integer
+        required: true
+        description: Offset do bloco no arquivo
+      - name: Upload-Checksum
+        in: header
+        type: string
+        required: false
+        description: 'Checksum do bloco: "sha256 <base64>"'
+    responses:
+      204:
+        description: Bloco aceito (header Upload-Offset com o novo offset)
+      400:
+        description: Bloco inválido, grande demais ou com checksum divergente
+      404:
+        description: Sessão não encontrada
+      409:
+        description: Offset divergente (header Upload-Offset com o offset esperado)
+    """
+    offset = request.headers.get("Upload-Offset", type=int)
+    if offset is None:
+        return jsonify({"error": "Header Upload-Offset é obrigatório."}), 400
+
+    try:
+        session = append_chunk(
+            session_id, offset, request.stream, request.content_length,
+            request.headers.get("Upload-Checksum"))
+    except LookupError as e:
+        return jsonify({"error": str(e)}), 404
+    except UploadOffsetError as e:
+        response = jsonify({"error": str(e), "offset": e.offset})
+        response.status_code = 409
+        response.headers["Upload-Offset"] = str(e.offset)
+        return response
+    except UploadError as e:
+        return jsonify({"error": str(e)}), 400
+
+    return _session_headers(current_app.response_class(status=204), session)
+
+
+@upload_bp.route("/uploads/sessions/<session_id>/finalize", methods=["POST"])
+def finalize_upload_session(session_id):
+    """
+    Conclui uma sessão de upload e registra o arquivo.
+    ---
+    tags:
+      - Uploads
+    parameters:
+      - name: session_id
+        in: path
+        type: string
+        required: true
+    responses:
+      201:
+        description: Upload registrado (inclui content_hash)
+      400:
+        description: Upload incompleto
+      404:
+        description: Sessão não encontrada
+    """
+    try:
+        upload = finalize_session(session_id)
+    except LookupError as e:
+        return jsonify({"error": str(e)}), 404
+    except UploadError as e:
+        return jsonify({"error": str(e)}), 400
+
+    return jsonify(format_upload(upload)), 201
+
+
+@upload_bp.route("/uploads/sessions/<session_id>", methods=["DELETE"])
+def cancel_upload_session(session_id):
+    """
+    Cancela uma sessão de upload e descarta os blocos recebidos.
+    ---
+    tags:
+      - Uploads
+    parameters:
+      - name: session_id
+        in: path
+        type: string
+        required: true
+    responses:
+      200:
+        description: Sessão cancelada
+      404:
+        description: Sessão não encontrada
+    """
+    if not cancel_session(session_id):
+        return jsonify({"error": "Sessão de upload não encontrada."}), 404
+    return jsonify({"message": "Sessão de upload cancelada."}), 200
 
 
 @upload_bp.route("/uploads", methods=["GET"])
@@ -287,6 +447,18 @@ def list_uploads():
         type: integer
         required: false
         description: Offset para paginação
+      - name: since
+        in: query
+        type: string
+        format: date-time
+        required: false
+        description: Retorna apenas uploads criados a partir desta data (ISO 8601)
+      - name: until
+        in: query
+        type: string
+        format: date-time
+        required: false
+        description: Retorna apenas uploads criados até esta data (ISO 8601)
     responses:
       200:
         description: Lista de uploads
@@ -302,12 +474,20 @@ def list_uploads():
     limit = int(request.args.get("limit", 20))
     offset = int(request.args.get("offset", 0))
 
+    try:
+        since, until = parse_range_args(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
     # Construir o filtro
     filter_query = {"user_id": user_id}
     if upload_type:
         filter_query["upload_type"] = upload_type
     if conversation_id:
         filter_query["conversation_id"] = conversation_id
+    created_range = build_range_filter(since, until)
+    if created_range:
+        filter_query["created_at"] = created_range
 
     db = get_db()
     uploads = list(db.uploads.find(filter_query).sort(
@@ -370,8 +550,14 @@ def download_upload(upload_id):
     responses:
       200:
         description: Arquivo para download
+      202:
+        description: Arquivo em verificação de segurança (Retry-After)
+      403:
+        description: Arquivo em quarentena
       404:
         description: Upload não encontrado
+      409:
+        description: Verificação de segurança falhou
     """
     try:
         db = get_db()
@@ -380,20 +566,81 @@ def download_upload(upload_id):
         if not upload:
             return jsonify({"error": "Upload não encontrado."}), 404
 
+        if upload.get("quarantined"):
+            return jsonify({"error": "Arquivo bloqueado pela verificação de segurança."}), 403
+
+        blocked = _verification_response(upload)
+        if blocked:
+            return blocked
+
         file_path = upload.get("file_path")
         if not os.path.exists(file_path):
             return jsonify({"error": "Arquivo não encontrado no servidor."}), 404
 
-        return send_file(
+        # O conteúdo de um upload nunca muda: o hash serve de ETag forte
+        return serve_file(
             file_path,
-            download_name=upload.get("original_filename"),
+            mimetype=upload.get("file_type"),
+            etag=upload.get("content_hash"),
+            immutable=bool(upload.get("content_hash")),
             as_attachment=True,
-            mimetype=upload.get("file_type")
+            download_name=upload.get("original_filename"),
+            private=True
         )
     except Exception as e:
         return jsonify({"error": str(e)}), 400
 
 
+@upload_bp.route("/uploads/<upload_id>/thumbnail", methods=["GET"])
+def get_upload_thumbnail(upload_id):
+    """
+    Obtém a miniatura de uma imagem ou PDF enviado.
+
+    ---
+    tags:
+      - Uploads
+    parameters:
+      - name: upload_id
+        in: path
+        type: string
+        required: true
+        description: ID do upload
+    responses:
+      200:
+        description: Miniatura em WebP
+      202:
+        description: Arquivo em verificação de segurança (Retry-After)
+      404:
+        description: Upload ou miniatura não encontrado
+      409:
+        description: Verificação de segurança falhou
+    """
+    try:
+        db = get_db()
+        upload = db.uploads.find_one(
+            {"_id": ObjectId(upload_id)},
+            {"thumbnail_path": 1, "quarantined": 1, "ingest_status": 1, "scan_status": 1})
+
+        if not upload:
+            return jsonify({"error": "Upload não encontrado."}), 404
+
+        if not upload.get("quarantined"):
+            blocked = _verification_response(upload)
+            if blocked:
+                return blocked
+
+        thumbnail_path = upload.get("thumbnail_path")
+        if upload.get("quarantined") or not thumbnail_path \
+                or not os.path.exists(thumbnail_path):
+            return jsonify({"error": "Miniatura não disponível."}), 404
+
+        # Miniatura nomeada pelo hash do conteúdo
+        return serve_file(thumbnail_path, mimetype="image/webp", immutable=True,
+                          private=True)
+    except Exception as e:
+        return jsonify({"error": str(e)}), 400
+
+
 @upload_bp.route("/uploads/<upload_id>", methods=["DELETE"])
 def delete_upload(upload_id):
     """
@@ -416,15 +663,14 @@ def delete_upload(upload_id):
     """
     try:
         db = get_db()
-        upload = db.uploads.find_one({"_id": ObjectId(upload_id)})
+        # Remove o registro primeiro: exclusões simultâneas liberam o arquivo uma vez só
+        upload = db.uploads.find_one_and_delete({"_id": ObjectId(upload_id)})
 
         if not upload:
             return jsonify({"error": "Upload não encontrado."}), 404
 
-        # Excluir o arquivo do sistema de arquivos
-        file_path = upload.get("file_path")
-        if os.path.exists(file_path):
-            os.remove(file_path)
+        # Excluir o arquivo (só sai do disco se nenhum outro upload o usa)
+        delete_upload_file(upload)
 
         # Remover referência do arquivo nas conversas
         conversation_id = upload.get("conversation_id")
@@ -434,9 +680,6 @@ def delete_upload(upload_id):
                 {"$pull": {"files": {"file_id": upload_id}}}
             )
 
-        # Excluir o registro do banco
-        db.uploads.delete_one({"_id": ObjectId(upload_id)})
-
         return jsonify({"message": "Upload excluído com sucesso."}), 200
     except Exception as e:
         return jsonify({"error": str(e)}), 400
@@ -1,14 +1,36 @@
-def get_prompt_instructions(consultation_data: str, custom_template: str = None) -> str:
+import logging
+from app.services.prompt_template_service import render_agent_prompt
+
+logger = logging.getLogger(__name__)
+
+
+def get_prompt_instructions(consultation_data: str, custom_template: str = None,
+                            agent: dict = None, context: str = None,
+                            files: list = None, variables: dict = None) -> str:
     """
     Monta o prompt para a consulta.
 
-    Se um template customizado for fornecido, utiliza-o;
-    caso contrário, utiliza uma formatação default simples.
+    Se o documento do agente for fornecido, renderiza o template pré-compilado
+    (slots de contexto, arquivos e few-shot). Se apenas um template customizado
+    for fornecido, utiliza-o; caso contrário, utiliza uma formatação default simples.
     """
+    if agent:
+        try:
+            return render_agent_prompt(agent, consultation_data, context=context,
+                                       files=files, variables=variables)
+        except Exception as e:
+            # Templates legados que não são Jinja válidos voltam ao formato antigo
+            logger.warning(f"Falha ao renderizar template do agente: {str(e)}")
+            custom_template = agent.get(
+                "prompt_template") or agent.get("description")
+
     if custom_template:
         prompt_instrucoes = custom_template + "\n\n"
     else:
         prompt_instrucoes = "Mensagem do Usuário:\n\n"
 
+    if context:
+        prompt_instrucoes += f"Trechos dos documentos anexados:\n\n{context}\n\n"
+
     full_prompt = f"{prompt_instrucoes}{consultation_data}"
     return full_prompt
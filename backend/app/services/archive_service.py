@@ -0,0 +1,301 @@
+# backend/app/services/archive_service.py
+"""
+Camada de arquivamento (cold storage) das conversas.
+
+Conversas sem atividade há mais de ARCHIVE_IDLE_DAYS têm o histórico movido
+para a coleção conversations_archive em blocos comprimidos (zstd, com zlib
+como alternativa quando o pacote zstandard não está instalado). Na coleção
+quente permanece apenas um documento "stub" com os metadados usados na
+listagem (título, datas, last_message, files), mantendo o working set e os
+índices pequenos.
+
+O acesso a uma conversa arquivada a reidrata de forma transparente. A
+reidratação grava rehydrated_at (sem alterar updated_at, que define a ordem da
+listagem), e a varredura só volta a arquivar a conversa depois de outros
+ARCHIVE_IDLE_DAYS sem acesso.
+"""
+import os
+import zlib
+import logging
+import bson
+from bson import ObjectId, Binary
+from app.db import get_db
+from app.utils.date_utils import utcnow
+from datetime import timedelta
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - dependência opcional
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_COLLECTION = "conversations_archive"
+ARCHIVE_IDLE_DAYS = int(os.environ.get('ARCHIVE_IDLE_DAYS', 90))
+ARCHIVE_BATCH_SIZE = int(os.environ.get('ARCHIVE_BATCH_SIZE', 200))
+ARCHIVE_BLOCK_MESSAGES = int(os.environ.get('ARCHIVE_BLOCK_MESSAGES', 200))
+ZSTD_LEVEL = int(os.environ.get('ARCHIVE_ZSTD_LEVEL', 10))
+
+CODEC_ZSTD = "zstd"
+CODEC_ZLIB = "zlib"
+
+
+def _default_codec():
+    return CODEC_ZSTD if zstandard is not None else CODEC_ZLIB
+
+
+def _compress(data, codec):
+    if codec == CODEC_ZSTD:
+        return zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(data)
+    return zlib.compress(data, 9)
+
+
+def _decompress(data, codec):
+    if codec == CODEC_ZSTD:
+        if zstandard is None:
+            raise RuntimeError(
+                "O pacote 'zstandard' é necessário para ler conversas arquivadas com zstd.")
+        return zstandard.ZstdDecompressor().decompress(data)
+    return zlib.decompress(data)
+
+
+def compress_messages(messages, codec=None, block_size=ARCHIVE_BLOCK_MESSAGES):
+    """
+    Comprime o histórico em blocos de mensagens codificadas em BSON.
+
+    O BSON preserva os tipos nativos (datetime, ObjectId) das mensagens.
+
+    Returns:
+        tuple: (blocos, codec, bytes originais, bytes comprimidos)
+    """
+    codec = codec or _default_codec()
+    blocks = []
+    raw_bytes = compressed_bytes = 0
+
+    for start in range(0, len(messages), block_size):
+        raw = bson.encode({"m": messages[start:start + block_size]})
+        compressed = _compress(raw, codec)
+        blocks.append(Binary(compressed))
+        raw_bytes += len(raw)
+        compressed_bytes += len(compressed)
+
+    return blocks, codec, raw_bytes, compressed_bytes
+
+
+def iter_block_messages(archive_doc):
+    """Gera as mensagens de um documento arquivado, bloco a bloco"""
+    codec = archive_doc.get("codec", CODEC_ZLIB)
+    for block in archive_doc.get("blocks", []):
+        for message in bson.decode(_decompress(bytes(block), codec)).get("m", []):
+            yield message
+
+
+def archive_conversation(db, conversation):
+    """
+    Arquiva uma conversa: grava o histórico comprimido e reduz o documento quente a um stub.
+
+    Args:
+        db: Instância do banco
+        conversation (dict): Documento completo da conversa
+
+    Returns:
+        bool: True se a conversa foi arquivada
+    """
+    conversation_id = conversation["_id"]
+    history = conversation.get("history", [])
+    blocks, codec, raw_bytes, compressed_bytes = compress_messages(history)
+
+    db[ARCHIVE_COLLECTION].replace_one(
+        {"_id": conversation_id},
+        {
+            "_id": conversation_id,
+            "user_id": conversation.get("user_id"),
+            "codec": codec,
+            "blocks": blocks,
+            "message_count": len(history),
+            "raw_bytes": raw_bytes,
+            "compressed_bytes": compressed_bytes,
+            "archived_at": utcnow()
+        },
+        upsert=True
+    )
+
+    # O filtro por updated_at garante que nenhuma mensagem chegou durante o arquivamento
+    result = db.conversations.update_one(
+        {"_id": conversation_id,
+         "updated_at": conversation.get("updated_at"),
+         "archived": {"$ne": True}},
+        {"$set": {"archived": True, "archived_at": utcnow(),
+                  "message_count": len(history)},
+         "$unset": {"history": "", "rehydrated_at": ""}}
+    )
+    if result.modified_count == 0:
+        db[ARCHIVE_COLLECTION].delete_one({"_id": conversation_id})
+        return False
+    return True
+
+
+def archive_idle_conversations(idle_days=ARCHIVE_IDLE_DAYS, batch_size=ARCHIVE_BATCH_SIZE, limit=None):
+    """
+    Arquiva conversas sem atividade há mais de idle_days dias.
+
+    Args:
+        idle_days (int): Dias de inatividade para arquivar
+        batch_size (int): Tamanho do lote do cursor
+        limit (int, optional): Número máximo de conversas por execução
+
+    Returns:
+        dict: Estatísticas da execução
+    """
+    db = get_db()
+    cutoff = utcnow() - timedelta(days=idle_days)
+    cursor = db.conversations.find(
+        {"updated_at": {"$lt": cutoff}, "archived": {"$ne": True},
+         # Conversas reidratadas recentemente continuam quentes
+         "$or": [{"rehydrated_at": {"$exists": False}},
+                 {"rehydrated_at": {"$lt": cutoff}}]},
+        batch_size=batch_size
+    )
+    if limit:
+        cursor = cursor.limit(limit)
+
+    stats = {"archived": 0, "skipped": 0, "errors": 0}
+    for conversation in cursor:
+        try:
+            if archive_conversation(db, conversation):
+                stats["archived"] += 1
+            else:
+                stats["skipped"] += 1
+        except Exception as e:
+            stats["errors"] += 1
+            logger.error(
+                f"Erro ao arquivar conversa {conversation.get('_id')}: {str(e)}")
+
+    logger.info(f"Arquivamento de conversas concluído: {stats}")
+    return stats
+
+
+def rehydrate_conversation(conversation_id, db=None):
+    """
+    Restaura o histórico de uma conversa arquivada para a coleção quente.
+
+    Args:
+        conversation_id (str|ObjectId): ID da conversa
+        db: Instância do banco (opcional)
+
+    Returns:
+        bool: True se a conversa estava arquivada e foi restaurada
+    """
+    db = db if db is not None else get_db()
+    conversation_id = ObjectId(conversation_id)
+
+    archive_doc = db[ARCHIVE_COLLECTION].find_one({"_id": conversation_id})
+    if not archive_doc:
+        # Stub sem arquivo (ex.: falha parcial): apenas remove a marcação
+        db.conversations.update_one(
+            {"_id": conversation_id, "archived": True},
+            {"$set": {"history": [], "rehydrated_at": utcnow()},
+             "$unset": {"archived": "", "archived_at": ""}}
+        )
+        return False
+
+    history = list(iter_block_messages(archive_doc))
+    db.conversations.update_one(
+        {"_id": conversation_id, "archived": True},
+        {"$set": {"history": history, "rehydrated_at": utcnow()},
+         "$unset": {"archived": "", "archived_at": "", "message_count": ""}}
+    )
+    db[ARCHIVE_COLLECTION].delete_one({"_id": conversation_id})
+    logger.info(
+        f"Conversa {conversation_id} reidratada ({len(history)} mensagens)")
+    return True
+
+
+def ensure_hot(conversation_id, db=None):
+    """
+    Garante que a conversa esteja na coleção quente antes de acessar o histórico.
+
+    Custa uma consulta por _id apenas com o campo archived.
+    """
+    db = db if db is not None else get_db()
+    try:
+        stub = db.conversations.find_one(
+            {"_id": ObjectId(conversation_id)}, {"archived": 1})
+    except Exception:
+        return False
+    if stub and stub.get("archived"):
+        return rehydrate_conversation(conversation_id, db=db)
+    return False
+
+
+def iter_archived_messages(conversation_id, db=None):
+    """Lê as mensagens de uma conversa arquivada sem reidratá-la"""
+    db = db if db is not None else get_db()
+    archive_doc = db[ARCHIVE_COLLECTION].find_one(
+        {"_id": ObjectId(conversation_id)})
+    if archive_doc:
+        for message in iter_block_messages(archive_doc):
+            yield message
+
+
+def delete_archived(conversation_id, db=None):
+    """Remove o arquivo de uma conversa (usado ao excluir/limpar a conversa)"""
+    db = db if db is not None else get_db()
+    db[ARCHIVE_COLLECTION].delete_one({"_id": ObjectId(conversation_id)})
+
+
+def _collection_stats(db, name):
+    try:
+        stats = db.command("collStats", name)
+    except Exception:
+        return {"count": 0, "size_bytes": 0, "storage_bytes": 0, "index_bytes": 0}
+    return {
+        "count": stats.get("count", 0),
+        "size_bytes": stats.get("size", 0),
+        "storage_bytes": stats.get("storageSize", 0),
+        "index_bytes": stats.get("totalIndexSize", 0)
+    }
+
+
+def get_storage_metrics(user_id=None):
+    """
+    Métricas de armazenamento das conversas (camada quente x arquivo).
+
+    Args:
+        user_id (str, optional): Restringe as contagens a um usuário
+
+    Returns:
+        dict: Contagens e tamanhos por camada
+    """
+    db = get_db()
+    query = {"user_id": user_id} if user_id else {}
+
+    archived_totals = list(db[ARCHIVE_COLLECTION].aggregate([
+        {"$match": query},
+        {"$group": {
+            "_id": None,
+            "conversations": {"$sum": 1},
+            "messages": {"$sum": "$message_count"},
+            "raw_bytes": {"$sum": "$raw_bytes"},
+            "compressed_bytes": {"$sum": "$compressed_bytes"}
+        }}
+    ]))
+    archived = archived_totals[0] if archived_totals else {}
+    raw_bytes = archived.get("raw_bytes", 0)
+    compressed_bytes = archived.get("compressed_bytes", 0)
+
+    return {
+        "hot": {
+            "conversations": db.conversations.count_documents(
+                dict(query, archived={"$ne": True})),
+            "collection": _collection_stats(db, "conversations")
+        },
+        "archive": {
+            "conversations": archived.get("conversations", 0),
+            "messages": archived.get("messages", 0),
+            "raw_bytes": raw_bytes,
+            "compressed_bytes": compressed_bytes,
+            "compression_ratio": round(raw_bytes / compressed_bytes, 2) if compressed_bytes else None,
+            "collection": _collection_stats(db, ARCHIVE_COLLECTION)
+        }
+    }
@@ -0,0 +1,207 @@
+# backend/app/services/blob_store.py
+"""
+Armazenamento de arquivos endereçado por conteúdo.
+
+Cada arquivo é gravado uma única vez por namespace, com o nome derivado do
+seu SHA-256, e registrado na coleção blobs:
+
+    _id         "<namespace>:<sha256>"
+    namespace   Área de armazenamento (images, uploads...)
+    hash        SHA-256 do conteúdo
+    path        Caminho do arquivo
+    size        Tamanho em bytes
+    refcount    Número de registros que apontam para o arquivo
+
+Os arquivos ficam distribuídos em subdiretórios pelo prefixo do hash
+(<diretório>/ab/cd/<sha256>.<ext>, ver app.utils.sharding).
+
+O hash é calculado durante a gravação (streaming), sem carregar o arquivo em
+memória. Conteúdo repetido apenas incrementa refcount; o arquivo só é removido
+quando a última referência é liberada. A referência é registrada com um único
+upsert atômico, então gravações simultâneas do mesmo conteúdo não se perdem.
+"""
+import os
+import uuid
+import hashlib
+import logging
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+from app.db import get_db
+from app.utils.date_utils import utcnow
+from app.utils.sharding import shard_path
+
+logger = logging.getLogger(__name__)
+
+BLOB_COLLECTION = "blobs"
+CHUNK_SIZE = 256 * 1024
+# Upserts simultâneos do mesmo _id podem falhar com DuplicateKeyError
+UPSERT_RETRIES = 3
+
+
+def _blob_id(namespace, digest):
+    return f"{namespace}:{digest}"
+
+
+def blob_path(directory, digest, ext):
+    """Caminho do arquivo de um blob"""
+    return shard_path(directory, f"{digest}.{ext}" if ext else digest, digest)
+
+
+def _add_reference(namespace, digest, path, size):
+    """
+    Incrementa refcount, criando o registro se necessário, em uma operação.
+
+    Returns:
+        dict: Registro anterior à operação ou None se o blob foi criado agora
+    """
+    collection = get_db()[BLOB_COLLECTION]
+    for attempt in range(UPSERT_RETRIES):
+        try:
+            return collection.find_one_and_update(
+                {"_id": _blob_id(namespace, digest)},
+                {"$inc": {"refcount": 1},
+                 "$setOnInsert": {"namespace": namespace, "hash": digest, "path": path,
+                                  "size": size, "created_at": utcnow()}},
+                upsert=True,
+                return_document=ReturnDocument.BEFORE
+            )
+        except DuplicateKeyError:
+            # Outro processo criou o registro entre a busca e a inserção
+            if attempt == UPSERT_RETRIES - 1:
+                raise
+
+
+def _created(namespace, digest, path, size):
+    return {"_id": _blob_id(namespace, digest), "namespace": namespace, "hash": digest,
+            "path": path, "size": size, "refcount": 1, "created": True}
+
+
+def register(namespace, digest, path, size):
+    """
+    Registra um arquivo já gravado (local ou remoto) com uma referência.
+
+    Se o conteúdo já estiver registrado, apenas a referência é adicionada e o
+    registro existente (com o caminho original) é retornado.
+
+    Returns:
+        dict: Registro do blob (created=False quando já existia)
+    """
+    before = _add_reference(namespace, digest, path, size)
+    if before:
+        return dict(before, refcount=before.get("refcount", 0) + 1, created=False)
+    return _created(namespace, digest, path, size)
+
+
+def put_file(namespace, temp_path, digest, size, directory, ext=None):
+    """
+    Publica um arquivo temporário cujo SHA-256 já é conhecido.
+
+    Se o conteúdo já existir, o arquivo temporário é descartado e apenas uma
+    nova referência é registrada.
+
+    Returns:
+        dict: Registro do blob (created=False quando reaproveitado)
+    """
+    path = blob_path(directory, digest, ext)
+    before = _add_reference(namespace, digest, path, size)
+
+    # Conteúdo já armazenado: descarta a cópia
+    if before and os.path.exists(before["path"]):
+        os.remove(temp_path)
+        return dict(before, refcount=before.get("refcount", 0) + 1, created=False)
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    os.replace(temp_path, path)
+    if before:
+        # Registro sem arquivo (ex.: removido manualmente): passa a usar esta cópia
+        get_db()[BLOB_COLLECTION].update_one(
+            {"_id": _blob_id(namespace, digest)}, {"$set": {"path": path, "size": size}})
+        return dict(before, path=path, size=size,
+                    refcount=before.get("refcount", 0) + 1, created=True)
+    return _created(namespace, digest, path, size)
+
+
+def write_stream(namespace, chunks, directory, ext=None):
+    """
+    Grava um fluxo de bytes calculando o SHA-256 incrementalmente.
+
+    Args:
+        namespace (str): Área de armazenamento
+        chunks (iterable): Blocos de bytes
+        directory (str): Diretório de destino
+        ext (str, optional): Extensão do arquivo
+
+    Returns:
+        dict: Registro do blob (hash, path, size, created)
+    """
+    os.makedirs(directory, exist_ok=True)
+    temp_path = os.path.join(directory, f".{uuid.uuid4().hex}.part")
+    sha256 = hashlib.sha256()
+    size = 0
+    try:
+        with open(temp_path, "wb") as f:
+            for chunk in chunks:
+                if not chunk:
+                    continue
+                sha256.update(chunk)
+                f.write(chunk)
+                size += len(chunk)
+        return put_file(namespace, temp_path, sha256.hexdigest(), size, directory, ext)
+    except Exception:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+def write_bytes(namespace, data, directory, ext=None):
+    """Grava um conteúdo já em memória (ex.: imagem em base64)"""
+    return write_stream(namespace,
+                        (data[i:i + CHUNK_SIZE] for i in range(0, len(data), CHUNK_SIZE)),
+                        directory, ext)
+
+
+def get_blob(namespace, digest):
+    """Obtém o registro de um blob ou None se não existir"""
+    return get_db()[BLOB_COLLECTION].find_one({"_id": _blob_id(namespace, digest)})
+
+
+def acquire(namespace, digest):
+    """
+    Registra uma nova referência a um blob existente.
+
+    Returns:
+        dict: Registro do blob ou None se o conteúdo não estiver armazenado
+    """
+    return get_db()[BLOB_COLLECTION].find_one_and_update(
+        {"_id": _blob_id(namespace, digest), "refcount": {"$gt": 0}},
+        {"$inc": {"refcount": 1}},
+        return_document=ReturnDocument.AFTER
+    )
+
+
+def release(namespace, digest):
+    """
+    Libera uma referência; remove o arquivo quando não restarem referências.
+
+    Returns:
+        dict: Registro do blob removido ou None se ainda houver referências
+    """
+    db = get_db()
+    blob_id = _blob_id(namespace, digest)
+    blob = db[BLOB_COLLECTION].find_one_and_update(
+        {"_id": blob_id, "refcount": {"$gt": 0}},
+        {"$inc": {"refcount": -1}},
+        return_document=ReturnDocument.AFTER
+    )
+    if not blob or blob.get("refcount", 0) > 0:
+        return None
+
+    # Só remove se nenhuma nova referência chegou nesse meio tempo
+    if db[BLOB_COLLECTION].delete_one({"_id": blob_id, "refcount": {"$lte": 0}}).deleted_count:
+        try:
+            os.remove(blob["path"])
+        except FileNotFoundError:
+            pass
+        logger.info(f"Blob {blob_id} removido ({blob.get('size', 0)} bytes)")
+        return blob
+    return None
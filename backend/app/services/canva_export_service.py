@@ -0,0 +1,141 @@
+# backend/app/services/canva_export_service.py
+"""
+Acompanhamento das exportações assíncronas do Canva.
+
+export_design_from_canva registra cada job em canva_exports com
+next_poll_at/attempts. Uma única tarefa periódica (canva.poll_exports)
+consulta em lote os jobs vencidos, com backoff exponencial entre as
+consultas de cada job, e notifica a exportação correspondente (coleção
+exports) quando o arquivo fica pronto ou o job falha.
+"""
+import os
+import logging
+from datetime import timedelta
+from concurrent.futures import ThreadPoolExecutor
+from pymongo import UpdateOne
+from app.db import get_db
+from app.utils.date_utils import utcnow
+from app.services.canva_service import get_canva_client
+
+logger = logging.getLogger(__name__)
+
+POLL_BATCH_SIZE = int(os.environ.get('CANVA_POLL_BATCH_SIZE', 50))
+POLL_WORKERS = int(os.environ.get('CANVA_POLL_WORKERS', 8))
+POLL_BASE_SECONDS = 2
+POLL_MAX_SECONDS = 120
+POLL_MAX_ATTEMPTS = int(os.environ.get('CANVA_POLL_MAX_ATTEMPTS', 20))
+# Reserva do job durante a consulta, para que execuções concorrentes não o repitam
+POLL_LEASE_SECONDS = 60
+
+
+def next_poll_delay(attempts):
+    """Intervalo até a próxima consulta: 2s, 4s, 8s... limitado a POLL_MAX_SECONDS"""
+    return min(POLL_BASE_SECONDS * (2 ** attempts), POLL_MAX_SECONDS)
+
+
+def _claim_due_jobs(db, batch_size):
+    """Reserva até batch_size jobs pendentes cuja próxima consulta já venceu"""
+    now = utcnow()
+    lease = now + timedelta(seconds=POLL_LEASE_SECONDS)
+    jobs = []
+    for _ in range(batch_size):
+        job = db.canva_exports.find_one_and_update(
+            {"status": "pendente", "next_poll_at": {"$lte": now}},
+            {"$set": {"next_poll_at": lease}},
+            sort=[("next_poll_at", 1)]
+        )
+        if not job:
+            break
+        jobs.append(job)
+    return jobs
+
+
+def _check(client, job):
+    try:
+        return job, client.get_export(job["canva_export_id"]), None
+    except Exception as e:
+        return job, None, e
+
+
+def _notify(job):
+    """Encaminha o resultado do job para a exportação que o originou"""
+    if not job.get("export_id"):
+        return
+    from app.tasks.export_tasks import finish_remote_export_task
+    finish_remote_export_task.delay(
+        job["export_id"], job.get("download_url"), job.get("error"))
+
+
+def poll_pending_exports(batch_size=POLL_BATCH_SIZE):
+    """
+    Consulta em lote o status das exportações pendentes no Canva.
+
+    Args:
+        batch_size (int): Número máximo de jobs consultados nesta execução
+
+    Returns:
+        dict: Contagem de jobs consultados, concluídos, com falha e pendentes
+    """
+    db = get_db()
+    jobs = _claim_due_jobs(db, batch_size)
+    summary = {"consultados": len(jobs), "concluidos": 0,
+               "falhas": 0, "pendentes": 0}
+    if not jobs:
+        return summary
+
+    client = get_canva_client()
+    with ThreadPoolExecutor(max_workers=min(POLL_WORKERS, len(jobs))) as executor:
+        results = list(executor.map(lambda job: _check(client, job), jobs))
+
+    now = utcnow()
+    operations = []
+    finished = []
+    for job, status, error in results:
+        attempts = job.get("attempts", 0) + 1
+        update = {"attempts": attempts, "last_polled_at": now}
+
+        if status and status["status"] != "pendente":
+            update.update({
+                "status": status["status"],
+                "download_url": status.get("download_url"),
+                "error": status.get("error"),
+                "completed_at": now
+            })
+        elif attempts >= POLL_MAX_ATTEMPTS:
+            update.update({
+                "status": "falha",
+                "error": str(error) if error else "Tempo limite da exportação no Canva excedido.",
+                "completed_at": now
+            })
+        else:
+            if error:
+                logger.warning(
+                    f"Erro ao consultar exportação {job['canva_export_id']} no Canva: {str(error)}")
+            update["next_poll_at"] = now + \
+                timedelta(seconds=next_poll_delay(attempts))
+
+        operations.append(UpdateOne({"_id": job["_id"]}, {"$set": update}))
+        if "completed_at" in update:
+            job.update(update)
+            finished.append(job)
+            summary["concluidos" if update["status"] == "concluido" else "falhas"] += 1
+        else:
+            summary["pendentes"] += 1
+
+    db.canva_exports.bulk_write(operations, ordered=False)
+    for job in finished:
+        _notify(job)
+
+    logger.info(f"Exportações do Canva consultadas: {summary}")
+    return summary
+
+
+def get_canva_export(canva_export_id):
+    """
+    Obtém o registro de um job de exportação do Canva.
+
+    Returns:
+        dict: Registro do job ou None se não encontrado
+    """
+    return get_db().canva_exports.find_one(
+        {"canva_export_id": canva_export_id}, {"_id": 0})
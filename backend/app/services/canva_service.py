@@ -2,9 +2,16 @@
 import requests
 import logging
 from app.db import get_db
+from app.utils.date_utils import utcnow
 import time
 import json
 import os
+import io
+import uuid
+import hashlib
+from datetime import timedelta
+from pymongo import ReturnDocument
+from PIL import Image
 from app.services.ebook_service import get_ebook, update_ebook_metadata
 
 logger = logging.getLogger(__name__)
@@ -12,6 +19,18 @@ logger = logging.getLogger(__name__)
 # Configuração base para o Canva
 CANVA_API_BASE_URL = "https://api.canva.com/v1"
 DEFAULT_BRAND_KIT_ID = None  # ID do brand kit padrão, se houver
+CANVA_REQUEST_TIMEOUT = int(os.environ.get('CANVA_REQUEST_TIMEOUT', 30))
+
+# Catálogo de templates em cache (coleção canva_templates)
+TEMPLATE_CACHE_TTL = int(os.environ.get('CANVA_TEMPLATE_CACHE_TTL', 900))
+TEMPLATE_FETCH_LIMIT = 100
+TEMPLATE_REFRESH_LEASE_SECONDS = 120
+TEMPLATE_THUMBNAIL_PATH = "static/templates/canva"
+TEMPLATE_THUMBNAIL_WIDTH = 320
+
+# Cliente da API de exportação: "api" (padrão) ou "local" (simulação, para
+# desenvolvimento e testes sem credenciais do Canva)
+CANVA_CLIENT = os.environ.get('CANVA_CLIENT', 'api')
 
 
 def get_canva_config():
@@ -34,15 +53,18 @@ def get_canva_config():
         return None
 
 
-def get_canva_auth_headers():
+def get_canva_auth_headers(config=None):
     """
     Obtém os headers de autenticação para a API do Canva.
 
+    Args:
+        config (dict, optional): Configuração já carregada (evita nova consulta)
+
     Returns:
         dict: Headers de autenticação ou None em caso de erro
     """
     try:
-        config = get_canva_config()
+        config = config or get_canva_config()
         if not config:
             logger.error("Configuração do Canva não encontrada.")
             return None
@@ -64,10 +86,131 @@ def get_canva_auth_headers():
         return None
 
 
+def _format_template(template, category):
+    return {
+        "id": template.get("id"),
+        "nome": template.get("name"),
+        "descricao": template.get("description", ""),
+        "preview_url": template.get("preview_url", ""),
+        "categoria": template.get("category", category)
+    }
+
+
+def _template_cache_key(category, brand_id):
+    return f"{category}:{brand_id or ''}"
+
+
+def _store_thumbnail(template):
+    """
+    Baixa o preview de um template e grava uma miniatura local (JPEG).
+
+    Returns:
+        str: URL local da miniatura ou None se não foi possível gerá-la
+    """
+    preview_url = template.get("preview_url")
+    if not template.get("id") or not preview_url or not preview_url.startswith("http"):
+        return None
+
+    os.makedirs(TEMPLATE_THUMBNAIL_PATH, exist_ok=True)
+    digest = hashlib.sha1(preview_url.encode("utf-8")).hexdigest()[:12]
+    filename = f"{template['id']}-{digest}.jpg"
+    filepath = os.path.join(TEMPLATE_THUMBNAIL_PATH, filename)
+    if not os.path.exists(filepath):
+        response = requests.get(preview_url, timeout=CANVA_REQUEST_TIMEOUT)
+        response.raise_for_status()
+        image = Image.open(io.BytesIO(response.content)).convert("RGB")
+        image.thumbnail((TEMPLATE_THUMBNAIL_WIDTH, TEMPLATE_THUMBNAIL_WIDTH * 2))
+        image.save(f"{filepath}.part", "JPEG", quality=82,
+                   optimize=True, progressive=True)
+        os.replace(f"{filepath}.part", filepath)
+    return f"/{TEMPLATE_THUMBNAIL_PATH}/{filename}"
+
+
+def refresh_template_catalogue(category="ebook", brand_id=None, thumbnails=True):
+    """
+    Atualiza o catálogo de templates em cache a partir da API do Canva.
+
+    A requisição é condicional (If-None-Match com o ETag anterior); um 304
+    apenas renova o cache.
+
+    Args:
+        category (str): Categoria dos templates
+        brand_id (str, optional): Brand kit; usa o da configuração se omitido
+        thumbnails (bool): Gera as miniaturas locais dos previews
+
+    Returns:
+        list: Templates formatados ou None se o Canva não estiver disponível
+    """
+    config = get_canva_config() or {}
+    headers = get_canva_auth_headers(config)
+    if not headers:
+        return None
+
+    brand_id = brand_id or config.get("brand_id", DEFAULT_BRAND_KIT_ID)
+    key = _template_cache_key(category, brand_id)
+    db = get_db()
+    cached = db.canva_templates.find_one({"_id": key}) or {}
+
+    params = {"category": category, "limit": TEMPLATE_FETCH_LIMIT}
+    if brand_id:
+        params["brand_id"] = brand_id
+    if cached.get("etag"):
+        headers["If-None-Match"] = cached["etag"]
+
+    response = requests.get(f"{CANVA_API_BASE_URL}/templates", headers=headers,
+                            params=params, timeout=CANVA_REQUEST_TIMEOUT)
+    now = utcnow()
+    if response.status_code == 304 and cached.get("templates") is not None:
+        templates = cached["templates"]
+        update = {"fetched_at": now}
+    else:
+        response.raise_for_status()
+        templates = [_format_template(template, category)
+                     for template in response.json().get("templates", [])]
+        # Templates novos ainda sem miniatura
+        update = {"templates": templates, "etag": response.headers.get("ETag"),
+                  "fetched_at": now, "thumbnails": False}
+
+    if thumbnails:
+        for template in templates:
+            try:
+                template["thumbnail_url"] = _store_thumbnail(template)
+            except Exception as e:
+                logger.warning(
+                    f"Erro ao gerar miniatura do template {template.get('id')}: {str(e)}")
+        update["templates"] = templates
+        update["thumbnails"] = True
+
+    db.canva_templates.update_one(
+        {"_id": key},
+        {"$set": update, "$unset": {"refreshing_until": ""}},
+        upsert=True
+    )
+    return templates
+
+
+def _schedule_template_refresh(db, key, category, brand_id):
+    """Dispara uma única atualização em segundo plano por catálogo"""
+    now = utcnow()
+    claimed = db.canva_templates.update_one(
+        {"_id": key, "$or": [{"refreshing_until": {"$exists": False}},
+                             {"refreshing_until": {"$lt": now}}]},
+        {"$set": {"refreshing_until": now + timedelta(seconds=TEMPLATE_REFRESH_LEASE_SECONDS)}}
+    )
+    if claimed.modified_count:
+        from app.tasks.canva_tasks import refresh_templates_task
+        refresh_templates_task.delay(category, brand_id)
+
+
 def list_templates(category="ebook", limit=10):
     """
     Lista os templates disponíveis no Canva para eBooks.
 
+    O catálogo fica em cache por (categoria, brand kit) na coleção
+    canva_templates. Dentro de TEMPLATE_CACHE_TTL a resposta sai do cache;
+    depois disso a cópia em cache continua sendo servida enquanto uma tarefa
+    em segundo plano revalida o catálogo (ETag) e gera as miniaturas.
+
     Args:
         category (str): Categoria dos templates (ebook, apresentação, etc.)
         limit (int): Número máximo de templates a retornar
@@ -75,43 +218,27 @@ def list_templates(category="ebook", limit=10):
     Returns:
         list: Lista de templates ou lista vazia em caso de erro
     """
+    category = category or "ebook"
     try:
-        headers = get_canva_auth_headers()
-        if not headers:
-            return []
-
-        # Obtém a configuração para parâmetros adicionais
-        config = get_canva_config()
+        db = get_db()
+        config = get_canva_config() or {}
         brand_id = config.get("brand_id", DEFAULT_BRAND_KIT_ID)
-
-        # Constrói a URL com os parâmetros
-        url = f"{CANVA_API_BASE_URL}/templates"
-        params = {
-            "category": category,
-            "limit": limit
-        }
-
-        if brand_id:
-            params["brand_id"] = brand_id
-
-        response = requests.get(url, headers=headers, params=params)
-        response.raise_for_status()
-
-        data = response.json()
-        templates = data.get("templates", [])
-
-        # Formata a resposta
-        formatted_templates = []
-        for template in templates:
-            formatted_templates.append({
-                "id": template.get("id"),
-                "nome": template.get("name"),
-                "descricao": template.get("description", ""),
-                "preview_url": template.get("preview_url", ""),
-                "categoria": template.get("category", category)
-            })
-
-        return formatted_templates
+        key = _template_cache_key(category, brand_id)
+
+        cached = db.canva_templates.find_one({"_id": key})
+        if cached and cached.get("templates") is not None:
+            age = (utcnow() - cached["fetched_at"]).total_seconds()
+            if age > TEMPLATE_CACHE_TTL or not cached.get("thumbnails"):
+                _schedule_template_refresh(db, key, category, brand_id)
+            return cached["templates"][:limit]
+
+        # Primeiro acesso: busca síncrona, miniaturas em segundo plano
+        templates = refresh_template_catalogue(
+            category, brand_id, thumbnails=False)
+        if templates is None:
+            return []
+        _schedule_template_refresh(db, key, category, brand_id)
+        return templates[:limit]
     except Exception as e:
         logger.error(f"Erro ao listar templates do Canva: {str(e)}")
         # Retornamos templates fictícios para o caso da API não estar disponível
@@ -174,7 +301,7 @@ def create_canva_design(template_id, title):
             "title": data.get("title"),
             "edit_url": data.get("edit_url", ""),
             "preview_url": data.get("preview_url", ""),
-            "created_at": time.time()
+            "created_at": utcnow()
         }
 
         # Salva o design na base de dados
@@ -190,7 +317,7 @@ def create_canva_design(template_id, title):
             "title": title,
             "edit_url": f"https://canva.com/design/mockup/{int(time.time())}",
             "preview_url": f"https://canva.com/design/preview/{int(time.time())}",
-            "created_at": time.time()
+            "created_at": utcnow()
         }
 
 
@@ -386,54 +513,158 @@ def preview_ebook(ebook_id):
         return None
 
 
-def export_design_from_canva(design_id, format="pdf"):
+def _normalize_export_job(data):
+    """Converte a resposta da API (com ou sem o envelope "job") em um formato único"""
+    job = data.get("job", data)
+    status = (job.get("status") or "in_progress").lower()
+    urls = job.get("urls") or ([job["download_url"]] if job.get("download_url") else [])
+    if status in ("success", "completed"):
+        status = "concluido"
+    elif status in ("failed", "error"):
+        status = "falha"
+    else:
+        status = "pendente"
+    error = job.get("error")
+    if isinstance(error, dict):
+        error = error.get("message") or error.get("code")
+    return {
+        "id": job.get("id"),
+        "status": status,
+        "download_url": urls[0] if urls else None,
+        "error": error
+    }
+
+
+class CanvaClient:
+    """Cliente da API de exportação do Canva"""
+
+    def create_export(self, design_id, formato):
+        """Inicia a exportação de um design; retorna o job normalizado"""
+        headers = get_canva_auth_headers()
+        if not headers:
+            raise RuntimeError("Credenciais do Canva não configuradas.")
+        response = requests.post(
+            f"{CANVA_API_BASE_URL}/designs/{design_id}/exports",
+            headers=headers, json={"format": formato.lower()},
+            timeout=CANVA_REQUEST_TIMEOUT)
+        response.raise_for_status()
+        return _normalize_export_job(response.json())
+
+    def get_export(self, job_id):
+        """Consulta o status de uma exportação"""
+        headers = get_canva_auth_headers()
+        if not headers:
+            raise RuntimeError("Credenciais do Canva não configuradas.")
+        response = requests.get(
+            f"{CANVA_API_BASE_URL}/exports/{job_id}",
+            headers=headers, timeout=CANVA_REQUEST_TIMEOUT)
+        response.raise_for_status()
+        return _normalize_export_job(response.json())
+
+
+class LocalCanvaClient:
+    """
+    Simulação local da API de exportação do Canva.
+
+    Cada job fica pendente por `polls_until_ready` consultas e então é
+    concluído com uma URL em `download_base_url` (ou falha, se o design_id
+    começar com "fail"). Os jobs ficam na coleção canva_local_jobs, para que
+    a requisição que cria a exportação e o worker que a consulta (processos
+    diferentes) vejam o mesmo estado.
+    """
+
+    def __init__(self, download_base_url=None, polls_until_ready=2):
+        self.download_base_url = download_base_url or os.environ.get(
+            'CANVA_LOCAL_DOWNLOAD_URL', 'http://localhost:5000/static/canva')
+        self.polls_until_ready = polls_until_ready
+
+    def create_export(self, design_id, formato):
+        job_id = str(uuid.uuid4())
+        get_db().canva_local_jobs.insert_one({
+            "_id": job_id, "design_id": design_id, "format": formato.lower(),
+            "polls": 0, "created_at": utcnow()})
+        return {"id": job_id, "status": "pendente",
+                "download_url": None, "error": None}
+
+    def get_export(self, job_id):
+        job = get_db().canva_local_jobs.find_one_and_update(
+            {"_id": job_id}, {"$inc": {"polls": 1}},
+            return_document=ReturnDocument.AFTER)
+        if not job:
+            raise KeyError(f"Exportação {job_id} não encontrada.")
+        if job["polls"] < self.polls_until_ready:
+            return {"id": job_id, "status": "pendente",
+                    "download_url": None, "error": None}
+        if job["design_id"].startswith("fail"):
+            return {"id": job_id, "status": "falha",
+                    "download_url": None, "error": "Falha simulada."}
+        return {
+            "id": job_id,
+            "status": "concluido",
+            "download_url": f"{self.download_base_url}/{job['design_id']}.{job['format']}",
+            "error": None
+        }
+
+
+_canva_client = None
+
+
+def get_canva_client():
+    """Retorna o cliente de exportação configurado (CANVA_CLIENT)"""
+    global _canva_client
+    if _canva_client is None:
+        _canva_client = LocalCanvaClient() if CANVA_CLIENT == "local" else CanvaClient()
+    return _canva_client
+
+
+def set_canva_client(client):
+    """Substitui o cliente de exportação (ex.: LocalCanvaClient em testes)"""
+    global _canva_client
+    _canva_client = client
+
+
+def export_design_from_canva(design_id, format="pdf", ebook_id=None, export_id=None):
     """
-    Exporta um design do Canva para o formato especificado.
+    Inicia a exportação de um design do Canva para o formato especificado.
+
+    A exportação no Canva é assíncrona: o job é registrado em canva_exports
+    e acompanhado por canva_export_service.poll_pending_exports, que notifica
+    a exportação (export_id) quando o arquivo estiver pronto.
 
     Args:
         design_id (str): ID do design
         format (str): Formato de exportação (pdf, png, etc.)
+        ebook_id (str, optional): eBook de origem
+        export_id (str, optional): Exportação (coleção exports) a notificar
 
     Returns:
-        dict: Informações do arquivo exportado ou None em caso de erro
+        dict: Informações do job de exportação ou None em caso de erro
     """
     try:
-        headers = get_canva_auth_headers()
-        if not headers:
-            return None
-
-        url = f"{CANVA_API_BASE_URL}/designs/{design_id}/exports"
-
-        payload = {
-            "format": format.lower()
-        }
+        job = get_canva_client().create_export(design_id, format)
+        if not job.get("id"):
+            raise RuntimeError("Resposta do Canva sem ID de exportação.")
 
-        response = requests.post(url, headers=headers, json=payload)
-        response.raise_for_status()
-
-        data = response.json()
-
-        # Extrai informações da exportação
+        now = utcnow()
         export_info = {
-            "export_id": data.get("id"),
-            "status": data.get("status", "pending"),
-            "download_url": data.get("download_url", ""),
+            "canva_export_id": job["id"],
+            "design_id": design_id,
+            "ebook_id": ebook_id,
+            "export_id": export_id,
             "format": format,
-            "created_at": time.time()
+            "status": job["status"],
+            "download_url": job.get("download_url"),
+            "error": job.get("error"),
+            "attempts": 0,
+            "next_poll_at": now,
+            "created_at": now
         }
 
-        # Salva as informações de exportação
+        # Salva o job para o acompanhamento em lote
         db = get_db()
-        db.canva_exports.insert_one(export_info)
+        db.canva_exports.insert_one(dict(export_info))
 
         return export_info
     except Exception as e:
         logger.error(f"Erro ao exportar design {design_id} do Canva: {str(e)}")
-        # Retornamos informações fictícias para o caso da API não estar disponível
-        return {
-            "export_id": f"export_{int(time.time())}",
-            "status": "completed",
-            "download_url": f"https://canva.com/exports/{design_id}.{format}",
-            "format": format,
-            "created_at": time.time()
-        }
+        return None
@@ -1,10 +1,41 @@
 # backend/app/services/content_service.py
+import os
+import time
+import uuid
 import logging
+from datetime import timedelta
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pymongo.errors import DuplicateKeyError
 from app.services.genai_service import GenAIService
+from app.services.ebook_service import update_ebook_status
+from app.services.subscription_service import SubscriptionService
+from app.models.subscription_model import SUBSCRIPTION_PLANS
+from app.utils.date_utils import utcnow
 from app.db import get_db
 
 logger = logging.getLogger(__name__)
 
+# Teto global de chamadas simultâneas por geração, independente do plano
+MAX_PARALLEL_CHAPTERS = int(os.environ.get('MAX_PARALLEL_CHAPTERS', 8))
+
+# Vagas de geração por usuário, compartilhadas entre eBooks e workers
+# (coleção generation_slots: {_id: user_id, holders: [{id, expires_at}]})
+SLOT_COLLECTION = "generation_slots"
+# Validade de uma vaga: libera a vaga de um worker que caiu no meio da chamada
+SLOT_LEASE_SECONDS = int(os.environ.get('GENERATION_SLOT_LEASE_SECONDS', 900))
+SLOT_POLL_SECONDS = float(os.environ.get('GENERATION_SLOT_POLL_SECONDS', 0.5))
+# Espera máxima por uma vaga antes de desistir do capítulo
+SLOT_WAIT_TIMEOUT_SECONDS = int(os.environ.get('GENERATION_SLOT_WAIT_TIMEOUT_SECONDS', 1800))
+# Vagas compartilhadas pelos eBooks sem dono (limite do plano free)
+ANONYMOUS_SLOT_KEY = "anonimo"
+
+# Status de geração de cada capítulo (metadata.capitulos.<i>.status)
+CHAPTER_PENDING = "pendente"
+CHAPTER_RUNNING = "gerando"
+CHAPTER_DONE = "concluido"
+CHAPTER_ERROR = "erro"
+
 
 def get_ai_service(provider='chatgpt', version='v4'):
     """
@@ -187,32 +218,16 @@ def generate_chapters(titulo, tema=None, provider='chatgpt', version='v4', qtd=5
         ]
 
 
-def generate_chapter_content(capitulo, subtemas=None, titulo_ebook=None, provider='chatgpt', version='v4'):
-    """
-    Gera o conteúdo detalhado para um capítulo específico.
-
-    Args:
-        capitulo (str): Título do capítulo
-        subtemas (list, optional): Lista de subtemas do capítulo
-        titulo_ebook (str, optional): Título do eBook para contexto
-        provider (str): Provedor de IA a ser usado
-        version (str): Versão do provedor
-
-    Returns:
-        str: Conteúdo formatado do capítulo
-    """
-    try:
-        ai_service = get_ai_service(provider, version)
-
-        contexto_ebook = f" do eBook '{titulo_ebook}'" if titulo_ebook else ""
-        contexto_subtemas = ""
+def _chapter_prompt(capitulo, subtemas=None, titulo_ebook=None):
+    contexto_ebook = f" do eBook '{titulo_ebook}'" if titulo_ebook else ""
+    contexto_subtemas = ""
 
-        if subtemas:
-            subtemas_texto = "\n".join(
-                [f"- {subtema}" for subtema in subtemas])
-            contexto_subtemas = f"\n\nOs subtemas a serem abordados são:\n{subtemas_texto}"
+    if subtemas:
+        subtemas_texto = "\n".join(
+            [f"- {subtema}" for subtema in subtemas])
+        contexto_subtemas = f"\n\nOs subtemas a serem abordados são:\n{subtemas_texto}"
 
-        prompt = f"""
+    return f"""
         Você é um redator especializado em eBooks educativos e informativos.
         Gere o conteúdo completo para o capítulo '{capitulo}'{contexto_ebook}.{contexto_subtemas}
         
@@ -227,26 +242,226 @@ def generate_chapter_content(capitulo, subtemas=None, titulo_ebook=None, provide
         Use formatação com subtítulos (##) para cada seção e listas quando apropriado.
         """
 
-        # Seleciona o método correspondente ao provider
-        if provider.lower() == 'chatgpt':
-            response = ai_service.chat_with_chatgpt(prompt, version)
-        elif provider.lower() == 'gemini':
-            response = ai_service.chat_with_gemini(prompt)
-        elif provider.lower() == 'claude':
-            response = ai_service.chat_with_claude(prompt)
-        else:
-            # Fallback para ChatGPT
-            response = ai_service.chat_with_chatgpt(prompt, 'v35_turbo')
 
+def _chat(ai_service, prompt, provider, version):
+    """Seleciona o método correspondente ao provider"""
+    if provider.lower() == 'chatgpt':
+        return ai_service.chat_with_chatgpt(prompt, version)
+    elif provider.lower() == 'gemini':
+        return ai_service.chat_with_gemini(prompt)
+    elif provider.lower() == 'claude':
+        return ai_service.chat_with_claude(prompt)
+    # Fallback para ChatGPT
+    return ai_service.chat_with_chatgpt(prompt, 'v35_turbo')
+
+
+def generate_chapter_content(capitulo, subtemas=None, titulo_ebook=None, provider='chatgpt', version='v4',
+                             ai_service=None, raise_errors=False):
+    """
+    Gera o conteúdo detalhado para um capítulo específico.
+
+    Args:
+        capitulo (str): Título do capítulo
+        subtemas (list, optional): Lista de subtemas do capítulo
+        titulo_ebook (str, optional): Título do eBook para contexto
+        provider (str): Provedor de IA a ser usado
+        version (str): Versão do provedor
+        ai_service (GenAIService, optional): Instância já configurada (reutilizada entre capítulos)
+        raise_errors (bool): Propaga erros em vez de retornar o texto de fallback
+
+    Returns:
+        str: Conteúdo formatado do capítulo
+    """
+    try:
+        ai_service = ai_service or get_ai_service(provider, version)
+        prompt = _chapter_prompt(capitulo, subtemas, titulo_ebook)
+        response = _chat(ai_service, prompt, provider, version)
         return response.strip()
 
     except Exception as e:
         logger.error(
             f"Erro ao gerar conteúdo para o capítulo '{capitulo}': {str(e)}")
+        if raise_errors:
+            raise
         return f"# {capitulo}\n\nConteúdo temporariamente indisponível. Por favor, tente gerar novamente."
 
 
-def generate_image_prompt(capitulo, conteudo=None, provider='chatgpt', version='v4'):
+def get_generation_concurrency(user_id=None):
+    """
+    Limite de capítulos gerados em paralelo para o plano do usuário.
+
+    Args:
+        user_id (str, optional): ID do usuário (sem usuário, usa o plano free)
+
+    Returns:
+        int: Número máximo de chamadas simultâneas
+    """
+    plan_limit = SUBSCRIPTION_PLANS["free"].get("parallel_generations", 1)
+    if user_id:
+        try:
+            subscription = SubscriptionService().get_user_subscription(user_id)
+            plan_limit = subscription.get_parallel_generations()
+        except Exception as e:
+            logger.warning(
+                f"Não foi possível obter o plano do usuário {user_id}: {str(e)}")
+    return max(1, min(plan_limit, MAX_PARALLEL_CHAPTERS))
+
+
+def acquire_generation_slot(db, user_id, limit):
+    """
+    Tenta ocupar uma das `limit` vagas de geração do usuário.
+
+    A vaga vale para todos os eBooks e processos: um usuário com vários eBooks
+    em geração continua limitado ao número de chamadas do plano.
+
+    Returns:
+        str: ID da vaga ou None se todas estiverem ocupadas
+    """
+    now = utcnow()
+    collection = db[SLOT_COLLECTION]
+    # Descarta vagas vencidas (worker interrompido)
+    collection.update_one(
+        {"_id": user_id}, {"$pull": {"holders": {"expires_at": {"$lt": now}}}})
+
+    slot_id = uuid.uuid4().hex
+    try:
+        collection.update_one(
+            {"_id": user_id, f"holders.{limit - 1}": {"$exists": False}},
+            {"$push": {"holders": {
+                "id": slot_id, "expires_at": now + timedelta(seconds=SLOT_LEASE_SECONDS)}}},
+            upsert=True
+        )
+    except DuplicateKeyError:
+        # O documento existe e todas as vagas estão ocupadas
+        return None
+    return slot_id
+
+
+def release_generation_slot(db, user_id, slot_id):
+    """Libera uma vaga de geração"""
+    db[SLOT_COLLECTION].update_one(
+        {"_id": user_id}, {"$pull": {"holders": {"id": slot_id}}})
+
+
+@contextmanager
+def generation_slot(db, user_id, limit, timeout=None):
+    """
+    Aguarda uma vaga de geração do usuário durante o bloco.
+
+    eBooks sem dono compartilham as vagas de ANONYMOUS_SLOT_KEY.
+
+    Raises:
+        TimeoutError: Se nenhuma vaga for liberada em `timeout` segundos
+            (padrão: SLOT_WAIT_TIMEOUT_SECONDS)
+    """
+    key = user_id or ANONYMOUS_SLOT_KEY
+    timeout = SLOT_WAIT_TIMEOUT_SECONDS if timeout is None else timeout
+    deadline = time.monotonic() + timeout
+    slot_id = acquire_generation_slot(db, key, limit)
+    while slot_id is None:
+        if time.monotonic() >= deadline:
+            raise TimeoutError(
+                f"Nenhuma vaga de geração liberada em {timeout} segundos.")
+        time.sleep(SLOT_POLL_SECONDS)
+        slot_id = acquire_generation_slot(db, key, limit)
+    try:
+        yield
+    finally:
+        release_generation_slot(db, key, slot_id)
+
+
+def _set_chapter(db, ebook_id, indice, fields):
+    update = {f"metadata.capitulos.{indice}.{key}": value
+              for key, value in fields.items()}
+    update["updated_at"] = utcnow()
+    db.ebooks.update_one({"ebook_id": ebook_id}, {"$set": update})
+
+
+def generate_ebook_chapters(ebook_id, provider='chatgpt', version='v4', user_id=None,
+                            only_pending=True, max_workers=None):
+    """
+    Gera o conteúdo de todos os capítulos de um eBook em paralelo.
+
+    Os capítulos vêm de metadata.capitulos ({titulo, subtemas}); o progresso é
+    gravado capítulo a capítulo em metadata.capitulos.<i> (status, conteudo,
+    erro, tempos), permitindo acompanhar pelo status do eBook.
+
+    O limite do plano vale por usuário: cada chamada ao provedor ocupa uma vaga
+    de generation_slot, compartilhada com as demais gerações do mesmo usuário.
+
+    Args:
+        ebook_id (str): ID do eBook
+        provider (str): Provedor de IA a ser usado
+        version (str): Versão do provedor
+        user_id (str, optional): Usuário dono do eBook (define o limite do plano)
+        only_pending (bool): Pula capítulos já concluídos
+        max_workers (int, optional): Limite explícito de concorrência
+
+    Returns:
+        dict: Resumo da geração (total, concluídos, erros)
+    """
+    db = get_db()
+    ebook = db.ebooks.find_one(
+        {"ebook_id": ebook_id},
+        {"_id": 0, "metadata.titulo": 1, "metadata.capitulos": 1}
+    )
+    if not ebook:
+        raise ValueError(f"eBook {ebook_id} não encontrado.")
+
+    metadata = ebook.get("metadata") or {}
+    capitulos = metadata.get("capitulos") or []
+    pendentes = [
+        (indice, capitulo) for indice, capitulo in enumerate(capitulos)
+        if not (only_pending and capitulo.get("status") == CHAPTER_DONE)
+    ]
+
+    plan_limit = get_generation_concurrency(user_id)
+    workers = max_workers or plan_limit
+    ai_service = get_ai_service(provider, version)
+
+    for indice, _ in pendentes:
+        _set_chapter(db, ebook_id, indice, {"status": CHAPTER_PENDING})
+    update_ebook_status(ebook_id, "Conteúdo", "em_andamento")
+
+    def worker(indice, capitulo):
+        titulo = capitulo.get("titulo") or f"Capítulo {indice + 1}"
+        try:
+            with generation_slot(db, user_id, plan_limit):
+                _set_chapter(db, ebook_id, indice, {
+                             "status": CHAPTER_RUNNING, "iniciado_em": utcnow()})
+                conteudo = generate_chapter_content(
+                    titulo, capitulo.get("subtemas"), metadata.get("titulo"),
+                    provider, version, ai_service=ai_service, raise_errors=True)
+        except Exception as e:
+            _set_chapter(db, ebook_id, indice, {
+                "status": CHAPTER_ERROR, "erro": str(e), "concluido_em": utcnow()})
+            return False
+
+        _set_chapter(db, ebook_id, indice, {
+            "status": CHAPTER_DONE, "conteudo": conteudo, "erro": None,
+            "concluido_em": utcnow()})
+        return True
+
+    concluidos = erros = 0
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(worker, indice, capitulo)
+                   for indice, capitulo in pendentes]
+        for future in as_completed(futures):
+            if future.result():
+                concluidos += 1
+            else:
+                erros += 1
+
+    update_ebook_status(ebook_id, "Conteúdo",
+                        "concluido" if erros == 0 else "falha")
+    logger.info(
+        f"Capítulos do eBook {ebook_id} gerados: {concluidos} concluídos, {erros} com erro "
+        f"({workers} em paralelo)")
+    return {"total": len(pendentes), "concluidos": concluidos, "erros": erros,
+            "concorrencia": workers}
+
+
+def generate_image_prompt(capitulo, conteudo=None, provider='chatgpt', version='v4', ai_service=None):
     """
     Gera um prompt de descrição para criação de imagem relacionada ao capítulo.
 
@@ -255,12 +470,13 @@ def generate_image_prompt(capitulo, conteudo=None, provider='chatgpt', version='
         conteudo (str, optional): Conteúdo do capítulo para contexto
         provider (str): Provedor de IA a ser usado
         version (str): Versão do provedor
+        ai_service (GenAIService, optional): Instância já configurada (reutilizada entre capítulos)
 
     Returns:
         str: Descrição detalhada para geração de imagem
     """
     try:
-        ai_service = get_ai_service(provider, version)
+        ai_service = ai_service or get_ai_service(provider, version)
 
         context = ""
         if conteudo:
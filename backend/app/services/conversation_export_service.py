@@ -0,0 +1,434 @@
+# backend/app/services/conversation_export_service.py
+"""
+Exportação e importação de conversas em NDJSON (opcionalmente em ZIP).
+
+A exportação é gerada em streaming a partir de cursores do MongoDB: cada
+mensagem é lida com $unwind e escrita como uma linha NDJSON, de modo que o
+consumo de memória do worker não depende do tamanho das conversas. No formato
+ZIP os arquivos anexados são copiados em blocos para dentro do arquivo.
+
+Formato NDJSON (uma linha por registro, na ordem abaixo para cada conversa):
+    {"type": "conversation", "id": ..., "title": ..., ...}
+    {"type": "message", "conversation_id": ..., "sender": ..., "text": ...}
+    {"type": "upload", "conversation_id": ..., "id": ..., "archive_path": ...}
+"""
+import io
+import json
+import logging
+import os
+import zipfile
+from bson import ObjectId
+from app.db import get_db
+from app.utils.helpers import JSONEncoder
+from app.utils.date_utils import to_datetime, utcnow
+from app.services.archive_service import iter_archived_messages
+from app.services.upload_service import store_upload, schedule_ingest
+
+logger = logging.getLogger(__name__)
+
+NDJSON_ENTRY_NAME = "conversations.ndjson"
+ZIP_FILES_DIR = "files"
+CURSOR_BATCH_SIZE = 100
+IMPORT_BATCH_SIZE = 200
+FILE_CHUNK_SIZE = 64 * 1024
+
+CONVERSATION_DATE_FIELDS = ("created_at", "updated_at")
+MESSAGE_DATE_FIELDS = ("timestamp",)
+UPLOAD_DATE_FIELDS = ("created_at",)
+# Campos de upload aceitos do pacote; os demais (caminhos, hash, resultado da
+# ingestão) são derivados do arquivo extraído
+UPLOAD_IMPORT_FIELDS = ("original_filename", "file_type", "upload_type", "created_at")
+UPLOAD_TYPES = ("file", "image")
+
+
+class _ZipStream:
+    """
+    Destino de escrita sem seek para o zipfile.
+
+    O zipfile detecta que o destino não suporta seek e passa a usar data
+    descriptors, permitindo gerar o ZIP em streaming: os bytes escritos são
+    acumulados aqui e drenados pelo gerador após cada bloco.
+    """
+
+    def __init__(self):
+        self._chunks = []
+        self._offset = 0
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._offset += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._offset
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def _dumps(record):
+    """Serializa um registro como uma linha NDJSON"""
+    return json.dumps(record, cls=JSONEncoder, ensure_ascii=False) + "\n"
+
+
+def _export_query(user_id, conversation_id=None):
+    query = {"user_id": user_id}
+    if conversation_id:
+        query["_id"] = ObjectId(conversation_id)
+    return query
+
+
+def _uploads_query(user_id, conversation_id=None):
+    if conversation_id:
+        return {"user_id": user_id, "conversation_id": conversation_id}
+    return {"user_id": user_id, "conversation_id": {"$nin": [None, ""]}}
+
+
+def _upload_archive_path(upload):
+    return f"{ZIP_FILES_DIR}/{upload['_id']}/{upload.get('filename', 'arquivo')}"
+
+
+def iter_conversation_records(user_id, conversation_id=None, include_archive_paths=False):
+    """
+    Gera os registros de exportação (dicts) usando cursores do servidor.
+
+    Args:
+        user_id (str): ID do usuário dono das conversas
+        conversation_id (str, optional): Exporta apenas esta conversa
+        include_archive_paths (bool): Inclui o caminho do arquivo dentro do ZIP
+
+    Yields:
+        dict: Registros do tipo conversation, message e upload
+    """
+    db = get_db()
+    conversations = db.conversations.find(
+        _export_query(user_id, conversation_id),
+        {"history": 0},
+        batch_size=CURSOR_BATCH_SIZE
+    ).sort("created_at", 1)
+
+    for conversation in conversations:
+        conv_id = conversation.pop("_id")
+        archived = conversation.pop("archived", False)
+        # Campos internos da camada de arquivo não fazem parte da exportação
+        conversation.pop("archived_at", None)
+        conversation.pop("rehydrated_at", None)
+        conversation.pop("message_count", None)
+        record = {"type": "conversation", "id": str(conv_id)}
+        record.update(conversation)
+        yield record
+
+        if archived:
+            # Conversas arquivadas são lidas do arquivo sem reidratação
+            messages = iter_archived_messages(conv_id, db=db)
+        else:
+            # $unwind devolve uma mensagem por documento, sem carregar o histórico inteiro
+            messages = db.conversations.aggregate([
+                {"$match": {"_id": conv_id}},
+                {"$unwind": "$history"},
+                {"$replaceRoot": {"newRoot": "$history"}}
+            ], batchSize=CURSOR_BATCH_SIZE)
+        for message in messages:
+            message.pop("_id", None)
+            record = {"type": "message", "conversation_id": str(conv_id)}
+            record.update(message)
+            yield record
+
+        uploads = db.uploads.find(
+            {"conversation_id": str(conv_id)}, batch_size=CURSOR_BATCH_SIZE)
+        for upload in uploads:
+            record = {"type": "upload", "id": str(upload["_id"])}
+            if include_archive_paths:
+                record["archive_path"] = _upload_archive_path(upload)
+            upload.pop("_id")
+            upload.pop("file_path", None)
+            # A referência ao blob é refeita na importação, a partir do arquivo
+            upload.pop("content_hash", None)
+            record.update(upload)
+            yield record
+
+
+def stream_ndjson(user_id, conversation_id=None):
+    """
+    Gera a exportação em NDJSON, linha a linha.
+
+    Yields:
+        str: Linhas NDJSON
+    """
+    for record in iter_conversation_records(user_id, conversation_id):
+        yield _dumps(record)
+
+
+def stream_zip(user_id, conversation_id=None):
+    """
+    Gera a exportação em ZIP (NDJSON + arquivos anexados) em streaming.
+
+    Yields:
+        bytes: Blocos do arquivo ZIP
+    """
+    sink = _ZipStream()
+    with zipfile.ZipFile(sink, mode="w", compression=zipfile.ZIP_DEFLATED) as archive:
+        with archive.open(NDJSON_ENTRY_NAME, mode="w") as entry:
+            for record in iter_conversation_records(
+                    user_id, conversation_id, include_archive_paths=True):
+                entry.write(_dumps(record).encode("utf-8"))
+                data = sink.drain()
+                if data:
+                    yield data
+
+        # Segunda passagem: copia os arquivos anexados em blocos
+        db = get_db()
+        uploads = db.uploads.find(
+            _uploads_query(user_id, conversation_id),
+            {"_id": 1, "filename": 1, "file_path": 1},
+            batch_size=CURSOR_BATCH_SIZE
+        )
+        for upload in uploads:
+            file_path = upload.get("file_path")
+            if not file_path or not os.path.exists(file_path):
+                logger.warning(
+                    f"Arquivo do upload {upload['_id']} não encontrado para exportação")
+                continue
+
+            with open(file_path, "rb") as source, \
+                    archive.open(_upload_archive_path(upload), mode="w") as entry:
+                while True:
+                    chunk = source.read(FILE_CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    entry.write(chunk)
+                    data = sink.drain()
+                    if data:
+                        yield data
+
+    data = sink.drain()
+    if data:
+        yield data
+
+
+def _parse_dates(document, fields):
+    for field in fields:
+        if field in document:
+            document[field] = to_datetime(document[field]) or utcnow()
+
+
+class _ConversationImporter:
+    """
+    Reconstrói conversas a partir de registros NDJSON e insere em lotes.
+
+    As mensagens de uma conversa devem vir logo após o registro da conversa
+    (ordem gerada pela exportação). Conversas e uploads recebem novos IDs, e as
+    referências entre eles (files, conversation_id) são reescritas. Uploads
+    só são registrados com o arquivo presente no pacote e passam pela ingestão.
+    """
+
+    def __init__(self, db, user_id=None, archive=None, batch_size=IMPORT_BATCH_SIZE):
+        self.db = db
+        self.user_id = user_id
+        self.archive = archive
+        self.batch_size = batch_size
+        self.current = None
+        self.current_source_id = None
+        self.conversation_ids = {}
+        self.upload_ids = {}
+        self.conversations_batch = []
+        self.uploads_batch = []
+        self.stats = {"conversations": 0, "messages": 0,
+                      "uploads": 0, "files": 0, "skipped": 0}
+
+    def feed(self, record):
+        record_type = record.pop("type", None)
+        if record_type == "conversation":
+            self._start_conversation(record)
+        elif record_type == "message":
+            self._add_message(record)
+        elif record_type == "upload":
+            self._add_upload(record)
+        else:
+            self.stats["skipped"] += 1
+
+    def _start_conversation(self, record):
+        self._finish_conversation()
+
+        source_id = record.pop("id", None) or str(ObjectId())
+        new_id = ObjectId()
+        self.conversation_ids[source_id] = new_id
+
+        record["_id"] = new_id
+        record["user_id"] = self.user_id or record.get("user_id")
+        record["history"] = []
+        record.setdefault("files", [])
+        record.setdefault("title", "Nova conversa")
+        record.setdefault("last_message", "")
+        _parse_dates(record, CONVERSATION_DATE_FIELDS)
+        record.setdefault("created_at", utcnow())
+        record.setdefault("updated_at", record["created_at"])
+
+        self.current = record
+        self.current_source_id = source_id
+
+    def _add_message(self, record):
+        source_id = record.pop("conversation_id", None)
+        if self.current is None or source_id != self.current_source_id:
+            self.stats["skipped"] += 1
+            return
+
+        _parse_dates(record, MESSAGE_DATE_FIELDS)
+        self.current["history"].append(record)
+        self.stats["messages"] += 1
+
+    def _add_upload(self, record):
+        source_conversation_id = record.get("conversation_id")
+        new_conversation_id = self.conversation_ids.get(source_conversation_id)
+        original_filename = record.get("original_filename") or record.get("filename")
+        if not new_conversation_id or not isinstance(original_filename, str):
+            self.stats["skipped"] += 1
+            return
+
+        # Sem o arquivo no pacote não há upload a registrar
+        blob = self._extract_file(original_filename, record.get("archive_path"))
+        if not blob:
+            self.stats["skipped"] += 1
+            return
+
+        upload = {field: record[field] for field in UPLOAD_IMPORT_FIELDS if field in record}
+        if upload.get("upload_type") not in UPLOAD_TYPES:
+            upload["upload_type"] = "file"
+        if not isinstance(upload.get("file_type"), str):
+            upload["file_type"] = None
+        _parse_dates(upload, UPLOAD_DATE_FIELDS)
+
+        new_id = ObjectId()
+        if record.get("id"):
+            self.upload_ids[record["id"]] = str(new_id)
+        upload.update({
+            "_id": new_id,
+            "user_id": self.user_id or record.get("user_id"),
+            "conversation_id": str(new_conversation_id),
+            "original_filename": original_filename,
+            # Arquivos repetidos no pacote (ou já existentes) são armazenados uma vez
+            "filename": os.path.basename(blob["path"]),
+            "file_path": blob["path"],
+            "file_size": blob["size"],
+            "content_hash": blob["hash"],
+            # O arquivo importado passa pela ingestão como um upload novo
+            "ingest_status": "pendente",
+        })
+        upload.setdefault("created_at", utcnow())
+
+        self.uploads_batch.append(upload)
+        self.stats["uploads"] += 1
+        if len(self.uploads_batch) >= self.batch_size:
+            self._flush_uploads()
+
+    def _extract_file(self, original_filename, archive_path):
+        """Copia o arquivo do ZIP para o armazenamento de uploads em blocos"""
+        if not self.archive or not isinstance(archive_path, str):
+            return None
+
+        try:
+            with self.archive.open(archive_path) as source:
+                blob = store_upload(source, original_filename)
+        except KeyError:
+            logger.warning(
+                f"Arquivo '{archive_path}' ausente no pacote de importação")
+            return None
+
+        self.stats["files"] += 1
+        return blob
+
+    def _finish_conversation(self):
+        if self.current is None:
+            return
+
+        # Reescreve as referências de arquivos para os novos IDs de upload
+        files = []
+        for reference in self.current.get("files", []):
+            if not isinstance(reference, dict):
+                continue
+            new_file_id = self.upload_ids.get(reference.get("file_id"))
+            if new_file_id:
+                reference["file_id"] = new_file_id
+                _parse_dates(reference, ("added_at",))
+                files.append(reference)
+        self.current["files"] = files
+
+        self.conversations_batch.append(self.current)
+        self.stats["conversations"] += 1
+        self.current = None
+        self.current_source_id = None
+
+        if len(self.conversations_batch) >= self.batch_size:
+            self._flush_conversations()
+
+    def _flush_conversations(self):
+        if self.conversations_batch:
+            self.db.conversations.insert_many(
+                self.conversations_batch, ordered=False)
+            self.conversations_batch = []
+
+    def _flush_uploads(self):
+        if self.uploads_batch:
+            self.db.uploads.insert_many(self.uploads_batch, ordered=False)
+            for upload in self.uploads_batch:
+                schedule_ingest(upload["_id"], upload["original_filename"])
+            self.uploads_batch = []
+
+    def close(self):
+        # Uploads da última conversa são conhecidos antes de fechá-la
+        self._finish_conversation()
+        self._flush_conversations()
+        self._flush_uploads()
+        return self.stats
+
+
+def _iter_records(lines):
+    for line in lines:
+        if isinstance(line, bytes):
+            line = line.decode("utf-8")
+        line = line.strip()
+        if not line:
+            continue
+        yield json.loads(line)
+
+
+def import_ndjson(lines, user_id=None, archive=None):
+    """
+    Importa conversas a partir de linhas NDJSON, inserindo com insert_many em lotes.
+
+    Args:
+        lines: Iterável de linhas (str ou bytes)
+        user_id (str, optional): Dono das conversas importadas (sobrescreve o original)
+        archive (zipfile.ZipFile, optional): Pacote com os arquivos anexados
+
+    Returns:
+        dict: Contadores da importação
+    """
+    importer = _ConversationImporter(get_db(), user_id=user_id, archive=archive)
+    for record in _iter_records(lines):
+        importer.feed(record)
+    stats = importer.close()
+    logger.info(f"Importação de conversas concluída: {stats}")
+    return stats
+
+
+def import_zip(fileobj, user_id=None):
+    """
+    Importa um pacote ZIP gerado por stream_zip.
+
+    Args:
+        fileobj: Arquivo com suporte a seek contendo o ZIP
+        user_id (str, optional): Dono das conversas importadas
+
+    Returns:
+        dict: Contadores da importação
+    """
+    with zipfile.ZipFile(fileobj) as archive:
+        with archive.open(NDJSON_ENTRY_NAME) as entry:
+            return import_ndjson(io.TextIOWrapper(entry, encoding="utf-8"),
+                                 user_id=user_id, archive=archive)
@@ -0,0 +1,241 @@
+# backend/app/services/conversation_summary_service.py
+"""
+Geração de títulos e resumos de conversas em segundo plano.
+
+Após a primeira troca de mensagens, um título é gerado para conversas que ainda
+usam o título padrão; a cada N turnos um resumo compacto (rolling summary) é
+atualizado. As tarefas rodam na fila de baixa prioridade do Celery com um
+modelo barato e são "debounced" por conversa: cada agendamento grava um token
+na conversa e apenas a tarefa com o token mais recente é executada.
+"""
+import os
+import uuid
+import logging
+from bson import ObjectId
+from app.db import get_db
+from app.services.genai_service import GenAIService
+from app.utils.date_utils import utcnow
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TITLE = "Nova conversa"
+
+# Modelo barato usado pelas tarefas de segundo plano
+BACKGROUND_PROVIDER = os.environ.get('BACKGROUND_AI_PROVIDER', 'chatgpt')
+BACKGROUND_PROVIDER_VERSION = os.environ.get(
+    'BACKGROUND_AI_VERSION', 'v35_turbo')
+BACKGROUND_MAX_TOKENS = int(os.environ.get('BACKGROUND_AI_MAX_TOKENS', 256))
+
+# Um turno = mensagem do usuário + resposta da IA
+SUMMARY_EVERY_N_TURNS = int(os.environ.get('SUMMARY_EVERY_N_TURNS', 10))
+TITLE_DEBOUNCE_SECONDS = int(os.environ.get('TITLE_DEBOUNCE_SECONDS', 5))
+SUMMARY_DEBOUNCE_SECONDS = int(os.environ.get('SUMMARY_DEBOUNCE_SECONDS', 60))
+
+MAX_TITLE_LENGTH = 60
+MAX_SUMMARY_INPUT_CHARS = 6000
+
+
+def get_background_provider_config():
+    """
+    Busca a configuração do provider usado pelas tarefas de segundo plano.
+
+    Returns:
+        dict: Configuração da versão do provider ou None se não configurado
+    """
+    db = get_db()
+    provider_doc = db.providers.find_one(
+        {"name": BACKGROUND_PROVIDER.lower()}, {"_id": 0})
+    if not provider_doc:
+        return None
+
+    versions = provider_doc.get("versions")
+    if versions:
+        config = versions.get(BACKGROUND_PROVIDER_VERSION) or next(
+            iter(versions.values()), None)
+    else:
+        config = provider_doc
+
+    if config:
+        config = dict(config)
+        config["max_tokens"] = BACKGROUND_MAX_TOKENS
+    return config
+
+
+def _ask_background_model(prompt):
+    config = get_background_provider_config()
+    if not config:
+        raise ValueError(
+            f"Provider '{BACKGROUND_PROVIDER}' não está configurado para tarefas em segundo plano.")
+
+    genai = GenAIService(provider_config=config)
+    return genai.chat(BACKGROUND_PROVIDER, prompt, version=BACKGROUND_PROVIDER_VERSION)
+
+
+def _format_messages(messages, limit=MAX_SUMMARY_INPUT_CHARS):
+    lines = []
+    for message in messages:
+        sender = "Usuário" if message.get("sender") == "user" else "Assistente"
+        lines.append(f"{sender}: {message.get('text', '')}")
+    text = "\n".join(lines)
+    return text[-limit:]
+
+
+def generate_title_text(messages):
+    """
+    Gera um título curto para a conversa a partir da primeira troca.
+
+    Args:
+        messages (list): Mensagens do histórico (primeira troca)
+
+    Returns:
+        str: Título gerado
+    """
+    prompt = (
+        "Crie um título curto (no máximo 6 palavras) para a conversa abaixo. "
+        "Responda apenas com o título, sem aspas nem pontuação final.\n\n"
+        f"{_format_messages(messages, limit=2000)}"
+    )
+    title = _ask_background_model(prompt).strip().strip('"\'').strip()
+    title = title.splitlines()[0] if title else ""
+    return title[:MAX_TITLE_LENGTH]
+
+
+def generate_rolling_summary(previous_summary, new_messages):
+    """
+    Atualiza o resumo da conversa com as mensagens desde o último resumo.
+
+    Args:
+        previous_summary (str): Resumo anterior (pode ser vazio)
+        new_messages (list): Mensagens ainda não resumidas
+
+    Returns:
+        str: Novo resumo compacto
+    """
+    previous = previous_summary or "(sem resumo anterior)"
+    prompt = (
+        "Você mantém um resumo compacto de uma conversa. Atualize o resumo "
+        "anterior com as novas mensagens, preservando fatos, decisões e "
+        "pendências importantes. Use no máximo 120 palavras.\n\n"
+        f"Resumo anterior:\n{previous}\n\n"
+        f"Novas mensagens:\n{_format_messages(new_messages)}"
+    )
+    return _ask_background_model(prompt).strip()
+
+
+def _schedule(conversation_id, job, task, countdown):
+    """Grava o token de debounce e agenda a tarefa com atraso"""
+    token = uuid.uuid4().hex
+    db = get_db()
+    db.conversations.update_one(
+        {"_id": ObjectId(conversation_id)},
+        {"$set": {f"background_jobs.{job}": {
+            "token": token, "scheduled_at": utcnow()}}}
+    )
+    task.apply_async(args=[conversation_id, token], countdown=countdown)
+
+
+def schedule_background_jobs(conversation_id, title, message_count):
+    """
+    Agenda as tarefas de título e resumo após uma nova troca de mensagens.
+
+    Falhas no agendamento (ex.: broker indisponível) não afetam o chat.
+
+    Args:
+        conversation_id (str): ID da conversa
+        title (str): Título atual da conversa
+        message_count (int): Total de mensagens no histórico após a troca
+    """
+    try:
+        from app.tasks.conversation_tasks import (
+            generate_conversation_title, update_conversation_summary
+        )
+
+        if title == DEFAULT_TITLE and message_count >= 2:
+            _schedule(conversation_id, "title",
+                      generate_conversation_title, TITLE_DEBOUNCE_SECONDS)
+
+        turns = message_count // 2
+        if SUMMARY_EVERY_N_TURNS > 0 and turns and turns % SUMMARY_EVERY_N_TURNS == 0:
+            _schedule(conversation_id, "summary",
+                      update_conversation_summary, SUMMARY_DEBOUNCE_SECONDS)
+    except Exception as e:
+        logger.warning(
+            f"Não foi possível agendar tarefas da conversa {conversation_id}: {str(e)}")
+
+
+def is_current_job(conversation, job, token):
+    """Verifica se o token é o do agendamento mais recente (debounce)"""
+    current = (conversation.get("background_jobs") or {}).get(job) or {}
+    return current.get("token") == token
+
+
+def apply_generated_title(conversation_id, token):
+    """
+    Gera e grava o título da conversa, se ela ainda usar o título padrão.
+
+    Returns:
+        str: Título gerado ou None se a tarefa foi descartada
+    """
+    db = get_db()
+    conversation = db.conversations.find_one(
+        {"_id": ObjectId(conversation_id)},
+        {"title": 1, "background_jobs": 1, "history": {"$slice": 2}}
+    )
+    if not conversation or not is_current_job(conversation, "title", token):
+        return None
+    if conversation.get("title") != DEFAULT_TITLE:
+        return None
+
+    title = generate_title_text(conversation.get("history", []))
+    if not title:
+        return None
+
+    # O filtro pelo título padrão evita sobrescrever uma renomeação do usuário
+    db.conversations.update_one(
+        {"_id": ObjectId(conversation_id), "title": DEFAULT_TITLE},
+        {"$set": {"title": title, "title_generated_at": utcnow()},
+         "$unset": {"background_jobs.title": ""}}
+    )
+    logger.info(f"Título gerado para a conversa {conversation_id}: '{title}'")
+    return title
+
+
+def apply_rolling_summary(conversation_id, token):
+    """
+    Atualiza o resumo da conversa com as mensagens ainda não resumidas.
+
+    Returns:
+        str: Resumo gerado ou None se a tarefa foi descartada
+    """
+    db = get_db()
+    conversation = db.conversations.find_one(
+        {"_id": ObjectId(conversation_id)},
+        {"summary": 1, "summary_message_count": 1, "background_jobs": 1}
+    )
+    if not conversation or not is_current_job(conversation, "summary", token):
+        return None
+
+    summarized = conversation.get("summary_message_count", 0)
+    new_messages = db.conversations.find_one(
+        {"_id": ObjectId(conversation_id)},
+        {"history": {"$slice": [summarized, 10 ** 6]}, "_id": 0}
+    ).get("history", [])
+    if not new_messages:
+        return None
+
+    summary = generate_rolling_summary(
+        conversation.get("summary"), new_messages)
+    # O token deixa de existir se o histórico for limpo durante a geração
+    result = db.conversations.update_one(
+        {"_id": ObjectId(conversation_id), "background_jobs.summary.token": token},
+        {"$set": {
+            "summary": summary,
+            "summary_message_count": summarized + len(new_messages),
+            "summary_updated_at": utcnow()
+        },
+            "$unset": {"background_jobs.summary": ""}}
+    )
+    if not result.matched_count:
+        return None
+    logger.info(f"Resumo atualizado para a conversa {conversation_id}")
+    return summary
@@ -0,0 +1,548 @@
+# backend/app/services/document_index_service.py
+"""
+Extração de texto e índice de busca dos documentos anexados às conversas.
+
+Cada arquivo enviado (pdf, docx, xlsx, csv...) é processado uma única vez por
+conteúdo, em segundo plano (tarefa documents.index): o texto é extraído,
+dividido em trechos e cada trecho recebe um embedding. O resultado fica na
+coleção document_texts, indexada pelo SHA-256 do blob, e é compartilhado por
+todos os uploads com o mesmo conteúdo:
+
+    _id         SHA-256 do conteúdo
+    status      pendente, em_andamento, concluido, falha ou nao_suportado
+                (formato sem extrator; definitivo, sem novas tentativas)
+    path, ext   Arquivo de origem (para reagendar a extração)
+    attempts    Tentativas de extração; falhas são repetidas com backoff
+                até INDEX_MAX_ATTEMPTS (retry_at)
+    chunks      Lista de trechos de texto
+    embeddings  Matriz float32 (len(chunks) x dim) serializada
+    embedder    Modelo que gerou os embeddings
+    truncated   Presente quando os trechos finais foram descartados para que
+                o registro caiba no limite de documento do MongoDB (16MB)
+
+Na conversa, os embeddings dos documentos anexados formam uma matriz única
+(mantida em memória enquanto os anexos não mudarem) e a busca por cosseno é
+um produto matriz-vetor no NumPy. Apenas os top-k trechos mais relevantes para
+a mensagem entram no slot {{ context }} do prompt.
+
+O embedder padrão (hashing) não depende de serviços externos; com
+DOCUMENT_EMBEDDER=openai os embeddings são gerados pela API da OpenAI.
+"""
+import os
+import re
+import csv
+import zlib
+import logging
+from datetime import timedelta
+from threading import Lock
+from collections import OrderedDict
+import numpy as np
+from bson import ObjectId, Binary
+from pymongo import ReturnDocument
+from app.db import get_db
+from app.utils.date_utils import utcnow
+
+try:
+    import fitz  # pymupdf
+except ImportError:
+    fitz = None
+
+try:
+    import openai
+except ImportError:
+    openai = None
+
+logger = logging.getLogger(__name__)
+
+DOCUMENT_COLLECTION = "document_texts"
+CHUNK_CHARS = 1200
+CHUNK_OVERLAP = 200
+MAX_CHUNKS = int(os.environ.get('DOCUMENT_MAX_CHUNKS', 2000))
+# Trechos + embeddings de um documento (o MongoDB limita cada registro a 16MB)
+MAX_DOCUMENT_BYTES = int(os.environ.get('DOCUMENT_MAX_BYTES', 12 * 1024 * 1024))
+# Estimativa do overhead BSON de cada trecho na lista
+CHUNK_OVERHEAD_BYTES = 16
+HASHING_DIM = 512
+TOP_K = int(os.environ.get('DOCUMENT_CONTEXT_TOP_K', 4))
+MIN_SCORE = 0.1
+MAX_CONTEXT_CHARS = 6000
+# Reserva do documento durante a extração (workers concorrentes)
+EXTRACTION_LEASE_SECONDS = 600
+INDEX_MAX_ATTEMPTS = int(os.environ.get('DOCUMENT_INDEX_MAX_ATTEMPTS', 5))
+# Espera antes de repetir uma extração que falhou (dobra a cada tentativa)
+INDEX_RETRY_BASE_SECONDS = 60
+# Documento pendente sem extração iniciada (ex.: falha ao agendar a tarefa)
+SCHEDULE_STALE_SECONDS = 900
+MAX_CACHED_INDEXES = 128
+
+EMBEDDER = os.environ.get('DOCUMENT_EMBEDDER', 'hashing')
+OPENAI_EMBEDDING_MODEL = os.environ.get(
+    'DOCUMENT_EMBEDDING_MODEL', 'text-embedding-3-small')
+OPENAI_BATCH_SIZE = 64
+
+TEXT_EXTENSIONS = {'txt', 'json', 'xml', 'md'}
+
+
+class UnsupportedFormatError(ValueError):
+    """Formato de arquivo sem extrator de texto (falha definitiva)"""
+
+
+_indexes = OrderedDict()
+_indexes_lock = Lock()
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+
+# --------------------------
+# Extração
+# --------------------------
+
+def _read_text(path):
+    with open(path, "r", encoding="utf-8", errors="replace") as f:
+        return f.read()
+
+
+def _extract_pdf(path):
+    if fitz is not None:
+        with fitz.open(path) as pdf:
+            return "\n\n".join(page.get_text() for page in pdf)
+    from PyPDF2 import PdfReader
+    return "\n\n".join(page.extract_text() or "" for page in PdfReader(path).pages)
+
+
+def _extract_docx(path):
+    import docx
+    document = docx.Document(path)
+    parts = [p.text for p in document.paragraphs if p.text.strip()]
+    for table in document.tables:
+        for row in table.rows:
+            parts.append("\t".join(cell.text.strip() for cell in row.cells))
+    return "\n\n".join(parts)
+
+
+def _extract_xlsx(path):
+    from openpyxl import load_workbook
+    workbook = load_workbook(path, read_only=True, data_only=True)
+    try:
+        sheets = []
+        for sheet in workbook.worksheets:
+            rows = ["\t".join("" if v is None else str(v) for v in row)
+                    for row in sheet.iter_rows(values_only=True) if any(v is not None for v in row)]
+            sheets.append(f"# {sheet.title}\n" + "\n".join(rows))
+        return "\n\n".join(sheets)
+    finally:
+        workbook.close()
+
+
+def _extract_xls(path):
+    import xlrd
+    workbook = xlrd.open_workbook(path)
+    sheets = []
+    for sheet in workbook.sheets():
+        rows = ["\t".join(str(v) for v in sheet.row_values(i)) for i in range(sheet.nrows)]
+        sheets.append(f"# {sheet.name}\n" + "\n".join(rows))
+    return "\n\n".join(sheets)
+
+
+def _extract_csv(path):
+    with open(path, "r", encoding="utf-8", errors="replace", newline="") as f:
+        return "\n".join("\t".join(row) for row in csv.reader(f))
+
+
+EXTRACTORS = {
+    "pdf": _extract_pdf,
+    "docx": _extract_docx,
+    "xlsx": _extract_xlsx,
+    "xls": _extract_xls,
+    "csv": _extract_csv,
+}
+
+
+def is_supported(ext):
+    """Indica se há extrator de texto para a extensão"""
+    ext = (ext or "").lower()
+    return ext in TEXT_EXTENSIONS or ext in EXTRACTORS
+
+
+def extract_text(path, ext):
+    """
+    Extrai o texto de um arquivo.
+
+    Raises:
+        UnsupportedFormatError: Formato não suportado (ex.: doc)
+    """
+    ext = (ext or "").lower()
+    if ext in TEXT_EXTENSIONS:
+        return _read_text(path)
+    extractor = EXTRACTORS.get(ext)
+    if not extractor:
+        raise UnsupportedFormatError(f"Formato não suportado para extração de texto: {ext}")
+    return extractor(path)
+
+
+def split_chunks(text, size=CHUNK_CHARS, overlap=CHUNK_OVERLAP):
+    """
+    Divide o texto em trechos de até `size` caracteres, respeitando parágrafos,
+    com `overlap` caracteres repetidos entre trechos consecutivos.
+    """
+    text = re.sub(r"[ \t\r\f\v]+", " ", text or "")
+    # Parágrafos longos são quebrados deixando espaço para a sobreposição
+    unit_size = size - overlap
+    units = []
+    for paragraph in re.split(r"\n\s*\n", text):
+        paragraph = paragraph.strip()
+        while len(paragraph) > unit_size:
+            cut = paragraph.rfind(" ", 0, unit_size)
+            cut = cut if cut > unit_size // 2 else unit_size
+            units.append(paragraph[:cut])
+            paragraph = paragraph[cut:].strip()
+        if paragraph:
+            units.append(paragraph)
+
+    chunks = []
+    current = ""
+    for unit in units:
+        if current and len(current) + len(unit) + 2 > size:
+            chunks.append(current)
+            tail = current[-overlap:] if overlap else ""
+            # A sobreposição começa no início de uma palavra
+            current = tail[tail.find(" ") + 1:] if " " in tail else tail
+        current = f"{current}\n\n{unit}" if current else unit
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+# --------------------------
+# Embeddings
+# --------------------------
+
+def _hashing_embed(texts, dim=HASHING_DIM):
+    """Embeddings por feature hashing de palavras e bigramas (sem serviço externo)"""
+    matrix = np.zeros((len(texts), dim), dtype=np.float32)
+    for row, text in enumerate(texts):
+        tokens = _TOKEN_RE.findall(text.lower())
+        features = tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]
+        if not features:
+            continue
+        hashes = np.fromiter(
+            (zlib.crc32(f.encode("utf-8")) for f in features),
+            dtype=np.uint32, count=len(features))
+        signs = np.where(hashes & 0x80000000, -1.0, 1.0)
+        counts = np.bincount(hashes % dim, weights=signs, minlength=dim)
+        # Frequência sublinear para que termos repetidos não dominem o trecho
+        matrix[row] = np.sign(counts) * np.log1p(np.abs(counts))
+    return matrix
+
+
+def _openai_embed(texts):
+    if openai is None:
+        raise RuntimeError("Pacote openai não instalado")
+    client = openai.OpenAI(api_key=os.environ.get('OPENAI_API_KEY'))
+    vectors = []
+    for start in range(0, len(texts), OPENAI_BATCH_SIZE):
+        response = client.embeddings.create(
+            model=OPENAI_EMBEDDING_MODEL,
+            input=texts[start:start + OPENAI_BATCH_SIZE])
+        vectors.extend(item.embedding for item in response.data)
+    return np.asarray(vectors, dtype=np.float32)
+
+
+def embedder_name():
+    return f"openai:{OPENAI_EMBEDDING_MODEL}" if EMBEDDER == "openai" else f"hashing:{HASHING_DIM}"
+
+
+def embed(texts):
+    """
+    Gera embeddings normalizados (norma L2 = 1) para uma lista de textos.
+
+    Returns:
+        numpy.ndarray: Matriz float32 (len(texts) x dim)
+    """
+    matrix = _openai_embed(texts) if EMBEDDER == "openai" else _hashing_embed(texts)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+# --------------------------
+# Indexação (tarefa em segundo plano)
+# --------------------------
+
+def _retry_delay(attempts):
+    return timedelta(seconds=INDEX_RETRY_BASE_SECONDS * 2 ** max(attempts - 1, 0))
+
+
+def _requeue_query(now):
+    """Documentos que precisam de uma nova tarefa de extração"""
+    return {"$or": [
+        {"status": "falha", "attempts": {"$lt": INDEX_MAX_ATTEMPTS},
+         "retry_at": {"$lte": now}},
+        {"status": "pendente",
+         "scheduled_at": {"$not": {"$gte": now - timedelta(seconds=SCHEDULE_STALE_SECONDS)}}},
+        # Worker interrompido durante a extração
+        {"status": "em_andamento", "attempts": {"$lt": INDEX_MAX_ATTEMPTS},
+         "lease_until": {"$lt": now}},
+    ]}
+
+
+def _enqueue(db, content_hash, path, ext):
+    from app.tasks.document_tasks import index_document_task
+    try:
+        index_document_task.delay(content_hash, path, ext)
+        return True
+    except Exception as e:
+        logger.error(f"Erro ao agendar a indexação do documento {content_hash}: {str(e)}")
+        # Sem scheduled_at o documento é reagendado na próxima oportunidade
+        db[DOCUMENT_COLLECTION].update_one(
+            {"_id": content_hash, "status": "pendente"}, {"$unset": {"scheduled_at": ""}})
+        return False
+
+
+def _requeue(db, content_hash, path=None, ext=None):
+    """Reagenda um documento falho (após o backoff) ou sem tarefa em execução"""
+    now = utcnow()
+    fields = {"status": "pendente", "scheduled_at": now}
+    if path:
+        fields.update({"path": path, "ext": ext})
+    document = db[DOCUMENT_COLLECTION].find_one_and_update(
+        dict(_requeue_query(now), _id=content_hash),
+        {"$set": fields, "$unset": {"lease_until": ""}},
+        return_document=ReturnDocument.AFTER
+    )
+    if document and document.get("path"):
+        _enqueue(db, content_hash, document["path"], document.get("ext"))
+    return document
+
+
+def schedule_document(upload):
+    """
+    Agenda a extração do texto de um upload, se o conteúdo ainda não foi indexado.
+
+    Um documento já registrado é reagendado se a extração falhou (respeitando o
+    backoff) ou se ficou pendente sem tarefa (ex.: broker indisponível).
+
+    Args:
+        upload (dict): Registro da coleção uploads (com content_hash)
+    """
+    content_hash = upload.get("content_hash")
+    if not content_hash or upload.get("upload_type") != "file":
+        return
+    path = upload["file_path"]
+    ext = os.path.splitext(upload.get("original_filename") or "")[1].lstrip(".")
+    now = utcnow()
+
+    db = get_db()
+    if not is_supported(ext):
+        # Nada a extrair: registrado como definitivo, sem tarefa
+        db[DOCUMENT_COLLECTION].update_one(
+            {"_id": content_hash},
+            {"$setOnInsert": {"status": "nao_suportado", "created_at": now,
+                              "attempts": 0, "path": path, "ext": ext}},
+            upsert=True
+        )
+        return
+
+    result = db[DOCUMENT_COLLECTION].update_one(
+        {"_id": content_hash},
+        {"$setOnInsert": {"status": "pendente", "created_at": now, "scheduled_at": now,
+                          "attempts": 0, "path": path, "ext": ext}},
+        upsert=True
+    )
+    if result.upserted_id is None:
+        _requeue(db, content_hash, path, ext)
+        return
+    _enqueue(db, content_hash, path, ext)
+
+
+def reschedule_documents(limit=500):
+    """
+    Reagenda as extrações falhas ou interrompidas (tarefa documents.reschedule).
+
+    Returns:
+        int: Número de documentos reagendados
+    """
+    db = get_db()
+    now = utcnow()
+    # Extrações interrompidas sem tentativas restantes ficam como falha
+    db[DOCUMENT_COLLECTION].update_many(
+        {"status": "em_andamento", "lease_until": {"$lt": now},
+         "attempts": {"$gte": INDEX_MAX_ATTEMPTS}},
+        {"$set": {"status": "falha", "error": "Extração interrompida", "completed_at": now},
+         "$unset": {"lease_until": ""}})
+    documents = db[DOCUMENT_COLLECTION].find(
+        _requeue_query(now), {"_id": 1}).limit(limit)
+    return sum(1 for document in list(documents) if _requeue(db, document["_id"]))
+
+
+def _claim(db, content_hash):
+    now = utcnow()
+    return db[DOCUMENT_COLLECTION].find_one_and_update(
+        {"_id": content_hash,
+         "$or": [{"status": "pendente"},
+                 {"status": "em_andamento", "lease_until": {"$lt": now},
+                  "attempts": {"$lt": INDEX_MAX_ATTEMPTS}}]},
+        {"$set": {"status": "em_andamento", "started_at": now,
+                  "lease_until": now + timedelta(seconds=EXTRACTION_LEASE_SECONDS)},
+         "$inc": {"attempts": 1}},
+        return_document=ReturnDocument.AFTER
+    )
+
+
+def _fit_document(chunks, matrix):
+    """
+    Mantém os primeiros trechos cujo texto e embeddings cabem em MAX_DOCUMENT_BYTES.
+
+    Returns:
+        tuple: (trechos, matriz) possivelmente truncados
+    """
+    row_bytes = matrix.shape[1] * matrix.itemsize if chunks else 0
+    total = 0
+    for count, chunk in enumerate(chunks):
+        total += len(chunk.encode("utf-8")) + CHUNK_OVERHEAD_BYTES + row_bytes
+        if total > MAX_DOCUMENT_BYTES:
+            return chunks[:count], matrix[:count]
+    return chunks, matrix
+
+
+def index_document(content_hash, path, ext):
+    """
+    Extrai, divide e gera os embeddings de um documento (uma vez por conteúdo).
+
+    Returns:
+        dict: Resumo da indexação ou None se outro worker já a realizou
+    """
+    db = get_db()
+    claimed = _claim(db, content_hash)
+    if not claimed:
+        return None
+
+    try:
+        chunks = split_chunks(extract_text(path, ext))[:MAX_CHUNKS]
+        matrix = embed(chunks) if chunks else np.zeros((0, 0), dtype=np.float32)
+    except UnsupportedFormatError as e:
+        logger.warning(f"Documento {content_hash} sem extração de texto: {str(e)}")
+        db[DOCUMENT_COLLECTION].update_one(
+            {"_id": content_hash},
+            {"$set": {"status": "nao_suportado", "error": str(e), "completed_at": utcnow()},
+             "$unset": {"lease_until": "", "retry_at": ""}})
+        return {"hash": content_hash, "error": str(e)}
+    except Exception as e:
+        logger.error(f"Erro ao indexar documento {content_hash}: {str(e)}")
+        now = utcnow()
+        db[DOCUMENT_COLLECTION].update_one(
+            {"_id": content_hash},
+            {"$set": {"status": "falha", "error": str(e), "completed_at": now,
+                      "retry_at": now + _retry_delay(claimed.get("attempts", 1))},
+             "$unset": {"lease_until": ""}})
+        return {"hash": content_hash, "error": str(e)}
+
+    fitted, matrix = _fit_document(chunks, matrix)
+    update = {"$set": {
+        "status": "concluido",
+        "chunks": fitted,
+        "embeddings": Binary(matrix.tobytes()),
+        "dim": int(matrix.shape[1]) if fitted else 0,
+        "embedder": embedder_name(),
+        "completed_at": utcnow()
+    }, "$unset": {"lease_until": "", "error": "", "retry_at": "", "truncated": ""}}
+    if len(fitted) < len(chunks):
+        logger.warning(
+            f"Documento {content_hash} truncado: {len(fitted)} de {len(chunks)} trechos")
+        update["$set"]["truncated"] = True
+        del update["$unset"]["truncated"]
+    db[DOCUMENT_COLLECTION].update_one({"_id": content_hash}, update)
+    logger.info(f"Documento {content_hash} indexado ({len(fitted)} trechos)")
+    return {"hash": content_hash, "trechos": len(fitted)}
+
+
+# --------------------------
+# Busca na conversa
+# --------------------------
+
+def _conversation_documents(db, conversation):
+    file_ids = [ObjectId(f["file_id"]) for f in conversation.get("files", [])
+                if f.get("file_id") and ObjectId.is_valid(f["file_id"])]
+    if not file_ids:
+        return {}
+    names = {}
+    for upload in db.uploads.find(
+            {"_id": {"$in": file_ids}, "content_hash": {"$exists": True}},
+            {"content_hash": 1, "original_filename": 1}):
+        names.setdefault(upload["content_hash"], upload.get("original_filename"))
+    return names
+
+
+def _load_index(db, conversation_id, names):
+    """Matriz de embeddings dos documentos da conversa (em cache por anexos)"""
+    signature = (embedder_name(),) + tuple(sorted(names))
+    with _indexes_lock:
+        cached = _indexes.get(conversation_id)
+        if cached and cached[0] == signature:
+            _indexes.move_to_end(conversation_id)
+            return cached[1], cached[2]
+
+    matrices, refs = [], []
+    for doc in db[DOCUMENT_COLLECTION].find(
+            {"_id": {"$in": list(names)}, "status": "concluido",
+             "embedder": embedder_name()}):
+        if not doc.get("chunks"):
+            continue
+        matrices.append(np.frombuffer(doc["embeddings"], dtype=np.float32)
+                        .reshape(len(doc["chunks"]), doc["dim"]))
+        refs.extend((names[doc["_id"]], text) for text in doc["chunks"])
+    matrix = np.vstack(matrices) if matrices else None
+
+    # Documentos ainda em processamento não entram no cache
+    if len(matrices) == len(names):
+        with _indexes_lock:
+            _indexes[conversation_id] = (signature, matrix, refs)
+            while len(_indexes) > MAX_CACHED_INDEXES:
+                _indexes.popitem(last=False)
+    return matrix, refs
+
+
+def search_conversation(conversation, query, top_k=TOP_K, db=None):
+    """
+    Busca os trechos dos documentos da conversa mais similares à consulta.
+
+    Returns:
+        list: [(nome do arquivo, trecho, similaridade)] em ordem decrescente
+    """
+    if not query or not conversation.get("files"):
+        return []
+    db = db or get_db()
+    names = _conversation_documents(db, conversation)
+    if not names:
+        return []
+    matrix, refs = _load_index(db, str(conversation["_id"]), names)
+    if matrix is None or not refs:
+        return []
+
+    scores = matrix @ embed([query])[0]
+    k = min(top_k, len(refs))
+    best = np.argpartition(-scores, k - 1)[:k]
+    best = best[np.argsort(-scores[best])]
+    return [(refs[i][0], refs[i][1], float(scores[i])) for i in best if scores[i] >= MIN_SCORE]
+
+
+def build_context(conversation, message, db=None):
+    """
+    Monta o contexto do prompt com os trechos relevantes dos anexos.
+
+    Returns:
+        str: Trechos formatados (vazio se nada relevante)
+    """
+    try:
+        results = search_conversation(conversation, message, db=db)
+    except Exception as e:
+        logger.warning(f"Erro na busca nos documentos da conversa: {str(e)}")
+        return ""
+
+    parts, total = [], 0
+    for filename, text, _ in results:
+        part = f"[{filename}]\n{text}"
+        if total + len(part) > MAX_CONTEXT_CHARS:
+            break
+        parts.append(part)
+        total += len(part)
+    return "\n\n---\n\n".join(parts)
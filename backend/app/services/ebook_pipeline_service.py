@@ -0,0 +1,467 @@
+# backend/app/services/ebook_pipeline_service.py
+"""
+Orquestrador do pipeline de geração de eBooks.
+
+Executa as seis etapas definidas em create_ebook (Título → Capítulos →
+Conteúdo → Imagens → Design → Exportação) como uma cadeia de tarefas Celery.
+O estado fica em ebooks.pipeline, com um checkpoint por etapa:
+
+    pipeline.status              em_andamento | concluido | falha
+    pipeline.options             Parâmetros da execução (provider, formatos...)
+    pipeline.stages.<etapa>      status, iniciado_em, concluido_em, duracao_ms,
+                                 tentativas, erro, resultado
+
+Etapas concluídas são puladas ao retomar o pipeline, e dentro das etapas de
+conteúdo e imagens cada capítulo tem seu próprio checkpoint
+(metadata.capitulos.<i>.status / imagem_id), de modo que uma falha não
+regenera o que já foi produzido. Conteúdo e imagens dos capítulos são gerados
+em paralelo.
+
+A exportação pelo Canva termina fora da cadeia: a etapa fica "aguardando" e é
+concluída por complete_export_stage quando as exportações terminam. O pipeline
+e a geração avulsa de capítulos (geracao_capitulos) não rodam ao mesmo tempo.
+"""
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from app.db import get_db
+from app.utils.date_utils import utcnow
+from app.services.ebook_service import get_ebook, update_ebook_status, update_ebook_metadata
+from app.services.content_service import (
+    generate_titles, generate_chapters, generate_ebook_chapters,
+    generate_image_prompt, get_ai_service, get_generation_concurrency
+)
+
+logger = logging.getLogger(__name__)
+
+# (chave, nome da etapa em ebooks.etapas)
+STAGES = [
+    ("titulo", "Título"),
+    ("capitulos", "Capítulos"),
+    ("conteudo", "Conteúdo"),
+    ("imagens", "Imagens"),
+    ("design", "Design"),
+    ("exportacao", "Exportação"),
+]
+STAGE_NAMES = dict(STAGES)
+
+STAGE_DONE = "concluido"
+STAGE_SKIPPED = "ignorado"
+STAGE_RUNNING = "em_andamento"
+STAGE_WAITING = "aguardando"
+STAGE_FAILED = "falha"
+
+DEFAULT_OPTIONS = {
+    "provider": "chatgpt",
+    "version": "v4",
+    "image_service": "openai",
+    "image_size": "1024x1024",
+    "qtd_capitulos": 5,
+    "template_id": None,
+    "formatos": ["pdf"],
+}
+
+
+class StageError(Exception):
+    """Falha de uma etapa do pipeline"""
+
+
+def _set_pipeline(db, ebook_id, fields, query=None):
+    update = {f"pipeline.{key}": value for key, value in fields.items()}
+    update["updated_at"] = utcnow()
+    selector = {"ebook_id": ebook_id}
+    selector.update(query or {})
+    return db.ebooks.update_one(selector, {"$set": update})
+
+
+def start_pipeline(ebook_id, options=None, force=False):
+    """
+    Prepara (ou retoma) o pipeline de um eBook.
+
+    Args:
+        ebook_id (str): ID do eBook
+        options (dict, optional): Opções da execução (mescladas às anteriores)
+        force (bool): Ignora uma execução marcada como em andamento
+
+    Returns:
+        list: Chaves das etapas que ainda precisam rodar, ou None se já houver
+            uma execução (do pipeline ou da geração de capítulos) em andamento
+    """
+    db = get_db()
+    ebook = db.ebooks.find_one({"ebook_id": ebook_id}, {"_id": 0, "pipeline": 1})
+    if ebook is None:
+        raise ValueError(f"eBook {ebook_id} não encontrado.")
+
+    pipeline = ebook.get("pipeline") or {}
+    merged = dict(DEFAULT_OPTIONS)
+    merged.update(pipeline.get("options") or {})
+    merged.update({k: v for k, v in (options or {}).items() if v is not None})
+
+    query = {} if force else {"pipeline.status": {"$ne": STAGE_RUNNING},
+                              "geracao_capitulos.status": {"$ne": STAGE_RUNNING}}
+    result = _set_pipeline(db, ebook_id, {
+        "status": STAGE_RUNNING,
+        "options": merged,
+        "iniciado_em": utcnow(),
+        "concluido_em": None,
+        "erro": None
+    }, query=query)
+    if result.matched_count == 0:
+        return None
+
+    stages = pipeline.get("stages") or {}
+    return [key for key, _ in STAGES
+            if (stages.get(key) or {}).get("status") not in (STAGE_DONE, STAGE_SKIPPED)]
+
+
+def set_pipeline_task(ebook_id, task_id):
+    """Registra o ID da cadeia de tarefas Celery do pipeline"""
+    _set_pipeline(get_db(), ebook_id, {"task_id": task_id})
+
+
+def finish_pipeline(ebook_id):
+    """
+    Marca o pipeline como concluído (última tarefa da cadeia).
+
+    Com a exportação aguardando o Canva o pipeline continua em andamento;
+    complete_export_stage o conclui.
+
+    Returns:
+        bool: True se o pipeline foi concluído
+    """
+    result = _set_pipeline(get_db(), ebook_id, {
+        "status": STAGE_DONE, "concluido_em": utcnow()},
+        query={"pipeline.status": STAGE_RUNNING,
+               "pipeline.stages.exportacao.status": {"$ne": STAGE_WAITING}})
+    return result.matched_count > 0
+
+
+def fail_pipeline(ebook_id, erro):
+    """Marca o pipeline como falho (ex.: broker indisponível ao agendar)"""
+    _set_pipeline(get_db(), ebook_id, {
+        "status": STAGE_FAILED, "erro": erro, "concluido_em": utcnow()})
+
+
+def get_pipeline(ebook_id):
+    """
+    Retorna o estado do pipeline de um eBook, com as etapas na ordem de execução.
+
+    Returns:
+        dict: Estado do pipeline ou None se o eBook não existir
+    """
+    db = get_db()
+    ebook = db.ebooks.find_one({"ebook_id": ebook_id}, {"_id": 0, "pipeline": 1})
+    if ebook is None:
+        return None
+
+    pipeline = ebook.get("pipeline") or {}
+    stages = pipeline.get("stages") or {}
+    return {
+        "status": pipeline.get("status", "pendente"),
+        "task_id": pipeline.get("task_id"),
+        "options": pipeline.get("options"),
+        "iniciado_em": pipeline.get("iniciado_em"),
+        "concluido_em": pipeline.get("concluido_em"),
+        "erro": pipeline.get("erro"),
+        "etapas": [dict({"etapa": key, "nome": name, "status": "pendente"},
+                        **(stages.get(key) or {}))
+                   for key, name in STAGES]
+    }
+
+
+def run_stage(ebook_id, stage):
+    """
+    Executa uma etapa do pipeline com checkpoint e medição de tempo.
+
+    Args:
+        ebook_id (str): ID do eBook
+        stage (str): Chave da etapa (titulo, capitulos, ...)
+
+    Returns:
+        dict: Checkpoint gravado para a etapa
+
+    Raises:
+        StageError: Se a etapa falhar (interrompe a cadeia)
+    """
+    db = get_db()
+    ebook = get_ebook(ebook_id)
+    if not ebook:
+        raise StageError(f"eBook {ebook_id} não encontrado.")
+
+    pipeline = ebook.get("pipeline") or {}
+    checkpoint = (pipeline.get("stages") or {}).get(stage) or {}
+    if checkpoint.get("status") in (STAGE_DONE, STAGE_SKIPPED):
+        return checkpoint
+
+    options = dict(DEFAULT_OPTIONS)
+    options.update(pipeline.get("options") or {})
+
+    prefix = f"stages.{stage}"
+    started_at = utcnow()
+    _set_pipeline(db, ebook_id, {
+        f"{prefix}.status": STAGE_RUNNING,
+        f"{prefix}.iniciado_em": started_at,
+        f"{prefix}.tentativas": checkpoint.get("tentativas", 0) + 1,
+        f"{prefix}.erro": None,
+        "status": STAGE_RUNNING
+    })
+    update_ebook_status(ebook_id, STAGE_NAMES[stage], "em_andamento")
+
+    started = time.perf_counter()
+    try:
+        status, result = STAGE_RUNNERS[stage](ebook, options)
+    except Exception as e:
+        duration_ms = int((time.perf_counter() - started) * 1000)
+        _set_pipeline(db, ebook_id, {
+            f"{prefix}.status": STAGE_FAILED,
+            f"{prefix}.erro": str(e),
+            f"{prefix}.duracao_ms": duration_ms,
+            f"{prefix}.concluido_em": utcnow(),
+            "status": STAGE_FAILED,
+            "erro": f"{STAGE_NAMES[stage]}: {str(e)}"
+        })
+        update_ebook_status(ebook_id, STAGE_NAMES[stage], "falha")
+        logger.error(
+            f"Etapa '{stage}' do eBook {ebook_id} falhou após {duration_ms} ms: {str(e)}")
+        raise StageError(str(e))
+
+    duration_ms = int((time.perf_counter() - started) * 1000)
+    if status == STAGE_WAITING:
+        _set_pipeline(db, ebook_id, {
+            f"{prefix}.status": status,
+            f"{prefix}.resultado": result
+        })
+        logger.info(
+            f"Etapa '{stage}' do eBook {ebook_id} aguardando processamento externo")
+        # A exportação pode ter terminado antes do checkpoint ser gravado
+        return complete_export_stage(ebook_id) or \
+            dict(checkpoint, status=status, resultado=result)
+
+    checkpoint = {
+        "status": status,
+        "iniciado_em": started_at,
+        "duracao_ms": duration_ms,
+        "concluido_em": utcnow(),
+        "resultado": result
+    }
+    _set_pipeline(db, ebook_id, {
+        f"{prefix}.status": status,
+        f"{prefix}.duracao_ms": duration_ms,
+        f"{prefix}.concluido_em": checkpoint["concluido_em"],
+        f"{prefix}.resultado": result
+    })
+    update_ebook_status(ebook_id, STAGE_NAMES[stage], "concluido")
+    logger.info(
+        f"Etapa '{stage}' do eBook {ebook_id} concluída em {duration_ms} ms")
+    return checkpoint
+
+
+# --------------------------
+# Etapas
+# --------------------------
+
+def _stage_title(ebook, options):
+    metadata = ebook.get("metadata") or {}
+    if metadata.get("titulo"):
+        return STAGE_SKIPPED, {"titulo": metadata["titulo"]}
+
+    titulos = generate_titles(
+        ebook.get("tema"), options["provider"], options["version"], qtd=1)
+    if not titulos:
+        raise StageError("Nenhum título foi gerado.")
+
+    update_ebook_metadata(ebook["ebook_id"], {"titulo": titulos[0]})
+    return STAGE_DONE, {"titulo": titulos[0]}
+
+
+def _stage_chapters(ebook, options):
+    metadata = ebook.get("metadata") or {}
+    if metadata.get("capitulos"):
+        return STAGE_SKIPPED, {"capitulos": len(metadata["capitulos"])}
+
+    capitulos = generate_chapters(
+        metadata.get("titulo"), ebook.get("tema"), options["provider"],
+        options["version"], qtd=options["qtd_capitulos"])
+    if not capitulos:
+        raise StageError("Nenhum capítulo foi gerado.")
+
+    update_ebook_metadata(ebook["ebook_id"], {"capitulos": capitulos})
+    return STAGE_DONE, {"capitulos": len(capitulos)}
+
+
+def _stage_content(ebook, options):
+    result = generate_ebook_chapters(
+        ebook["ebook_id"], options["provider"], options["version"],
+        user_id=ebook.get("user_id"), only_pending=True)
+    if result["erros"]:
+        raise StageError(
+            f"{result['erros']} capítulo(s) falharam; a etapa pode ser retomada.")
+    return STAGE_DONE, result
+
+
+def _stage_images(ebook, options):
+    from app.services.image_service import generate_image
+
+    ebook_id = ebook["ebook_id"]
+    capitulos = (ebook.get("metadata") or {}).get("capitulos") or []
+    pendentes = [(indice, capitulo) for indice, capitulo in enumerate(capitulos)
+                 if not capitulo.get("imagem_id")]
+    if not pendentes:
+        return STAGE_SKIPPED, {"imagens": len(capitulos)}
+
+    db = get_db()
+    ai_service = get_ai_service(options["provider"], options["version"])
+
+    def worker(indice, capitulo):
+        titulo = capitulo.get("titulo") or f"Capítulo {indice + 1}"
+        descricao = generate_image_prompt(
+            titulo, capitulo.get("conteudo"), options["provider"],
+            options["version"], ai_service=ai_service)
+        image = generate_image(
+            descricao, options["image_service"], options["image_size"])
+        if not image:
+            raise StageError(f"Falha ao gerar a imagem do capítulo '{titulo}'.")
+
+        # Checkpoint por capítulo: imagens prontas não são geradas novamente
+        db.ebooks.update_one(
+            {"ebook_id": ebook_id},
+            {"$set": {
+                f"metadata.capitulos.{indice}.imagem_id": image["image_id"],
+                f"metadata.capitulos.{indice}.imagem_url": image["url"],
+                f"metadata.capitulos.{indice}.imagem_prompt": descricao,
+                "updated_at": utcnow()
+            },
+                "$push": {"metadata.imagens": {
+                    "capitulo": indice, "image_id": image["image_id"]}}}
+        )
+        return image["image_id"]
+
+    geradas = erros = 0
+    workers = get_generation_concurrency(ebook.get("user_id"))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(worker, indice, capitulo)
+                   for indice, capitulo in pendentes]
+        for future in as_completed(futures):
+            try:
+                future.result()
+                geradas += 1
+            except Exception as e:
+                erros += 1
+                logger.error(f"Erro ao gerar imagem do eBook {ebook_id}: {str(e)}")
+
+    if erros:
+        raise StageError(
+            f"{erros} imagem(ns) falharam; a etapa pode ser retomada.")
+    return STAGE_DONE, {"geradas": geradas, "concorrencia": workers}
+
+
+def _stage_design(ebook, options):
+    from app.services.canva_service import apply_template
+
+    metadata = ebook.get("metadata") or {}
+    if metadata.get("design_id"):
+        return STAGE_SKIPPED, {"design_id": metadata["design_id"]}
+
+    template_id = options.get("template_id") or metadata.get("template_id")
+    if not template_id:
+        # Sem template do Canva a exportação usa os renderizadores locais
+        return STAGE_SKIPPED, {"design_id": None}
+
+    design = apply_template(ebook["ebook_id"], template_id)
+    if not design:
+        raise StageError(f"Falha ao aplicar o template {template_id}.")
+    return STAGE_DONE, {"design_id": design.get("design_id")}
+
+
+def _stage_export(ebook, options):
+    from app.services.export_service import export_ebook
+
+    exports = []
+    for formato in options.get("formatos") or ["pdf"]:
+        export = export_ebook(ebook["ebook_id"], formato)
+        if not export:
+            raise StageError(f"Falha ao exportar o eBook em {formato}.")
+        exports.append({"formato": formato, "export_id": export["export_id"]})
+
+    # Exportações do Canva terminam depois (finish_remote_export)
+    if any(export.get("status") != STAGE_DONE for export in _load_exports(exports)):
+        return STAGE_WAITING, {"exports": exports}
+    return STAGE_DONE, {"exports": exports}
+
+
+def _load_exports(exports):
+    ids = [export["export_id"] for export in exports]
+    found = {export["export_id"]: export for export in get_db().exports.find(
+        {"export_id": {"$in": ids}}, {"_id": 0, "export_id": 1, "status": 1, "error": 1})}
+    return [found.get(export_id) or {"export_id": export_id} for export_id in ids]
+
+
+def complete_export_stage(ebook_id):
+    """
+    Conclui a etapa de exportação que aguardava exportações assíncronas.
+
+    Chamado pelo export_service ao concluir ou falhar uma exportação. Só tem
+    efeito quando todas as exportações da etapa terminaram.
+
+    Returns:
+        dict: Checkpoint gravado ou None se a etapa ainda aguarda
+    """
+    db = get_db()
+    ebook = db.ebooks.find_one(
+        {"ebook_id": ebook_id, "pipeline.stages.exportacao.status": STAGE_WAITING},
+        {"_id": 0, "pipeline.stages.exportacao": 1})
+    if not ebook:
+        return None
+
+    checkpoint = ebook["pipeline"]["stages"]["exportacao"]
+    exports = _load_exports((checkpoint.get("resultado") or {}).get("exports") or [])
+    statuses = {export.get("status") for export in exports}
+    if statuses - {STAGE_DONE, STAGE_FAILED}:
+        return None
+
+    now = utcnow()
+    started_at = checkpoint.get("iniciado_em")
+    fields = {
+        "stages.exportacao.concluido_em": now,
+        "stages.exportacao.duracao_ms":
+            int((now - started_at).total_seconds() * 1000) if started_at else None
+    }
+    if STAGE_FAILED in statuses:
+        erro = next(export.get("error") for export in exports
+                    if export.get("status") == STAGE_FAILED) or "Falha na exportação."
+        fields.update({
+            "stages.exportacao.status": STAGE_FAILED,
+            "stages.exportacao.erro": erro,
+            "status": STAGE_FAILED,
+            "erro": f"{STAGE_NAMES['exportacao']}: {erro}",
+            "concluido_em": now
+        })
+    else:
+        fields.update({
+            "stages.exportacao.status": STAGE_DONE,
+            "status": STAGE_DONE,
+            "concluido_em": now
+        })
+
+    # Apenas uma das exportações concluídas fecha a etapa
+    result = _set_pipeline(db, ebook_id, fields, query={
+        "pipeline.stages.exportacao.status": STAGE_WAITING})
+    if result.matched_count == 0:
+        return None
+
+    status = fields["stages.exportacao.status"]
+    update_ebook_status(ebook_id, STAGE_NAMES["exportacao"], status)
+    logger.info(f"Etapa 'exportacao' do eBook {ebook_id}: {status}")
+    return {"status": status, "concluido_em": now,
+            "duracao_ms": fields["stages.exportacao.duracao_ms"],
+            "resultado": checkpoint.get("resultado")}
+
+
+STAGE_RUNNERS = {
+    "titulo": _stage_title,
+    "capitulos": _stage_chapters,
+    "conteudo": _stage_content,
+    "imagens": _stage_images,
+    "design": _stage_design,
+    "exportacao": _stage_export,
+}
@@ -0,0 +1,516 @@
+# backend/app/services/ebook_render_service.py
+"""
+Renderizadores de eBooks (HTML, PDF, EPUB e DOCX).
+
+A renderização acontece em duas fases:
+
+1. build_document (no processo que atende a exportação): monta uma
+   representação intermediária (IR) uma única vez — o Markdown de cada
+   capítulo é convertido para HTML e as imagens são resolvidas para arquivos
+   locais (apenas dentro de static/images). Cada capítulo é gravado em disco (chapter-NNN.md/.html) e a IR em
+   si guarda apenas caminhos, então seu tamanho não depende do livro.
+
+2. render (no pool de processos): cada formato é escrito a partir da IR,
+   capítulo a capítulo. HTML é gravado em streaming; o PDF é renderizado por
+   capítulo com weasyprint e concatenado com PyMuPDF, de modo que o layout de
+   apenas um capítulo fica em memória por vez. EPUB (ebooklib) e DOCX
+   (python-docx) são exceções: as bibliotecas montam o livro inteiro, com as
+   imagens, em memória antes de gravar o arquivo. Para esses formatos os
+   capítulos, as imagens e o livro têm tamanho máximo (ver _in_memory_chapters).
+
+Os arquivos gerados não referenciam o sistema de arquivos do servidor: o HTML
+embute as imagens como data URIs e o weasyprint só carrega as imagens dos
+capítulos (demais URLs do conteúdo gerado são recusadas).
+
+O trabalho de CPU roda em um ProcessPoolExecutor mantido aquecido (weasyprint
+e demais bibliotecas são importados na inicialização dos processos). Onde não é
+possível criar processos filhos (ex.: dentro de um worker prefork do Celery),
+a renderização acontece no próprio processo.
+"""
+import os
+import html
+import json
+import base64
+import hashlib
+import mimetypes
+import atexit
+import shutil
+import logging
+import pathlib
+import tempfile
+import itertools
+from concurrent.futures import ProcessPoolExecutor
+from threading import Lock
+from urllib.parse import urlparse, unquote
+
+logger = logging.getLogger(__name__)
+
+# Incrementar quando a saída dos renderizadores mudar (invalida o cache de exportações)
+RENDERER_VERSION = "3"
+
+RENDER_WORKERS = int(os.environ.get('EXPORT_RENDER_WORKERS', 2))
+RENDER_TIMEOUT = int(os.environ.get('EXPORT_RENDER_TIMEOUT', 600))
+IMAGE_STORAGE_PATH = "static/images"
+
+# Limites dos formatos montados inteiramente em memória (EPUB e DOCX)
+IN_MEMORY_MAX_CHAPTER_BYTES = int(os.environ.get('EXPORT_MAX_CHAPTER_BYTES', 2 * 1024 * 1024))
+IN_MEMORY_MAX_IMAGE_BYTES = int(os.environ.get('EXPORT_MAX_IMAGE_BYTES', 5 * 1024 * 1024))
+IN_MEMORY_MAX_BOOK_BYTES = int(os.environ.get('EXPORT_MAX_BOOK_BYTES', 64 * 1024 * 1024))
+
+MARKDOWN_EXTENSIONS = ["extra", "sane_lists", "toc"]
+
+BOOK_CSS = """
+body { font-family: Georgia, serif; line-height: 1.5; margin: 0 auto; max-width: 42em; }
+h1.book-title { text-align: center; margin-top: 30%; }
+p.book-theme { text-align: center; font-style: italic; }
+section.chapter { page-break-before: always; }
+section.chapter img { max-width: 100%; display: block; margin: 1em auto; }
+"""
+
+_pool = None
+_pool_lock = Lock()
+
+
+# --------------------------
+# Representação intermediária
+# --------------------------
+
+def _resolve_image(capitulo):
+    from app.services.image_service import get_image_path
+
+    image_id = capitulo.get("imagem_id")
+    if not image_id:
+        return None
+    path = get_image_path(image_id)
+    return _image_file(path) if path else None
+
+
+def _image_file(path):
+    """Caminho absoluto de uma imagem, ou None se estiver fora de static/images"""
+    root = os.path.realpath(IMAGE_STORAGE_PATH)
+    path = os.path.realpath(path)
+    if os.path.commonpath([root, path]) != root or not os.path.isfile(path):
+        return None
+    return path
+
+
+def build_document(ebook, workdir):
+    """
+    Monta a representação intermediária do eBook em um diretório de trabalho.
+
+    Args:
+        ebook (dict): Documento do eBook
+        workdir (str): Diretório onde os capítulos serão gravados
+
+    Returns:
+        dict: IR com título, tema e, por capítulo, os caminhos do Markdown,
+            do HTML e da imagem
+    """
+    import markdown
+
+    metadata = ebook.get("metadata") or {}
+    converter = markdown.Markdown(extensions=MARKDOWN_EXTENSIONS)
+    chapters = []
+
+    for indice, capitulo in enumerate(metadata.get("capitulos") or []):
+        titulo = capitulo.get("titulo") or f"Capítulo {indice + 1}"
+        conteudo = capitulo.get("conteudo")
+        if not conteudo:
+            subtemas = capitulo.get("subtemas") or []
+            conteudo = "\n".join(f"- {subtema}" for subtema in subtemas)
+
+        md_path = os.path.join(workdir, f"chapter-{indice:03d}.md")
+        html_path = os.path.join(workdir, f"chapter-{indice:03d}.html")
+        with open(md_path, "w", encoding="utf-8") as f:
+            f.write(conteudo)
+        with open(html_path, "w", encoding="utf-8") as f:
+            f.write(converter.reset().convert(conteudo))
+
+        chapters.append({
+            "indice": indice,
+            "titulo": titulo,
+            "markdown": md_path,
+            "html": html_path,
+            "imagem": _resolve_image(capitulo)
+        })
+
+    document = {
+        "titulo": metadata.get("titulo") or "eBook Sem Título",
+        "tema": ebook.get("tema", ""),
+        "autor": metadata.get("autor") or "AdamChat",
+        "idioma": metadata.get("idioma") or "pt-BR",
+        "capitulos": chapters
+    }
+    with open(os.path.join(workdir, "document.json"), "w", encoding="utf-8") as f:
+        json.dump(document, f, ensure_ascii=False)
+    return document
+
+
+def _file_url(path):
+    return pathlib.Path(path).as_uri() if path else None
+
+
+def _image_type(path):
+    """Tipo MIME e extensão de uma imagem, pelo conteúdo do arquivo"""
+    media_type = None
+    try:
+        from PIL import Image
+        with Image.open(path) as image:
+            media_type = Image.MIME.get(image.format)
+    except Exception:
+        pass
+    media_type = media_type or mimetypes.guess_type(path)[0] or "image/png"
+    extension = mimetypes.guess_extension(media_type) or ".png"
+    return media_type, ".jpg" if extension in (".jpe", ".jpeg") else extension
+
+
+def _data_uri(path):
+    if not path:
+        return None
+    media_type, _ = _image_type(path)
+    with open(path, "rb") as f:
+        return f"data:{media_type};base64,{base64.b64encode(f.read()).decode('ascii')}"
+
+
+def _url_fetcher(allowed):
+    """
+    url_fetcher do weasyprint que só carrega as imagens dos capítulos.
+
+    O conteúdo dos capítulos vem do modelo de IA; sem esta restrição um
+    <img src="file:///etc/passwd"> ou uma URL interna seria lida pelo servidor.
+    """
+    def fetcher(url, *args, **kwargs):
+        parsed = urlparse(url)
+        if parsed.scheme == "file" and os.path.realpath(unquote(parsed.path)) in allowed:
+            from weasyprint import default_url_fetcher
+            return default_url_fetcher(url, *args, **kwargs)
+        raise ValueError(f"URL não permitida na renderização: {url[:200]}")
+
+    return fetcher
+
+
+def _read(path):
+    with open(path, encoding="utf-8") as f:
+        return f.read()
+
+
+def _chapter_html(chapter, image_src=None):
+    parts = [f'<section class="chapter" id="cap-{chapter["indice"]}">',
+             f"<h1>{html.escape(chapter['titulo'])}</h1>"]
+    if image_src:
+        parts.append(
+            f'<img src="{html.escape(image_src)}" alt="{html.escape(chapter["titulo"])}"/>')
+    parts.append(_read(chapter["html"]))
+    parts.append("</section>")
+    return "\n".join(parts)
+
+
+def _html_head(document):
+    return (
+        "<!DOCTYPE html>\n"
+        f'<html lang="{html.escape(document["idioma"])}"><head><meta charset="utf-8"/>'
+        f"<title>{html.escape(document['titulo'])}</title>"
+        f"<style>{BOOK_CSS}</style></head><body>\n"
+    )
+
+
+def _cover_html(document):
+    return (
+        f'<h1 class="book-title">{html.escape(document["titulo"])}</h1>\n'
+        f'<p class="book-theme">{html.escape(document["tema"])}</p>\n'
+    )
+
+
+# --------------------------
+# Escritores por formato
+# --------------------------
+
+def write_html(document, filepath):
+    """Grava o eBook em um único HTML, capítulo a capítulo"""
+    with open(filepath, "w", encoding="utf-8") as out:
+        out.write(_html_head(document))
+        out.write(_cover_html(document))
+        for chapter in document["capitulos"]:
+            out.write(_chapter_html(chapter, _data_uri(chapter["imagem"])))
+            out.write("\n")
+        out.write("</body></html>\n")
+
+
+def write_pdf(document, filepath):
+    """
+    Grava o PDF renderizando cada capítulo separadamente (weasyprint) e
+    concatenando as partes com PyMuPDF.
+    """
+    import fitz
+    from weasyprint import HTML
+
+    allowed = {os.path.realpath(chapter["imagem"])
+               for chapter in document["capitulos"] if chapter["imagem"]}
+    url_fetcher = _url_fetcher(allowed)
+
+    workdir = tempfile.mkdtemp(prefix="pdf-")
+    try:
+        # Gerador: o HTML de cada parte só é montado quando for renderizado
+        parts = [_html_head(document) + _cover_html(document) + "</body></html>"]
+        parts = itertools.chain(parts, (
+            _html_head(document)
+            + _chapter_html(chapter, _file_url(chapter["imagem"]))
+            + "</body></html>"
+            for chapter in document["capitulos"]))
+
+        output = fitz.open()
+        toc = []
+        for indice, part in enumerate(parts):
+            part_path = os.path.join(workdir, f"part-{indice:03d}.pdf")
+            HTML(string=part, base_url=os.getcwd(),
+                 url_fetcher=url_fetcher).write_pdf(part_path)
+            if indice > 0:
+                # A primeira página de cada parte é o início do capítulo
+                toc.append([1, document["capitulos"][indice - 1]["titulo"],
+                            output.page_count + 1])
+            with fitz.open(part_path) as part_pdf:
+                output.insert_pdf(part_pdf)
+            os.remove(part_path)
+
+        if toc:
+            output.set_toc(toc)
+        output.save(filepath, garbage=3, deflate=True)
+        output.close()
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def _in_memory_chapters(document, source):
+    """
+    Capítulos de um formato montado inteiramente em memória (EPUB e DOCX).
+
+    Diferente do HTML e do PDF, o uso de memória desses formatos cresce com o
+    livro, então os limites são conferidos antes de começar: capítulos acima
+    de IN_MEMORY_MAX_CHAPTER_BYTES e livros acima de IN_MEMORY_MAX_BOOK_BYTES
+    são recusados; imagens acima de IN_MEMORY_MAX_IMAGE_BYTES são omitidas.
+
+    Args:
+        document (dict): IR do eBook
+        source (str): Arquivo do capítulo usado pelo formato (markdown ou html)
+
+    Returns:
+        list: Pares (capítulo, caminho da imagem ou None)
+
+    Raises:
+        ValueError: Se um capítulo ou o livro exceder o limite
+    """
+    chapters = []
+    total = 0
+    for chapter in document["capitulos"]:
+        size = os.path.getsize(chapter[source])
+        if size > IN_MEMORY_MAX_CHAPTER_BYTES:
+            raise ValueError(
+                f"Capítulo '{chapter['titulo']}' grande demais para exportação "
+                f"({size // 1024}KB; máximo {IN_MEMORY_MAX_CHAPTER_BYTES // 1024}KB).")
+
+        image = chapter["imagem"]
+        if image:
+            image_size = os.path.getsize(image)
+            if image_size > IN_MEMORY_MAX_IMAGE_BYTES:
+                logger.warning(
+                    f"Imagem do capítulo '{chapter['titulo']}' omitida na exportação "
+                    f"({image_size // 1024}KB)")
+                image = None
+            else:
+                size += image_size
+
+        total += size
+        if total > IN_MEMORY_MAX_BOOK_BYTES:
+            raise ValueError(
+                f"eBook grande demais para exportação neste formato "
+                f"(máximo {IN_MEMORY_MAX_BOOK_BYTES // (1024 * 1024)}MB).")
+        chapters.append((chapter, image))
+    return chapters
+
+
+def write_epub(document, filepath):
+    """Grava o EPUB com um item XHTML por capítulo (ebooklib, em memória)"""
+    from ebooklib import epub
+
+    book = epub.EpubBook()
+    book.set_identifier("adamchat-" + hashlib.sha1(
+        document["titulo"].encode("utf-8")).hexdigest())
+    book.set_title(document["titulo"])
+    book.set_language(document["idioma"])
+    book.add_author(document["autor"])
+
+    style = epub.EpubItem(uid="style", file_name="style/book.css",
+                          media_type="text/css", content=BOOK_CSS)
+    book.add_item(style)
+
+    spine = ["nav"]
+    toc = []
+    for chapter, image_path in _in_memory_chapters(document, "html"):
+        image_src = None
+        if image_path:
+            media_type, extension = _image_type(image_path)
+            image_name = f"images/cap-{chapter['indice']}{extension}"
+            # EpubImage (ebooklib 0.17) não recebe argumentos no construtor
+            image = epub.EpubImage()
+            image.id = f"img-{chapter['indice']}"
+            image.file_name = image_name
+            image.media_type = media_type
+            with open(image_path, "rb") as f:
+                image.content = f.read()
+            book.add_item(image)
+            image_src = f"../{image_name}"
+
+        item = epub.EpubHtml(title=chapter["titulo"],
+                             file_name=f"text/cap-{chapter['indice']:03d}.xhtml",
+                             lang=document["idioma"])
+        item.content = _chapter_html(chapter, image_src)
+        item.add_item(style)
+        book.add_item(item)
+        spine.append(item)
+        toc.append(item)
+
+    book.toc = toc
+    book.spine = spine
+    book.add_item(epub.EpubNcx())
+    book.add_item(epub.EpubNav())
+    epub.write_epub(filepath, book)
+
+
+def write_docx(document, filepath):
+    """Grava o DOCX a partir do Markdown dos capítulos (python-docx, em memória)"""
+    from docx import Document
+    from docx.shared import Inches
+
+    doc = Document()
+    doc.core_properties.title = document["titulo"]
+    doc.core_properties.author = document["autor"]
+    doc.add_heading(document["titulo"], level=0)
+    if document["tema"]:
+        doc.add_paragraph().add_run(document["tema"]).italic = True
+
+    for chapter, image_path in _in_memory_chapters(document, "markdown"):
+        doc.add_page_break()
+        doc.add_heading(chapter["titulo"], level=1)
+        if image_path:
+            doc.add_picture(image_path, width=Inches(5.5))
+
+        with open(chapter["markdown"], encoding="utf-8") as source:
+            paragraph = []
+            for line in source:
+                line = line.rstrip()
+                if not line:
+                    _flush_paragraph(doc, paragraph)
+                    continue
+                stripped = line.lstrip()
+                if stripped.startswith("#"):
+                    _flush_paragraph(doc, paragraph)
+                    level = len(stripped) - len(stripped.lstrip("#"))
+                    doc.add_heading(stripped.lstrip("#").strip(),
+                                    level=min(level + 1, 9))
+                elif stripped[:2] in ("- ", "* ", "+ "):
+                    _flush_paragraph(doc, paragraph)
+                    doc.add_paragraph(_strip_inline(stripped[2:]),
+                                      style="List Bullet")
+                else:
+                    paragraph.append(_strip_inline(stripped))
+            _flush_paragraph(doc, paragraph)
+
+    doc.save(filepath)
+
+
+def _strip_inline(text):
+    for marker in ("**", "__", "`"):
+        text = text.replace(marker, "")
+    return text
+
+
+def _flush_paragraph(doc, lines):
+    if lines:
+        doc.add_paragraph(" ".join(lines))
+        del lines[:]
+
+
+WRITERS = {
+    "html": write_html,
+    "pdf": write_pdf,
+    "epub": write_epub,
+    "docx": write_docx,
+}
+
+
+# --------------------------
+# Pool de processos
+# --------------------------
+
+def _warm_up():
+    """Importa as bibliotecas pesadas uma única vez por processo do pool"""
+    for module in ("markdown", "weasyprint", "fitz", "ebooklib.epub", "docx"):
+        try:
+            __import__(module)
+        except Exception as e:
+            logger.warning(f"Não foi possível pré-carregar '{module}': {str(e)}")
+
+
+def _render_job(workdir, formato, filepath):
+    with open(os.path.join(workdir, "document.json"), encoding="utf-8") as f:
+        document = json.load(f)
+
+    # Grava em um arquivo temporário e publica com rename atômico
+    partial = f"{filepath}.part"
+    WRITERS[formato](document, partial)
+    os.replace(partial, filepath)
+    return os.path.getsize(filepath)
+
+
+def _get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(
+                max_workers=RENDER_WORKERS, initializer=_warm_up)
+        return _pool
+
+
+def shutdown_pool():
+    """Encerra o pool de renderização"""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False)
+            _pool = None
+
+
+atexit.register(shutdown_pool)
+
+
+def render_ebook(ebook, formato, filepath):
+    """
+    Renderiza um eBook no formato indicado.
+
+    Args:
+        ebook (dict): Documento do eBook
+        formato (str): html, pdf, epub ou docx
+        filepath (str): Caminho final do arquivo
+
+    Returns:
+        int: Tamanho do arquivo gerado em bytes
+
+    Raises:
+        ValueError: Se o formato não for suportado
+    """
+    if formato not in WRITERS:
+        raise ValueError(f"Formato de exportação não suportado: {formato}")
+
+    workdir = tempfile.mkdtemp(prefix="ebook-")
+    try:
+        build_document(ebook, workdir)
+        try:
+            future = _get_pool().submit(_render_job, workdir, formato, filepath)
+        except (AssertionError, OSError, RuntimeError) as e:
+            # Processos daemon (ex.: workers do Celery) não podem criar filhos
+            logger.info(
+                f"Pool de renderização indisponível ({str(e)}); renderizando no processo atual")
+            return _render_job(workdir, formato, filepath)
+        return future.result(timeout=RENDER_TIMEOUT)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
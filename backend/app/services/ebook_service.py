@@ -1,26 +1,29 @@
 # backend/app/services/ebook_service.py
 import uuid
-import time
 from app.db import get_db
+from app.utils.date_utils import utcnow, build_range_filter
 import logging
 
 logger = logging.getLogger(__name__)
 
 
-def create_ebook(tema):
+def create_ebook(tema, user_id=None):
     """
     Cria um novo eBook com o tema especificado.
 
     Args:
         tema (str): O tema principal do eBook
+        user_id (str, optional): Dono do eBook (define o limite de geração do plano)
 
     Returns:
         str: ID único do eBook criado
     """
     ebook_id = str(uuid.uuid4())
+    now = utcnow()
     ebook = {
         "ebook_id": ebook_id,
         "tema": tema,
+        "user_id": user_id,
         "status": "em_andamento",
         "etapas": [
             {"etapa": "Título", "status": "pendente"},
@@ -36,8 +39,8 @@ def create_ebook(tema):
             "imagens": [],
             "template_id": None
         },
-        "created_at": time.time(),
-        "updated_at": time.time()
+        "created_at": now,
+        "updated_at": now
     }
 
     try:
@@ -69,9 +72,26 @@ def get_ebook(ebook_id):
         return None
 
 
+def _chapters_progress(capitulos):
+    """Resume o progresso da geração de conteúdo por capítulo"""
+    itens = [{
+        "indice": indice,
+        "titulo": capitulo.get("titulo"),
+        "status": capitulo.get("status", "pendente"),
+        "erro": capitulo.get("erro")
+    } for indice, capitulo in enumerate(capitulos)]
+
+    return {
+        "total": len(itens),
+        "concluidos": sum(1 for item in itens if item["status"] == "concluido"),
+        "erros": sum(1 for item in itens if item["status"] == "erro"),
+        "itens": itens
+    }
+
+
 def get_ebook_status(ebook_id):
     """
-    Obtém apenas o status e o progresso das etapas de um eBook.
+    Obtém apenas o status e o progresso das etapas (e dos capítulos) de um eBook.
 
     Args:
         ebook_id (str): ID do eBook
@@ -83,12 +103,19 @@ def get_ebook_status(ebook_id):
         db = get_db()
         ebook = db.ebooks.find_one(
             {"ebook_id": ebook_id},
-            {"_id": 0, "status": 1, "etapas": 1}
+            {"_id": 0, "status": 1, "etapas": 1,
+             "metadata.capitulos.titulo": 1, "metadata.capitulos.status": 1,
+             "metadata.capitulos.erro": 1, "geracao_capitulos": 1,
+             "pipeline.status": 1, "pipeline.erro": 1}
         )
         if ebook:
             return {
                 "status": ebook.get("status"),
-                "etapas": ebook.get("etapas", [])
+                "etapas": ebook.get("etapas", []),
+                "capitulos": _chapters_progress(
+                    (ebook.get("metadata") or {}).get("capitulos", [])),
+                "geracao_capitulos": ebook.get("geracao_capitulos"),
+                "pipeline": ebook.get("pipeline")
             }
         return None
     except Exception as e:
@@ -112,7 +139,7 @@ def update_ebook_status(ebook_id, etapa, novo_status):
         db = get_db()
         result = db.ebooks.update_one(
             {"ebook_id": ebook_id, "etapas.etapa": etapa},
-            {"$set": {"etapas.$.status": novo_status, "updated_at": time.time()}}
+            {"$set": {"etapas.$.status": novo_status, "updated_at": utcnow()}}
         )
         return result.modified_count > 0
     except Exception as e:
@@ -133,7 +160,7 @@ def update_ebook_metadata(ebook_id, metadata):
         bool: True se atualizado com sucesso, False caso contrário
     """
     try:
-        update_data = {"updated_at": time.time()}
+        update_data = {"updated_at": utcnow()}
 
         # Adiciona cada campo de metadata ao objeto de atualização
         for key, value in metadata.items():
@@ -165,7 +192,7 @@ def finalize_ebook(ebook_id):
         db = get_db()
         result = db.ebooks.update_one(
             {"ebook_id": ebook_id},
-            {"$set": {"status": "finalizado", "updated_at": time.time()}}
+            {"$set": {"status": "finalizado", "updated_at": utcnow()}}
         )
         return result.modified_count > 0
     except Exception as e:
@@ -173,24 +200,84 @@ def finalize_ebook(ebook_id):
         return False
 
 
-def list_ebooks(limit=10, skip=0):
+def list_ebooks(limit=10, skip=0, since=None, until=None):
     """
     Lista os eBooks criados, com paginação.
 
     Args:
         limit (int): Número máximo de resultados
         skip (int): Número de registros a pular
+        since (datetime, optional): Data mínima de criação
+        until (datetime, optional): Data máxima de criação
 
     Returns:
         list: Lista de eBooks
     """
     try:
+        query = {}
+        created_range = build_range_filter(since, until)
+        if created_range:
+            query["created_at"] = created_range
+
         db = get_db()
         ebooks = list(db.ebooks.find(
-            {},
+            query,
             {"_id": 0}
         ).sort("created_at", -1).skip(skip).limit(limit))
         return ebooks
     except Exception as e:
         logger.error(f"Erro ao listar eBooks: {str(e)}")
         return []
+
+
+def claim_chapter_generation(ebook_id, force=False):
+    """
+    Marca o início de uma geração de capítulos, impedindo execuções simultâneas
+    (inclusive com o pipeline do eBook, que também gera os capítulos).
+
+    Args:
+        ebook_id (str): ID do eBook
+        force (bool): Ignora uma geração marcada como em andamento (ex.: worker interrompido)
+
+    Returns:
+        bool: True se a geração pode ser iniciada
+    """
+    query = {"ebook_id": ebook_id}
+    if not force:
+        query["geracao_capitulos.status"] = {"$ne": "em_andamento"}
+        query["pipeline.status"] = {"$ne": "em_andamento"}
+
+    db = get_db()
+    result = db.ebooks.update_one(
+        query,
+        {"$set": {"geracao_capitulos": {
+            "status": "em_andamento", "iniciado_em": utcnow()}}}
+    )
+    return result.matched_count > 0
+
+
+def set_chapter_generation_task(ebook_id, task_id):
+    """Registra o ID da tarefa Celery da geração de capítulos"""
+    db = get_db()
+    db.ebooks.update_one(
+        {"ebook_id": ebook_id},
+        {"$set": {"geracao_capitulos.task_id": task_id}}
+    )
+
+
+def release_chapter_generation(ebook_id, status, result=None):
+    """
+    Marca o fim de uma geração de capítulos.
+
+    Args:
+        ebook_id (str): ID do eBook
+        status (str): Status final (concluido, concluido_com_erros, erro)
+        result (dict, optional): Resumo da geração
+    """
+    db = get_db()
+    db.ebooks.update_one(
+        {"ebook_id": ebook_id},
+        {"$set": {"geracao_capitulos.status": status,
+                  "geracao_capitulos.resultado": result,
+                  "geracao_capitulos.concluido_em": utcnow()}}
+    )
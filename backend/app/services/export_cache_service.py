@@ -0,0 +1,216 @@
+# backend/app/services/export_cache_service.py
+"""
+Cache de exportações endereçado por conteúdo.
+
+Cada artefato exportado é identificado pelo hash SHA-256 de tudo o que
+influencia o resultado: conteúdo do eBook (título, tema, capítulos), imagens,
+template/design do Canva, formato, opções e versão dos renderizadores. Uma
+exportação com o mesmo hash reaproveita o arquivo já gerado.
+
+Os artefatos ficam em static/exports/ab/cd/<hash>.<formato> e são registrados na
+coleção export_cache:
+
+    _id             Hash do conteúdo
+    format, path    Formato e caminho do arquivo
+    size            Tamanho em bytes
+    refcount        Exportações concluídas que apontam para o artefato (liberadas
+                    ao excluir a exportação ou quando uma nova a substitui)
+    hits            Reaproveitamentos
+    last_access_at  Último uso (ordem da evição LRU)
+
+Quando o diretório passa de EXPORT_CACHE_MAX_BYTES, os artefatos menos usados
+recentemente são removidos — primeiro os sem referências; as exportações que
+apontavam para um artefato removido passam ao status "expirado".
+"""
+import os
+import json
+import hashlib
+import logging
+from datetime import timedelta
+from pymongo import ASCENDING
+from app.db import get_db
+from app.utils.date_utils import utcnow
+from app.utils.sharding import shard_path, locate
+from app.services.ebook_render_service import RENDERER_VERSION, IMAGE_STORAGE_PATH
+
+logger = logging.getLogger(__name__)
+
+CACHE_COLLECTION = "export_cache"
+EXPORT_CACHE_MAX_BYTES = int(os.environ.get(
+    'EXPORT_CACHE_MAX_BYTES', 2 * 1024 ** 3))
+# Artefatos usados há menos tempo que isso nunca são removidos (downloads em curso)
+EXPORT_CACHE_MIN_AGE_SECONDS = int(os.environ.get(
+    'EXPORT_CACHE_MIN_AGE_SECONDS', 600))
+
+
+def _image_fingerprint(image_id):
+    image = get_db().images.find_one({"image_id": image_id}, {"content_hash": 1})
+    if image and image.get("content_hash"):
+        return [image_id, image["content_hash"]]
+
+    # Imagens anteriores ao armazenamento por conteúdo
+    path = locate(IMAGE_STORAGE_PATH, f"{image_id}.png")
+    if not path:
+        return None
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return [image_id, stat.st_size, int(stat.st_mtime)]
+
+
+def compute_export_key(ebook, formato, options=None, source="local"):
+    """
+    Calcula o hash que identifica o artefato de uma exportação.
+
+    Args:
+        ebook (dict): Documento do eBook
+        formato (str): Formato de exportação
+        options (dict, optional): Opções de exportação
+        source (str): Origem do artefato (local ou canva)
+
+    Returns:
+        str: Hash SHA-256 em hexadecimal
+    """
+    metadata = ebook.get("metadata") or {}
+    capitulos = [{
+        "titulo": capitulo.get("titulo"),
+        "subtemas": capitulo.get("subtemas"),
+        "conteudo": capitulo.get("conteudo"),
+        "imagem": _image_fingerprint(capitulo["imagem_id"]) if capitulo.get("imagem_id") else None
+    } for capitulo in metadata.get("capitulos") or []]
+
+    payload = {
+        "renderer": RENDERER_VERSION,
+        "source": source,
+        "format": formato,
+        "options": options or {},
+        "tema": ebook.get("tema"),
+        "titulo": metadata.get("titulo"),
+        "autor": metadata.get("autor"),
+        "template_id": metadata.get("template_id"),
+        "design_id": metadata.get("design_id"),
+        "capitulos": capitulos
+    }
+    encoded = json.dumps(payload, sort_keys=True, ensure_ascii=False,
+                         default=str).encode("utf-8")
+    return hashlib.sha256(encoded).hexdigest()
+
+
+def artifact_path(export_dir, key, formato):
+    """Caminho do artefato no diretório de exportações (export_dir/ab/cd/<key>.<formato>)"""
+    return shard_path(export_dir, f"{key}.{formato}", key)
+
+
+def lookup(key):
+    """
+    Busca um artefato no cache e registra o acesso.
+
+    Returns:
+        dict: Registro do cache ou None se ausente (ou se o arquivo sumiu)
+    """
+    db = get_db()
+    entry = db[CACHE_COLLECTION].find_one_and_update(
+        {"_id": key},
+        {"$inc": {"hits": 1}, "$set": {"last_access_at": utcnow()}}
+    )
+    if not entry:
+        return None
+    if not os.path.exists(entry["path"]):
+        db[CACHE_COLLECTION].delete_one({"_id": key})
+        return None
+    return entry
+
+
+def store(key, formato, temp_path, final_path):
+    """
+    Publica um artefato recém-renderizado no cache.
+
+    Args:
+        key (str): Hash do conteúdo
+        formato (str): Formato do artefato
+        temp_path (str): Arquivo gerado
+        final_path (str): Caminho endereçado por conteúdo
+
+    Returns:
+        dict: Registro do cache
+    """
+    os.makedirs(os.path.dirname(final_path), exist_ok=True)
+    os.replace(temp_path, final_path)
+    now = utcnow()
+    entry = {
+        "format": formato,
+        "path": final_path,
+        "size": os.path.getsize(final_path),
+        "last_access_at": now
+    }
+    db = get_db()
+    db[CACHE_COLLECTION].update_one(
+        {"_id": key},
+        {"$set": entry,
+         "$setOnInsert": {"created_at": now, "hits": 0, "refcount": 0}},
+        upsert=True
+    )
+    entry["_id"] = key
+    return entry
+
+
+def acquire(key):
+    """Registra uma nova exportação apontando para o artefato"""
+    get_db()[CACHE_COLLECTION].update_one({"_id": key}, {"$inc": {"refcount": 1}})
+
+
+def release(key):
+    """Remove uma referência ao artefato (ex.: exportação excluída)"""
+    get_db()[CACHE_COLLECTION].update_one(
+        {"_id": key, "refcount": {"$gt": 0}}, {"$inc": {"refcount": -1}})
+
+
+def remove_artifact(db, entry):
+    """Remove um artefato e expira as exportações que apontavam para ele"""
+    try:
+        os.remove(entry["path"])
+    except FileNotFoundError:
+        pass
+    db[CACHE_COLLECTION].delete_one({"_id": entry["_id"]})
+    db.exports.update_many(
+        {"cache_key": entry["_id"], "status": "concluido"},
+        {"$set": {"status": "expirado", "download_url": None}}
+    )
+
+
+def evict(max_bytes=EXPORT_CACHE_MAX_BYTES):
+    """
+    Remove artefatos (LRU) até o cache ficar abaixo do limite de tamanho.
+
+    Returns:
+        dict: Número de artefatos e bytes removidos
+    """
+    db = get_db()
+    totals = list(db[CACHE_COLLECTION].aggregate([
+        {"$group": {"_id": None, "bytes": {"$sum": "$size"}}}
+    ]))
+    total = totals[0]["bytes"] if totals else 0
+    removed = {"artifacts": 0, "bytes": 0}
+    if total <= max_bytes:
+        return removed
+
+    cutoff = utcnow() - timedelta(seconds=EXPORT_CACHE_MIN_AGE_SECONDS)
+    # Primeiro os artefatos sem referência, depois os demais, sempre do menos recente
+    for query in ({"refcount": {"$lte": 0}}, {"refcount": {"$gt": 0}}):
+        query = dict(query, last_access_at={"$lt": cutoff})
+        candidates = db[CACHE_COLLECTION].find(
+            query, {"path": 1, "size": 1}).sort("last_access_at", ASCENDING)
+        for entry in candidates:
+            if total <= max_bytes:
+                break
+            remove_artifact(db, entry)
+            total -= entry.get("size", 0)
+            removed["artifacts"] += 1
+            removed["bytes"] += entry.get("size", 0)
+
+    if removed["artifacts"]:
+        logger.info(
+            f"Cache de exportações: {removed['artifacts']} artefatos removidos "
+            f"({removed['bytes']} bytes)")
+    return removed
@@ -2,17 +2,31 @@
 import os
 import logging
 import requests
-import time
 import uuid
+from datetime import timedelta
+from pymongo import ReturnDocument
 from app.db import get_db
+from app.utils.date_utils import utcnow
+from app.utils.sharding import relative_url
 from app.services.ebook_service import get_ebook, update_ebook_status
 from app.services.canva_service import export_design_from_canva
+from app.services.ebook_render_service import render_ebook
+from app.services.export_cache_service import (
+    compute_export_key, artifact_path, lookup, store, acquire, release, evict
+)
 
 logger = logging.getLogger(__name__)
 
 # Configurações para exportação
 EXPORT_FORMATS = ["pdf", "epub", "docx", "html"]
 EXPORT_STORAGE_PATH = "static/exports"
+DOWNLOAD_CHUNK_SIZE = 256 * 1024
+DOWNLOAD_TIMEOUT = int(os.environ.get('EXPORT_DOWNLOAD_TIMEOUT', 60))
+# Reserva da exportação durante a renderização/download (worker interrompido)
+EXPORT_LEASE_SECONDS = int(os.environ.get('EXPORT_LEASE_SECONDS', 1800))
+EXPORT_MAX_ATTEMPTS = int(os.environ.get('EXPORT_MAX_ATTEMPTS', 3))
+# Exportação pendente sem tarefa em execução (ex.: falha ao agendar)
+EXPORT_STALE_SECONDS = 900
 
 
 def ensure_export_directory():
@@ -23,9 +37,160 @@ def ensure_export_directory():
     return EXPORT_STORAGE_PATH
 
 
-def export_ebook(ebook_id, formato="pdf", options=None):
+def _complete_export(db, export_id, ebook_id, formato, entry, cached=False):
+    """Aponta a exportação para o artefato do cache e a marca como concluída"""
+    acquire(entry["_id"])
+    download_url = relative_url(EXPORT_STORAGE_PATH, entry["path"], "/static/exports")
+    db.exports.update_one(
+        {"export_id": export_id},
+        {"$set": {
+            "status": "concluido",
+            "progress": 100,
+            "filepath": entry["path"],
+            "download_url": download_url,
+            "cache_key": entry["_id"],
+            "cached": cached,
+            "size": entry.get("size"),
+            "completed_at": utcnow()
+        }, "$unset": {"lease_until": ""}}
+    )
+
+    _supersede_exports(db, export_id, ebook_id, formato)
+
+    # Atualiza o status da etapa de exportação no eBook
+    update_ebook_status(ebook_id, "Exportação", "concluido")
+    _notify_pipeline(ebook_id)
+
+    return {
+        "export_id": export_id,
+        "status": "concluido",
+        "progress": 100,
+        "download_url": download_url,
+        "format": formato,
+        "cached": cached
+    }
+
+
+def _release_cache(db, query, fields=None):
+    """
+    Libera a referência de uma exportação concluída ao artefato do cache.
+
+    A exportação continua baixável enquanto o artefato existir, mas ele passa
+    a poder ser removido primeiro pela evição.
+    """
+    update = {"cache_released": True}
+    update.update(fields or {})
+    export = db.exports.find_one_and_update(
+        dict(query, status="concluido", cache_released={"$ne": True}),
+        {"$set": update})
+    if export and export.get("cache_key"):
+        release(export["cache_key"])
+    return export
+
+
+def _supersede_exports(db, export_id, ebook_id, formato):
+    """Libera o cache das exportações anteriores do mesmo eBook e formato"""
+    previous = db.exports.find(
+        {"ebook_id": ebook_id, "format": formato, "status": "concluido",
+         "export_id": {"$ne": export_id}, "cache_released": {"$ne": True}},
+        {"export_id": 1})
+    for export in previous:
+        _release_cache(db, {"export_id": export["export_id"]},
+                       {"superseded_by": export_id})
+
+
+def delete_export(export_id):
+    """
+    Remove o registro de uma exportação e sua referência ao artefato do cache.
+
+    Returns:
+        bool: True se a exportação existia
+    """
+    db = get_db()
+    export = db.exports.find_one_and_delete({"export_id": export_id})
+    if not export:
+        return False
+
+    if export.get("status") == "concluido" and export.get("cache_key") \
+            and not export.get("cache_released"):
+        release(export["cache_key"])
+
+    # Arquivos de trabalho de uma exportação interrompida
+    filepath = os.path.join(EXPORT_STORAGE_PATH, f"{export_id}.{export.get('format')}")
+    for path in (filepath, f"{filepath}.part"):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+    return True
+
+
+def _notify_pipeline(ebook_id):
+    """Conclui a etapa de exportação do pipeline que aguardava esta exportação"""
+    from app.services.ebook_pipeline_service import complete_export_stage
+
+    try:
+        complete_export_stage(ebook_id)
+    except Exception as e:
+        logger.error(
+            f"Erro ao atualizar o pipeline do eBook {ebook_id}: {str(e)}")
+
+
+def update_export_progress(export_id, progress, etapa=None):
+    """
+    Atualiza o percentual de conclusão de uma exportação.
+
+    Args:
+        export_id (str): ID da exportação
+        progress (int): Percentual (0-100)
+        etapa (str, optional): Descrição da etapa atual
+    """
+    update_data = {"progress": max(0, min(100, int(progress)))}
+    if etapa:
+        update_data["progress_step"] = etapa
+    get_db().exports.update_one(
+        {"export_id": export_id, "status": {"$in": ["pendente", "em_andamento"]}},
+        {"$set": update_data}
+    )
+
+
+def download_to_file(url, filepath, on_progress=None, chunk_size=DOWNLOAD_CHUNK_SIZE):
     """
-    Exporta um eBook para o formato especificado.
+    Baixa um arquivo remoto em blocos direto para o disco.
+
+    Args:
+        url (str): URL do arquivo
+        filepath (str): Caminho de destino
+        on_progress (callable, optional): Recebe a fração baixada (0-1) quando
+            o tamanho total é conhecido
+        chunk_size (int): Tamanho dos blocos
+
+    Returns:
+        int: Bytes gravados
+    """
+    partial = f"{filepath}.part"
+    written = 0
+    with requests.get(url, stream=True, timeout=DOWNLOAD_TIMEOUT) as response:
+        response.raise_for_status()
+        total = int(response.headers.get("Content-Length") or 0)
+        with open(partial, "wb") as f:
+            for chunk in response.iter_content(chunk_size=chunk_size):
+                if not chunk:
+                    continue
+                f.write(chunk)
+                written += len(chunk)
+                if on_progress and total:
+                    on_progress(written / float(total))
+    os.replace(partial, filepath)
+    return written
+
+
+def create_export(ebook_id, formato="pdf", options=None):
+    """
+    Registra uma exportação e verifica o cache de artefatos.
+
+    Se um artefato idêntico já existir, a exportação é concluída na hora;
+    caso contrário fica pendente para ser processada por run_export.
 
     Args:
         ebook_id (str): ID do eBook
@@ -33,146 +198,318 @@ def export_ebook(ebook_id, formato="pdf", options=None):
         options (dict, optional): Opções adicionais de exportação
 
     Returns:
-        dict: Informações sobre a exportação ou None em caso de erro
+        dict: Informações da exportação (status concluido ou pendente)
+
+    Raises:
+        ValueError: Se o formato for inválido ou o eBook não existir
     """
+    formato = formato.lower()
+    if formato not in EXPORT_FORMATS:
+        raise ValueError(f"Formato de exportação inválido: {formato}")
+
+    ebook = get_ebook(ebook_id)
+    if not ebook:
+        raise ValueError(f"eBook {ebook_id} não encontrado.")
+
+    # Verifica se o eBook está pronto para exportação
+    if ebook.get("status") != "finalizado":
+        logger.warning(
+            f"eBook {ebook_id} não está finalizado para exportação.")
+        # Continuamos mesmo assim, mas com aviso
+
+    design_id = ebook.get("metadata", {}).get("design_id")
+
+    # no_cache força nova renderização (ex.: design editado direto no Canva)
+    options = dict(options or {})
+    use_cache = not options.pop("no_cache", False)
+    cache_key = compute_export_key(
+        ebook, formato, options, source="canva" if design_id else "local")
+
+    export_id = str(uuid.uuid4())
+    db = get_db()
+    db.exports.insert_one({
+        "export_id": export_id,
+        "ebook_id": ebook_id,
+        "format": formato,
+        "options": options,
+        "filepath": None,
+        "status": "pendente",
+        "progress": 0,
+        "download_url": None,  # Será preenchido após a exportação
+        "cache_key": cache_key,
+        "created_at": utcnow(),
+        "completed_at": None
+    })
+
+    # Artefato idêntico já renderizado: retorna imediatamente
+    entry = lookup(cache_key) if use_cache else None
+    if entry:
+        logger.info(
+            f"Exportação {export_id} reaproveitou o artefato {cache_key}")
+        return _complete_export(db, export_id, ebook_id, formato, entry, cached=True)
+
+    update_ebook_status(ebook_id, "Exportação", "em_andamento")
+    return {
+        "export_id": export_id,
+        "status": "pendente",
+        "progress": 0,
+        "download_url": None,
+        "format": formato,
+        "cached": False
+    }
+
+
+def _fail_export(db, export, error):
+    """Marca a exportação como falha e remove arquivos parciais"""
+    export_id = export["export_id"]
+    logger.error(
+        f"Erro ao exportar eBook {export['ebook_id']}: {str(error)}")
+    # Tentamos atualizar o status em caso de erro
     try:
-        # Validação do formato
-        formato = formato.lower()
-        if formato not in EXPORT_FORMATS:
-            logger.error(f"Formato de exportação inválido: {formato}")
-            return None
+        db.exports.update_one(
+            {"export_id": export_id},
+            {"$set": {"status": "falha", "error": str(error)},
+             "$unset": {"lease_until": ""}})
+        update_ebook_status(export["ebook_id"], "Exportação", "falha")
+        _notify_pipeline(export["ebook_id"])
+        filepath = os.path.join(
+            EXPORT_STORAGE_PATH, f"{export_id}.{export['format']}")
+        for path in (filepath, f"{filepath}.part"):
+            if os.path.exists(path):
+                os.remove(path)
+    except Exception:
+        pass
+
+
+def fail_export(export_id, error):
+    """
+    Marca uma exportação como falha (ex.: a tarefa não pôde ser agendada).
 
-        # Obtém os dados do eBook
-        ebook = get_ebook(ebook_id)
-        if not ebook:
-            logger.error(f"eBook {ebook_id} não encontrado.")
-            return None
+    Returns:
+        bool: True se a exportação existia e ainda não estava concluída
+    """
+    db = get_db()
+    export = db.exports.find_one(
+        {"export_id": export_id, "status": {"$in": ["pendente", "em_andamento"]}})
+    if not export:
+        return False
+    _fail_export(db, export, error)
+    return True
+
+
+def _claim(db, export_id):
+    """Reserva uma exportação pendente ou com a reserva vencida"""
+    now = utcnow()
+    return db.exports.find_one_and_update(
+        {"export_id": export_id,
+         "$or": [{"status": "pendente"},
+                 {"status": "em_andamento", "lease_until": {"$lt": now},
+                  "attempts": {"$lt": EXPORT_MAX_ATTEMPTS}}]},
+        {"$set": {"status": "em_andamento", "started_at": now,
+                  "lease_until": now + timedelta(seconds=EXPORT_LEASE_SECONDS)},
+         "$inc": {"attempts": 1}},
+        return_document=ReturnDocument.AFTER
+    )
+
+
+def _publish(db, export, filepath):
+    """Move o arquivo gerado para o cache e conclui a exportação"""
+    update_export_progress(export["export_id"], 95, "publicando")
+    entry = store(export["cache_key"], export["format"], filepath,
+                  artifact_path(EXPORT_STORAGE_PATH, export["cache_key"], export["format"]))
+    result = _complete_export(
+        db, export["export_id"], export["ebook_id"], export["format"], entry)
+    evict()
+    return result
+
+
+def _download_remote(db, export, download_url):
+    """Baixa o artefato remoto em blocos, reportando o progresso (20-90%)"""
+    export_id = export["export_id"]
+    filepath = os.path.join(
+        EXPORT_STORAGE_PATH, f"{export_id}.{export['format']}")
+    last = [20]
+
+    def on_progress(fraction):
+        percent = 20 + int(fraction * 70)
+        if percent - last[0] >= 5:
+            last[0] = percent
+            update_export_progress(export_id, percent, "baixando")
+
+    ensure_export_directory()
+    update_export_progress(export_id, 20, "baixando")
+    download_to_file(download_url, filepath, on_progress)
+    return _publish(db, export, filepath)
+
+
+def run_export(export_id):
+    """
+    Processa uma exportação pendente (executada pela tarefa export.run).
 
-        # Verifica se o eBook está pronto para exportação
-        if ebook.get("status") != "finalizado":
-            logger.warning(
-                f"eBook {ebook_id} não está finalizado para exportação.")
-            # Continuamos mesmo assim, mas com aviso
+    O progresso é gravado em exports.progress. Exportações locais são
+    renderizadas aqui; as do Canva são registradas como job assíncrono e
+    concluídas por finish_remote_export quando o Canva termina.
 
-        # Atualiza o status da etapa de exportação
-        update_ebook_status(ebook_id, "Exportação", "em_andamento")
+    Args:
+        export_id (str): ID da exportação
 
-        # Obtém as informações do design no Canva (se disponível)
-        design_id = ebook.get("metadata", {}).get("design_id")
+    Returns:
+        dict: Informações sobre a exportação ou None em caso de erro
+    """
+    db = get_db()
+    export = _claim(db, export_id)
+    if not export:
+        logger.warning(f"Exportação {export_id} não está pendente.")
+        return get_export_status(export_id=export_id)
 
-        # Define um ID único para a exportação
-        export_id = str(uuid.uuid4())
-        filename = f"{export_id}.{formato}"
-        filepath = os.path.join(EXPORT_STORAGE_PATH, filename)
+    ebook_id = export["ebook_id"]
+    formato = export["format"]
+    filepath = os.path.join(EXPORT_STORAGE_PATH, f"{export_id}.{formato}")
+
+    try:
+        ebook = get_ebook(ebook_id)
+        if not ebook:
+            raise ValueError(f"eBook {ebook_id} não encontrado.")
 
         # Cria o diretório de exportação se não existir
         ensure_export_directory()
+        update_export_progress(export_id, 10, "preparando")
 
-        # Inicializa o registro da exportação
-        db = get_db()
-        export_record = {
-            "export_id": export_id,
-            "ebook_id": ebook_id,
-            "format": formato,
-            "filepath": filepath,
-            "status": "em_andamento",
-            "download_url": None,  # Será preenchido após a exportação
-            "created_at": time.time(),
-            "completed_at": None
-        }
-
-        db.exports.insert_one(export_record)
-
-        # Método de exportação depende do formato e da existência de design no Canva
+        # Método de exportação depende da existência de design no Canva
+        design_id = ebook.get("metadata", {}).get("design_id")
         if design_id:
-            # Se temos um design no Canva, usamos a API do Canva para exportar
-            export_info = export_design_from_canva(design_id, format=formato)
-
-            if export_info and export_info.get("download_url"):
-                # Baixa o arquivo do Canva e salva localmente
-                download_url = export_info.get("download_url")
-                response = requests.get(download_url)
-                response.raise_for_status()
-
-                with open(filepath, "wb") as f:
-                    f.write(response.content)
-
-                # Atualiza o registro com as informações da exportação concluída
-                download_url = f"/static/exports/{filename}"
-                db.exports.update_one(
-                    {"export_id": export_id},
-                    {"$set": {
-                        "status": "concluido",
-                        "download_url": download_url,
-                        "completed_at": time.time()
-                    }}
-                )
-
-                # Atualiza o status da etapa de exportação no eBook
-                update_ebook_status(ebook_id, "Exportação", "concluido")
-
-                return {
-                    "export_id": export_id,
-                    "status": "concluido",
-                    "download_url": download_url,
-                    "format": formato
-                }
-            else:
-                # Falha na exportação via Canva
-                logger.error(f"Falha ao exportar design {design_id} do Canva.")
-                update_export_status(export_id, "falha")
-                update_ebook_status(ebook_id, "Exportação", "falha")
-                return None
-        else:
-            # Sem design do Canva, usamos o método local de exportação
-            # Implementação dependeria do formato e do conteúdo disponível
-            success = export_ebook_local(ebook, filepath, formato, options)
-
-            if success:
-                # Atualiza o registro com as informações da exportação concluída
-                download_url = f"/static/exports/{filename}"
-                db.exports.update_one(
-                    {"export_id": export_id},
-                    {"$set": {
-                        "status": "concluido",
-                        "download_url": download_url,
-                        "completed_at": time.time()
-                    }}
-                )
-
-                # Atualiza o status da etapa de exportação no eBook
-                update_ebook_status(ebook_id, "Exportação", "concluido")
-
-                return {
-                    "export_id": export_id,
-                    "status": "concluido",
-                    "download_url": download_url,
-                    "format": formato
-                }
-            else:
-                # Falha na exportação local
-                logger.error(f"Falha ao exportar eBook {ebook_id} localmente.")
-                update_export_status(export_id, "falha")
-                update_ebook_status(ebook_id, "Exportação", "falha")
-                return None
+            job = export_design_from_canva(
+                design_id, format=formato, ebook_id=ebook_id, export_id=export_id)
+            if not job:
+                raise RuntimeError(
+                    f"Falha ao exportar design {design_id} do Canva.")
+            if job["status"] == "falha":
+                raise RuntimeError(job.get("error") or
+                                   f"Canva recusou a exportação do design {design_id}.")
+            if job["status"] == "concluido" and job.get("download_url"):
+                return _download_remote(db, export, job["download_url"])
+
+            # O acompanhamento do Canva tem reserva própria (canva_export_service)
+            db.exports.update_one(
+                {"export_id": export_id},
+                {"$set": {"canva_export_id": job["canva_export_id"]},
+                 "$unset": {"lease_until": ""}})
+            update_export_progress(export_id, 15, "aguardando Canva")
+            return get_export_status(export_id=export_id)
+
+        update_export_progress(export_id, 20, "renderizando")
+        if not export_ebook_local(ebook, filepath, formato, export.get("options")):
+            raise RuntimeError(
+                f"Falha ao renderizar o eBook {ebook_id} em {formato}.")
+        return _publish(db, export, filepath)
+
+    except Exception as e:
+        _fail_export(db, export, e)
+        return None
+
+
+def finish_remote_export(export_id, download_url=None, error=None):
+    """
+    Conclui uma exportação do Canva notificada por canva_export_service.
+
+    Args:
+        export_id (str): ID da exportação
+        download_url (str, optional): URL do arquivo pronto
+        error (str, optional): Erro informado pelo Canva
 
+    Returns:
+        dict: Informações sobre a exportação ou None em caso de erro
+    """
+    db = get_db()
+    now = utcnow()
+    export = db.exports.find_one_and_update(
+        {"export_id": export_id, "status": "em_andamento",
+         "lease_until": {"$not": {"$gte": now}}},
+        {"$set": {"lease_until": now + timedelta(seconds=EXPORT_LEASE_SECONDS)}},
+        return_document=ReturnDocument.AFTER)
+    if not export:
+        logger.warning(
+            f"Exportação {export_id} não está aguardando o Canva.")
+        return get_export_status(export_id=export_id)
+
+    try:
+        if error or not download_url:
+            raise RuntimeError(error or "Canva não retornou o arquivo exportado.")
+        return _download_remote(db, export, download_url)
     except Exception as e:
-        logger.error(f"Erro ao exportar eBook {ebook_id}: {str(e)}")
-        # Tentamos atualizar o status em caso de erro
+        _fail_export(db, export, e)
+        return None
+
+
+def reschedule_exports(limit=200):
+    """
+    Reagenda as exportações pendentes sem tarefa e as interrompidas (reserva
+    vencida); as interrompidas sem tentativas restantes são marcadas como falha.
+
+    Returns:
+        int: Número de exportações reagendadas
+    """
+    from app.tasks.export_tasks import run_export_task
+
+    db = get_db()
+    now = utcnow()
+    for export in list(db.exports.find(
+            {"status": "em_andamento", "lease_until": {"$lt": now},
+             "attempts": {"$gte": EXPORT_MAX_ATTEMPTS}}).limit(limit)):
+        _fail_export(db, export, "Exportação interrompida.")
+
+    exports = db.exports.find(
+        {"$or": [
+            {"status": "pendente",
+             "created_at": {"$lt": now - timedelta(seconds=EXPORT_STALE_SECONDS)}},
+            {"status": "em_andamento", "lease_until": {"$lt": now},
+             "attempts": {"$lt": EXPORT_MAX_ATTEMPTS}},
+        ]}, {"export_id": 1}).limit(limit)
+
+    count = 0
+    for export in list(exports):
         try:
-            if 'export_id' in locals():
-                update_export_status(export_id, "falha")
-            update_ebook_status(ebook_id, "Exportação", "falha")
-        except:
-            pass
+            run_export_task.delay(export["export_id"])
+            count += 1
+        except Exception as e:
+            logger.error(f"Erro ao reagendar a exportação {export['export_id']}: {str(e)}")
+            break
+    return count
+
+
+def export_ebook(ebook_id, formato="pdf", options=None):
+    """
+    Exporta um eBook de forma síncrona (usado pelo pipeline, que já roda no Celery).
+
+    Exportações do Canva retornam em andamento e são concluídas pelo
+    acompanhamento de canva_export_service.
+
+    Args:
+        ebook_id (str): ID do eBook
+        formato (str): Formato de exportação (pdf, epub, docx, html)
+        options (dict, optional): Opções adicionais de exportação
+
+    Returns:
+        dict: Informações sobre a exportação ou None em caso de erro
+    """
+    try:
+        export = create_export(ebook_id, formato, options)
+    except ValueError as e:
+        logger.error(str(e))
         return None
 
+    if export["status"] == "concluido":
+        return export
+    return run_export(export["export_id"])
+
 
 def export_ebook_local(ebook, filepath, formato, options=None):
     """
     Exporta um eBook localmente para o formato especificado.
-    Esta é uma implementação simplificada. Em um sistema real,
-    você utilizaria bibliotecas específicas para cada formato.
+
+    A renderização (HTML, PDF, EPUB ou DOCX) roda no pool de processos de
+    ebook_render_service, a partir de uma representação intermediária montada
+    uma única vez.
 
     Args:
         ebook (dict): Dados do eBook
@@ -184,27 +521,9 @@ def export_ebook_local(ebook, filepath, formato, options=None):
         bool: True se exportado com sucesso, False caso contrário
     """
     try:
-        # Obtém os dados necessários do eBook
-        titulo = ebook.get("metadata", {}).get("titulo", "eBook Sem Título")
-        tema = ebook.get("tema", "")
-        capitulos = ebook.get("metadata", {}).get("capitulos", [])
-
-        # Cria uma exportação fictícia (em um sistema real, usaria as bibliotecas adequadas)
-        if formato == "pdf":
-            # Em um sistema real: use uma biblioteca como reportlab, PyPDF2 ou weasyprint
-            generate_pdf_mockup(filepath, titulo, tema, capitulos)
-        elif formato == "epub":
-            # Em um sistema real: use uma biblioteca como ebooklib
-            generate_epub_mockup(filepath, titulo, tema, capitulos)
-        elif formato == "docx":
-            # Em um sistema real: use uma biblioteca como python-docx
-            generate_docx_mockup(filepath, titulo, tema, capitulos)
-        elif formato == "html":
-            # Em um sistema real: use uma biblioteca como jinja2 para templates HTML
-            generate_html_mockup(filepath, titulo, tema, capitulos)
-        else:
-            return False
-
+        size = render_ebook(ebook, formato, filepath)
+        logger.info(
+            f"eBook {ebook.get('ebook_id')} renderizado em {formato} ({size} bytes)")
         return os.path.exists(filepath)
 
     except Exception as e:
@@ -212,51 +531,6 @@ def export_ebook_local(ebook, filepath, formato, options=None):
         return False
 
 
-def generate_pdf_mockup(filepath, titulo, tema, capitulos):
-    """Gera um arquivo PDF fictício (em um sistema real, use reportlab ou similar)"""
-    with open(filepath, "w") as f:
-        f.write(f"MOCKUP PDF: {titulo}\n\n")
-        f.write(f"Tema: {tema}\n\n")
-        for capitulo in capitulos:
-            f.write(f"Capítulo: {capitulo.get('titulo', '')}\n")
-            for subtema in capitulo.get("subtemas", []):
-                f.write(f"  - {subtema}\n")
-
-
-def generate_epub_mockup(filepath, titulo, tema, capitulos):
-    """Gera um arquivo EPUB fictício (em um sistema real, use ebooklib)"""
-    with open(filepath, "w") as f:
-        f.write(f"MOCKUP EPUB: {titulo}\n\n")
-        f.write(f"Tema: {tema}\n\n")
-        for capitulo in capitulos:
-            f.write(f"Capítulo: {capitulo.get('titulo', '')}\n")
-
-
-def generate_docx_mockup(filepath, titulo, tema, capitulos):
-    """Gera um arquivo DOCX fictício (em um sistema real, use python-docx)"""
-    with open(filepath, "w") as f:
-        f.write(f"MOCKUP DOCX: {titulo}\n\n")
-        f.write(f"Tema: {tema}\n\n")
-        for capitulo in capitulos:
-            f.write(f"Capítulo: {capitulo.get('titulo', '')}\n")
-
-
-def generate_html_mockup(filepath, titulo, tema, capitulos):
-    """Gera um arquivo HTML fictício (em um sistema real, use jinja2 ou similar)"""
-    with open(filepath, "w") as f:
-        f.write(f"<html><head><title>{titulo}</title></head>")
-        f.write("<body>")
-        f.write(f"<h1>{titulo}</h1>")
-        f.write(f"<p>Tema: {tema}</p>")
-        for capitulo in capitulos:
-            f.write(f"<h2>{capitulo.get('titulo', '')}</h2>")
-            f.write("<ul>")
-            for subtema in capitulo.get("subtemas", []):
-                f.write(f"<li>{subtema}</li>")
-            f.write("</ul>")
-        f.write("</body></html>")
-
-
 def update_export_status(export_id, status):
     """
     Atualiza o status de uma exportação.
@@ -273,7 +547,7 @@ def update_export_status(export_id, status):
         update_data = {"status": status}
 
         if status == "concluido":
-            update_data["completed_at"] = time.time()
+            update_data["completed_at"] = utcnow()
 
         result = db.exports.update_one(
             {"export_id": export_id},
@@ -64,6 +64,33 @@ class GenAIService:
         # 3. Caso não encontre, lançar exceção
         raise ValueError(f"API key não encontrada para o provedor {provider}")
 
+    def chat(self, provider: str, prompt: str, version: str = None) -> str:
+        """
+        Envia o prompt ao provedor informado, despachando para o método correspondente.
+
+        Args:
+            provider: Nome do provedor (chatgpt, gemini, deepseek, llama, copilot, claude)
+            prompt: Texto do prompt
+            version: Versão do provedor (usada apenas pelo ChatGPT)
+
+        Returns:
+            Resposta do modelo como string
+        """
+        provider = (provider or "").lower()
+        if provider == "chatgpt":
+            return self.chat_with_chatgpt(prompt, version=version or "v35_turbo")
+        if provider == "gemini":
+            return self.chat_with_gemini(prompt)
+        if provider == "deepseek":
+            return self.chat_with_deepseek(prompt)
+        if provider == "llama":
+            return self.chat_with_llama(prompt)
+        if provider == "copilot":
+            return self.chat_with_copilot(prompt)
+        if provider == "claude":
+            return self.chat_with_claude(prompt)
+        raise ValueError(f"Provider '{provider}' não suportado.")
+
     def chat_with_chatgpt(self, prompt: str, version: str = "v35_turbo") -> str:
         config = self._get_provider_version_config("chatgpt", version)
         if not config:
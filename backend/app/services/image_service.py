@@ -5,15 +5,32 @@ import logging
 import requests
 import base64
 from io import BytesIO
+from threading import BoundedSemaphore
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from PIL import Image
-import time
 from app.db import get_db
+from app.utils.date_utils import utcnow
+from app.utils.sharding import locate
+from app.services.image_variant_service import process_image, remove_variants
+from app.services.blob_store import write_stream, write_bytes, release, CHUNK_SIZE
 
 logger = logging.getLogger(__name__)
 
 # Configurações para serviços de geração de imagem
 DEFAULT_IMAGE_MODEL = "dall-e-3"  # Modelo padrão para o OpenAI
 IMAGE_STORAGE_PATH = "static/images"  # Pasta para armazenar imagens
+IMAGE_NAMESPACE = "images"  # Namespace das imagens no blob_store
+IMAGE_DOWNLOAD_TIMEOUT = 60
+
+# Geração em lote: chamadas simultâneas por provedor (limites de taxa das APIs)
+PROVIDER_CONCURRENCY = {
+    "openai": int(os.environ.get('OPENAI_IMAGE_CONCURRENCY', 4)),
+    "stability": int(os.environ.get('STABILITY_IMAGE_CONCURRENCY', 2)),
+}
+BATCH_MAX_WORKERS = 8
+MAX_BATCH_IMAGES = 20
+_provider_slots = {name: BoundedSemaphore(limit)
+                   for name, limit in PROVIDER_CONCURRENCY.items()}
 
 
 def ensure_image_directory():
@@ -59,7 +76,7 @@ def generate_image_openai(prompt, size="1024x1024", quality="standard", model=DE
         model (str): Modelo da OpenAI (dall-e-3, dall-e-2, etc.)
 
     Returns:
-        tuple: (imagem_id, imagem_url) ou (None, None) em caso de erro
+        tuple: (blob, imagem_url) ou (None, None) em caso de erro
     """
     try:
         config = get_image_service_config("openai")
@@ -93,8 +110,9 @@ def generate_image_openai(prompt, size="1024x1024", quality="standard", model=DE
             image_url = data["data"][0].get("url")
             if image_url:
                 # Baixa a imagem e salva localmente
-                image_id = save_image_from_url(image_url)
-                return image_id, image_url
+                blob = save_image_from_url(image_url)
+                if blob:
+                    return blob, image_url
 
         logger.error(f"Resposta inválida da API OpenAI DALL-E: {data}")
         return None, None
@@ -115,7 +133,7 @@ def generate_image_stability(prompt, engine_id="stable-diffusion-v1-5", width=10
         height (int): Altura da imagem
 
     Returns:
-        tuple: (imagem_id, imagem_url) ou (None, None) em caso de erro
+        tuple: (blob, imagem_url) ou (None, None) em caso de erro
     """
     try:
         config = get_image_service_config("stability")
@@ -151,11 +169,10 @@ def generate_image_stability(prompt, engine_id="stable-diffusion-v1-5", width=10
             b64_image = data["artifacts"][0].get("base64")
             if b64_image:
                 # Converte base64 para imagem e salva localmente
-                image_id = save_image_from_base64(b64_image)
-
-                # Cria uma URL para a imagem local
-                image_url = f"/static/images/{image_id}.png"
-                return image_id, image_url
+                blob = save_image_from_base64(b64_image)
+                if blob:
+                    # Cria uma URL para a imagem local
+                    return blob, f"/{blob['path']}"
 
         logger.error(f"Resposta inválida da API Stability AI: {data}")
         return None, None
@@ -169,30 +186,27 @@ def save_image_from_url(image_url):
     """
     Baixa uma imagem da URL e salva localmente.
 
+    O download é gravado em blocos direto no disco, com o SHA-256 calculado
+    durante a gravação; imagens idênticas compartilham o mesmo arquivo.
+
     Args:
         image_url (str): URL da imagem
 
     Returns:
-        str: ID único da imagem salva
+        dict: Blob da imagem (hash, path, size) ou None em caso de erro
     """
     try:
         # Garante que o diretório existe
         ensure_image_directory()
 
-        # Gera um ID único para a imagem
-        image_id = str(uuid.uuid4())
-
-        # Baixa a imagem
-        response = requests.get(image_url)
-        response.raise_for_status()
-
-        # Salva localmente
-        image_path = os.path.join(IMAGE_STORAGE_PATH, f"{image_id}.png")
-        with open(image_path, "wb") as f:
-            f.write(response.content)
+        with requests.get(image_url, stream=True, timeout=IMAGE_DOWNLOAD_TIMEOUT) as response:
+            response.raise_for_status()
+            blob = write_stream(
+                IMAGE_NAMESPACE, response.iter_content(chunk_size=CHUNK_SIZE),
+                IMAGE_STORAGE_PATH, "png")
 
-        logger.info(f"Imagem salva em: {image_path}")
-        return image_id
+        logger.info(f"Imagem salva em: {blob['path']}")
+        return blob
 
     except Exception as e:
         logger.error(f"Erro ao salvar imagem da URL {image_url}: {str(e)}")
@@ -207,31 +221,85 @@ def save_image_from_base64(b64_image):
         b64_image (str): String base64 da imagem
 
     Returns:
-        str: ID único da imagem salva
+        dict: Blob da imagem (hash, path, size) ou None em caso de erro
     """
     try:
         # Garante que o diretório existe
         ensure_image_directory()
 
-        # Gera um ID único para a imagem
-        image_id = str(uuid.uuid4())
-
         # Decodifica o base64
         image_data = base64.b64decode(b64_image)
 
-        # Salva localmente
-        image_path = os.path.join(IMAGE_STORAGE_PATH, f"{image_id}.png")
-        with open(image_path, "wb") as f:
-            f.write(image_data)
+        blob = write_bytes(IMAGE_NAMESPACE, image_data,
+                           IMAGE_STORAGE_PATH, "png")
 
-        logger.info(f"Imagem salva em: {image_path}")
-        return image_id
+        logger.info(f"Imagem salva em: {blob['path']}")
+        return blob
 
     except Exception as e:
         logger.error(f"Erro ao salvar imagem de base64: {str(e)}")
         return None
 
 
+def get_image_path(image_id):
+    """
+    Caminho do arquivo de uma imagem.
+
+    Imagens gravadas por conteúdo têm o caminho no registro; as antigas
+    seguem o padrão static/images/[ab/cd/]<image_id>.png.
+
+    Returns:
+        str: Caminho do arquivo ou None se não existir
+    """
+    image = get_db().images.find_one({"image_id": image_id}, {"path": 1})
+    path = (image or {}).get("path")
+    if path:
+        return path if os.path.exists(path) else None
+    return locate(IMAGE_STORAGE_PATH, f"{image_id}.png")
+
+
+def _call_provider(description, service, size):
+    """Chama o provedor respeitando o limite de chamadas simultâneas dele"""
+    service = service.lower()
+    provider = service if service in PROVIDER_CONCURRENCY else "openai"
+    with _provider_slots[provider]:
+        if provider == "stability":
+            # Converte o tamanho para dimensões (apenas para Stability)
+            dimensions = size.split("x")
+            width = int(dimensions[0]) if len(dimensions) > 0 else 1024
+            height = int(dimensions[1]) if len(dimensions) > 1 else 1024
+
+            return generate_image_stability(
+                description, width=width, height=height)
+        # Serviço padrão (fallback para OpenAI)
+        return generate_image_openai(description, size=size)
+
+
+def _image_record(blob, image_url, description, service, size):
+    return {
+        "image_id": str(uuid.uuid4()),
+        "url": image_url,
+        "content_hash": blob["hash"],
+        "path": blob["path"],
+        "bytes": blob["size"],
+        "description": description,
+        "service": service,
+        "size": size,
+        "created_at": utcnow()
+    }
+
+
+def _schedule_variants(record):
+    # Miniatura e variantes WebP/AVIF são geradas em segundo plano
+    # (uma vez por conteúdo: imagens idênticas reaproveitam as variantes)
+    try:
+        process_image(record["image_id"], record["path"],
+                      stem=record["content_hash"])
+    except Exception as e:
+        logger.error(
+            f"Erro ao agendar variantes da imagem {record['image_id']}: {str(e)}")
+
+
 def generate_image(description, service="openai", size="1024x1024"):
     """
     Função principal que gera uma imagem usando o serviço especificado.
@@ -245,43 +313,21 @@ def generate_image(description, service="openai", size="1024x1024"):
         dict: Informações da imagem (id, url, service)
     """
     try:
-        image_id = None
-        image_url = None
-
-        # Escolhe o serviço de geração
-        if service.lower() == "openai":
-            image_id, image_url = generate_image_openai(description, size=size)
-        elif service.lower() == "stability":
-            # Converte o tamanho para dimensões (apenas para Stability)
-            dimensions = size.split("x")
-            width = int(dimensions[0]) if len(dimensions) > 0 else 1024
-            height = int(dimensions[1]) if len(dimensions) > 1 else 1024
-
-            image_id, image_url = generate_image_stability(
-                description, width=width, height=height)
-        else:
-            # Serviço padrão (fallback para OpenAI)
-            image_id, image_url = generate_image_openai(description, size=size)
+        blob, image_url = _call_provider(description, service, size)
 
-        if not image_id or not image_url:
+        if not blob or not image_url:
             logger.error(f"Falha ao gerar imagem com serviço {service}")
             return None
 
         # Salva o registro da imagem no MongoDB
         db = get_db()
-        image_record = {
-            "image_id": image_id,
-            "url": image_url,
-            "description": description,
-            "service": service,
-            "size": size,
-            "created_at": time.time()
-        }
-
+        image_record = _image_record(
+            blob, image_url, description, service, size)
         db.images.insert_one(image_record)
+        _schedule_variants(image_record)
 
         return {
-            "image_id": image_id,
+            "image_id": image_record["image_id"],
             "url": image_url,
             "service": service
         }
@@ -291,6 +337,121 @@ def generate_image(description, service="openai", size="1024x1024"):
         return None
 
 
+def build_batch_jobs(prompts=None, prompt=None, n=1):
+    """
+    Monta a lista de gerações de um lote.
+
+    Args:
+        prompts (list, optional): Descrições (uma imagem por descrição)
+        prompt (str, optional): Descrição única, gerada n vezes
+        n (int): Variações por descrição
+
+    Returns:
+        list: Tuplas (índice, descrição)
+
+    Raises:
+        ValueError: Se o lote estiver vazio ou exceder MAX_BATCH_IMAGES
+    """
+    prompts = [p for p in (prompts or ([prompt] if prompt else [])) if p]
+    if not prompts:
+        raise ValueError("Informe 'prompts' ou 'prompt'.")
+    if not isinstance(n, int) or n < 1:
+        raise ValueError("'n' deve ser um inteiro positivo.")
+
+    jobs = list(enumerate(
+        description for description in prompts for _ in range(n)))
+    if len(jobs) > MAX_BATCH_IMAGES:
+        raise ValueError(
+            f"Lote excede o máximo de {MAX_BATCH_IMAGES} imagens.")
+    return jobs
+
+
+def _batch_job(indice, description, service, size):
+    try:
+        blob, image_url = _call_provider(description, service, size)
+        if not blob or not image_url:
+            return indice, description, None, "Falha ao gerar imagem."
+        return indice, description, _image_record(
+            blob, image_url, description, service, size), None
+    except Exception as e:
+        return indice, description, None, str(e)
+
+
+def _save_batch_records(records):
+    """
+    Grava um grupo de registros do lote.
+
+    Returns:
+        set: image_id dos registros gravados; os blobs dos demais são liberados
+    """
+    if not records:
+        return set()
+    db = get_db()
+    try:
+        db.images.insert_many(records, ordered=False)
+        saved = {record["image_id"] for record in records}
+    except Exception as e:
+        logger.error(f"Erro ao gravar imagens do lote: {str(e)}")
+        saved = {image["image_id"] for image in db.images.find(
+            {"image_id": {"$in": [record["image_id"] for record in records]}},
+            {"image_id": 1})}
+
+    for record in records:
+        if record["image_id"] in saved:
+            _schedule_variants(record)
+        else:
+            release(IMAGE_NAMESPACE, record["content_hash"])
+    return saved
+
+
+def generate_images_batch(jobs, service="openai", size="1024x1024"):
+    """
+    Gera um lote de imagens em paralelo.
+
+    As chamadas são distribuídas em um pool de threads, limitado por provedor
+    (PROVIDER_CONCURRENCY). Os resultados são gravados em pequenos grupos (os
+    que ficam prontos juntos) antes de serem entregues, então todo image_id
+    enviado já existe. Se o cliente interromper a leitura, as imagens restantes
+    ainda são gravadas.
+
+    Args:
+        jobs (list): Tuplas (índice, descrição) de build_batch_jobs
+        service (str): Serviço a utilizar (openai, stability)
+        size (str): Tamanho das imagens
+
+    Yields:
+        dict: Resultado de cada imagem e, por último, um resumo do lote
+    """
+    executor = ThreadPoolExecutor(
+        max_workers=min(BATCH_MAX_WORKERS, len(jobs)))
+    pending = {executor.submit(_batch_job, indice, description, service, size)
+               for indice, description in jobs}
+    saved = 0
+    try:
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            results = [future.result() for future in done]
+            stored = _save_batch_records([record for _, _, record, _ in results if record])
+            saved += len(stored)
+            for indice, description, record, error in results:
+                if record and record["image_id"] in stored:
+                    yield {"index": indice, "prompt": description,
+                           "image_id": record["image_id"], "url": record["url"],
+                           "service": service}
+                else:
+                    yield {"index": indice, "prompt": description,
+                           "error": error or "Falha ao gravar imagem."}
+    finally:
+        # Cliente desconectado: grava o que ainda estava em andamento
+        executor.shutdown(wait=True)
+        if pending:
+            saved += len(_save_batch_records(
+                [record for _, _, record, _ in (f.result() for f in pending) if record]))
+        logger.info(f"Lote de imagens: {saved}/{len(jobs)} geradas")
+
+    yield {"done": True, "total": len(jobs), "saved": saved}
+
+
 def regenerate_image(image_id=None, description=None, service="openai", size="1024x1024"):
     """
     Regenera uma imagem com base na descrição anterior ou uma nova.
@@ -346,3 +507,38 @@ def get_image(image_id):
     except Exception as e:
         logger.error(f"Erro ao buscar imagem {image_id}: {str(e)}")
         return None
+
+
+def delete_image(image_id):
+    """
+    Remove o registro de uma imagem.
+
+    O arquivo (e suas variantes) só é apagado quando nenhuma outra imagem
+    compartilha o mesmo conteúdo.
+
+    Args:
+        image_id (str): ID da imagem
+
+    Returns:
+        bool: True se removida, False se não encontrada
+    """
+    try:
+        db = get_db()
+        image = db.images.find_one_and_delete({"image_id": image_id})
+        if not image:
+            return False
+
+        content_hash = image.get("content_hash")
+        if content_hash:
+            if release(IMAGE_NAMESPACE, content_hash):
+                remove_variants(content_hash)
+        else:
+            # Imagem anterior ao armazenamento por conteúdo
+            legacy_path = locate(IMAGE_STORAGE_PATH, f"{image_id}.png")
+            if legacy_path:
+                os.remove(legacy_path)
+            remove_variants(image_id)
+        return True
+    except Exception as e:
+        logger.error(f"Erro ao remover imagem {image_id}: {str(e)}")
+        return False
@@ -0,0 +1,248 @@
+# backend/app/services/image_variant_service.py
+"""
+Pós-processamento das imagens geradas.
+
+Para cada imagem original (static/images/ab/cd/<sha256>.png) são gerados, em um pool de
+processos, uma miniatura e variantes WebP em várias larguras (e AVIF, quando
+o Pillow da imagem Docker tiver suporte). As variantes ficam em
+static/images/variants/ab/cd, nomeadas pelo hash do conteúdo (imagens
+idênticas compartilham as variantes), e são registradas no documento da
+coleção images:
+
+    width, height       Dimensões do original
+    thumbnail_url       Miniatura WebP (galerias, dashboard)
+    variants            [{width, format, url, bytes}]
+    variants_status     pendente, concluido ou falha
+
+select_variant escolhe a menor variante que atende à largura pedida, no
+melhor formato aceito pelo cliente.
+"""
+import os
+import glob
+import atexit
+import logging
+from threading import Lock
+from concurrent.futures import ProcessPoolExecutor
+from PIL import Image
+from app.db import get_db
+from app.utils.date_utils import utcnow
+from app.utils.sharding import shard_dir, locate
+
+try:
+    import pillow_avif  # noqa: F401 - registra o codec AVIF no Pillow
+except ImportError:
+    pass
+
+logger = logging.getLogger(__name__)
+
+IMAGE_STORAGE_PATH = "static/images"
+VARIANT_STORAGE_PATH = os.path.join(IMAGE_STORAGE_PATH, "variants")
+VARIANT_WIDTHS = (320, 640, 1280)
+THUMBNAIL_WIDTH = 160
+WEBP_QUALITY = 80
+AVIF_QUALITY = 60
+VARIANT_WORKERS = int(os.environ.get('IMAGE_VARIANT_WORKERS', 2))
+
+# Ordem de preferência dos formatos (o original PNG é sempre o último recurso)
+FORMAT_MIMETYPES = {
+    "avif": "image/avif",
+    "webp": "image/webp",
+    "png": "image/png",
+}
+
+_pool = None
+_pool_lock = Lock()
+
+
+def supported_formats():
+    """Formatos de variante suportados pelo Pillow instalado"""
+    formats = ["webp"]
+    if "AVIF" in Image.SAVE:
+        formats.insert(0, "avif")
+    return formats
+
+
+def _save(image, path, formato):
+    partial = f"{path}.part"
+    if formato == "avif":
+        image.save(partial, "AVIF", quality=AVIF_QUALITY)
+    else:
+        image.save(partial, "WEBP", quality=WEBP_QUALITY, method=4)
+    os.replace(partial, path)
+    return os.path.getsize(path)
+
+
+def _resized(image, width):
+    height = max(1, round(image.height * width / float(image.width)))
+    return image.resize((width, height), Image.LANCZOS)
+
+
+def build_variants(stem, source_path, output_dir=VARIANT_STORAGE_PATH):
+    """
+    Gera a miniatura e as variantes de uma imagem (executado no pool).
+
+    Returns:
+        dict: Dimensões, miniatura e lista de variantes geradas
+    """
+    # Todas as variantes de um conteúdo ficam no mesmo subdiretório
+    output_dir = shard_dir(output_dir, stem)
+    os.makedirs(output_dir, exist_ok=True)
+    url_prefix = "/" + output_dir.replace(os.sep, "/")
+
+    with Image.open(source_path) as original:
+        original.load()
+        image = original.convert("RGBA" if "A" in original.getbands() else "RGB")
+
+    # Larguras menores que o original, mais o próprio original recomprimido
+    widths = sorted({w for w in VARIANT_WIDTHS if w < image.width} | {image.width})
+    variants = []
+    for formato in supported_formats():
+        for width in widths:
+            resized = image if width == image.width else _resized(image, width)
+            filename = f"{stem}-{width}.{formato}"
+            size = _save(resized, os.path.join(output_dir, filename), formato)
+            variants.append({"width": width, "format": formato,
+                             "url": f"{url_prefix}/{filename}", "bytes": size})
+
+    thumbnail = image.copy()
+    thumbnail.thumbnail((THUMBNAIL_WIDTH, THUMBNAIL_WIDTH))
+    thumbnail_name = f"{stem}-thumb.webp"
+    _save(thumbnail, os.path.join(output_dir, thumbnail_name), "webp")
+
+    return {
+        "width": image.width,
+        "height": image.height,
+        "thumbnail_url": f"{url_prefix}/{thumbnail_name}",
+        "variants": variants
+    }
+
+
+def _get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=VARIANT_WORKERS)
+        return _pool
+
+
+def shutdown_pool():
+    """Encerra o pool de processamento de imagens"""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False)
+            _pool = None
+
+
+atexit.register(shutdown_pool)
+
+
+def _record(image_id, result=None, error=None):
+    update = {"variants_updated_at": utcnow()}
+    if error:
+        logger.error(
+            f"Erro ao gerar variantes da imagem {image_id}: {str(error)}")
+        update["variants_status"] = "falha"
+    else:
+        update.update(result)
+        update["variants_status"] = "concluido"
+    get_db().images.update_one({"image_id": image_id}, {"$set": update})
+
+
+def _on_done(image_id):
+    def callback(future):
+        try:
+            _record(image_id, future.result())
+        except Exception as e:
+            _record(image_id, error=e)
+    return callback
+
+
+def process_image(image_id, source_path=None, stem=None):
+    """
+    Agenda a geração das variantes de uma imagem no pool de processos.
+
+    O documento da imagem é atualizado quando o processamento termina. Em
+    processos que não podem criar filhos (workers do Celery), o trabalho é
+    feito no processo atual.
+
+    Args:
+        image_id (str): ID da imagem
+        source_path (str, optional): Arquivo original; padrão static/images/<id>.png
+        stem (str, optional): Prefixo dos arquivos de variante (hash do
+            conteúdo); imagens com o mesmo conteúdo reaproveitam as variantes
+    """
+    source_path = source_path or locate(IMAGE_STORAGE_PATH, f"{image_id}.png") or \
+        os.path.join(IMAGE_STORAGE_PATH, f"{image_id}.png")
+    stem = stem or image_id
+    db = get_db()
+
+    if stem != image_id:
+        done = db.images.find_one(
+            {"content_hash": stem, "variants_status": "concluido"},
+            {"_id": 0, "width": 1, "height": 1, "thumbnail_url": 1, "variants": 1})
+        if done:
+            _record(image_id, done)
+            return
+
+    db.images.update_one(
+        {"image_id": image_id}, {"$set": {"variants_status": "pendente"}})
+    try:
+        future = _get_pool().submit(build_variants, stem, source_path)
+    except (AssertionError, OSError, RuntimeError) as e:
+        logger.info(
+            f"Pool de imagens indisponível ({str(e)}); processando no processo atual")
+        try:
+            _record(image_id, build_variants(stem, source_path))
+        except Exception as err:
+            _record(image_id, error=err)
+        return
+    future.add_done_callback(_on_done(image_id))
+
+
+def remove_variants(stem, output_dir=VARIANT_STORAGE_PATH):
+    """Remove os arquivos de variante gerados para um conteúdo"""
+    removed = 0
+    pattern = f"{glob.escape(stem)}-*"
+    # Subdiretório do conteúdo e raiz (variantes anteriores à distribuição)
+    paths = glob.glob(os.path.join(shard_dir(output_dir, stem), pattern)) + \
+        glob.glob(os.path.join(output_dir, pattern))
+    for filename in paths:
+        try:
+            os.remove(filename)
+            removed += 1
+        except FileNotFoundError:
+            pass
+    return removed
+
+
+def select_variant(image, width=None, accept=""):
+    """
+    Escolhe a melhor variante para a largura e os formatos aceitos pelo cliente.
+
+    Args:
+        image (dict): Documento da imagem
+        width (int, optional): Largura desejada em pixels (padrão: a maior)
+        accept (str): Header Accept da requisição
+
+    Returns:
+        tuple: (caminho do arquivo, mimetype)
+    """
+    accept = accept or ""
+    variants = image.get("variants") or []
+    for formato in ("avif", "webp"):
+        if FORMAT_MIMETYPES[formato] not in accept:
+            continue
+        candidates = sorted(
+            (v for v in variants if v["format"] == formato), key=lambda v: v["width"])
+        if not candidates:
+            continue
+        chosen = candidates[-1]
+        if width:
+            chosen = next((v for v in candidates if v["width"] >= width), chosen)
+        return chosen["url"].lstrip("/"), FORMAT_MIMETYPES[formato]
+
+    filename = f"{image['image_id']}.png"
+    original = image.get("path") or locate(IMAGE_STORAGE_PATH, filename) or \
+        os.path.join(IMAGE_STORAGE_PATH, filename)
+    return original, FORMAT_MIMETYPES["png"]
@@ -0,0 +1,297 @@
+# backend/app/services/prompt_template_service.py
+"""
+Templates de prompt dos agentes, pré-compilados e versionados.
+
+O template de um agente (prompt_template ou, na falta dele, description) é um
+template Jinja2 com os slots abaixo, além de variáveis livres com valores
+padrão definidos no próprio agente:
+
+    {{ message }}     Mensagem do usuário
+    {{ context }}     Contexto adicional (ex.: trechos de documentos)
+    {{ files }}       Lista de arquivos anexados (nomes)
+    {% for shot in few_shots %}{{ shot.input }} / {{ shot.output }}{% endfor %}
+
+Templates sem o slot {{ message }} (formato legado, texto puro) recebem a
+mensagem ao final, como antes. Os slots {{ context }} e {{ files }} não
+declarados são acrescentados em blocos condicionais (SLOT_BLOCKS), para que
+os trechos dos documentos não sejam descartados. A versão do template é o
+hash SHA-256 do seu conteúdo: o template compilado fica em cache por versão,
+e o número de tokens da parte fixa é calculado uma única vez, ao salvar o
+agente. Esse número limita o tamanho do {{ context }} para que o prompt caiba em PROMPT_MAX_TOKENS.
+
+Os templates são editados pelos usuários e por isso rodam em um ambiente
+Jinja2 isolado (ImmutableSandboxedEnvironment): acesso a atributos internos
+(__class__, __globals__...) e métodos que alteram objetos é bloqueado.
+"""
+import os
+import json
+import math
+import time
+import hashlib
+import logging
+from collections import OrderedDict
+from threading import Lock
+from jinja2 import StrictUndefined, TemplateSyntaxError, meta
+from jinja2.exceptions import SecurityError
+from jinja2.sandbox import ImmutableSandboxedEnvironment
+
+logger = logging.getLogger(__name__)
+
+# Slots preenchidos pelo sistema na montagem do prompt
+RESERVED_SLOTS = ("message", "context", "files", "few_shots")
+
+COMPILED_CACHE_SIZE = int(os.environ.get('PROMPT_TEMPLATE_CACHE_SIZE', 256))
+AGENT_CACHE_TTL = int(os.environ.get('AGENT_CACHE_TTL_SECONDS', 60))
+PROMPT_MAX_TOKENS = int(os.environ.get('PROMPT_MAX_TOKENS', 12000))
+
+# Aproximação de tokens usada quando não há tokenizer do provider disponível
+CHARS_PER_TOKEN = 4
+
+LEGACY_PREFIX = "Mensagem do Usuário:\n\n"
+# Conteúdo dos slots acrescentados a templates que não os declaram
+SLOT_BLOCKS = (("context", "Trechos dos documentos anexados:\n\n{{ context }}"),
+               ("files", "Arquivos anexados: {{ files | join(', ') }}"))
+
+_env = ImmutableSandboxedEnvironment(
+    undefined=StrictUndefined, autoescape=False, keep_trailing_newline=True)
+
+_compiled = OrderedDict()
+_compiled_lock = Lock()
+
+_agents = {}
+_agents_lock = Lock()
+
+
+class PromptTemplateError(ValueError):
+    """Template de prompt inválido"""
+
+
+def estimate_tokens(text):
+    """
+    Estima o número de tokens de um texto.
+
+    Args:
+        text (str): Texto
+
+    Returns:
+        int: Número aproximado de tokens
+    """
+    if not text:
+        return 0
+    return int(math.ceil(len(text) / float(CHARS_PER_TOKEN)))
+
+
+def normalize_source(source):
+    """
+    Garante os slots da mensagem, do contexto e dos arquivos.
+
+    Em templates no formato legado os blocos de contexto e arquivos precedem a
+    mensagem; nos demais, os blocos ausentes são acrescentados ao final.
+    """
+    source = source or ""
+    declared = _undeclared(source)
+    missing = [(slot, body) for slot, body in SLOT_BLOCKS if slot not in declared]
+    if "message" in declared:
+        return source + "".join(
+            f"{{% if {slot} %}}\n\n{body}{{% endif %}}" for slot, body in missing)
+
+    blocks = "".join(f"{{% if {slot} %}}{body}\n\n{{% endif %}}" for slot, body in missing)
+    if source:
+        return source + "\n\n" + blocks + "{{ message }}"
+    return LEGACY_PREFIX + blocks + "{{ message }}"
+
+
+def _undeclared(source):
+    try:
+        return meta.find_undeclared_variables(_env.parse(source))
+    except TemplateSyntaxError as e:
+        raise PromptTemplateError(
+            f"Template inválido (linha {e.lineno}): {e.message}")
+
+
+def template_version(source, few_shots=None):
+    """
+    Calcula a versão (hash SHA-256) de um template e seus exemplos few-shot.
+
+    Returns:
+        str: Hash hexadecimal
+    """
+    payload = json.dumps({"source": source or "", "few_shots": few_shots or []},
+                         sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _cached(version):
+    with _compiled_lock:
+        template = _compiled.get(version)
+        if template is not None:
+            _compiled.move_to_end(version)
+        return template
+
+
+def get_compiled(source, version=None):
+    """
+    Retorna o template compilado, usando o cache por versão.
+
+    Args:
+        source (str): Template já normalizado
+        version (str, optional): Versão do template (calculada se ausente)
+
+    Returns:
+        jinja2.Template: Template compilado
+    """
+    version = version or template_version(source)
+    template = _cached(version)
+    if template is not None:
+        return template
+
+    try:
+        template = _env.from_string(source)
+    except TemplateSyntaxError as e:
+        raise PromptTemplateError(
+            f"Template inválido (linha {e.lineno}): {e.message}")
+
+    with _compiled_lock:
+        _compiled[version] = template
+        while len(_compiled) > COMPILED_CACHE_SIZE:
+            _compiled.popitem(last=False)
+    return template
+
+
+def _agent_source(agent):
+    return agent.get("prompt_template") or agent.get("description") or ""
+
+
+def compile_agent_template(agent):
+    """
+    Valida e pré-compila o template de um agente, calculando os metadados salvos
+    no documento (versão, variáveis e tokens da parte fixa).
+
+    Args:
+        agent (dict): Documento do agente (prompt_template, description,
+            few_shots, variables)
+
+    Returns:
+        dict: Campos template_version, template_variables e template_tokens
+
+    Raises:
+        PromptTemplateError: Se o template for inválido
+    """
+    few_shots = agent.get("few_shots") or []
+    if not isinstance(few_shots, list) or not all(
+            isinstance(shot, dict) for shot in few_shots):
+        raise PromptTemplateError(
+            "few_shots deve ser uma lista de objetos {input, output}.")
+
+    source = normalize_source(_agent_source(agent))
+    version = template_version(source, few_shots)
+    variables = sorted(v for v in _undeclared(source) if v not in RESERVED_SLOTS)
+
+    defaults = agent.get("variables") or {}
+    missing = [v for v in variables if v not in defaults]
+    if missing:
+        raise PromptTemplateError(
+            f"Variáveis sem valor padrão em 'variables': {', '.join(missing)}")
+
+    template = get_compiled(source, version)
+    fixed_part = _render(template, few_shots, defaults, message="")
+
+    return {
+        "template_version": version,
+        "template_variables": variables,
+        "template_tokens": estimate_tokens(fixed_part)
+    }
+
+
+def _render(template, few_shots, variables, message, context="", files=None):
+    values = dict(variables or {})
+    values.update({
+        "message": message,
+        "context": context or "",
+        "files": files or [],
+        "few_shots": few_shots or []
+    })
+    try:
+        return template.render(**values)
+    except SecurityError as e:
+        raise PromptTemplateError(f"Operação não permitida no template: {str(e)}")
+
+
+def fit_context(context, message, template_tokens):
+    """
+    Corta o contexto para que o prompt caiba em PROMPT_MAX_TOKENS.
+
+    Args:
+        context (str): Contexto adicional
+        message (str): Mensagem do usuário
+        template_tokens (int): Tokens da parte fixa do template
+
+    Returns:
+        str: Contexto, inteiro ou cortado no limite disponível
+    """
+    if not context:
+        return context
+    budget = PROMPT_MAX_TOKENS - (template_tokens or 0) - estimate_tokens(message)
+    if estimate_tokens(context) <= budget:
+        return context
+    return context[:max(budget, 0) * CHARS_PER_TOKEN]
+
+
+def render_agent_prompt(agent, message, context=None, files=None, variables=None):
+    """
+    Monta o prompt de um agente a partir do template pré-compilado.
+
+    Args:
+        agent (dict): Documento do agente
+        message (str): Mensagem do usuário
+        context (str, optional): Contexto adicional
+        files (list, optional): Nomes dos arquivos anexados
+        variables (dict, optional): Valores que sobrescrevem os padrões do agente
+
+    Returns:
+        str: Prompt final
+    """
+    few_shots = agent.get("few_shots") or []
+    # Versão gravada ao salvar o agente: o template só é analisado na falta do cache
+    version = agent.get("template_version")
+    template = _cached(version) if version else None
+    if template is None:
+        source = normalize_source(_agent_source(agent))
+        template = get_compiled(source, version or template_version(source, few_shots))
+
+    values = dict(agent.get("variables") or {})
+    values.update(variables or {})
+    context = fit_context(context, message, agent.get("template_tokens"))
+    return _render(template, few_shots, values, message, context, files)
+
+
+def get_cached_agent(db, agent_name):
+    """
+    Busca um agente pelo nome com cache em memória (TTL curto).
+
+    Returns:
+        dict: Documento do agente ou None
+    """
+    key = agent_name.lower()
+    now = time.monotonic()
+    with _agents_lock:
+        entry = _agents.get(key)
+        if entry and entry[0] > now:
+            return entry[1]
+
+    agent = db.agents.find_one({"name": key}, {
+        "_id": 0, "prompt_template": 1, "description": 1, "few_shots": 1,
+        "variables": 1, "template_version": 1, "template_tokens": 1})
+
+    with _agents_lock:
+        _agents[key] = (now + AGENT_CACHE_TTL, agent)
+    return agent
+
+
+def invalidate_agent(agent_name=None):
+    """Remove um agente (ou todos) do cache em memória"""
+    with _agents_lock:
+        if agent_name is None:
+            _agents.clear()
+        else:
+            _agents.pop(agent_name.lower(), None)
@@ -0,0 +1,340 @@
+# backend/app/services/storage_backend.py
+"""
+Backends de armazenamento de arquivos (sistema de arquivos local ou S3).
+
+O backend ativo é escolhido pela configuração USE_S3 e criado uma única vez
+por configuração: o cliente boto3 (thread-safe) é reaproveitado entre as
+requisições em vez de ser recriado a cada upload ou URL pré-assinada.
+
+Uploads para o S3 usam o TransferManager do boto3: objetos acima de
+S3_MULTIPART_THRESHOLD são enviados em partes de S3_MULTIPART_CHUNKSIZE,
+até S3_MAX_CONCURRENCY partes em paralelo.
+
+URLs pré-assinadas são guardadas em memória por (objeto, validade) e
+reaproveitadas até pouco antes de expirarem (PRESIGNED_URL_MARGIN segundos ou
+10% da validade), de modo que listagens repetidas não assinam novamente cada
+item.
+
+Qualquer serviço compatível com S3 (MinIO, por exemplo) pode ser usado
+definindo S3_ENDPOINT_URL; nesse caso o endereçamento por caminho é usado e,
+com S3_CREATE_BUCKET=true, o bucket é criado se não existir.
+"""
+import os
+import time
+import shutil
+import logging
+from threading import Lock
+from collections import OrderedDict
+from flask import current_app, has_app_context
+from app.utils.sharding import shard_path, locate
+
+try:
+    import boto3
+    from boto3.s3.transfer import TransferConfig
+    from botocore.config import Config as BotoConfig
+    from botocore.exceptions import ClientError
+except ImportError:
+    boto3 = None
+
+logger = logging.getLogger(__name__)
+
+LOCAL_STORAGE_FOLDER = os.path.join(os.path.dirname(
+    os.path.dirname(__file__)), 'static', 'uploads')
+LOCAL_URL_PREFIX = "/api/storage/file"
+MB = 1024 * 1024
+DEFAULT_MULTIPART_THRESHOLD = 8 * MB
+DEFAULT_MULTIPART_CHUNKSIZE = 8 * MB
+DEFAULT_MAX_CONCURRENCY = 10
+DEFAULT_URL_EXPIRATION = 3600
+PRESIGNED_CACHE_SIZE = int(os.environ.get('S3_PRESIGNED_CACHE_SIZE', 4096))
+# Uma URL deixa de ser reaproveitada quando restar menos que isto de validade
+PRESIGNED_URL_MARGIN = 300
+# Namespace dos arquivos no blob_store; cada backend tem o seu, então um mesmo
+# conteúdo gravado no disco e no S3 são blobs distintos
+STORAGE_NAMESPACE = "storage"
+
+_backends = {}
+_backends_lock = Lock()
+
+
+class StorageBackend:
+    """Interface comum dos backends de armazenamento"""
+
+    name = None
+
+    def save(self, fileobj, key, content_type=None):
+        """Grava o conteúdo de um arquivo aberto e retorna o storage_path"""
+        raise NotImplementedError
+
+    def delete(self, storage_path):
+        """Remove um arquivo; retorna False se ele não existia"""
+        raise NotImplementedError
+
+    def exists(self, key):
+        raise NotImplementedError
+
+    def size(self, storage_path):
+        """Tamanho do arquivo em bytes (None se não existir)"""
+        raise NotImplementedError
+
+    def url(self, storage_path, expiration=DEFAULT_URL_EXPIRATION):
+        """URL de acesso ao arquivo"""
+        raise NotImplementedError
+
+    def owns(self, storage_path):
+        """Indica se o storage_path pertence a este backend"""
+        raise NotImplementedError
+
+    def key_for(self, storage_path):
+        """Nome do objeto a partir do storage_path"""
+        return storage_path.replace("\\", "/").rsplit("/", 1)[-1]
+
+
+class LocalStorageBackend(StorageBackend):
+    """Arquivos em disco, servidos por /api/storage/file/<nome>"""
+
+    name = "local"
+
+    def __init__(self, root=LOCAL_STORAGE_FOLDER, url_prefix=LOCAL_URL_PREFIX):
+        self.root = root
+        self.url_prefix = url_prefix
+        os.makedirs(root, exist_ok=True)
+
+    def path_for(self, key):
+        """Caminho distribuído (root/ab/cd/<nome>) de um arquivo novo"""
+        return shard_path(self.root, key)
+
+    def find(self, key):
+        """Caminho de um arquivo existente (distribuído ou legado, na raiz)"""
+        return locate(self.root, key)
+
+    def save(self, fileobj, key, content_type=None):
+        path = self.path_for(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        partial = f"{path}.part"
+        with open(partial, "wb") as f:
+            shutil.copyfileobj(fileobj, f, DEFAULT_MULTIPART_CHUNKSIZE)
+        os.replace(partial, path)
+        return path
+
+    def delete(self, storage_path):
+        try:
+            os.remove(storage_path)
+            return True
+        except FileNotFoundError:
+            return False
+
+    def exists(self, key):
+        return self.find(key) is not None
+
+    def size(self, storage_path):
+        try:
+            return os.path.getsize(storage_path)
+        except OSError:
+            return None
+
+    def url(self, storage_path, expiration=DEFAULT_URL_EXPIRATION):
+        return f"{self.url_prefix}/{self.key_for(storage_path)}"
+
+    def owns(self, storage_path):
+        return not storage_path.startswith("s3://")
+
+
+class S3StorageBackend(StorageBackend):
+    """Objetos em um bucket S3 (ou serviço compatível via endpoint_url)"""
+
+    name = "s3"
+
+    def __init__(self, bucket, region=None, access_key=None, secret_key=None,
+                 endpoint_url=None, multipart_threshold=DEFAULT_MULTIPART_THRESHOLD,
+                 multipart_chunksize=DEFAULT_MULTIPART_CHUNKSIZE,
+                 max_concurrency=DEFAULT_MAX_CONCURRENCY):
+        if boto3 is None:
+            raise RuntimeError("boto3 não está instalado; armazenamento S3 indisponível")
+        if not bucket:
+            raise RuntimeError("S3_BUCKET não configurado")
+
+        self.bucket = bucket
+        self.prefix = f"s3://{bucket}/"
+        # Um pool de conexões por parte enviada em paralelo
+        self.client = boto3.client(
+            's3',
+            region_name=region,
+            endpoint_url=endpoint_url,
+            aws_access_key_id=access_key,
+            aws_secret_access_key=secret_key,
+            config=BotoConfig(
+                max_pool_connections=max_concurrency,
+                s3={"addressing_style": "path" if endpoint_url else "auto"},
+                retries={"max_attempts": 5, "mode": "standard"}
+            )
+        )
+        self.transfer_config = TransferConfig(
+            multipart_threshold=multipart_threshold,
+            multipart_chunksize=multipart_chunksize,
+            max_concurrency=max_concurrency,
+            use_threads=True
+        )
+        # (key, expiration) -> (url, reaproveitável até)
+        self._presigned = OrderedDict()
+        self._presigned_lock = Lock()
+
+    def ensure_bucket(self):
+        """Cria o bucket se ele não existir (serviços locais, como o MinIO)"""
+        try:
+            self.client.head_bucket(Bucket=self.bucket)
+        except ClientError:
+            self.client.create_bucket(Bucket=self.bucket)
+            logger.info(f"Bucket {self.bucket} criado")
+
+    def save(self, fileobj, key, content_type=None):
+        extra_args = {"ACL": "private"}
+        if content_type:
+            extra_args["ContentType"] = content_type
+        self.client.upload_fileobj(
+            fileobj, self.bucket, key,
+            ExtraArgs=extra_args, Config=self.transfer_config)
+        return f"{self.prefix}{key}"
+
+    def delete(self, storage_path):
+        key = self.key_for(storage_path)
+        self.client.delete_object(Bucket=self.bucket, Key=key)
+        with self._presigned_lock:
+            for cached in [k for k in self._presigned if k[0] == key]:
+                del self._presigned[cached]
+        return True
+
+    def exists(self, key):
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=key)
+            return True
+        except ClientError:
+            return False
+
+    def size(self, storage_path):
+        try:
+            return self.client.head_object(
+                Bucket=self.bucket, Key=self.key_for(storage_path))["ContentLength"]
+        except ClientError:
+            return None
+
+    def url(self, storage_path, expiration=DEFAULT_URL_EXPIRATION):
+        key = self.key_for(storage_path)
+        cache_key = (key, expiration)
+        now = time.monotonic()
+        with self._presigned_lock:
+            cached = self._presigned.get(cache_key)
+            if cached and cached[1] > now:
+                self._presigned.move_to_end(cache_key)
+                return cached[0]
+
+        try:
+            url = self.client.generate_presigned_url(
+                'get_object',
+                Params={'Bucket': self.bucket, 'Key': key},
+                ExpiresIn=expiration
+            )
+        except Exception as e:
+            logger.error(f"Erro ao gerar URL pré-assinada: {str(e)}")
+            return None
+
+        # URLs de validade curta não são guardadas
+        reusable_for = expiration - max(PRESIGNED_URL_MARGIN, expiration // 10)
+        if reusable_for > 0:
+            with self._presigned_lock:
+                self._presigned[cache_key] = (url, now + reusable_for)
+                while len(self._presigned) > PRESIGNED_CACHE_SIZE:
+                    self._presigned.popitem(last=False)
+        return url
+
+    def owns(self, storage_path):
+        return storage_path.startswith("s3://")
+
+    def key_for(self, storage_path):
+        if storage_path.startswith(self.prefix):
+            return storage_path[len(self.prefix):]
+        return super().key_for(storage_path)
+
+
+def _config_value(config, key, default=None):
+    value = config.get(key) if config is not None else None
+    if value is None:
+        value = os.environ.get(key, default)
+    return value
+
+
+def _flag(value):
+    return str(value).lower() == "true" if not isinstance(value, bool) else value
+
+
+def get_storage_backend(config=None):
+    """
+    Obtém o backend de armazenamento configurado (reaproveitado entre chamadas).
+
+    Args:
+        config (dict, optional): Configuração; padrão app.config (ou variáveis
+            de ambiente fora do contexto da aplicação)
+
+    Returns:
+        StorageBackend: Backend local ou S3
+    """
+    if config is None and has_app_context():
+        config = current_app.config
+
+    if not _flag(_config_value(config, 'USE_S3', False)):
+        settings = ("local", _config_value(config, 'LOCAL_UPLOAD_FOLDER', LOCAL_STORAGE_FOLDER))
+    else:
+        settings = (
+            "s3",
+            _config_value(config, 'S3_BUCKET'),
+            _config_value(config, 'S3_REGION'),
+            _config_value(config, 'AWS_ACCESS_KEY'),
+            _config_value(config, 'AWS_SECRET_KEY'),
+            _config_value(config, 'S3_ENDPOINT_URL') or None,
+            int(_config_value(config, 'S3_MULTIPART_THRESHOLD', DEFAULT_MULTIPART_THRESHOLD)),
+            int(_config_value(config, 'S3_MULTIPART_CHUNKSIZE', DEFAULT_MULTIPART_CHUNKSIZE)),
+            int(_config_value(config, 'S3_MAX_CONCURRENCY', DEFAULT_MAX_CONCURRENCY)),
+        )
+
+    backend = _backends.get(settings)
+    if backend is not None:
+        return backend
+
+    with _backends_lock:
+        backend = _backends.get(settings)
+        if backend is None:
+            if settings[0] == "local":
+                backend = LocalStorageBackend(settings[1])
+            else:
+                backend = S3StorageBackend(*settings[1:])
+                if _flag(_config_value(config, 'S3_CREATE_BUCKET', False)):
+                    backend.ensure_bucket()
+            _backends[settings] = backend
+        return backend
+
+
+def get_backend_for_path(storage_path, config=None):
+    """
+    Backend responsável por um storage_path já gravado.
+
+    Arquivos locais continuam acessíveis mesmo com o S3 habilitado (e vice-versa,
+    enquanto as credenciais do S3 estiverem configuradas).
+    """
+    backend = get_storage_backend(config)
+    if backend.owns(storage_path):
+        return backend
+    if backend.name == "s3":
+        return get_storage_backend({'USE_S3': False})
+    if config is None:
+        config = current_app.config if has_app_context() else {}
+    return get_storage_backend(dict(config, USE_S3=True))
+
+
+def storage_namespace(backend_name):
+    """Namespace no blob_store dos arquivos de um backend (local, s3)"""
+    return STORAGE_NAMESPACE if backend_name == "local" else f"{STORAGE_NAMESPACE}_{backend_name}"
+
+
+def storage_namespace_for_path(storage_path):
+    """Namespace no blob_store de um storage_path já gravado"""
+    return storage_namespace("s3" if (storage_path or "").startswith("s3://") else "local")
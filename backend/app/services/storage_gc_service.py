@@ -0,0 +1,435 @@
+# backend/app/services/storage_gc_service.py
+"""
+Coleta de lixo dos arquivos armazenados.
+
+Executada periodicamente (tarefa storage.gc), remove:
+
+    uploads órfãos         Uploads de conversas que já foram excluídas
+    sessões expiradas      upload_sessions vencidas e seus arquivos parciais
+    temporários vencidos   StorageItem com is_temporary e expires_at no passado
+    excluídos              StorageItem excluídos logicamente há mais de
+                           GC_DELETED_RETENTION_DAYS
+    exportações            Artefatos do export_cache sem referências e sem
+                           acesso há GC_EXPORT_RETENTION_DAYS
+    blobs sem referência   Registros de blobs com refcount zerado
+    arquivos órfãos        Arquivos em disco sem registro correspondente
+
+O trabalho é feito em lotes de GC_BATCH_SIZE, com pausa de
+GC_BATCH_PAUSE_SECONDS entre lotes e no máximo GC_MAX_ITEMS_PER_RUN itens por
+categoria em cada execução. As varreduras (uploads e diretórios) guardam um
+cursor na coleção gc_state e continuam de onde pararam na execução seguinte,
+de modo que o custo de cada execução não cresce com o volume armazenado.
+"""
+import os
+import re
+import time
+import heapq
+import logging
+from datetime import datetime, timedelta
+from bson import ObjectId
+from app.db import get_db
+from app.utils.date_utils import utcnow
+from app.utils.sharding import leaf_dirs
+from app.services import blob_store
+from app.services.export_cache_service import CACHE_COLLECTION, remove_artifact
+from app.services.export_service import EXPORT_STORAGE_PATH
+from app.services.image_service import IMAGE_NAMESPACE, IMAGE_STORAGE_PATH
+from app.services.image_variant_service import VARIANT_STORAGE_PATH
+from app.services.storage_backend import (
+    get_backend_for_path, storage_namespace_for_path, STORAGE_NAMESPACE, LOCAL_STORAGE_FOLDER)
+from app.services.upload_service import (
+    UPLOAD_NAMESPACE, BLOB_UPLOAD_FOLDER, TEMP_UPLOAD_FOLDER, delete_upload_file,
+    release_session_blob)
+from app.services.upload_ingest_service import THUMBNAIL_FOLDER
+
+logger = logging.getLogger(__name__)
+
+GC_BATCH_SIZE = int(os.environ.get('GC_BATCH_SIZE', 100))
+GC_BATCH_PAUSE_SECONDS = float(os.environ.get('GC_BATCH_PAUSE_SECONDS', 0.5))
+GC_MAX_ITEMS_PER_RUN = int(os.environ.get('GC_MAX_ITEMS_PER_RUN', 5000))
+GC_DELETED_RETENTION_DAYS = int(os.environ.get('GC_DELETED_RETENTION_DAYS', 30))
+GC_EXPORT_RETENTION_DAYS = int(os.environ.get('GC_EXPORT_RETENTION_DAYS', 7))
+# Arquivos mais novos que isso nunca são considerados órfãos (gravações em curso)
+GC_MIN_FILE_AGE_SECONDS = int(os.environ.get('GC_MIN_FILE_AGE_SECONDS', 24 * 3600))
+GC_STATE_COLLECTION = "gc_state"
+
+_SHA256 = re.compile(r"^[0-9a-f]{64}$")
+_UUID = re.compile(r"^[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}$")
+_UUID_HEX = re.compile(r"^[0-9a-f]{32}$")
+
+
+def _summary():
+    return {"itens": 0, "bytes": 0}
+
+
+def _pause():
+    if GC_BATCH_PAUSE_SECONDS > 0:
+        time.sleep(GC_BATCH_PAUSE_SECONDS)
+
+
+def _batches(items, size=None, limit=None):
+    """Agrupa um iterável em lotes, pausando entre eles e respeitando o limite"""
+    size = size or GC_BATCH_SIZE
+    limit = limit or GC_MAX_ITEMS_PER_RUN
+    batch, total = [], 0
+    for item in items:
+        if total >= limit:
+            break
+        batch.append(item)
+        total += 1
+        if len(batch) >= size:
+            yield batch
+            batch = []
+            _pause()
+    if batch:
+        yield batch
+
+
+def _get_cursor(db, name):
+    state = db[GC_STATE_COLLECTION].find_one({"_id": name})
+    return state.get("cursor") if state else None
+
+
+def _set_cursor(db, name, cursor):
+    db[GC_STATE_COLLECTION].update_one(
+        {"_id": name}, {"$set": {"cursor": cursor, "updated_at": utcnow()}}, upsert=True)
+
+
+def _remove_file(path):
+    try:
+        size = os.path.getsize(path)
+        os.remove(path)
+        return size
+    except FileNotFoundError:
+        return 0
+
+
+# --------------------------
+# Registros no MongoDB
+# --------------------------
+
+def collect_orphan_uploads(db):
+    """Remove uploads associados a conversas que não existem mais"""
+    summary = _summary()
+    cursor = _get_cursor(db, "uploads")
+    query = {"conversation_id": {"$nin": [None, ""]}}
+    if cursor:
+        query["_id"] = {"$gt": cursor}
+    uploads = db.uploads.find(
+        query, {"conversation_id": 1, "content_hash": 1, "file_path": 1, "file_size": 1}
+    ).sort("_id", 1)
+
+    last_id, scanned = None, 0
+    for batch in _batches(uploads):
+        last_id = batch[-1]["_id"]
+        scanned += len(batch)
+        conversation_ids = {u["conversation_id"] for u in batch
+                            if ObjectId.is_valid(u["conversation_id"])}
+        existing = {str(c["_id"]) for c in db.conversations.find(
+            {"_id": {"$in": [ObjectId(c) for c in conversation_ids]}}, {"_id": 1})}
+        orphans = [u for u in batch if u["conversation_id"] not in existing]
+        for upload in orphans:
+            delete_upload_file(upload)
+            summary["bytes"] += upload.get("file_size") or 0
+        if orphans:
+            db.uploads.delete_many({"_id": {"$in": [u["_id"] for u in orphans]}})
+            summary["itens"] += len(orphans)
+
+    # Varredura completa: recomeça do início na próxima execução
+    _set_cursor(db, "uploads", last_id if scanned >= GC_MAX_ITEMS_PER_RUN else None)
+    return summary
+
+
+def collect_expired_sessions(db):
+    """
+    Remove sessões de upload retomável vencidas e seus arquivos parciais.
+
+    Sessões em finalização (status "finalizando") nunca são removidas: o blob
+    publicado ainda está sendo registrado como upload.
+    """
+    summary = _summary()
+    query = {"status": {"$in": ["em_andamento", "concluido"]},
+             "expires_at": {"$lt": utcnow()}}
+    sessions = db.upload_sessions.find(query, {"_id": 1}).sort("expires_at", 1)
+    for batch in _batches(sessions):
+        for candidate in batch:
+            # A sessão pode ter recebido um bloco ou iniciado a finalização
+            session = db.upload_sessions.find_one_and_delete(
+                dict(query, _id=candidate["_id"]))
+            if not session:
+                continue
+            release_session_blob(session)
+            summary["bytes"] += _remove_file(
+                os.path.join(TEMP_UPLOAD_FOLDER, f"{session['_id']}.part"))
+            summary["itens"] += 1
+    return summary
+
+
+def collect_unreferenced_exports(db):
+    """Remove artefatos de exportação sem referências e sem acesso recente"""
+    summary = _summary()
+    cutoff = utcnow() - timedelta(days=GC_EXPORT_RETENTION_DAYS)
+    entries = db[CACHE_COLLECTION].find(
+        {"refcount": {"$lte": 0}, "last_access_at": {"$lt": cutoff}},
+        {"path": 1, "size": 1}).sort("last_access_at", 1)
+    for batch in _batches(entries):
+        for entry in batch:
+            remove_artifact(db, entry)
+            summary["bytes"] += entry.get("size", 0)
+        summary["itens"] += len(batch)
+    return summary
+
+
+def collect_unreferenced_blobs(db):
+    """Remove blobs cujo refcount chegou a zero sem que o arquivo fosse apagado"""
+    summary = _summary()
+    blobs = db[blob_store.BLOB_COLLECTION].find({"refcount": {"$lte": 0}})
+    for batch in _batches(blobs):
+        for blob in batch:
+            # Só remove se nenhuma referência nova chegou nesse meio tempo
+            if not db[blob_store.BLOB_COLLECTION].delete_one(
+                    {"_id": blob["_id"], "refcount": {"$lte": 0}}).deleted_count:
+                continue
+            if blob["path"].startswith("s3://"):
+                get_backend_for_path(blob["path"]).delete(blob["path"])
+            else:
+                _remove_file(blob["path"])
+            summary["itens"] += 1
+            summary["bytes"] += blob.get("size", 0)
+    return summary
+
+
+# --------------------------
+# StorageItem (SQL)
+# --------------------------
+
+def _purge_storage_item(item):
+    """Remove o arquivo e o registro de um StorageItem (sem commit)"""
+    from app.extensions import db as sql
+    from app.services.storage_usage_service import track_item_removed
+
+    track_item_removed(item)
+    if item.content_hash:
+        blob = blob_store.release(
+            storage_namespace_for_path(item.storage_path), item.content_hash)
+        if blob and blob["path"].startswith("s3://"):
+            get_backend_for_path(blob["path"]).delete(blob["path"])
+    else:
+        get_backend_for_path(item.storage_path).delete(item.storage_path)
+    sql.session.delete(item)
+
+
+def collect_storage_items():
+    """
+    Remove StorageItem temporários vencidos e excluídos há mais que a retenção.
+
+    Requer o contexto da aplicação Flask (SQLAlchemy).
+    """
+    from app.extensions import db as sql
+    from app.models.storage import StorageItem
+
+    summary = _summary()
+    now = datetime.utcnow()
+    retention = now - timedelta(days=GC_DELETED_RETENTION_DAYS)
+    query = StorageItem.query.filter(sql.or_(
+        sql.and_(StorageItem.is_temporary.is_(True), StorageItem.expires_at < now),
+        sql.and_(StorageItem.deleted.is_(True), StorageItem.deleted_at < retention)
+    )).order_by(StorageItem.id)
+
+    while summary["itens"] < GC_MAX_ITEMS_PER_RUN:
+        batch = query.limit(min(GC_BATCH_SIZE, GC_MAX_ITEMS_PER_RUN - summary["itens"])).all()
+        if not batch:
+            break
+        for item in batch:
+            _purge_storage_item(item)
+            summary["bytes"] += item.size_bytes or 0
+        sql.session.commit()
+        summary["itens"] += len(batch)
+        _pause()
+    return summary
+
+
+# --------------------------
+# Arquivos órfãos em disco
+# --------------------------
+
+def _blob_exists(db, namespace):
+    def check(stems):
+        ids = [f"{namespace}:{s}" for s in stems]
+        found = {b["_id"].split(":", 1)[1] for b in db[blob_store.BLOB_COLLECTION].find(
+            {"_id": {"$in": ids}}, {"_id": 1})}
+        return found
+    return check
+
+
+def _images_exist(db):
+    """Imagens: blobs por conteúdo ou image_id das imagens anteriores ao blob_store"""
+    blobs = _blob_exists(db, IMAGE_NAMESPACE)
+
+    def check(stems):
+        found = blobs([s for s in stems if _SHA256.match(s)])
+        legacy = [s for s in stems if not _SHA256.match(s)]
+        if legacy:
+            found |= {i["image_id"] for i in db.images.find(
+                {"image_id": {"$in": legacy}}, {"image_id": 1})}
+        return found
+    return check
+
+
+def _exports_exist(db):
+    def check(stems):
+        return {e["_id"] for e in db[CACHE_COLLECTION].find(
+            {"_id": {"$in": list(stems)}}, {"_id": 1})}
+    return check
+
+
+def _sessions_exist(db):
+    def check(stems):
+        return {s["_id"] for s in db.upload_sessions.find(
+            {"_id": {"$in": list(stems)}}, {"_id": 1})}
+    return check
+
+
+def _stem(name):
+    return name.split(".", 1)[0]
+
+
+def _variant_stem(name):
+    # <stem>-<largura>.<formato> ou <stem>-thumb.webp
+    return name.rsplit("-", 1)[0]
+
+
+def _image_name(stem):
+    return bool(_SHA256.match(stem) or _UUID.match(stem))
+
+
+def _directories(db):
+    """
+    (nome, diretório, extrator do identificador, verificação de existência,
+    formato dos identificadores gerenciados)
+
+    Arquivos cujo nome não segue o formato gerenciado (ex.: anteriores ao
+    armazenamento por conteúdo) nunca são removidos.
+    """
+    return [
+        ("images", IMAGE_STORAGE_PATH, _stem, _images_exist(db), _image_name),
+        ("variants", VARIANT_STORAGE_PATH, _variant_stem, _images_exist(db), _image_name),
+        ("uploads", BLOB_UPLOAD_FOLDER, _stem, _blob_exists(db, UPLOAD_NAMESPACE), _SHA256.match),
+        ("thumbnails", THUMBNAIL_FOLDER, _stem, _blob_exists(db, UPLOAD_NAMESPACE), _SHA256.match),
+        ("sessions", TEMP_UPLOAD_FOLDER, _stem, _sessions_exist(db), _UUID_HEX.match),
+        ("storage", LOCAL_STORAGE_FOLDER, _stem, _blob_exists(db, STORAGE_NAMESPACE), _SHA256.match),
+        ("exports", EXPORT_STORAGE_PATH, _stem, _exports_exist(db), _SHA256.match),
+    ]
+
+
+def _scan(directory, after, limit):
+    """
+    Os `limit` primeiros arquivos após o cursor `after`, como caminhos
+    relativos ao diretório ("<nome>" na raiz, "ab/cd/<nome>" nos subdiretórios).
+
+    Os subdiretórios são percorridos em ordem e apenas os necessários para
+    completar o lote são listados; os.scandir lê só as entradas (sem stat).
+    """
+    after_dir, after_name = os.path.split(after) if after else ("", None)
+    found = []
+    for relative in leaf_dirs(directory):
+        if after and relative < after_dir:
+            continue
+        resume = after_name if after and relative == after_dir else None
+        try:
+            with os.scandir(os.path.join(directory, relative)) as entries:
+                names = (e.name for e in entries
+                         if e.is_file(follow_symlinks=False)
+                         and (resume is None or e.name > resume))
+                chosen = heapq.nsmallest(limit - len(found), names)
+        except FileNotFoundError:
+            continue
+        found.extend(f"{relative}/{name}" if relative else name for name in chosen)
+        if len(found) >= limit:
+            break
+    return found
+
+
+def collect_orphan_files(db):
+    """Remove arquivos em disco sem registro correspondente"""
+    summary = _summary()
+    min_mtime = time.time() - GC_MIN_FILE_AGE_SECONDS
+
+    for name, directory, stem_of, exists, managed in _directories(db):
+        state_name = f"dir:{name}"
+        names = _scan(directory, _get_cursor(db, state_name), GC_MAX_ITEMS_PER_RUN)
+
+        for batch in _batches(names):
+            candidates = {}
+            for relative in batch:
+                path = os.path.join(directory, relative)
+                filename = os.path.basename(relative)
+                try:
+                    if os.path.getmtime(path) > min_mtime:
+                        continue
+                except FileNotFoundError:
+                    continue
+                if filename.startswith(".") and filename.endswith(".part"):
+                    # Gravação interrompida do blob_store
+                    summary["bytes"] += _remove_file(path)
+                    summary["itens"] += 1
+                    continue
+                stem = stem_of(filename)
+                if not managed(stem):
+                    continue
+                candidates.setdefault(stem, []).append(path)
+
+            known = exists(list(candidates)) if candidates else set()
+            for stem, paths in candidates.items():
+                if stem in known:
+                    continue
+                for path in paths:
+                    summary["bytes"] += _remove_file(path)
+                    summary["itens"] += 1
+
+        # Lote incompleto: o diretório foi percorrido até o fim
+        _set_cursor(db, state_name,
+                    names[-1] if len(names) >= GC_MAX_ITEMS_PER_RUN else None)
+    return summary
+
+
+def run_gc(include_sql=True):
+    """
+    Executa todas as etapas da coleta de lixo.
+
+    Args:
+        include_sql (bool): Inclui os StorageItem (requer contexto da aplicação)
+
+    Returns:
+        dict: Itens e bytes recuperados por etapa e no total
+    """
+    db = get_db()
+    steps = [
+        ("uploads_orfaos", lambda: collect_orphan_uploads(db)),
+        ("sessoes_expiradas", lambda: collect_expired_sessions(db)),
+        ("exportacoes", lambda: collect_unreferenced_exports(db)),
+        ("blobs", lambda: collect_unreferenced_blobs(db)),
+    ]
+    if include_sql:
+        steps.append(("storage_items", collect_storage_items))
+    # Por último, para que os arquivos liberados acima não sejam contados duas vezes
+    steps.append(("arquivos_orfaos", lambda: collect_orphan_files(db)))
+
+    report = {"total": _summary()}
+    for name, step in steps:
+        try:
+            report[name] = step()
+        except Exception as e:
+            logger.error(f"Erro na coleta de lixo ({name}): {str(e)}")
+            report[name] = {"error": str(e)}
+            continue
+        report["total"]["itens"] += report[name]["itens"]
+        report["total"]["bytes"] += report[name]["bytes"]
+
+    logger.info(
+        f"Coleta de lixo: {report['total']['itens']} itens removidos, "
+        f"{report['total']['bytes']} bytes recuperados")
+    db[GC_STATE_COLLECTION].update_one(
+        {"_id": "last_run"}, {"$set": {"report": report, "finished_at": utcnow()}},
+        upsert=True)
+    return report
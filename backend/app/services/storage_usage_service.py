@@ -0,0 +1,155 @@
+# backend/app/services/storage_usage_service.py
+"""
+Contadores de uso de armazenamento por usuário (tabela storage_usage).
+
+Uploads e exclusões de StorageItem atualizam o resumo (quantidade e bytes por
+tipo de conteúdo) na mesma sessão, antes do commit: o contador e o item são
+gravados na mesma transação. O dashboard lê o resumo com uma consulta pela
+chave primária, sem COUNT/SUM sobre storage_items.
+
+reconcile_usage recalcula os agregados a partir de storage_items e corrige
+divergências (executado periodicamente pela tarefa storage.reconcile_usage),
+usuário a usuário e com as linhas do usuário bloqueadas durante a contagem.
+"""
+import logging
+from sqlalchemy.exc import IntegrityError
+from app.extensions import db
+from app.models.storage import StorageItem, StorageUsage
+
+logger = logging.getLogger(__name__)
+
+
+def _apply(user_id, content_type, files, size_bytes):
+    """Soma os deltas ao resumo do usuário (sem commit)"""
+    updated = StorageUsage.query.filter_by(
+        user_id=user_id, content_type=content_type
+    ).update({
+        StorageUsage.file_count: StorageUsage.file_count + files,
+        StorageUsage.total_bytes: StorageUsage.total_bytes + size_bytes
+    }, synchronize_session=False)
+    if updated:
+        return
+
+    # Primeiro arquivo do tipo: cria a linha (outra requisição pode criá-la antes)
+    try:
+        with db.session.begin_nested():
+            db.session.add(StorageUsage(
+                user_id, content_type, max(files, 0), max(size_bytes, 0)))
+    except IntegrityError:
+        _apply(user_id, content_type, files, size_bytes)
+
+
+def track_item_added(item):
+    """Contabiliza um StorageItem novo (chamar antes do commit)"""
+    _apply(item.user_id, item.content_type, 1, item.size_bytes or 0)
+
+
+def track_item_removed(item):
+    """Descontabiliza um StorageItem excluído (lógica ou fisicamente)"""
+    if item.deleted:
+        # Já descontado na exclusão lógica
+        return
+    _apply(item.user_id, item.content_type, -1, -(item.size_bytes or 0))
+
+
+def get_usage(user_id):
+    """
+    Obtém o resumo de uso de um usuário.
+
+    Returns:
+        dict: total_files, storage_usage_bytes e type_stats
+    """
+    rows = StorageUsage.query.filter_by(user_id=user_id).all()
+    type_stats = [{
+        "content_type": row.content_type,
+        "count": row.file_count,
+        "size_bytes": row.total_bytes
+    } for row in rows if row.file_count > 0]
+    return {
+        "total_files": sum(stat["count"] for stat in type_stats),
+        "storage_usage_bytes": sum(stat["size_bytes"] for stat in type_stats),
+        "type_stats": type_stats
+    }
+
+
+def _user_ids(user_id=None):
+    """Usuários com itens ou contadores (ou apenas o informado)"""
+    if user_id is not None:
+        return [user_id]
+    items = db.session.query(StorageItem.user_id).distinct()
+    usage = db.session.query(StorageUsage.user_id).distinct()
+    return sorted({uid for uid, in items} | {uid for uid, in usage})
+
+
+def _reconcile_user(user_id):
+    """
+    Reconcilia os contadores de um usuário em uma transação própria.
+
+    As linhas do usuário em storage_usage são bloqueadas (SELECT ... FOR UPDATE)
+    antes da agregação: uploads e exclusões concorrentes atualizam essas mesmas
+    linhas em _apply e aguardam o commit, e um upload que já as atualizou faz a
+    reconciliação aguardar até que o item esteja visível. Assim a contagem e a
+    escrita não se intercalam com um delta em andamento.
+
+    Returns:
+        tuple: (linhas verificadas, linhas corrigidas)
+    """
+    rows = {row.content_type: row for row in StorageUsage.query.filter_by(
+        user_id=user_id).with_for_update().all()}
+    actual = {ctype: (int(count), int(size)) for ctype, count, size in db.session.query(
+        StorageItem.content_type,
+        db.func.count(StorageItem.id),
+        db.func.coalesce(db.func.sum(StorageItem.size_bytes), 0)
+    ).filter(
+        StorageItem.user_id == user_id,
+        StorageItem.deleted.is_(False)
+    ).group_by(StorageItem.content_type)}
+
+    keys = set(actual) | set(rows)
+    corrected = 0
+    for content_type in keys:
+        count, size = actual.get(content_type, (0, 0))
+        row = rows.get(content_type)
+        if row is None:
+            # Sem linha para bloquear: um upload concorrente pode criá-la antes
+            try:
+                with db.session.begin_nested():
+                    db.session.add(StorageUsage(user_id, content_type, count, size))
+            except IntegrityError:
+                continue
+        elif (row.file_count, row.total_bytes) != (count, size):
+            row.file_count, row.total_bytes = count, size
+        else:
+            continue
+        corrected += 1
+        logger.warning(
+            f"Uso de armazenamento divergente corrigido: usuário {user_id}, "
+            f"tipo {content_type} -> {count} arquivos, {size} bytes")
+
+    db.session.commit()
+    return len(keys), corrected
+
+
+def reconcile_usage(user_id=None):
+    """
+    Recalcula os contadores a partir de storage_items e corrige divergências.
+
+    Cada usuário é reconciliado em sua própria transação, com as linhas de
+    storage_usage bloqueadas durante a contagem (ver _reconcile_user).
+
+    Args:
+        user_id (int, optional): Reconcilia apenas um usuário
+
+    Returns:
+        dict: Número de linhas verificadas e corrigidas
+    """
+    checked = corrected = 0
+    for uid in _user_ids(user_id):
+        try:
+            user_checked, user_corrected = _reconcile_user(uid)
+        except Exception:
+            db.session.rollback()
+            raise
+        checked += user_checked
+        corrected += user_corrected
+    return {"verificados": checked, "corrigidos": corrected}
@@ -0,0 +1,464 @@
+# backend/app/services/upload_ingest_service.py
+"""
+Pipeline de ingestão dos uploads.
+
+A requisição de upload apenas grava os bytes (blob_store) e registra o
+upload; as etapas abaixo rodam em segundo plano (tarefa uploads.ingest) e
+anotam o registro na coleção uploads:
+
+    sniff       Tipo real pelo conteúdo (magic bytes): detected_type, type_mismatch
+    metadata    Dimensões das imagens (width, height) e páginas dos PDFs (page_count)
+    thumbnail   Miniatura WebP em uploads/thumbnails/ab/cd/<sha256>.webp (thumbnail_path)
+    scan        Antivírus opcional (scan_status, scan_signature)
+
+O andamento fica em ingest_status (pendente, em_andamento, concluido, falha);
+o worker reserva o upload por INGEST_LEASE_SECONDS (ingest_lease_until). A
+tarefa uploads.reschedule retoma as ingestões interrompidas e repete as que
+falharam (ex.: antivírus indisponível), com backoff, até INGEST_MAX_ATTEMPTS.
+Arquivos executáveis ou infectados recebem quarantined=True e não podem ser
+baixados. Com um antivírus configurado, o arquivo e a miniatura só são
+servidos depois da ingestão (verification_status). Uploads com o mesmo
+conteúdo reaproveitam o resultado já obtido, desde que a varredura tenha sido
+concluída pelo antivírus atual (scan_engine).
+
+Antivírus (MALWARE_SCANNER):
+    none    Sem varredura (padrão)
+    clamd   Daemon ClamAV via protocolo INSTREAM (CLAMD_HOST/CLAMD_PORT ou
+            CLAMD_SOCKET)
+    local   Substituto local para desenvolvimento e testes: detecta apenas a
+            assinatura de teste EICAR
+"""
+import os
+import socket
+import struct
+import zipfile
+import logging
+import mimetypes
+from datetime import timedelta
+from bson import ObjectId
+from PIL import Image
+from pymongo import ReturnDocument
+from app.db import get_db
+from app.utils.date_utils import utcnow
+from app.utils.sharding import shard_path
+from app.services.upload_service import UPLOAD_FOLDER, CHUNK_READ_SIZE
+from app.services.document_index_service import schedule_document
+
+try:
+    import fitz  # pymupdf
+except ImportError:
+    fitz = None
+
+logger = logging.getLogger(__name__)
+
+THUMBNAIL_FOLDER = os.path.join(UPLOAD_FOLDER, 'thumbnails')
+THUMBNAIL_SIZE = 256
+SNIFF_BYTES = 8192
+INGEST_FIELDS = ("detected_type", "type_mismatch", "width", "height", "page_count",
+                 "thumbnail_path", "scan_status", "scan_signature", "scan_engine",
+                 "quarantined")
+# Reserva do upload durante a ingestão (workers interrompidos)
+INGEST_LEASE_SECONDS = int(os.environ.get('UPLOAD_INGEST_LEASE_SECONDS', 600))
+# Upload pendente sem ingestão iniciada (ex.: falha ao agendar a tarefa)
+INGEST_STALE_SECONDS = 900
+INGEST_MAX_ATTEMPTS = int(os.environ.get('UPLOAD_INGEST_MAX_ATTEMPTS', 5))
+# Espera antes de repetir uma ingestão que falhou (dobra a cada tentativa)
+INGEST_RETRY_BASE_SECONDS = 60
+# Resultados de varredura que valem para outros uploads do mesmo conteúdo
+FINAL_SCAN_STATUSES = ("limpo", "infectado")
+
+MALWARE_SCANNER = os.environ.get('MALWARE_SCANNER', 'none')
+CLAMD_HOST = os.environ.get('CLAMD_HOST', 'clamav')
+CLAMD_PORT = int(os.environ.get('CLAMD_PORT', 3310))
+CLAMD_SOCKET = os.environ.get('CLAMD_SOCKET')
+CLAMD_TIMEOUT = int(os.environ.get('CLAMD_TIMEOUT', 60))
+
+EICAR_SIGNATURE = b"EICAR-STANDARD-ANTIVIRUS-TEST-FILE"
+EXECUTABLE_TYPES = {"application/x-msdownload", "application/x-executable",
+                    "application/x-mach-binary"}
+TEXT_EXTENSIONS = {"txt", "csv", "json", "xml", "svg"}
+
+
+# --------------------------
+# Etapas
+# --------------------------
+
+def _zip_type(path):
+    """Distingue os formatos do Office Open XML (zip) pelo conteúdo do pacote"""
+    try:
+        with zipfile.ZipFile(path) as package:
+            names = set(package.namelist())
+    except zipfile.BadZipFile:
+        return "application/zip"
+    if "word/document.xml" in names:
+        return "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+    if "xl/workbook.xml" in names:
+        return "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+    return "application/zip"
+
+
+def sniff_type(path, ext=None):
+    """
+    Identifica o tipo do arquivo pelos primeiros bytes.
+
+    Returns:
+        str: MIME type detectado
+    """
+    with open(path, "rb") as f:
+        head = f.read(SNIFF_BYTES)
+
+    if head.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "image/png"
+    if head.startswith(b"\xff\xd8\xff"):
+        return "image/jpeg"
+    if head[:6] in (b"GIF87a", b"GIF89a"):
+        return "image/gif"
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "image/webp"
+    if head.startswith(b"%PDF-"):
+        return "application/pdf"
+    if head.startswith(b"PK\x03\x04"):
+        return _zip_type(path)
+    if head.startswith(b"\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1"):
+        # Formatos binários antigos do Office (doc, xls)
+        return mimetypes.guess_type(f"x.{ext}")[0] if ext in ("doc", "xls") \
+            else "application/x-ole-storage"
+    if head.startswith(b"MZ"):
+        return "application/x-msdownload"
+    if head.startswith(b"\x7fELF"):
+        return "application/x-executable"
+    if head[:4] in (b"\xcf\xfa\xed\xfe", b"\xce\xfa\xed\xfe"):
+        return "application/x-mach-binary"
+
+    try:
+        text = head.decode("utf-8")
+    except UnicodeDecodeError as e:
+        # O bloco lido pode terminar no meio de um caractere
+        if e.start < len(head) - 3:
+            return "application/octet-stream"
+        text = head[:e.start].decode("utf-8")
+    if "<svg" in text[:1024]:
+        return "image/svg+xml"
+    if ext in TEXT_EXTENSIONS:
+        return mimetypes.guess_type(f"x.{ext}")[0] or "text/plain"
+    return "text/plain"
+
+
+def _type_mismatch(detected, ext):
+    expected = mimetypes.guess_type(f"x.{ext}")[0] if ext else None
+    if not expected or detected == expected:
+        return False
+    # Formatos textuais (csv, json, xml) são aceitos como texto
+    textual = detected.startswith("text/") or detected in ("image/svg+xml",)
+    return not (textual and ext in TEXT_EXTENSIONS)
+
+
+def read_metadata(path, detected):
+    """Dimensões das imagens e número de páginas dos PDFs"""
+    metadata = {}
+    if detected.startswith("image/") and detected != "image/svg+xml":
+        # Image.open lê apenas o cabeçalho
+        with Image.open(path) as image:
+            metadata["width"], metadata["height"] = image.size
+    elif detected == "application/pdf":
+        if fitz is not None:
+            with fitz.open(path) as pdf:
+                metadata["page_count"] = pdf.page_count
+        else:
+            from PyPDF2 import PdfReader
+            metadata["page_count"] = len(PdfReader(path).pages)
+    return metadata
+
+
+def build_thumbnail(path, detected, content_hash):
+    """
+    Gera a miniatura de imagens e da primeira página dos PDFs.
+
+    Returns:
+        str: Caminho da miniatura ou None se o tipo não tiver miniatura
+    """
+    target = shard_path(THUMBNAIL_FOLDER, f"{content_hash}.webp", content_hash)
+    if os.path.exists(target):
+        return target
+
+    if detected.startswith("image/") and detected != "image/svg+xml":
+        with Image.open(path) as original:
+            original.draft("RGB", (THUMBNAIL_SIZE, THUMBNAIL_SIZE))
+            image = original.convert("RGBA" if "A" in original.getbands() else "RGB")
+    elif detected == "application/pdf" and fitz is not None:
+        with fitz.open(path) as pdf:
+            if not pdf.page_count:
+                return None
+            page = pdf[0]
+            zoom = THUMBNAIL_SIZE / max(page.rect.width, page.rect.height, 1)
+            pixmap = page.get_pixmap(matrix=fitz.Matrix(zoom, zoom))
+            image = Image.frombytes("RGB", (pixmap.width, pixmap.height), pixmap.samples)
+    else:
+        return None
+
+    image.thumbnail((THUMBNAIL_SIZE, THUMBNAIL_SIZE))
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    partial = f"{target}.part"
+    image.save(partial, "WEBP", quality=80)
+    os.replace(partial, target)
+    return target
+
+
+class ClamdScanner:
+    """Cliente do daemon ClamAV (protocolo INSTREAM)"""
+
+    name = "clamd"
+
+    def __init__(self, host=CLAMD_HOST, port=CLAMD_PORT, unix_socket=CLAMD_SOCKET,
+                 timeout=CLAMD_TIMEOUT):
+        self.host = host
+        self.port = port
+        self.unix_socket = unix_socket
+        self.timeout = timeout
+
+    def _connect(self):
+        if self.unix_socket:
+            conn = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            conn.settimeout(self.timeout)
+            conn.connect(self.unix_socket)
+            return conn
+        return socket.create_connection((self.host, self.port), timeout=self.timeout)
+
+    def scan(self, path):
+        """
+        Envia o arquivo ao clamd em blocos.
+
+        Returns:
+            tuple: (status, assinatura) com status limpo ou infectado
+        """
+        with self._connect() as conn, open(path, "rb") as f:
+            conn.sendall(b"zINSTREAM\0")
+            for chunk in iter(lambda: f.read(CHUNK_READ_SIZE), b""):
+                conn.sendall(struct.pack("!L", len(chunk)) + chunk)
+            conn.sendall(struct.pack("!L", 0))
+
+            reply = b""
+            while not reply.endswith(b"\0"):
+                data = conn.recv(4096)
+                if not data:
+                    break
+                reply += data
+
+        result = reply.rstrip(b"\0").decode("utf-8", errors="replace")
+        # "stream: OK", "stream: <assinatura> FOUND" ou "... ERROR"
+        if result.endswith("OK"):
+            return "limpo", None
+        if result.endswith("FOUND"):
+            return "infectado", result.split(":", 1)[-1].strip()[:-len("FOUND")].strip()
+        raise RuntimeError(f"Resposta inesperada do clamd: {result}")
+
+
+class LocalScanner:
+    """Substituto do clamd para desenvolvimento: detecta o arquivo de teste EICAR"""
+
+    name = "local"
+
+    def scan(self, path):
+        overlap = len(EICAR_SIGNATURE)
+        tail = b""
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(CHUNK_READ_SIZE), b""):
+                window = tail + chunk
+                if EICAR_SIGNATURE in window:
+                    return "infectado", "Eicar-Test-Signature"
+                tail = window[-overlap:]
+        return "limpo", None
+
+
+_scanner = None
+
+
+def get_scanner():
+    """Antivírus configurado em MALWARE_SCANNER (None se desabilitado)"""
+    global _scanner
+    if _scanner is None and MALWARE_SCANNER != "none":
+        _scanner = ClamdScanner() if MALWARE_SCANNER == "clamd" else LocalScanner()
+    return _scanner
+
+
+def set_scanner(scanner):
+    """Substitui o antivírus (ex.: testes)"""
+    global _scanner
+    _scanner = scanner
+
+
+def scanner_name(scanner):
+    return getattr(scanner, "name", type(scanner).__name__)
+
+
+def verification_status(upload):
+    """
+    Situação da verificação de um upload antes de servir o arquivo.
+
+    Sem antivírus configurado, ou para uploads anteriores à ingestão (sem
+    ingest_status), o arquivo é liberado.
+
+    Returns:
+        str: None se liberado, "pendente" se a ingestão ainda não terminou (ou
+        falhou e será repetida) ou "falha" se a ingestão ou a varredura falharam
+        sem novas tentativas
+    """
+    status = upload.get("ingest_status")
+    if status is None or get_scanner() is None:
+        return None
+    if status in ("pendente", "em_andamento"):
+        return "pendente"
+    if status == "falha" and upload.get("ingest_attempts", 0) < INGEST_MAX_ATTEMPTS:
+        return "pendente"
+    if status != "concluido" or upload.get("scan_status") not in FINAL_SCAN_STATUSES:
+        return "falha"
+    return None
+
+
+# --------------------------
+# Pipeline
+# --------------------------
+
+def _run_stages(upload):
+    path = upload["file_path"]
+    ext = (os.path.splitext(upload.get("original_filename") or "")[1].lstrip(".") or "").lower()
+    result = {}
+
+    detected = sniff_type(path, ext)
+    result["detected_type"] = detected
+    result["type_mismatch"] = _type_mismatch(detected, ext)
+    result["quarantined"] = detected in EXECUTABLE_TYPES
+
+    try:
+        result.update(read_metadata(path, detected))
+    except Exception as e:
+        logger.warning(f"Erro ao ler metadados de {path}: {str(e)}")
+
+    if upload.get("content_hash"):
+        try:
+            thumbnail = build_thumbnail(path, detected, upload["content_hash"])
+            if thumbnail:
+                result["thumbnail_path"] = thumbnail
+        except Exception as e:
+            logger.warning(f"Erro ao gerar miniatura de {path}: {str(e)}")
+
+    scanner = get_scanner()
+    if scanner:
+        # Erros do antivírus (conexão, timeout) propagam: a ingestão é repetida
+        status, signature = scanner.scan(path)
+        result["scan_status"] = status
+        result["scan_signature"] = signature
+        result["scan_engine"] = scanner_name(scanner)
+        if status == "infectado":
+            result["quarantined"] = True
+    return result
+
+
+def _claim(db, upload_id):
+    now = utcnow()
+    return db.uploads.find_one_and_update(
+        {"_id": ObjectId(upload_id),
+         "$or": [{"ingest_status": {"$in": [None, "pendente", "falha"]}},
+                 {"ingest_status": "em_andamento", "ingest_lease_until": {"$lt": now}}]},
+        {"$set": {"ingest_status": "em_andamento", "ingest_started_at": now,
+                  "ingest_lease_until": now + timedelta(seconds=INGEST_LEASE_SECONDS)},
+         "$inc": {"ingest_attempts": 1}},
+        return_document=ReturnDocument.AFTER
+    )
+
+
+def _retry_delay(attempts):
+    return timedelta(seconds=INGEST_RETRY_BASE_SECONDS * 2 ** max(attempts - 1, 0))
+
+
+def _reusable_query():
+    """Ingestões cujo resultado vale para outro upload do mesmo conteúdo"""
+    query = {"ingest_status": "concluido"}
+    scanner = get_scanner()
+    if scanner:
+        # Varredura concluída pelo antivírus atual (não "erro" nem de outro antivírus)
+        query.update({"scan_status": {"$in": list(FINAL_SCAN_STATUSES)},
+                      "scan_engine": scanner_name(scanner)})
+    return query
+
+
+def ingest_upload(upload_id):
+    """
+    Executa as etapas de ingestão de um upload e anota o registro.
+
+    Returns:
+        dict: Campos anotados ou None se o upload não existir ou já estiver
+        sendo processado
+    """
+    db = get_db()
+    upload = _claim(db, upload_id)
+    if not upload:
+        return None
+
+    try:
+        # Mesmo conteúdo já processado em outro upload
+        done = None
+        if upload.get("content_hash"):
+            done = db.uploads.find_one(
+                dict(_reusable_query(), content_hash=upload["content_hash"]),
+                {field: 1 for field in INGEST_FIELDS})
+        if done:
+            result = {field: done[field] for field in INGEST_FIELDS if field in done}
+        else:
+            result = _run_stages(upload)
+    except Exception as e:
+        logger.error(f"Erro na ingestão do upload {upload_id}: {str(e)}")
+        now = utcnow()
+        db.uploads.update_one(
+            {"_id": upload["_id"]},
+            {"$set": {"ingest_status": "falha", "ingest_error": str(e), "ingested_at": now,
+                      "ingest_retry_at": now + _retry_delay(upload.get("ingest_attempts", 1))},
+             "$unset": {"ingest_lease_until": ""}})
+        return None
+
+    result.update({"ingest_status": "concluido", "ingested_at": utcnow()})
+    db.uploads.update_one(
+        {"_id": upload["_id"]},
+        {"$set": result,
+         "$unset": {"ingest_lease_until": "", "ingest_error": "", "ingest_retry_at": ""}})
+
+    if result.get("quarantined"):
+        logger.warning(
+            f"Upload {upload_id} em quarentena ({result.get('detected_type')}, "
+            f"{result.get('scan_signature')})")
+    else:
+        # Texto dos documentos só é extraído de arquivos liberados
+        schedule_document(upload)
+    return result
+
+
+def reschedule_ingests(limit=500):
+    """
+    Reagenda a ingestão dos uploads pendentes sem tarefa (ex.: broker
+    indisponível no envio), das ingestões interrompidas (reserva expirada) e
+    das que falharam, depois do backoff.
+
+    Returns:
+        int: Número de uploads reagendados
+    """
+    from app.tasks.upload_tasks import ingest_upload_task
+
+    now = utcnow()
+    uploads = get_db().uploads.find(
+        {"$or": [
+            {"ingest_status": "pendente",
+             "created_at": {"$lt": now - timedelta(seconds=INGEST_STALE_SECONDS)}},
+            {"ingest_status": "em_andamento", "ingest_lease_until": {"$lt": now}},
+            {"ingest_status": "falha", "ingest_attempts": {"$lt": INGEST_MAX_ATTEMPTS},
+             "ingest_retry_at": {"$lte": now}},
+        ]}, {"_id": 1}).limit(limit)
+
+    count = 0
+    for upload in list(uploads):
+        try:
+            ingest_upload_task.delay(str(upload["_id"]))
+            count += 1
+        except Exception as e:
+            logger.error(f"Erro ao reagendar a ingestão do upload {upload['_id']}: {str(e)}")
+            break
+    return count
@@ -0,0 +1,569 @@
+# backend/app/services/upload_service.py
+"""
+Uploads de arquivos e imagens, incluindo o protocolo de upload retomável.
+
+Upload retomável (coleção upload_sessions):
+
+    1. create_session     registra nome, tipo e tamanho total do arquivo
+    2. append_chunk       grava um bloco no offset atual (PATCH com Upload-Offset)
+    3. finalize_session   confere o tamanho, publica o blob e registra o upload
+
+Os blocos são gravados direto em UPLOAD_FOLDER/tmp/<session_id>.part, lidos
+do corpo da requisição em pedaços de CHUNK_READ_SIZE (memória constante). O
+SHA-256 é atualizado a cada bloco; se o bloco seguinte chegar a outro
+processo, o estado do hash é reconstruído a partir do arquivo parcial.
+
+Os arquivos são armazenados por conteúdo (blob_store, namespace "uploads"):
+o mesmo arquivo enviado em várias conversas ocupa o disco uma única vez, e
+uma sessão criada com o sha256 de um conteúdo já conhecido é concluída sem
+transferir nenhum byte.
+"""
+import os
+import uuid
+import base64
+import hashlib
+import logging
+import mimetypes
+from datetime import timedelta
+from threading import Lock
+from collections import OrderedDict
+from bson import ObjectId
+from werkzeug.utils import secure_filename
+from app.db import get_db
+from app.utils.date_utils import utcnow
+from app.services.blob_store import write_stream, put_file, acquire, release
+
+logger = logging.getLogger(__name__)
+
+# Configurações para upload
+ALLOWED_FILE_EXTENSIONS = {'pdf', 'doc', 'docx',
+                           'txt', 'csv', 'xls', 'xlsx', 'json', 'xml'}
+ALLOWED_IMAGE_EXTENSIONS = {'jpg', 'jpeg', 'png', 'gif', 'webp', 'svg'}
+MAX_CONTENT_LENGTH = 10 * 1024 * 1024  # 10MB limite
+
+# Configurar diretório de upload
+UPLOAD_FOLDER = os.environ.get('UPLOAD_FOLDER', 'uploads')
+FILE_UPLOAD_FOLDER = os.path.join(UPLOAD_FOLDER, 'files')
+IMAGE_UPLOAD_FOLDER = os.path.join(UPLOAD_FOLDER, 'images')
+TEMP_UPLOAD_FOLDER = os.path.join(UPLOAD_FOLDER, 'tmp')
+BLOB_UPLOAD_FOLDER = os.path.join(UPLOAD_FOLDER, 'blobs')
+UPLOAD_NAMESPACE = "uploads"
+
+# Upload retomável
+MAX_RESUMABLE_SIZE = {
+    "file": int(os.environ.get('MAX_RESUMABLE_FILE_SIZE', 512 * 1024 * 1024)),
+    "image": int(os.environ.get('MAX_RESUMABLE_IMAGE_SIZE', 50 * 1024 * 1024)),
+}
+MAX_CHUNK_SIZE = 8 * 1024 * 1024
+CHUNK_READ_SIZE = 64 * 1024
+SESSION_TTL_HOURS = 24
+# Prazo de um bloco em gravação; depois disso outro envio do offset é aceito
+CHUNK_LEASE_SECONDS = int(os.environ.get('UPLOAD_CHUNK_LEASE_SECONDS', 300))
+MAX_CACHED_HASHERS = 256
+
+
+class UploadError(ValueError):
+    """Requisição de upload inválida"""
+
+
+class UploadOffsetError(UploadError):
+    """Bloco enviado fora do offset esperado"""
+
+    def __init__(self, message, offset):
+        super().__init__(message)
+        self.offset = offset
+
+
+# Estado do SHA-256 das sessões ativas neste processo: session_id -> (offset, hasher)
+_hashers = OrderedDict()
+_hashers_lock = Lock()
+
+
+def allowed_file(filename, allowed_extensions):
+    """Verifica se o arquivo tem uma extensão permitida"""
+    return '.' in filename and filename.rsplit('.', 1)[1].lower() in allowed_extensions
+
+
+def upload_folder(upload_type):
+    """Diretório dos uploads anteriores ao armazenamento por conteúdo"""
+    return IMAGE_UPLOAD_FOLDER if upload_type == "image" else FILE_UPLOAD_FOLDER
+
+
+def _extension(filename):
+    return filename.rsplit('.', 1)[1].lower() if '.' in filename else None
+
+
+def store_upload(stream, original_filename):
+    """
+    Grava o conteúdo de um upload no armazenamento por conteúdo.
+
+    Args:
+        stream: Objeto com read() (ex.: FileStorage.stream)
+        original_filename (str): Nome original (define a extensão)
+
+    Returns:
+        dict: Blob (hash, path, size, created)
+    """
+    chunks = iter(lambda: stream.read(CHUNK_READ_SIZE), b"")
+    return write_stream(UPLOAD_NAMESPACE, chunks, BLOB_UPLOAD_FOLDER,
+                        _extension(original_filename))
+
+
+def record_blob_upload(blob, user_id, original_filename, file_type,
+                       upload_type, conversation_id=None):
+    """
+    Registra um upload apontando para um blob e agenda a ingestão.
+
+    A ingestão (upload_ingest_service) identifica o tipo, extrai metadados,
+    gera a miniatura, faz a varredura antivírus e agenda a extração do texto.
+    """
+    upload = record_upload(
+        user_id, original_filename, os.path.basename(blob["path"]), blob["path"],
+        file_type, blob["size"], upload_type, conversation_id,
+        extra={"content_hash": blob["hash"], "ingest_status": "pendente"})
+    schedule_ingest(upload["_id"], original_filename)
+    return upload
+
+
+def schedule_ingest(upload_id, original_filename=None):
+    """
+    Agenda a ingestão de um upload registrado com ingest_status "pendente".
+
+    Se o broker estiver indisponível, a tarefa uploads.reschedule retoma o upload.
+    """
+    try:
+        from app.tasks.upload_tasks import ingest_upload_task
+        ingest_upload_task.delay(str(upload_id))
+    except Exception as e:
+        logger.error(
+            f"Erro ao agendar a ingestão de {original_filename or upload_id}: {str(e)}")
+
+
+def delete_upload_file(upload):
+    """
+    Libera o arquivo de um upload removido.
+
+    O conteúdo só é apagado do disco quando nenhum outro upload o referencia.
+    """
+    if upload.get("content_hash"):
+        release(UPLOAD_NAMESPACE, upload["content_hash"])
+        return
+    # Upload anterior ao armazenamento por conteúdo
+    file_path = upload.get("file_path")
+    if file_path and os.path.exists(file_path):
+        os.remove(file_path)
+
+
+def record_upload(user_id, original_filename, filename, file_path, file_type,
+                  file_size, upload_type, conversation_id=None, extra=None):
+    """
+    Registra um upload e, se informado, associa o arquivo à conversa.
+
+    Returns:
+        dict: Registro inserido na coleção uploads (com _id)
+    """
+    db = get_db()
+    upload_record = {
+        "user_id": user_id,
+        "original_filename": original_filename,
+        "filename": filename,
+        "file_path": file_path,
+        "file_type": file_type or mimetypes.guess_type(original_filename)[0],
+        "file_size": file_size,
+        "upload_type": upload_type,
+        "created_at": utcnow(),
+        "conversation_id": conversation_id
+    }
+    upload_record.update(extra or {})
+
+    result = db.uploads.insert_one(upload_record)
+
+    # Se a conversa foi especificada, adicionar referência do arquivo à conversa
+    if conversation_id:
+        try:
+            file_reference = {
+                "file_id": str(result.inserted_id),
+                "original_filename": original_filename,
+                "upload_type": upload_type,
+                "added_at": utcnow()
+            }
+
+            db.conversations.update_one(
+                {"_id": ObjectId(conversation_id)},
+                {"$push": {"files": file_reference}}
+            )
+        except Exception as e:
+            logger.error(
+                f"Erro ao associar arquivo à conversa: {str(e)}")
+
+    return upload_record
+
+
+# --------------------------
+# Upload retomável
+# --------------------------
+
+def _temp_path(session_id):
+    return os.path.join(TEMP_UPLOAD_FOLDER, f"{session_id}.part")
+
+
+def _hasher_for(session_id, offset):
+    """Retorna o SHA-256 dos primeiros `offset` bytes da sessão"""
+    with _hashers_lock:
+        cached = _hashers.pop(session_id, None)
+    if cached and cached[0] == offset:
+        return cached[1]
+
+    # Bloco anterior foi recebido por outro processo: reconstrói do arquivo
+    hasher = hashlib.sha256()
+    remaining = offset
+    with open(_temp_path(session_id), "rb") as f:
+        while remaining > 0:
+            data = f.read(min(CHUNK_READ_SIZE, remaining))
+            if not data:
+                break
+            hasher.update(data)
+            remaining -= len(data)
+    return hasher
+
+
+def _remember_hasher(session_id, offset, hasher):
+    with _hashers_lock:
+        _hashers[session_id] = (offset, hasher)
+        while len(_hashers) > MAX_CACHED_HASHERS:
+            _hashers.popitem(last=False)
+
+
+def _forget_hasher(session_id):
+    with _hashers_lock:
+        _hashers.pop(session_id, None)
+
+
+def create_session(user_id, filename, total_size, upload_type="file",
+                   content_type=None, conversation_id=None, sha256=None):
+    """
+    Cria uma sessão de upload retomável.
+
+    Se o cliente informar o sha256 de um conteúdo que o próprio usuário já
+    enviou, o upload é registrado na hora e a sessão volta com status
+    "concluido". Conteúdo enviado apenas por outros usuários precisa ser
+    transferido: o hash sozinho não prova que o cliente tem os bytes.
+
+    Args:
+        user_id (str): ID do usuário
+        filename (str): Nome original do arquivo
+        total_size (int): Tamanho total em bytes
+        upload_type (str): file ou image
+        content_type (str, optional): Tipo MIME informado pelo cliente
+        conversation_id (str, optional): Conversa a associar o arquivo
+        sha256 (str, optional): Hash do arquivo, para evitar reenvio
+
+    Returns:
+        dict: Sessão criada (com "upload" quando concluída na hora)
+
+    Raises:
+        UploadError: Se os dados forem inválidos
+    """
+    if upload_type not in MAX_RESUMABLE_SIZE:
+        raise UploadError("upload_type deve ser 'file' ou 'image'.")
+
+    original_filename = secure_filename(filename or "")
+    allowed = ALLOWED_IMAGE_EXTENSIONS if upload_type == "image" else ALLOWED_FILE_EXTENSIONS
+    if not original_filename or not allowed_file(original_filename, allowed):
+        raise UploadError(
+            f"Tipo de arquivo não permitido. Extensões permitidas: {', '.join(allowed)}")
+
+    if not isinstance(total_size, int) or total_size <= 0:
+        raise UploadError("size deve ser um inteiro positivo.")
+    if total_size > MAX_RESUMABLE_SIZE[upload_type]:
+        raise UploadError(
+            f"Arquivo muito grande. Tamanho máximo: {MAX_RESUMABLE_SIZE[upload_type] // (1024 * 1024)}MB")
+
+    file_type = content_type or mimetypes.guess_type(original_filename)[0]
+    session_id = uuid.uuid4().hex
+    now = utcnow()
+
+    # Conteúdo já enviado pelo usuário: nenhum byte precisa ser transferido
+    owned = sha256 and get_db().uploads.find_one(
+        {"user_id": user_id, "content_hash": sha256.lower()}, {"_id": 1})
+    blob = acquire(UPLOAD_NAMESPACE, sha256.lower()) if owned else None
+    if blob and blob.get("size") == total_size:
+        upload = record_blob_upload(
+            blob, user_id, original_filename, file_type, upload_type, conversation_id)
+        return {
+            "_id": session_id,
+            "original_filename": original_filename,
+            "upload_type": upload_type,
+            "total_size": total_size,
+            "offset": total_size,
+            "chunk_size": MAX_CHUNK_SIZE,
+            "status": "concluido",
+            "expires_at": now,
+            "upload": upload
+        }
+    if blob:
+        # Hash informado não corresponde ao tamanho: ignora o atalho
+        release(UPLOAD_NAMESPACE, blob["hash"])
+
+    os.makedirs(TEMP_UPLOAD_FOLDER, exist_ok=True)
+    open(_temp_path(session_id), "wb").close()
+
+    session = {
+        "_id": session_id,
+        "user_id": user_id,
+        "original_filename": original_filename,
+        "file_type": file_type,
+        "upload_type": upload_type,
+        "conversation_id": conversation_id,
+        "total_size": total_size,
+        "offset": 0,
+        "chunk_size": MAX_CHUNK_SIZE,
+        "status": "em_andamento",
+        "created_at": now,
+        "updated_at": now,
+        "expires_at": now + timedelta(hours=SESSION_TTL_HOURS)
+    }
+    get_db().upload_sessions.insert_one(session)
+    return session
+
+
+def get_session(session_id):
+    """Obtém uma sessão de upload ou None se não existir"""
+    return get_db().upload_sessions.find_one({"_id": session_id})
+
+
+def _parse_checksum(header):
+    """Converte o header Upload-Checksum ("sha256 <base64>") em bytes"""
+    if not header:
+        return None
+    try:
+        algorithm, value = header.split(" ", 1)
+        if algorithm.lower() != "sha256":
+            raise UploadError("Upload-Checksum suporta apenas sha256.")
+        return base64.b64decode(value.strip())
+    except UploadError:
+        raise
+    except Exception:
+        raise UploadError("Upload-Checksum inválido.")
+
+
+def append_chunk(session_id, offset, stream, content_length, checksum=None):
+    """
+    Grava um bloco da sessão a partir do offset informado.
+
+    Args:
+        session_id (str): ID da sessão
+        offset (int): Offset do bloco (header Upload-Offset)
+        stream: Corpo da requisição (lido em pedaços)
+        content_length (int): Tamanho do bloco
+        checksum (str, optional): Header Upload-Checksum do bloco
+
+    Returns:
+        dict: Sessão atualizada
+
+    Raises:
+        LookupError: Se a sessão não existir
+        UploadOffsetError: Se o offset não for o esperado
+        UploadError: Se o bloco for inválido
+    """
+    session = get_session(session_id)
+    if not session or session.get("status") != "em_andamento":
+        raise LookupError("Sessão de upload não encontrada.")
+
+    if offset != session["offset"]:
+        raise UploadOffsetError(
+            "Offset diferente do esperado.", session["offset"])
+    if content_length is None or content_length <= 0:
+        raise UploadError("Content-Length obrigatório.")
+    if content_length > MAX_CHUNK_SIZE:
+        raise UploadError(
+            f"Bloco muito grande. Tamanho máximo: {MAX_CHUNK_SIZE // (1024 * 1024)}MB")
+    if offset + content_length > session["total_size"]:
+        raise UploadError("Bloco excede o tamanho total declarado.")
+
+    expected_checksum = _parse_checksum(checksum)
+    writer = _claim_chunk(session_id, offset)
+    try:
+        hasher, written = _write_chunk(
+            session_id, offset, stream, content_length, expected_checksum)
+    except Exception:
+        _release_chunk(session_id, writer)
+        raise
+
+    new_offset = offset + written
+    now = utcnow()
+    updated = get_db().upload_sessions.update_one(
+        {"_id": session_id, "offset": offset, "writer": writer},
+        # Cada bloco aceito renova o prazo da sessão
+        {"$set": {"offset": new_offset, "updated_at": now,
+                  "expires_at": now + timedelta(hours=SESSION_TTL_HOURS)},
+         "$unset": {"writer": "", "writing_until": ""}}
+    )
+    if not updated.modified_count:
+        # Sessão cancelada ou prazo do bloco vencido durante a gravação
+        current = get_session(session_id)
+        if not current:
+            raise LookupError("Sessão de upload não encontrada.")
+        raise UploadOffsetError("Prazo de gravação do bloco expirou.", current["offset"])
+
+    _remember_hasher(session_id, new_offset, hasher)
+    session["offset"] = new_offset
+    return session
+
+
+def _claim_chunk(session_id, offset):
+    """
+    Reserva o offset para um único envio antes de gravar no arquivo parcial.
+
+    Returns:
+        str: Identificador do envio que detém a reserva
+
+    Raises:
+        UploadOffsetError: Se o offset mudou ou outro envio está gravando
+    """
+    writer = uuid.uuid4().hex
+    now = utcnow()
+    session = get_db().upload_sessions.find_one_and_update(
+        {"_id": session_id, "status": "em_andamento", "offset": offset,
+         "writing_until": {"$not": {"$gt": now}}},
+        {"$set": {"writer": writer,
+                  "writing_until": now + timedelta(seconds=CHUNK_LEASE_SECONDS)}}
+    )
+    if session:
+        return writer
+
+    current = get_session(session_id)
+    if not current or current.get("status") != "em_andamento":
+        raise LookupError("Sessão de upload não encontrada.")
+    if current["offset"] != offset:
+        raise UploadOffsetError("Offset diferente do esperado.", current["offset"])
+    raise UploadOffsetError("Outro bloco está sendo gravado neste offset.", offset)
+
+
+def _release_chunk(session_id, writer):
+    get_db().upload_sessions.update_one(
+        {"_id": session_id, "writer": writer},
+        {"$unset": {"writer": "", "writing_until": ""}})
+
+
+def _write_chunk(session_id, offset, stream, content_length, expected_checksum):
+    """
+    Grava o bloco no arquivo parcial (com a reserva do offset).
+
+    Returns:
+        tuple: (SHA-256 do arquivo até o fim do bloco, bytes gravados)
+    """
+    # O hash do arquivo avança numa cópia, descartada se o bloco for recusado
+    base_hasher = _hasher_for(session_id, offset)
+    hasher = base_hasher.copy()
+    chunk_hasher = hashlib.sha256()
+    written = 0
+
+    with open(_temp_path(session_id), "r+b") as f:
+        # Descarta sobras de um bloco anterior interrompido
+        f.seek(offset)
+        f.truncate()
+        while written < content_length:
+            data = stream.read(min(CHUNK_READ_SIZE, content_length - written))
+            if not data:
+                break
+            f.write(data)
+            hasher.update(data)
+            chunk_hasher.update(data)
+            written += len(data)
+
+        if written != content_length or (
+                expected_checksum and chunk_hasher.digest() != expected_checksum):
+            f.seek(offset)
+            f.truncate()
+            _remember_hasher(session_id, offset, base_hasher)
+            raise UploadError("Bloco incompleto." if written != content_length
+                              else "Checksum do bloco não confere.")
+    return hasher, written
+
+
+def finalize_session(session_id):
+    """
+    Conclui a sessão: publica o arquivo no armazenamento por conteúdo e
+    registra o upload.
+
+    Em caso de erro a sessão volta para "em_andamento" e a finalização pode
+    ser repetida; o blob já publicado fica guardado na sessão (session.blob).
+
+    Returns:
+        dict: Registro do upload
+
+    Raises:
+        LookupError: Se a sessão não existir
+        UploadError: Se o arquivo ainda estiver incompleto
+    """
+    db = get_db()
+    session = db.upload_sessions.find_one_and_update(
+        {"_id": session_id, "status": "em_andamento"},
+        {"$set": {"status": "finalizando"}}
+    )
+    if not session:
+        raise LookupError("Sessão de upload não encontrada.")
+
+    if session["offset"] != session["total_size"]:
+        db.upload_sessions.update_one(
+            {"_id": session_id}, {"$set": {"status": "em_andamento"}})
+        raise UploadError(
+            f"Upload incompleto: {session['offset']} de {session['total_size']} bytes.")
+
+    original_filename = session["original_filename"]
+    try:
+        blob = session.get("blob")
+        if not blob:
+            content_hash = _hasher_for(session_id, session["offset"]).hexdigest()
+            blob = put_file(UPLOAD_NAMESPACE, _temp_path(session_id), content_hash,
+                            session["total_size"], BLOB_UPLOAD_FOLDER,
+                            _extension(original_filename))
+            blob = {"hash": blob["hash"], "path": blob["path"], "size": blob["size"]}
+            # O arquivo parcial já foi consumido: a referência fica com a sessão
+            db.upload_sessions.update_one({"_id": session_id}, {"$set": {"blob": blob}})
+        _forget_hasher(session_id)
+
+        upload = record_blob_upload(
+            blob, session["user_id"], original_filename, session.get("file_type"),
+            session["upload_type"], session.get("conversation_id"))
+    except Exception:
+        db.upload_sessions.update_one(
+            {"_id": session_id, "status": "finalizando"},
+            {"$set": {"status": "em_andamento", "updated_at": utcnow()}})
+        raise
+
+    db.upload_sessions.update_one(
+        {"_id": session_id},
+        {"$set": {"status": "concluido", "upload_id": str(upload["_id"]),
+                  "updated_at": utcnow()},
+         # A referência ao blob passou para o upload
+         "$unset": {"blob": ""}}
+    )
+    return upload
+
+
+def cancel_session(session_id):
+    """
+    Cancela uma sessão e remove o arquivo parcial.
+
+    Returns:
+        bool: True se a sessão foi cancelada
+    """
+    session = get_db().upload_sessions.find_one_and_delete(
+        {"_id": session_id, "status": "em_andamento"})
+    _forget_hasher(session_id)
+    if session:
+        release_session_blob(session)
+        try:
+            os.remove(_temp_path(session_id))
+        except FileNotFoundError:
+            pass
+        return True
+    return False
+
+
+def release_session_blob(session):
+    """Libera o blob publicado por uma finalização que falhou"""
+    if session.get("blob"):
+        release(UPLOAD_NAMESPACE, session["blob"]["hash"])
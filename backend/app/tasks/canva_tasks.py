@@ -0,0 +1,23 @@
+# backend/app/tasks/canva_tasks.py
+"""
+Tarefas de integração com o Canva.
+"""
+import logging
+from app.celery_worker import celery
+from app.services.canva_service import refresh_template_catalogue
+
+logger = logging.getLogger(__name__)
+
+
+@celery.task(name="canva.refresh_templates")
+def refresh_templates_task(category, brand_id=None):
+    """
+    Revalida o catálogo de templates em cache e gera as miniaturas locais.
+    """
+    try:
+        templates = refresh_template_catalogue(category, brand_id)
+        return {"categoria": category, "templates": len(templates or [])}
+    except Exception as e:
+        logger.error(
+            f"Erro ao atualizar templates do Canva ({category}): {str(e)}")
+        return {"categoria": category, "error": str(e)}
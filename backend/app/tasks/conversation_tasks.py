@@ -0,0 +1,63 @@
+# backend/app/tasks/conversation_tasks.py
+"""
+Tarefas de segundo plano das conversas (fila conversation_background).
+"""
+import logging
+from app.celery_worker import celery
+from app.services.conversation_summary_service import (
+    apply_generated_title, apply_rolling_summary
+)
+from app.services.archive_service import archive_idle_conversations
+
+logger = logging.getLogger(__name__)
+
+
+@celery.task(name="conversation.generate_title", bind=True, max_retries=2,
+             ignore_result=True, priority=9)
+def generate_conversation_title(self, conversation_id, token):
+    """
+    Gera o título de uma conversa após a primeira troca de mensagens.
+
+    Args:
+        conversation_id: ID da conversa
+        token: Token de debounce gravado no agendamento
+    """
+    try:
+        return apply_generated_title(conversation_id, token)
+    except Exception as e:
+        logger.error(
+            f"Erro ao gerar título da conversa {conversation_id}: {str(e)}")
+        raise self.retry(exc=e, countdown=60)
+
+
+@celery.task(name="conversation.update_summary", bind=True, max_retries=2,
+             ignore_result=True, priority=9)
+def update_conversation_summary(self, conversation_id, token):
+    """
+    Atualiza o resumo compacto de uma conversa a cada N turnos.
+
+    Args:
+        conversation_id: ID da conversa
+        token: Token de debounce gravado no agendamento
+    """
+    try:
+        return apply_rolling_summary(conversation_id, token)
+    except Exception as e:
+        logger.error(
+            f"Erro ao atualizar resumo da conversa {conversation_id}: {str(e)}")
+        raise self.retry(exc=e, countdown=120)
+
+
+@celery.task(name="conversation.archive_idle", ignore_result=True, priority=9)
+def archive_idle_conversations_task(idle_days=None, limit=None):
+    """
+    Move conversas inativas para o arquivo comprimido (executada pelo celery beat).
+
+    Args:
+        idle_days: Dias de inatividade (padrão ARCHIVE_IDLE_DAYS)
+        limit: Número máximo de conversas por execução
+    """
+    kwargs = {"limit": limit}
+    if idle_days is not None:
+        kwargs["idle_days"] = idle_days
+    return archive_idle_conversations(**kwargs)
@@ -0,0 +1,31 @@
+# backend/app/tasks/document_tasks.py
+"""
+Tarefas de extração e indexação dos documentos enviados às conversas.
+"""
+import logging
+from app.celery_worker import celery
+from app.services.document_index_service import index_document, reschedule_documents
+
+logger = logging.getLogger(__name__)
+
+
+@celery.task(name="documents.index")
+def index_document_task(content_hash, path, ext):
+    """
+    Extrai o texto de um documento e gera o índice de trechos.
+
+    Executada uma vez por conteúdo; uploads repetidos reaproveitam o resultado.
+    """
+    result = index_document(content_hash, path, ext)
+    if result is None:
+        logger.info(f"Documento {content_hash} já indexado por outro worker.")
+    return result
+
+
+@celery.task(name="documents.reschedule")
+def reschedule_documents_task():
+    """Reagenda extrações que falharam (com backoff) ou ficaram sem tarefa"""
+    count = reschedule_documents()
+    if count:
+        logger.info(f"{count} documento(s) reagendados para indexação.")
+    return count
@@ -0,0 +1,82 @@
+# backend/app/tasks/ebook_tasks.py
+"""
+Tarefas de geração de eBooks.
+"""
+import logging
+from celery import chain
+from app.celery_worker import celery
+from app.services.content_service import generate_ebook_chapters
+from app.services.ebook_service import release_chapter_generation
+from app.services.ebook_pipeline_service import (
+    run_stage, finish_pipeline, StageError
+)
+
+logger = logging.getLogger(__name__)
+
+
+@celery.task(name="ebook.generate_chapters")
+def generate_ebook_chapters_task(ebook_id, provider="chatgpt", version="v4",
+                                 user_id=None, only_pending=True):
+    """
+    Gera o conteúdo de todos os capítulos de um eBook em paralelo.
+
+    Args:
+        ebook_id: ID do eBook
+        provider: Provedor de IA
+        version: Versão do provedor
+        user_id: Usuário dono do eBook (define a concorrência pelo plano)
+        only_pending: Pula capítulos já concluídos
+    """
+    try:
+        result = generate_ebook_chapters(
+            ebook_id, provider, version, user_id=user_id, only_pending=only_pending)
+        status = "concluido" if result["erros"] == 0 else "concluido_com_erros"
+    except Exception as e:
+        logger.error(
+            f"Erro ao gerar capítulos do eBook {ebook_id}: {str(e)}")
+        result = {"error": str(e)}
+        status = "erro"
+
+    release_chapter_generation(ebook_id, status, result)
+    return result
+
+
+@celery.task(name="ebook.pipeline_stage", bind=True, max_retries=2)
+def run_pipeline_stage_task(self, ebook_id, stage):
+    """
+    Executa uma etapa do pipeline do eBook (elo da cadeia criada por enqueue_pipeline).
+
+    Falhas transitórias são repetidas; esgotadas as tentativas, a cadeia é
+    interrompida e o pipeline pode ser retomado a partir do checkpoint.
+    """
+    try:
+        checkpoint = run_stage(ebook_id, stage)
+        return {"etapa": stage, "status": checkpoint.get("status"),
+                "duracao_ms": checkpoint.get("duracao_ms")}
+    except StageError as e:
+        if self.request.retries < self.max_retries:
+            raise self.retry(exc=e, countdown=30 * (self.request.retries + 1))
+        raise
+
+
+@celery.task(name="ebook.pipeline_finish")
+def finish_pipeline_task(ebook_id):
+    """Marca o pipeline do eBook como concluído"""
+    finish_pipeline(ebook_id)
+    return ebook_id
+
+
+def enqueue_pipeline(ebook_id, stages):
+    """
+    Agenda as etapas pendentes do pipeline como uma cadeia Celery.
+
+    Args:
+        ebook_id (str): ID do eBook
+        stages (list): Chaves das etapas a executar, na ordem
+
+    Returns:
+        AsyncResult: Resultado da cadeia
+    """
+    signatures = [run_pipeline_stage_task.si(ebook_id, stage) for stage in stages]
+    signatures.append(finish_pipeline_task.si(ebook_id))
+    return chain(*signatures).apply_async()
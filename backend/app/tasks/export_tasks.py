@@ -0,0 +1,49 @@
+# backend/app/tasks/export_tasks.py
+"""
+Tarefas de exportação de eBooks.
+"""
+import logging
+from app.celery_worker import celery
+from app.services.export_service import run_export, finish_remote_export, reschedule_exports
+from app.services.canva_export_service import poll_pending_exports
+
+logger = logging.getLogger(__name__)
+
+
+@celery.task(name="export.run")
+def run_export_task(export_id):
+    """
+    Processa uma exportação registrada por create_export.
+
+    O progresso fica em exports.progress e pode ser consultado em
+    /export/status/<export_id>.
+    """
+    result = run_export(export_id)
+    if not result:
+        logger.warning(f"Exportação {export_id} terminou com falha.")
+    return result
+
+
+@celery.task(name="export.finish_remote")
+def finish_remote_export_task(export_id, download_url=None, error=None):
+    """
+    Baixa o arquivo de uma exportação do Canva concluída e publica no cache.
+    """
+    return finish_remote_export(export_id, download_url, error)
+
+
+@celery.task(name="export.reschedule")
+def reschedule_exports_task():
+    """Reagenda exportações pendentes sem tarefa ou interrompidas"""
+    count = reschedule_exports()
+    if count:
+        logger.info(f"{count} exportação(ões) reagendadas.")
+    return count
+
+
+@celery.task(name="canva.poll_exports")
+def poll_canva_exports_task():
+    """
+    Consulta em lote as exportações pendentes no Canva (agendada pelo beat).
+    """
+    return poll_pending_exports()
@@ -0,0 +1,44 @@
+# backend/app/tasks/storage_tasks.py
+"""
+Tarefas de manutenção do armazenamento de arquivos.
+"""
+import logging
+from app.celery_worker import celery
+
+logger = logging.getLogger(__name__)
+
+_flask_app = None
+
+
+def _app_context():
+    """Contexto da aplicação Flask (SQLAlchemy) para as tarefas deste módulo"""
+    global _flask_app
+    if _flask_app is None:
+        from app import create_app
+        _flask_app = create_app()
+    return _flask_app.app_context()
+
+
+@celery.task(name="storage.reconcile_usage")
+def reconcile_usage_task(user_id=None):
+    """
+    Recalcula os contadores de storage_usage e corrige divergências.
+    """
+    from app.services.storage_usage_service import reconcile_usage
+    with _app_context():
+        try:
+            return reconcile_usage(user_id)
+        except Exception as e:
+            logger.error(f"Erro ao reconciliar uso de armazenamento: {str(e)}")
+            return {"error": str(e)}
+
+
+@celery.task(name="storage.gc")
+def storage_gc_task():
+    """
+    Remove arquivos órfãos, temporários vencidos, itens excluídos além da
+    retenção e exportações sem referência. Retorna os bytes recuperados.
+    """
+    from app.services.storage_gc_service import run_gc
+    with _app_context():
+        return run_gc()
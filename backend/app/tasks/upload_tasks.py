@@ -0,0 +1,33 @@
+# backend/app/tasks/upload_tasks.py
+"""
+Tarefas de ingestão dos uploads (tipo real, metadados, miniatura e antivírus).
+"""
+import logging
+from app.celery_worker import celery
+from app.services.upload_ingest_service import ingest_upload, reschedule_ingests
+
+logger = logging.getLogger(__name__)
+
+
+@celery.task(name="uploads.ingest")
+def ingest_upload_task(upload_id):
+    """
+    Executa o pipeline de ingestão de um upload.
+
+    Uploads já processados (ou em processamento por outro worker) são ignorados.
+    """
+    result = ingest_upload(upload_id)
+    if result is None:
+        logger.info(f"Upload {upload_id} já ingerido ou em processamento.")
+        return None
+    return {"detected_type": result.get("detected_type"),
+            "quarantined": result.get("quarantined", False)}
+
+
+@celery.task(name="uploads.reschedule")
+def reschedule_ingests_task():
+    """Reagenda ingestões pendentes sem tarefa ou interrompidas"""
+    count = reschedule_ingests()
+    if count:
+        logger.info(f"{count} upload(s) reagendados para ingestão.")
+    return count
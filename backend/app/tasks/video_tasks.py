@@ -8,7 +8,8 @@ from app.models.user import User
 from app.models.video import Video
 from app.models.storage import StorageItem
 from app.utils.token_manager import consume_tokens, refund_tokens
-from flask import current_app
+from app.services.storage_backend import get_storage_backend
+from app.services.storage_usage_service import track_item_added
 from datetime import datetime
 from werkzeug.utils import secure_filename
 import uuid
@@ -374,62 +375,15 @@ def save_video_to_storage(video, url):
         filename = f"video_{uuid.uuid4().hex}.mp4"
         safe_filename = secure_filename(filename)
 
-        # Configurações de armazenamento
-        USE_S3 = current_app.config.get('USE_S3', False)
-
-        if USE_S3:
-            # Implementação para S3
-            import boto3
-            from botocore.exceptions import NoCredentialsError
-
-            S3_BUCKET = current_app.config.get('S3_BUCKET')
-            S3_REGION = current_app.config.get('S3_REGION')
-
-            s3_client = boto3.client(
-                's3',
-                region_name=S3_REGION,
-                aws_access_key_id=current_app.config.get('AWS_ACCESS_KEY'),
-                aws_secret_access_key=current_app.config.get('AWS_SECRET_KEY')
-            )
-
-            # Upload para o S3
-            s3_client.put_object(
-                Bucket=S3_BUCKET,
-                Key=safe_filename,
-                Body=response.content,
-                ContentType='video/mp4'
-            )
-
-            storage_path = f"s3://{S3_BUCKET}/{safe_filename}"
-
-            # Gera URL pré-assinada
-            public_url = s3_client.generate_presigned_url(
-                'get_object',
-                Params={'Bucket': S3_BUCKET, 'Key': safe_filename},
-                ExpiresIn=3600 * 24 * 7  # 7 dias
-            )
-        else:
-            # Armazenamento local
-            LOCAL_UPLOAD_FOLDER = os.path.join(os.path.dirname(
-                os.path.dirname(os.path.dirname(__file__))), 'static', 'uploads')
-
-            if not os.path.exists(LOCAL_UPLOAD_FOLDER):
-                os.makedirs(LOCAL_UPLOAD_FOLDER)
-
-            local_path = os.path.join(LOCAL_UPLOAD_FOLDER, safe_filename)
-
-            # Salva o arquivo localmente
-            with open(local_path, 'wb') as f:
-                for chunk in response.iter_content(chunk_size=8192):
-                    if chunk:
-                        f.write(chunk)
-
-            storage_path = local_path
-            public_url = f"/api/storage/file/{safe_filename}"
+        # Armazenamento local ou S3 (upload multipart direto do download,
+        # sem carregar o vídeo em memória)
+        backend = get_storage_backend()
+        response.raw.decode_content = True
+        storage_path = backend.save(response.raw, safe_filename, 'video/mp4')
+        public_url = backend.url(storage_path, 3600 * 24 * 7)  # 7 dias
 
         # Cria o item de armazenamento
-        content_length = len(response.content) if not response.headers.get(
-            'content-length') else int(response.headers.get('content-length'))
+        content_length = backend.size(storage_path) or 0
 
         storage_item = StorageItem(
             filename=filename,
@@ -447,6 +401,7 @@ def save_video_to_storage(video, url):
         )
 
         db.session.add(storage_item)
+        track_item_added(storage_item)
 
         # Atualiza o vídeo com referência ao armazenamento
         video.storage_id = storage_item.id
@@ -0,0 +1,151 @@
+"""
+Utilitários para datas nativas (BSON datetime) no MongoDB.
+
+Todos os campos de auditoria (created_at, updated_at, timestamp, ...) devem ser
+gravados como datetime UTC, permitindo ordenação e filtros por intervalo com
+índices e o uso de índices TTL.
+"""
+from datetime import datetime, timezone
+
+
+def utcnow():
+    """
+    Retorna o instante atual em UTC como datetime "naive".
+
+    O PyMongo grava datetimes naive como UTC, e é esse o formato lido de volta
+    por padrão, o que mantém as comparações consistentes. A precisão é truncada
+    em milissegundos, que é a resolução do tipo Date do BSON.
+    """
+    now = datetime.utcnow()
+    return now.replace(microsecond=(now.microsecond // 1000) * 1000)
+
+
+def to_datetime(value):
+    """
+    Converte valores legados (string ISO, timestamp float/int) para datetime UTC.
+
+    Args:
+        value: datetime, string ISO 8601, timestamp epoch ou None
+
+    Returns:
+        datetime: Data convertida (naive, em UTC) ou None se não for possível converter
+    """
+    if value is None or value == "":
+        return None
+
+    if isinstance(value, datetime):
+        if value.tzinfo is not None:
+            return value.astimezone(timezone.utc).replace(tzinfo=None)
+        return value
+
+    if isinstance(value, bool):
+        return None
+
+    if isinstance(value, (int, float)):
+        # Timestamps em milissegundos (ex.: Date.now() do frontend)
+        if value > 1e11:
+            value = value / 1000.0
+        try:
+            return datetime.utcfromtimestamp(value)
+        except (OverflowError, OSError, ValueError):
+            # inf, nan ou fora do intervalo suportado pela plataforma
+            return None
+
+    if isinstance(value, str):
+        text = value.strip()
+        if text.endswith("Z"):
+            text = text[:-1] + "+00:00"
+        try:
+            parsed = datetime.fromisoformat(text)
+        except ValueError:
+            try:
+                return to_datetime(float(text))
+            except ValueError:
+                return None
+        return to_datetime(parsed)
+
+    return None
+
+
+def isoformat(value):
+    """
+    Serializa uma data para string ISO 8601 (UTC), aceitando formatos legados.
+
+    Args:
+        value: datetime, string ISO, timestamp ou None
+
+    Returns:
+        str: Data em ISO 8601 ou None
+    """
+    parsed = to_datetime(value)
+    return parsed.isoformat() if parsed else None
+
+
+def parse_range_args(args, since_key="since", until_key="until"):
+    """
+    Lê os parâmetros de intervalo de tempo de uma query string.
+
+    Args:
+        args: MultiDict da requisição (request.args)
+        since_key (str): Nome do parâmetro de início do intervalo
+        until_key (str): Nome do parâmetro de fim do intervalo
+
+    Returns:
+        tuple: (since, until) como datetime ou None
+
+    Raises:
+        ValueError: Se algum dos parâmetros não for uma data válida
+    """
+    since = until = None
+
+    raw_since = args.get(since_key)
+    if raw_since:
+        since = to_datetime(raw_since)
+        if since is None:
+            raise ValueError(
+                f"Parâmetro '{since_key}' inválido. Use ISO 8601 ou timestamp epoch.")
+
+    raw_until = args.get(until_key)
+    if raw_until:
+        until = to_datetime(raw_until)
+        if until is None:
+            raise ValueError(
+                f"Parâmetro '{until_key}' inválido. Use ISO 8601 ou timestamp epoch.")
+
+    if since and until and since > until:
+        raise ValueError(
+            f"O parâmetro '{since_key}' deve ser anterior a '{until_key}'.")
+
+    return since, until
+
+
+def build_range_filter(since=None, until=None):
+    """
+    Monta o filtro MongoDB para um intervalo [since, until].
+
+    Returns:
+        dict: Filtro com $gte/$lte ou None se nenhum limite foi informado
+    """
+    range_filter = {}
+    if since:
+        range_filter["$gte"] = since
+    if until:
+        range_filter["$lte"] = until
+    return range_filter or None
+
+
+def in_range(value, since=None, until=None):
+    """
+    Verifica se uma data (em qualquer formato suportado) está no intervalo.
+    """
+    if not since and not until:
+        return True
+
+    parsed = to_datetime(value)
+    if parsed is None:
+        return False
+    if since and parsed < since:
+        return False
+    if until and parsed > until:
+        return False
+    return True
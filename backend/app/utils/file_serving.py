@@ -0,0 +1,132 @@
+"""
+Utilitários para servir arquivos do disco.
+
+serve_file envia um arquivo com ETag forte (derivado do hash do conteúdo,
+quando disponível), respeitando If-None-Match e Range (seek de vídeos,
+downloads retomados) e com a política de cache adequada: arquivos endereçados
+por conteúdo (<sha256>...) nunca mudam e recebem Cache-Control immutable.
+
+Com FILE_ACCEL_REDIRECT=true a transferência é delegada ao proxy (nginx): a
+resposta leva apenas os headers e X-Accel-Redirect apontando para a location
+interna X_ACCEL_PREFIX. O worker Python não lê o arquivo; Range e sendfile
+ficam a cargo do nginx.
+
+Apenas os diretórios de arquivos (X_ACCEL_DIRS, relativos a X_ACCEL_ROOT) são
+montados no nginx; caminhos fora deles são servidos pelo próprio Flask. O
+redirecionamento só é usado em requisições que passaram pelo proxy (header
+X-Accel-Available definido pelo nginx), então o backend continua acessível
+diretamente.
+"""
+import os
+import re
+import mimetypes
+import logging
+from urllib.parse import quote
+from flask import request, send_file, Response
+
+logger = logging.getLogger(__name__)
+
+ACCEL_REDIRECT = os.environ.get('FILE_ACCEL_REDIRECT', 'false').lower() == 'true'
+ACCEL_PREFIX = os.environ.get('X_ACCEL_PREFIX', '/_protected/')
+# Diretório do backend; X_ACCEL_PREFIX + caminho relativo a ele = location interna
+ACCEL_ROOT = os.path.realpath(os.environ.get(
+    'X_ACCEL_ROOT', os.path.dirname(os.path.dirname(os.path.dirname(__file__)))))
+# Diretórios montados no nginx (uma location interna por diretório)
+ACCEL_DIRS = [os.path.realpath(os.path.join(ACCEL_ROOT, directory.strip()))
+              for directory in os.environ.get(
+                  'X_ACCEL_DIRS', 'static,uploads,app/static/uploads').split(',')
+              if directory.strip()]
+ACCEL_HEADER = 'X-Accel-Available'
+DEFAULT_MAX_AGE = 3600
+IMMUTABLE_MAX_AGE = 31536000  # 1 ano
+
+_CONTENT_ADDRESSED = re.compile(r"^[0-9a-f]{64}(?:[-.]|$)")
+
+
+def content_etag(path):
+    """
+    ETag de um arquivo endereçado por conteúdo (nome iniciado pelo SHA-256).
+
+    Returns:
+        str: Nome do arquivo (único por conteúdo e variante) ou None
+    """
+    filename = os.path.basename(path)
+    return filename if _CONTENT_ADDRESSED.match(filename) else None
+
+
+def _accel_path(path):
+    """Location interna de um arquivo ou None se estiver fora de ACCEL_DIRS"""
+    path = os.path.realpath(path)
+    if not any(os.path.commonpath([directory, path]) == directory
+               for directory in ACCEL_DIRS):
+        return None
+    relative = os.path.relpath(path, ACCEL_ROOT)
+    return ACCEL_PREFIX.rstrip("/") + "/" + quote(relative.replace(os.sep, "/"))
+
+
+def _content_disposition(response, download_name):
+    try:
+        download_name.encode("ascii")
+        response.headers.set("Content-Disposition", "attachment",
+                             filename=download_name)
+    except UnicodeEncodeError:
+        response.headers["Content-Disposition"] = \
+            f"attachment; filename*=UTF-8''{quote(download_name, safe='')}"
+
+
+def serve_file(path, mimetype=None, etag=None, immutable=False, max_age=None,
+               as_attachment=False, download_name=None, private=False):
+    """
+    Serve um arquivo existente em disco.
+
+    Args:
+        path (str): Caminho do arquivo
+        mimetype (str, optional): Tipo do conteúdo (padrão: pela extensão)
+        etag (str, optional): ETag forte, normalmente o hash do conteúdo
+            (padrão: o nome do arquivo, se endereçado por conteúdo)
+        immutable (bool): O conteúdo nunca muda neste endereço
+        max_age (int, optional): Validade do cache em segundos
+        as_attachment (bool): Força o download
+        download_name (str, optional): Nome sugerido para o download
+        private (bool): Impede o cache em proxies compartilhados
+
+    Returns:
+        Response: Arquivo, 206 (Range), 304 (If-None-Match) ou redirecionamento
+        interno para o nginx
+    """
+    path = os.path.abspath(path)
+    mimetype = mimetype or mimetypes.guess_type(path)[0] or "application/octet-stream"
+    etag = etag or content_etag(path)
+    if max_age is None:
+        max_age = IMMUTABLE_MAX_AGE if immutable else DEFAULT_MAX_AGE
+
+    internal = _accel_path(path) \
+        if ACCEL_REDIRECT and request.headers.get(ACCEL_HEADER) else None
+    if internal:
+        if etag and request.if_none_match.contains(etag):
+            response = Response(status=304)
+        else:
+            response = Response(mimetype=mimetype)
+            response.headers["X-Accel-Redirect"] = internal
+            if as_attachment:
+                _content_disposition(
+                    response, download_name or os.path.basename(path))
+        if etag:
+            response.set_etag(etag)
+    else:
+        response = send_file(
+            path,
+            mimetype=mimetype,
+            as_attachment=as_attachment,
+            download_name=download_name,
+            conditional=True,
+            etag=etag or True,
+            max_age=max_age
+        )
+
+    directives = ["private" if private else "public", f"max-age={max_age}"]
+    if immutable:
+        directives.append("immutable")
+    response.headers["Cache-Control"] = ", ".join(directives)
+    response.headers["Accept-Ranges"] = "bytes"
+    return response
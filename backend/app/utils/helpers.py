@@ -6,22 +6,26 @@ import datetime
 import uuid
 from bson import ObjectId
 from flask import jsonify, request
+from flask.json import JSONEncoder as FlaskJSONEncoder
 
 
-class JSONEncoder(json.JSONEncoder):
+class JSONEncoder(FlaskJSONEncoder):
     """
     Classe personalizada para codificar objetos JSON com tipos especiais
     como ObjectId, datetime, etc.
+
+    Também é registrada como encoder da aplicação Flask, para que datas
+    nativas do MongoDB sejam retornadas em ISO 8601 pelo jsonify.
     """
 
     def default(self, obj):
         if isinstance(obj, ObjectId):
             return str(obj)
-        if isinstance(obj, datetime.datetime):
+        if isinstance(obj, (datetime.datetime, datetime.date)):
             return obj.isoformat()
         if isinstance(obj, uuid.UUID):
             return str(obj)
-        return json.JSONEncoder.default(self, obj)
+        return FlaskJSONEncoder.default(self, obj)
 
 
 def parse_json(data):
@@ -80,7 +80,7 @@ def migrate_conversations():
             history = conversation.get('history', [])
 
             # Adiciona timestamps se não existirem
-            now = datetime.datetime.utcnow().isoformat()
+            now = datetime.datetime.utcnow()
             for message in history:
                 if 'timestamp' not in message:
                     message['timestamp'] = now
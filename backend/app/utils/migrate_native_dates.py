@@ -0,0 +1,286 @@
+#!/usr/bin/env python3
+"""
+Script de migração para converter datas legadas em datas nativas do MongoDB.
+
+Até aqui os campos de auditoria eram gravados como strings ISO
+(datetime.utcnow().isoformat()) nas rotas de chat/upload/agents e como
+timestamps float (time.time()) nos serviços de eBook, imagens, exportação e
+Canva. Este script converte todos esses campos para BSON datetime em lotes
+(bulk_write), cria os índices usados pelos filtros de intervalo (since/until)
+e, opcionalmente, índices TTL.
+
+Uso:
+    python -m app.utils.migrate_native_dates
+    python -m app.utils.migrate_native_dates --batch-size 500
+    python -m app.utils.migrate_native_dates --dry-run
+
+Índices TTL (opcional), no formato colecao.campo=dias separados por vírgula:
+    TTL_INDEXES="exports.created_at=30,canva_exports.created_at=7"
+
+Nota: Certifique-se de fazer um backup do banco de dados antes de executar este script.
+"""
+import sys
+import os
+import argparse
+import logging
+from pymongo import MongoClient, UpdateOne, ASCENDING, DESCENDING
+from app.utils.date_utils import to_datetime
+
+# Configuração de logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s [%(levelname)s] %(message)s',
+    handlers=[
+        logging.StreamHandler(),
+        logging.FileHandler('migration.log')
+    ]
+)
+logger = logging.getLogger('migration')
+
+DEFAULT_BATCH_SIZE = 1000
+
+# Campos de data de primeiro nível por coleção
+DATE_FIELDS = {
+    "conversations": ["created_at", "updated_at"],
+    "uploads": ["created_at"],
+    "agents": ["created_at", "updated_at"],
+    "ebooks": ["created_at", "updated_at"],
+    "images": ["created_at"],
+    "exports": ["created_at", "completed_at"],
+    "canva_designs": ["created_at"],
+    "canva_exports": ["created_at"],
+}
+
+# Campos de data dentro de arrays de subdocumentos (array, campo)
+ARRAY_DATE_FIELDS = {
+    "conversations": [("history", "timestamp"), ("files", "added_at")],
+}
+
+# Índices que suportam a ordenação e os filtros since/until dos endpoints
+RANGE_INDEXES = {
+    "conversations": [[("user_id", ASCENDING), ("updated_at", DESCENDING)],
+                      # Varredura de conversas inativas do arquivamento
+                      [("updated_at", ASCENDING)]],
+    "conversations_archive": [[("user_id", ASCENDING)]],
+    "uploads": [[("user_id", ASCENDING), ("created_at", DESCENDING)],
+                # Atalho de upload retomável para conteúdo já enviado pelo usuário
+                [("user_id", ASCENDING), ("content_hash", ASCENDING)]],
+    "ebooks": [[("created_at", DESCENDING)]],
+    "images": [[("user_id", ASCENDING), ("created_at", DESCENDING)],
+               # Reaproveitamento de variantes entre imagens com o mesmo conteúdo
+               [("content_hash", ASCENDING)]],
+    "exports": [[("ebook_id", ASCENDING), ("created_at", DESCENDING)]],
+    # Consulta em lote das exportações pendentes no Canva
+    "canva_exports": [[("status", ASCENDING), ("next_poll_at", ASCENDING)]],
+    # Coleta de lixo (storage.gc)
+    "upload_sessions": [[("expires_at", ASCENDING)]],
+    "export_cache": [[("refcount", ASCENDING), ("last_access_at", ASCENDING)]],
+    "blobs": [[("refcount", ASCENDING)]],
+}
+
+LEGACY_TYPES = ["string", "double", "int", "long"]
+
+
+def get_db():
+    """Conecta ao MongoDB e retorna a instância do banco de dados"""
+    mongo_uri = os.environ.get(
+        'MONGODB_URI', 'mongodb://localhost:27017/adamchat')
+    client = MongoClient(mongo_uri)
+    db_name = mongo_uri.split('/')[-1]
+    return client[db_name]
+
+
+def legacy_filter(collection_name):
+    """Monta o filtro dos documentos que ainda possuem datas legadas"""
+    conditions = [{field: {"$type": LEGACY_TYPES}}
+                  for field in DATE_FIELDS.get(collection_name, [])]
+    for array_field, field in ARRAY_DATE_FIELDS.get(collection_name, []):
+        conditions.append(
+            {f"{array_field}.{field}": {"$type": LEGACY_TYPES}})
+    return {"$or": conditions} if conditions else None
+
+
+def build_update(collection_name, document):
+    """
+    Calcula o $set necessário para converter as datas de um documento.
+
+    Returns:
+        dict: Campos convertidos (vazio se nada precisar mudar)
+    """
+    updates = {}
+
+    for field in DATE_FIELDS.get(collection_name, []):
+        value = document.get(field)
+        if value is None or hasattr(value, "year"):
+            continue
+        converted = to_datetime(value)
+        if converted is not None:
+            updates[field] = converted
+
+    for array_field, field in ARRAY_DATE_FIELDS.get(collection_name, []):
+        items = document.get(array_field)
+        if not isinstance(items, list):
+            continue
+
+        changed = False
+        for item in items:
+            if not isinstance(item, dict):
+                continue
+            value = item.get(field)
+            if value is None or hasattr(value, "year"):
+                continue
+            converted = to_datetime(value)
+            if converted is not None:
+                item[field] = converted
+                changed = True
+
+        if changed:
+            updates[array_field] = items
+
+    return updates
+
+
+def migrate_collection(db, collection_name, batch_size=DEFAULT_BATCH_SIZE, dry_run=False):
+    """Converte as datas legadas de uma coleção usando bulk_write em lotes"""
+    query = legacy_filter(collection_name)
+    if not query:
+        return 0
+
+    collection = db[collection_name]
+    pending = collection.count_documents(query)
+    logger.info(
+        f"[{collection_name}] {pending} documentos com datas legadas")
+    if pending == 0:
+        return 0
+
+    projection = DATE_FIELDS.get(collection_name, []) + \
+        [array_field for array_field, _ in ARRAY_DATE_FIELDS.get(
+            collection_name, [])]
+
+    operations = []
+    migrated = 0
+    cursor = collection.find(query, projection, batch_size=batch_size)
+    for document in cursor:
+        updates = build_update(collection_name, document)
+        if not updates:
+            continue
+
+        operations.append(UpdateOne({"_id": document["_id"]}, {"$set": updates}))
+        if len(operations) >= batch_size:
+            migrated += _flush(collection, operations, dry_run)
+            operations = []
+            logger.info(
+                f"[{collection_name}] Migrados {migrated} de {pending} documentos")
+
+    if operations:
+        migrated += _flush(collection, operations, dry_run)
+
+    logger.info(
+        f"[{collection_name}] Migração concluída. {migrated} documentos atualizados.")
+    return migrated
+
+
+def _flush(collection, operations, dry_run):
+    """Executa um lote de atualizações"""
+    if dry_run:
+        return len(operations)
+    result = collection.bulk_write(operations, ordered=False)
+    return result.modified_count
+
+
+def parse_ttl_config(raw=None):
+    """
+    Lê a configuração de índices TTL.
+
+    Args:
+        raw (str): Configuração no formato "colecao.campo=dias,..."
+
+    Returns:
+        list: Tuplas (colecao, campo, segundos)
+    """
+    raw = raw if raw is not None else os.environ.get("TTL_INDEXES", "")
+    ttl_indexes = []
+    for entry in raw.split(","):
+        entry = entry.strip()
+        if not entry:
+            continue
+        try:
+            target, days = entry.split("=", 1)
+            collection_name, field = target.split(".", 1)
+            ttl_indexes.append(
+                (collection_name, field, int(float(days) * 86400)))
+        except ValueError:
+            logger.warning(f"Configuração TTL inválida ignorada: '{entry}'")
+    return ttl_indexes
+
+
+def ensure_indexes(db, ttl_indexes=None):
+    """Cria os índices de intervalo e, se configurados, os índices TTL"""
+    ttl_indexes = ttl_indexes if ttl_indexes is not None else parse_ttl_config()
+    ttl_keys = {(collection_name, field)
+                for collection_name, field, _ in ttl_indexes}
+
+    for collection_name, indexes in RANGE_INDEXES.items():
+        for keys in indexes:
+            # Um índice de campo único no mesmo campo do TTL conflitaria com ele
+            if len(keys) == 1 and (collection_name, keys[0][0]) in ttl_keys:
+                continue
+            db[collection_name].create_index(keys)
+            logger.info(f"[{collection_name}] Índice garantido: {keys}")
+
+    for collection_name, field, seconds in ttl_indexes:
+        collection = db[collection_name]
+        for name, info in collection.index_information().items():
+            if info.get("key") == [(field, 1)] and info.get("expireAfterSeconds") != seconds:
+                collection.drop_index(name)
+        collection.create_index(
+            [(field, ASCENDING)], expireAfterSeconds=seconds)
+        logger.info(
+            f"[{collection_name}] Índice TTL em '{field}' ({seconds}s) garantido")
+
+
+def validate_migration(db):
+    """Valida se não restaram datas legadas"""
+    remaining = 0
+    for collection_name in DATE_FIELDS:
+        count = db[collection_name].count_documents(
+            legacy_filter(collection_name))
+        if count:
+            logger.warning(
+                f"[{collection_name}] {count} documentos ainda possuem datas legadas")
+        remaining += count
+
+    if remaining == 0:
+        logger.info("Todas as datas foram convertidas com sucesso!")
+    return remaining
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Converte datas legadas para BSON datetime")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument("--dry-run", action="store_true",
+                        help="Apenas conta os documentos que seriam alterados")
+    parser.add_argument("--skip-indexes", action="store_true",
+                        help="Não cria os índices de intervalo/TTL")
+    args = parser.parse_args(argv)
+
+    db = get_db()
+    for collection_name in DATE_FIELDS:
+        migrate_collection(db, collection_name,
+                           batch_size=args.batch_size, dry_run=args.dry_run)
+
+    if not args.dry_run:
+        if not args.skip_indexes:
+            ensure_indexes(db)
+        validate_migration(db)
+
+
+if __name__ == "__main__":
+    try:
+        logger.info("Iniciando migração de datas...")
+        main()
+        logger.info("Processo de migração concluído!")
+    except Exception as e:
+        logger.error(f"Erro durante a migração: {str(e)}")
+        sys.exit(1)
@@ -0,0 +1,289 @@
+#!/usr/bin/env python3
+"""
+Script de migração dos arquivos locais para o layout distribuído (ab/cd/<nome>).
+
+Os arquivos novos já são gravados nos subdiretórios (app.utils.sharding); este
+script move os arquivos antigos, que ficaram na raiz de cada diretório, e
+reescreve as referências gravadas no banco:
+
+    static/images            images.path, images.url, blobs.path
+    static/images/variants   images.thumbnail_url, images.variants.url
+    uploads/files|images     uploads.file_path
+    uploads/blobs            uploads.file_path, blobs.path
+    uploads/thumbnails       uploads.thumbnail_path
+    armazenamento local      blobs.path, storage_items.storage_path
+    static/exports           export_cache.path, exports.filepath, exports.download_url
+
+O trabalho é feito em lotes: cada arquivo do lote recebe um hard link no
+caminho novo, as referências do lote são reescritas (bulk_write e UPDATE) e só
+então o nome antigo é removido. Durante a migração os dois caminhos são
+válidos, e o script pode ser interrompido e executado novamente.
+
+Uso:
+    python -m app.utils.migrate_sharded_storage
+    python -m app.utils.migrate_sharded_storage --batch-size 500
+    python -m app.utils.migrate_sharded_storage --dry-run
+    python -m app.utils.migrate_sharded_storage --only images,uploads
+
+Nota: Certifique-se de fazer um backup do banco de dados antes de executar este script.
+"""
+import sys
+import os
+import re
+import shutil
+import argparse
+import logging
+from pymongo import UpdateOne
+from app.utils.sharding import shard_key, shard_path
+
+# Configuração de logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s [%(levelname)s] %(message)s',
+    handlers=[
+        logging.StreamHandler(),
+        logging.FileHandler('migration.log')
+    ]
+)
+logger = logging.getLogger('migration')
+
+DEFAULT_BATCH_SIZE = 1000
+
+_SHA256 = re.compile(r"^[0-9a-f]{64}$")
+
+
+def _variant_key(filename):
+    # <stem>-<largura>.<formato> ou <stem>-thumb.webp
+    return shard_key(filename).rsplit("-", 1)[0]
+
+
+def _any_file(filename):
+    return True
+
+
+def _cache_artifact(filename):
+    return bool(_SHA256.match(shard_key(filename)))
+
+
+def _url(path):
+    return "/" + path.replace(os.sep, "/")
+
+
+def get_areas(app):
+    """
+    Diretórios migrados.
+
+    Returns:
+        list: dicts com name, directory, key_of, accept (filtro de nomes),
+        refs [(coleção, campo, "path" ou "url")] e sql (storage_items)
+    """
+    from app.services.image_service import IMAGE_STORAGE_PATH
+    from app.services.image_variant_service import VARIANT_STORAGE_PATH
+    from app.services.upload_service import (
+        FILE_UPLOAD_FOLDER, IMAGE_UPLOAD_FOLDER, BLOB_UPLOAD_FOLDER)
+    from app.services.upload_ingest_service import THUMBNAIL_FOLDER
+    from app.services.storage_backend import LOCAL_STORAGE_FOLDER
+    from app.services.export_service import EXPORT_STORAGE_PATH
+
+    return [
+        {"name": "images", "directory": IMAGE_STORAGE_PATH, "key_of": shard_key,
+         "accept": _any_file,
+         "refs": [("images", "path", "path"), ("images", "url", "url"),
+                  ("blobs", "path", "path")]},
+        {"name": "variants", "directory": VARIANT_STORAGE_PATH, "key_of": _variant_key,
+         "accept": _any_file,
+         "refs": [("images", "thumbnail_url", "url"), ("images", "variants.url", "url")]},
+        {"name": "upload_files", "directory": FILE_UPLOAD_FOLDER, "key_of": shard_key,
+         "accept": _any_file, "refs": [("uploads", "file_path", "path")]},
+        {"name": "upload_images", "directory": IMAGE_UPLOAD_FOLDER, "key_of": shard_key,
+         "accept": _any_file, "refs": [("uploads", "file_path", "path")]},
+        {"name": "uploads", "directory": BLOB_UPLOAD_FOLDER, "key_of": shard_key,
+         "accept": _any_file,
+         "refs": [("uploads", "file_path", "path"), ("blobs", "path", "path")]},
+        {"name": "thumbnails", "directory": THUMBNAIL_FOLDER, "key_of": shard_key,
+         "accept": _any_file, "refs": [("uploads", "thumbnail_path", "path")]},
+        {"name": "storage",
+         "directory": app.config.get('LOCAL_UPLOAD_FOLDER') or LOCAL_STORAGE_FOLDER,
+         "key_of": shard_key, "accept": _any_file,
+         "refs": [("blobs", "path", "path")], "sql": True},
+        # Apenas os artefatos do cache; os arquivos de trabalho das exportações
+        # em andamento (<export_id>.<formato>) ficam na raiz
+        {"name": "exports", "directory": EXPORT_STORAGE_PATH, "key_of": shard_key,
+         "accept": _cache_artifact,
+         "refs": [("export_cache", "path", "path"), ("exports", "filepath", "path"),
+                  ("exports", "download_url", "url")]},
+    ]
+
+
+def iter_batches(area, batch_size):
+    """Lotes de arquivos da raiz do diretório (layout antigo)"""
+    directory = area["directory"]
+    batch = []
+    try:
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                name = entry.name
+                # Gravações em andamento (.<uuid>.part, <nome>.part)
+                if name.startswith(".") or name.endswith(".part"):
+                    continue
+                if not entry.is_file(follow_symlinks=False) or not area["accept"](name):
+                    continue
+                batch.append(name)
+                if len(batch) >= batch_size:
+                    yield batch
+                    batch = []
+    except FileNotFoundError:
+        return
+    if batch:
+        yield batch
+
+
+def _link(source, target):
+    """Cria o caminho novo sem remover o antigo"""
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    if os.path.exists(target):
+        return
+    try:
+        os.link(source, target)
+    except OSError:
+        # Sistema de arquivos sem hard links
+        shutil.copy2(source, target)
+
+
+def _rewrite_refs(db, refs, moves):
+    """Reescreve as referências de um lote de arquivos (antigo -> novo)"""
+    updated = 0
+    for collection_name, field, kind in refs:
+        mapping = {(_url(old) if kind == "url" else old): (_url(new) if kind == "url" else new)
+                   for old, new in moves.items()}
+        collection = db[collection_name]
+
+        if "." in field:
+            # Campo dentro de array de subdocumentos (ex.: variants.url)
+            array_field, sub_field = field.split(".", 1)
+            operations = []
+            for document in collection.find({field: {"$in": list(mapping)}},
+                                            {array_field: 1}):
+                items = document.get(array_field) or []
+                for item in items:
+                    if isinstance(item, dict) and item.get(sub_field) in mapping:
+                        item[sub_field] = mapping[item[sub_field]]
+                operations.append(
+                    UpdateOne({"_id": document["_id"]}, {"$set": {array_field: items}}))
+        else:
+            operations = [
+                UpdateOne({"_id": document["_id"]}, {"$set": {field: mapping[document[field]]}})
+                for document in collection.find({field: {"$in": list(mapping)}}, {field: 1})
+            ]
+
+        if operations:
+            updated += collection.bulk_write(operations, ordered=False).modified_count
+    return updated
+
+
+def _rewrite_sql(moves):
+    from app.extensions import db
+    from app.models.storage import StorageItem
+
+    updated = 0
+    for old, new in moves.items():
+        updated += StorageItem.query.filter_by(storage_path=old).update(
+            {StorageItem.storage_path: new}, synchronize_session=False)
+    db.session.commit()
+    return updated
+
+
+def migrate_area(db, area, batch_size=DEFAULT_BATCH_SIZE, dry_run=False):
+    """Move os arquivos da raiz de um diretório para os subdiretórios"""
+    directory = area["directory"]
+    moved = 0
+    references = 0
+
+    for batch in iter_batches(area, batch_size):
+        if dry_run:
+            moved += len(batch)
+            continue
+
+        moves = {}
+        for filename in batch:
+            source = os.path.join(directory, filename)
+            target = shard_path(directory, filename, area["key_of"](filename))
+            try:
+                _link(source, target)
+            except FileNotFoundError:
+                # Removido (ex.: coleta de lixo) durante a migração
+                continue
+            moves[source] = target
+
+        if not moves:
+            continue
+
+        references += _rewrite_refs(db, area["refs"], moves)
+        if area.get("sql"):
+            references += _rewrite_sql(moves)
+
+        # Referências já apontam para o caminho novo
+        for source in moves:
+            try:
+                os.remove(source)
+            except FileNotFoundError:
+                pass
+        moved += len(moves)
+        logger.info(
+            f"[{area['name']}] {moved} arquivos movidos, {references} referências atualizadas")
+
+    logger.info(
+        f"[{area['name']}] Migração concluída. {moved} arquivos"
+        f"{' seriam movidos' if dry_run else ' movidos'}.")
+    return moved
+
+
+def validate_migration(areas):
+    """Valida se não restaram arquivos na raiz dos diretórios"""
+    remaining = 0
+    for area in areas:
+        count = sum(len(batch) for batch in iter_batches(area, DEFAULT_BATCH_SIZE))
+        if count:
+            logger.warning(f"[{area['name']}] {count} arquivos ainda na raiz")
+        remaining += count
+
+    if remaining == 0:
+        logger.info("Todos os arquivos foram movidos com sucesso!")
+    return remaining
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Move os arquivos locais para o layout distribuído (ab/cd/<nome>)")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument("--dry-run", action="store_true",
+                        help="Apenas conta os arquivos que seriam movidos")
+    parser.add_argument("--only", default="",
+                        help="Diretórios a migrar, separados por vírgula")
+    args = parser.parse_args(argv)
+
+    # Contexto da aplicação: caminhos configurados, MongoDB e SQLAlchemy
+    from app import create_app
+    from app.db import get_db
+
+    app = create_app()
+    with app.app_context():
+        db = get_db()
+        only = {name.strip() for name in args.only.split(",") if name.strip()}
+        areas = [area for area in get_areas(app) if not only or area["name"] in only]
+
+        for area in areas:
+            migrate_area(db, area, batch_size=args.batch_size, dry_run=args.dry_run)
+
+        if not args.dry_run:
+            validate_migration(areas)
+
+
+if __name__ == "__main__":
+    try:
+        logger.info("Iniciando migração dos arquivos para o layout distribuído...")
+        main()
+        logger.info("Processo de migração concluído!")
+    except Exception as e:
+        logger.error(f"Erro durante a migração: {str(e)}")
+        sys.exit(1)
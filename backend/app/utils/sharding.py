@@ -0,0 +1,107 @@
+"""
+Distribuição dos arquivos em subdiretórios (fan-out).
+
+Diretórios com milhões de arquivos tornam lentas a listagem, a criação de
+arquivos e os backups. Os arquivos são gravados em dois níveis derivados do
+hash do identificador:
+
+    static/images/ab/cd/abcd1234...png
+
+Nomes endereçados por conteúdo (iniciados pelo SHA-256) usam o próprio
+prefixo; os demais usam o SHA-256 do identificador, de modo que IDs
+sequenciais (ObjectId, timestamps) também se distribuem uniformemente.
+
+Arquivos anteriores a este formato continuam na raiz do diretório até a
+migração (app.utils.migrate_sharded_storage); locate procura nos dois lugares.
+"""
+import os
+import re
+import hashlib
+
+SHARD_LEVELS = 2
+SHARD_WIDTH = 2
+
+_SHA256_PREFIX = re.compile(r"^[0-9a-f]{64}")
+_SHARD_NAME = re.compile(r"^[0-9a-f]{%d}$" % SHARD_WIDTH)
+
+
+def shard_key(filename):
+    """Identificador usado na distribuição: o nome sem as extensões"""
+    return os.path.basename(filename).split(".", 1)[0]
+
+
+def shard_dirs(key):
+    """
+    Subdiretórios de um identificador.
+
+    Returns:
+        list: Um nome por nível (ex.: ["ab", "cd"])
+    """
+    digest = key if _SHA256_PREFIX.match(key) else \
+        hashlib.sha256(key.encode("utf-8")).hexdigest()
+    return [digest[i * SHARD_WIDTH:(i + 1) * SHARD_WIDTH] for i in range(SHARD_LEVELS)]
+
+
+def shard_dir(directory, key):
+    """Diretório de destino de um identificador"""
+    return os.path.join(directory, *shard_dirs(key))
+
+
+def shard_path(directory, filename, key=None):
+    """
+    Caminho distribuído de um arquivo.
+
+    Args:
+        directory (str): Diretório base
+        filename (str): Nome do arquivo
+        key (str, optional): Identificador (padrão: o nome sem extensão);
+            arquivos relacionados (ex.: variantes de uma imagem) compartilham
+            o diretório quando usam o mesmo identificador
+    """
+    return os.path.join(shard_dir(directory, key or shard_key(filename)), filename)
+
+
+def locate(directory, filename, key=None):
+    """
+    Procura um arquivo no caminho distribuído e, depois, na raiz (legado).
+
+    Returns:
+        str: Caminho existente ou None
+    """
+    for path in (shard_path(directory, filename, key), os.path.join(directory, filename)):
+        if os.path.exists(path):
+            return path
+    return None
+
+
+def relative_url(directory, path, url_prefix):
+    """URL de um arquivo a partir do prefixo público do diretório"""
+    relative = os.path.relpath(path, directory).replace(os.sep, "/")
+    return f"{url_prefix.rstrip('/')}/{relative}"
+
+
+def leaf_dirs(directory):
+    """
+    Diretórios que contêm arquivos, em ordem: a raiz ("", legado) e depois
+    cada subdiretório distribuído ("ab/cd"). Outros subdiretórios são ignorados.
+    """
+    yield ""
+
+    def children(relative):
+        try:
+            with os.scandir(os.path.join(directory, relative)) as entries:
+                names = [e.name for e in entries
+                         if _SHARD_NAME.match(e.name) and e.is_dir(follow_symlinks=False)]
+        except FileNotFoundError:
+            return []
+        return sorted(names)
+
+    def walk(relative, level):
+        for name in children(relative):
+            child = f"{relative}/{name}" if relative else name
+            if level == SHARD_LEVELS:
+                yield child
+            else:
+                yield from walk(child, level + 1)
+
+    yield from walk("", 1)
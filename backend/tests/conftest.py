@@ -0,0 +1,32 @@
+"""
+Configuração dos testes unitários do backend.
+
+Os testes usam o mongomock no lugar do MongoDB; nenhum serviço externo é
+necessário.
+"""
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def mongo(monkeypatch):
+    """
+    Banco MongoDB em memória (mongomock).
+
+    Retorna uma função que aplica o banco aos módulos informados, substituindo
+    o get_db importado por cada um.
+    """
+    mongomock = pytest.importorskip("mongomock")
+    database = mongomock.MongoClient()["adamchat_test"]
+
+    def patch(*modules):
+        for module in modules:
+            monkeypatch.setattr(module, "get_db", lambda: database)
+        return database
+
+    patch.db = database
+    return patch
@@ -0,0 +1,67 @@
+from datetime import timedelta
+
+import pytest
+from bson import ObjectId
+
+from app.services import archive_service
+from app.utils.date_utils import utcnow
+
+
+@pytest.fixture
+def db(mongo):
+    return mongo(archive_service)
+
+
+def _conversation(db, idle_days):
+    conversation_id = ObjectId()
+    db.conversations.insert_one({
+        "_id": conversation_id,
+        "user_id": "u1",
+        "updated_at": utcnow() - timedelta(days=idle_days),
+        "history": [{"sender": "user", "text": f"mensagem {i}"} for i in range(5)],
+    })
+    return conversation_id
+
+
+def test_compress_round_trip():
+    messages = [{"text": f"m{i}"} for i in range(7)]
+    blocks, codec, raw_bytes, compressed_bytes = archive_service.compress_messages(
+        messages, block_size=3)
+    assert len(blocks) == 3
+    restored = list(archive_service.iter_block_messages({"codec": codec, "blocks": blocks}))
+    assert restored == messages
+
+
+def test_archive_and_rehydrate(db):
+    idle = _conversation(db, idle_days=120)
+    recent = _conversation(db, idle_days=1)
+
+    stats = archive_service.archive_idle_conversations(idle_days=90)
+    assert stats["archived"] == 1
+    stub = db.conversations.find_one({"_id": idle})
+    assert stub["archived"] is True
+    assert "history" not in stub
+    assert db.conversations.find_one({"_id": recent}).get("archived") is None
+
+    assert archive_service.ensure_hot(idle, db=db) is True
+    conversation = db.conversations.find_one({"_id": idle})
+    assert len(conversation["history"]) == 5
+    assert "archived" not in conversation
+    assert db[archive_service.ARCHIVE_COLLECTION].count_documents({}) == 0
+
+
+def test_rehydrated_conversation_is_not_archived_again(db):
+    conversation_id = _conversation(db, idle_days=120)
+    archive_service.archive_idle_conversations(idle_days=90)
+    archive_service.rehydrate_conversation(conversation_id, db=db)
+
+    stats = archive_service.archive_idle_conversations(idle_days=90)
+    assert stats["archived"] == 0
+    assert not db.conversations.find_one({"_id": conversation_id}).get("archived")
+
+    # Sem novo acesso por ARCHIVE_IDLE_DAYS, volta a ser arquivada
+    db.conversations.update_one(
+        {"_id": conversation_id},
+        {"$set": {"rehydrated_at": utcnow() - timedelta(days=100)}})
+    assert archive_service.archive_idle_conversations(idle_days=90)["archived"] == 1
+    assert "rehydrated_at" not in db.conversations.find_one({"_id": conversation_id})
@@ -0,0 +1,100 @@
+import os
+import threading
+
+import pytest
+from pymongo.errors import DuplicateKeyError
+
+from app.services import blob_store
+
+
+@pytest.fixture
+def db(mongo):
+    return mongo(blob_store)
+
+
+def _refcount(db, digest, namespace="images"):
+    return db[blob_store.BLOB_COLLECTION].find_one({"_id": f"{namespace}:{digest}"})["refcount"]
+
+
+def test_duplicate_content_is_stored_once(db, tmp_path):
+    first = blob_store.write_bytes("images", b"abc", str(tmp_path), "png")
+    second = blob_store.write_bytes("images", b"abc", str(tmp_path), "png")
+
+    assert first["created"] and not second["created"]
+    assert first["path"] == second["path"]
+    assert _refcount(db, first["hash"]) == 2
+    # Nenhum arquivo temporário sobra no diretório
+    assert not [name for name in os.listdir(tmp_path) if name.endswith(".part")]
+
+
+def test_release_removes_the_file_with_the_last_reference(db, tmp_path):
+    blob = blob_store.write_bytes("images", b"abc", str(tmp_path), "png")
+    blob_store.write_bytes("images", b"abc", str(tmp_path), "png")
+
+    assert blob_store.release("images", blob["hash"]) is None
+    assert os.path.exists(blob["path"])
+    assert blob_store.release("images", blob["hash"])
+    assert not os.path.exists(blob["path"])
+    assert blob_store.get_blob("images", blob["hash"]) is None
+
+
+def test_namespaces_are_independent(db, tmp_path):
+    image = blob_store.write_bytes("images", b"abc", str(tmp_path / "a"), "png")
+    upload = blob_store.write_bytes("uploads", b"abc", str(tmp_path / "b"), "png")
+    assert upload["created"]
+    assert image["path"] != upload["path"]
+
+
+def test_acquire_only_existing_blobs(db, tmp_path):
+    assert blob_store.acquire("images", "0" * 64) is None
+    blob = blob_store.write_bytes("images", b"abc", str(tmp_path), "png")
+    assert blob_store.acquire("images", blob["hash"])["refcount"] == 2
+
+
+def test_register_keeps_the_existing_path(db):
+    first = blob_store.register("storage", "f" * 64, "s3://bucket/a.png", 3)
+    second = blob_store.register("storage", "f" * 64, "s3://bucket/b.png", 3)
+    assert first["created"] and not second["created"]
+    assert second["path"] == "s3://bucket/a.png"
+    assert _refcount(db, "f" * 64, "storage") == 2
+
+
+def test_missing_file_is_replaced(db, tmp_path):
+    blob = blob_store.write_bytes("images", b"abc", str(tmp_path), "png")
+    os.remove(blob["path"])
+    again = blob_store.write_bytes("images", b"abc", str(tmp_path), "png")
+    assert again["created"] and os.path.exists(again["path"])
+    assert _refcount(db, blob["hash"]) == 2
+
+
+def test_register_retries_on_duplicate_key(db, monkeypatch):
+    collection = db[blob_store.BLOB_COLLECTION]
+    original = type(collection).find_one_and_update
+    calls = []
+
+    def racing(self, *args, **kwargs):
+        calls.append(1)
+        if len(calls) == 1:
+            # Outro processo inseriu o blob durante o upsert
+            collection.insert_one({"_id": "storage:" + "e" * 64, "path": "outro", "refcount": 1})
+            raise DuplicateKeyError("E11000")
+        return original(self, *args, **kwargs)
+
+    monkeypatch.setattr(type(collection), "find_one_and_update", racing)
+    blob = blob_store.register("storage", "e" * 64, "meu", 3)
+    assert not blob["created"] and blob["path"] == "outro"
+    assert _refcount(db, "e" * 64, "storage") == 2
+
+
+def test_concurrent_writes_keep_every_reference(db, tmp_path):
+    threads = [threading.Thread(
+        target=blob_store.write_bytes, args=("images", b"abc", str(tmp_path), "png"))
+        for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    blob = db[blob_store.BLOB_COLLECTION].find_one()
+    assert blob["refcount"] == 8
+    assert os.path.exists(blob["path"])
@@ -0,0 +1,112 @@
+from datetime import timedelta
+
+import pytest
+
+from app.services import canva_export_service as service, canva_service
+from app.services.canva_service import LocalCanvaClient, export_design_from_canva
+from app.utils.date_utils import utcnow
+
+
+class BrokenClient:
+    def get_export(self, job_id):
+        raise ConnectionError("Canva indisponível")
+
+
+@pytest.fixture
+def db(mongo, monkeypatch):
+    from app.tasks import export_tasks
+    notified = []
+    monkeypatch.setattr(export_tasks.finish_remote_export_task, "delay",
+                        lambda *args: notified.append(args))
+    canva_service.set_canva_client(LocalCanvaClient("http://canva.local", polls_until_ready=2))
+    database = mongo(service, canva_service)
+    database.notified = notified
+    yield database
+    canva_service.set_canva_client(None)
+
+
+def _make_due(db):
+    db.canva_exports.update_many({}, {"$set": {"next_poll_at": utcnow() - timedelta(seconds=1)}})
+
+
+def test_next_poll_delay_is_exponential_and_capped():
+    assert [service.next_poll_delay(n) for n in range(4)] == [2, 4, 8, 16]
+    assert service.next_poll_delay(20) == service.POLL_MAX_SECONDS
+
+
+def test_claim_skips_jobs_not_due_and_leased(db):
+    export_design_from_canva("d1", export_id="e1")
+    export_design_from_canva("d2", export_id="e2")
+    db.canva_exports.update_one({"design_id": "d2"},
+                                {"$set": {"next_poll_at": utcnow() + timedelta(minutes=1)}})
+
+    jobs = service._claim_due_jobs(db, 10)
+    assert [job["design_id"] for job in jobs] == ["d1"]
+    # A reserva adia a próxima consulta: outra execução não repete o job
+    assert service._claim_due_jobs(db, 10) == []
+
+
+def test_pending_job_backs_off_then_finishes_and_notifies(db):
+    export_design_from_canva("d1", format="PDF", export_id="e1")
+
+    before = utcnow()
+    assert service.poll_pending_exports() == {
+        "consultados": 1, "concluidos": 0, "falhas": 0, "pendentes": 1}
+    job = db.canva_exports.find_one()
+    assert job["attempts"] == 1 and job["status"] == "pendente"
+    assert job["next_poll_at"] >= before + timedelta(seconds=service.next_poll_delay(1))
+    assert service.poll_pending_exports()["consultados"] == 0
+    assert db.notified == []
+
+    _make_due(db)
+    assert service.poll_pending_exports()["concluidos"] == 1
+    job = db.canva_exports.find_one()
+    assert job["status"] == "concluido" and job["attempts"] == 2
+    assert db.notified == [("e1", "http://canva.local/d1.pdf", None)]
+
+
+def test_failed_job_is_forwarded_with_error(db):
+    export_design_from_canva("fail-1", export_id="e1")
+    service.poll_pending_exports()
+    _make_due(db)
+    assert service.poll_pending_exports()["falhas"] == 1
+    assert db.notified == [("e1", None, "Falha simulada.")]
+
+
+def test_jobs_are_updated_in_one_bulk_write(db, monkeypatch):
+    for i in range(3):
+        export_design_from_canva(f"d{i}")
+    calls = []
+    original = db.canva_exports.bulk_write
+
+    def bulk_write(operations, ordered=True):
+        calls.append(len(operations))
+        return original(operations, ordered=ordered)
+    monkeypatch.setattr(db.canva_exports, "bulk_write", bulk_write)
+
+    assert service.poll_pending_exports()["pendentes"] == 3
+    assert calls == [3]
+    # Sem export_id não há exportação a notificar
+    _make_due(db)
+    assert service.poll_pending_exports()["concluidos"] == 3
+    assert db.notified == []
+
+
+def test_errors_fail_the_job_after_max_attempts(db, monkeypatch):
+    export_design_from_canva("d1", export_id="e1")
+    canva_service.set_canva_client(BrokenClient())
+
+    assert service.poll_pending_exports()["pendentes"] == 1
+    db.canva_exports.update_one({}, {"$set": {"attempts": service.POLL_MAX_ATTEMPTS - 1}})
+    _make_due(db)
+    assert service.poll_pending_exports()["falhas"] == 1
+    assert db.canva_exports.find_one()["error"] == "Canva indisponível"
+    assert db.notified == [("e1", None, "Canva indisponível")]
+
+
+def test_local_client_jobs_are_shared_between_instances(db):
+    job = LocalCanvaClient(polls_until_ready=1).create_export("d1", "PNG")
+    status = LocalCanvaClient("http://outro", polls_until_ready=1).get_export(job["id"])
+    assert status["download_url"] == "http://outro/d1.png"
+    with pytest.raises(KeyError):
+        LocalCanvaClient().get_export("inexistente")
@@ -0,0 +1,116 @@
+from datetime import timedelta
+
+import pytest
+
+from app.services import canva_service as service
+from app.utils.date_utils import utcnow
+
+KEY = "ebook:b1"
+
+
+class FakeResponse:
+    def __init__(self, status_code=200, templates=None, etag=None):
+        self.status_code = status_code
+        self.headers = {"ETag": etag} if etag else {}
+        self._templates = templates or []
+
+    def json(self):
+        return {"templates": self._templates}
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise RuntimeError(f"HTTP {self.status_code}")
+
+
+@pytest.fixture
+def db(mongo, monkeypatch):
+    from app.tasks import canva_tasks
+    refreshes, requests_made, responses = [], [], []
+
+    def get(url, headers=None, params=None, timeout=None):
+        requests_made.append(dict(headers or {}))
+        return responses.pop(0)
+
+    monkeypatch.setattr(canva_tasks.refresh_templates_task, "delay",
+                        lambda *args: refreshes.append(args))
+    monkeypatch.setattr(service.requests, "get", get)
+    monkeypatch.setattr(service, "_store_thumbnail", lambda t: f"/miniaturas/{t['id']}.jpg")
+    database = mongo(service)
+    database.providers.insert_one({"name": "canva", "type": "design",
+                                   "config": {"api_key": "k", "brand_id": "b1"}})
+    database.refreshes = refreshes
+    database.requests_made = requests_made
+    database.responses = responses
+    return database
+
+
+def _templates(*ids):
+    return [{"id": i, "name": f"Template {i}", "preview_url": f"https://canva/{i}.png"}
+            for i in ids]
+
+
+def _cache(db, age=0, thumbnails=True, **fields):
+    document = {"_id": KEY, "templates": [{"id": "t1"}, {"id": "t2"}], "etag": '"v1"',
+                "fetched_at": utcnow() - timedelta(seconds=age), "thumbnails": thumbnails}
+    document.update(fields)
+    db.canva_templates.insert_one(document)
+
+
+def test_first_access_fetches_once_and_schedules_thumbnails(db):
+    db.responses.append(FakeResponse(templates=_templates("t1", "t2", "t3"), etag='"v1"'))
+
+    assert [t["id"] for t in service.list_templates(limit=2)] == ["t1", "t2"]
+    assert "If-None-Match" not in db.requests_made[0]
+    cached = db.canva_templates.find_one({"_id": KEY})
+    assert cached["etag"] == '"v1"' and cached["thumbnails"] is False
+    assert db.refreshes == [("ebook", "b1")]
+
+
+def test_fresh_cache_is_served_without_requests(db):
+    _cache(db)
+    assert [t["id"] for t in service.list_templates()] == ["t1", "t2"]
+    assert db.requests_made == [] and db.refreshes == []
+
+
+def test_stale_cache_is_served_while_a_single_refresh_runs(db):
+    _cache(db, age=service.TEMPLATE_CACHE_TTL + 1)
+
+    for _ in range(3):
+        assert [t["id"] for t in service.list_templates()] == ["t1", "t2"]
+    assert db.requests_made == []
+    assert db.refreshes == [("ebook", "b1")]
+
+    # Reserva vencida (tarefa perdida): outra atualização é disparada
+    db.canva_templates.update_one({"_id": KEY}, {"$set": {
+        "refreshing_until": utcnow() - timedelta(seconds=1)}})
+    service.list_templates()
+    assert len(db.refreshes) == 2
+
+
+def test_not_modified_keeps_templates_and_renews_cache(db):
+    _cache(db, age=service.TEMPLATE_CACHE_TTL + 1,
+           refreshing_until=utcnow() + timedelta(minutes=1))
+    db.responses.append(FakeResponse(304))
+
+    templates = service.refresh_template_catalogue("ebook", "b1")
+
+    assert db.requests_made[0]["If-None-Match"] == '"v1"'
+    assert [t["thumbnail_url"] for t in templates] == ["/miniaturas/t1.jpg", "/miniaturas/t2.jpg"]
+    cached = db.canva_templates.find_one({"_id": KEY})
+    assert cached["etag"] == '"v1"' and "refreshing_until" not in cached
+    assert (utcnow() - cached["fetched_at"]).total_seconds() < 60
+    service.list_templates()
+    assert db.refreshes == []
+
+
+def test_changed_catalogue_replaces_cache_and_etag(db):
+    _cache(db, age=service.TEMPLATE_CACHE_TTL + 1)
+    db.responses.append(FakeResponse(templates=_templates("t9"), etag='"v2"'))
+
+    service.refresh_template_catalogue("ebook", "b1", thumbnails=False)
+
+    cached = db.canva_templates.find_one({"_id": KEY})
+    assert cached["etag"] == '"v2"' and [t["id"] for t in cached["templates"]] == ["t9"]
+    # As miniaturas dos templates novos ainda precisam ser geradas
+    service.list_templates()
+    assert db.refreshes == [("ebook", "b1")]
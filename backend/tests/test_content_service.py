@@ -0,0 +1,106 @@
+import threading
+import time
+from datetime import timedelta
+
+import pytest
+
+from app.services import content_service
+from app.utils.date_utils import utcnow
+
+
+@pytest.fixture
+def db(mongo, monkeypatch):
+    monkeypatch.setattr(content_service, "SLOT_POLL_SECONDS", 0.01)
+    return mongo(content_service)
+
+
+def test_slots_are_limited_per_user(db):
+    first = content_service.acquire_generation_slot(db, "u1", 2)
+    second = content_service.acquire_generation_slot(db, "u1", 2)
+    assert first and second
+    assert content_service.acquire_generation_slot(db, "u1", 2) is None
+    # Outro usuário tem as próprias vagas
+    assert content_service.acquire_generation_slot(db, "u2", 2)
+
+    content_service.release_generation_slot(db, "u1", first)
+    assert content_service.acquire_generation_slot(db, "u1", 2)
+
+
+def test_expired_slot_is_reclaimed(db):
+    db[content_service.SLOT_COLLECTION].insert_one({
+        "_id": "u1",
+        "holders": [{"id": "morto", "expires_at": utcnow() - timedelta(seconds=1)}],
+    })
+    assert content_service.acquire_generation_slot(db, "u1", 1)
+
+
+def test_concurrent_jobs_share_the_user_limit(db):
+    active = []
+    peak = []
+    lock = threading.Lock()
+
+    def job():
+        for _ in range(3):
+            with content_service.generation_slot(db, "u1", 2):
+                with lock:
+                    active.append(1)
+                    peak.append(len(active))
+                time.sleep(0.01)
+                with lock:
+                    active.pop()
+
+    # Dois "eBooks" do mesmo usuário, cada um com o próprio pool
+    threads = [threading.Thread(target=job) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert max(peak) <= 2
+    assert db[content_service.SLOT_COLLECTION].find_one({"_id": "u1"})["holders"] == []
+
+
+def test_slot_without_user_shares_the_anonymous_limit(db):
+    with content_service.generation_slot(db, None, 1):
+        holders = db[content_service.SLOT_COLLECTION].find_one(
+            {"_id": content_service.ANONYMOUS_SLOT_KEY})["holders"]
+        assert len(holders) == 1
+        with pytest.raises(TimeoutError):
+            with content_service.generation_slot(db, None, 1, timeout=0.05):
+                pass
+
+
+def test_slot_wait_times_out(db):
+    assert content_service.acquire_generation_slot(db, "u1", 1)
+    started = time.monotonic()
+    with pytest.raises(TimeoutError):
+        with content_service.generation_slot(db, "u1", 1, timeout=0.05):
+            pass
+    assert time.monotonic() - started < 1
+
+
+def test_generation_uses_the_ebook_owner(mongo, monkeypatch):
+    from flask import Flask
+    from app.routes import ebook_routes
+    from app.services import ebook_service
+    from app.tasks import ebook_tasks
+
+    db = mongo(ebook_service)
+    db.ebooks.insert_one({"ebook_id": "e1", "user_id": "dono",
+                          "metadata": {"capitulos": [{"titulo": "Um"}]}})
+    calls = []
+
+    class Result:
+        id = "t1"
+
+    def delay(*args, **kwargs):
+        calls.append(kwargs)
+        return Result()
+    monkeypatch.setattr(ebook_tasks.generate_ebook_chapters_task, "delay", delay)
+
+    app = Flask(__name__)
+    app.register_blueprint(ebook_routes.ebook_bp, url_prefix="/api")
+    response = app.test_client().post("/api/ebook/e1/capitulos/gerar", json={"user_id": "outro"})
+
+    assert response.status_code == 202
+    assert calls[0]["user_id"] == "dono"
@@ -0,0 +1,118 @@
+import io
+import json
+import zipfile
+
+import pytest
+from bson import ObjectId
+
+from app.services import blob_store, conversation_export_service, upload_service
+from app.utils.date_utils import utcnow
+
+
+@pytest.fixture
+def db(mongo, monkeypatch, tmp_path):
+    monkeypatch.setattr(upload_service, "BLOB_UPLOAD_FOLDER", str(tmp_path / "blobs"))
+    from app.tasks import upload_tasks
+    queued = []
+    monkeypatch.setattr(upload_tasks.ingest_upload_task, "delay", queued.append)
+    database = mongo(blob_store, conversation_export_service)
+    database.queued = queued
+    return database
+
+
+def _seed(db, tmp_path):
+    conversation_id = ObjectId()
+    upload_id = ObjectId()
+    path = tmp_path / "relatorio.txt"
+    path.write_bytes(b"conteudo do anexo")
+    db.conversations.insert_one({
+        "_id": conversation_id, "user_id": "u1", "title": "Consulta",
+        "created_at": utcnow(), "updated_at": utcnow(),
+        "files": [{"file_id": str(upload_id), "original_filename": "relatorio.txt"}],
+        "history": [{"sender": "user", "text": "olá", "timestamp": utcnow()},
+                    {"sender": "ai", "text": "oi", "timestamp": utcnow()}],
+    })
+    db.uploads.insert_one({
+        "_id": upload_id, "user_id": "u1", "conversation_id": str(conversation_id),
+        "filename": "relatorio.txt", "original_filename": "relatorio.txt",
+        "file_path": str(path), "created_at": utcnow(),
+    })
+    return conversation_id, upload_id
+
+
+def test_zip_round_trip(db, tmp_path):
+    conversation_id, upload_id = _seed(db, tmp_path)
+
+    package = b"".join(conversation_export_service.stream_zip("u1"))
+    stats = conversation_export_service.import_zip(io.BytesIO(package), user_id="u2")
+
+    assert stats["conversations"] == 1
+    assert stats["messages"] == 2
+    assert stats["uploads"] == 1
+    assert stats["files"] == 1
+
+    imported = db.conversations.find_one({"user_id": "u2"})
+    assert imported["_id"] != conversation_id
+    assert [m["text"] for m in imported["history"]] == ["olá", "oi"]
+
+    upload = db.uploads.find_one({"user_id": "u2"})
+    assert upload["conversation_id"] == str(imported["_id"])
+    assert imported["files"][0]["file_id"] == str(upload["_id"])
+    with open(upload["file_path"], "rb") as f:
+        assert f.read() == b"conteudo do anexo"
+    assert blob_store.get_blob(upload_service.UPLOAD_NAMESPACE, upload["content_hash"])
+    assert upload["ingest_status"] == "pendente"
+    assert db.queued == [str(upload["_id"])]
+
+
+def test_import_skips_orphan_records(db):
+    lines = [
+        '{"type": "message", "conversation_id": "x", "text": "solta"}\n',
+        '{"type": "desconhecido"}\n',
+        '{"type": "conversation", "id": "c1", "title": "T"}\n',
+        '{"type": "message", "conversation_id": "c1", "text": "ok"}\n',
+    ]
+    stats = conversation_export_service.import_ndjson(lines, user_id="u3")
+    assert stats["conversations"] == 1
+    assert stats["messages"] == 1
+    assert stats["skipped"] == 2
+
+
+def _package(records, files):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as archive:
+        archive.writestr(conversation_export_service.NDJSON_ENTRY_NAME,
+                         "".join(json.dumps(record) + "\n" for record in records))
+        for name, data in files.items():
+            archive.writestr(name, data)
+    buffer.seek(0)
+    return buffer
+
+
+def test_import_keeps_only_allowed_upload_fields(db):
+    other = blob_store.write_bytes(upload_service.UPLOAD_NAMESPACE, b"do outro usuario",
+                                   upload_service.BLOB_UPLOAD_FOLDER, "txt")
+    crafted = {
+        "type": "upload", "conversation_id": "c1", "id": "up1",
+        "archive_path": "files/a.txt", "original_filename": "a.txt",
+        "upload_type": "file", "thumbnail_path": "/app/.env",
+        "content_hash": other["hash"], "file_size": 1, "ingest_status": "concluido",
+        "scan_status": "limpo", "quarantined": False,
+    }
+    missing = dict(crafted, id="up2", archive_path="files/ausente.txt")
+    package = _package([{"type": "conversation", "id": "c1",
+                         "files": [{"file_id": "up1"}, {"file_id": "up2"}]},
+                        crafted, missing],
+                       {"files/a.txt": b"conteudo"})
+
+    stats = conversation_export_service.import_zip(package, user_id="u2")
+    assert stats["uploads"] == 1 and stats["skipped"] == 1
+
+    upload = db.uploads.find_one({"user_id": "u2"})
+    assert upload["content_hash"] != other["hash"]
+    assert upload["file_size"] == len(b"conteudo")
+    assert upload["ingest_status"] == "pendente"
+    for field in ("thumbnail_path", "scan_status", "quarantined"):
+        assert field not in upload
+    assert [f["file_id"] for f in db.conversations.find_one()["files"]] == [str(upload["_id"])]
+    assert blob_store.get_blob(upload_service.UPLOAD_NAMESPACE, other["hash"])["refcount"] == 1
@@ -0,0 +1,125 @@
+import pytest
+from bson import ObjectId
+from flask import Flask
+
+from app.services import conversation_summary_service as service
+from app.utils.date_utils import utcnow
+
+
+class FakeTask:
+    def __init__(self):
+        self.calls = []
+
+    def apply_async(self, args, countdown):
+        self.calls.append((args, countdown))
+
+
+@pytest.fixture
+def db(mongo, monkeypatch):
+    from app.tasks import conversation_tasks
+    title_task, summary_task = FakeTask(), FakeTask()
+    monkeypatch.setattr(conversation_tasks, "generate_conversation_title", title_task)
+    monkeypatch.setattr(conversation_tasks, "update_conversation_summary", summary_task)
+    database = mongo(service)
+    database.title_task = title_task
+    database.summary_task = summary_task
+    return database
+
+
+def _messages(count, start=0):
+    return [{"sender": "user" if i % 2 == 0 else "ai", "text": f"m{i}", "timestamp": utcnow()}
+            for i in range(start, start + count)]
+
+
+def _conversation(db, messages=0, **fields):
+    document = {"user_id": "u1", "title": service.DEFAULT_TITLE,
+                "history": _messages(messages)}
+    document.update(fields)
+    return str(db.conversations.insert_one(document).inserted_id)
+
+
+def _token(db, conversation_id, job):
+    conversation = db.conversations.find_one({"_id": ObjectId(conversation_id)})
+    return conversation["background_jobs"][job]["token"]
+
+
+def test_schedule_title_and_summary(db, monkeypatch):
+    monkeypatch.setattr(service, "SUMMARY_EVERY_N_TURNS", 2)
+    conversation_id = _conversation(db, messages=2)
+
+    service.schedule_background_jobs(conversation_id, service.DEFAULT_TITLE, 2)
+    assert len(db.title_task.calls) == 1 and db.summary_task.calls == []
+    assert db.title_task.calls[0][0] == [conversation_id, _token(db, conversation_id, "title")]
+
+    service.schedule_background_jobs(conversation_id, "Renomeada", 4)
+    assert len(db.title_task.calls) == 1 and len(db.summary_task.calls) == 1
+
+
+def test_only_latest_token_runs(db, monkeypatch):
+    monkeypatch.setattr(service, "generate_title_text", lambda messages: "Consulta")
+    conversation_id = _conversation(db, messages=2)
+    service.schedule_background_jobs(conversation_id, service.DEFAULT_TITLE, 2)
+    first = _token(db, conversation_id, "title")
+    service.schedule_background_jobs(conversation_id, service.DEFAULT_TITLE, 2)
+
+    assert service.apply_generated_title(conversation_id, first) is None
+    assert service.apply_generated_title(
+        conversation_id, _token(db, conversation_id, "title")) == "Consulta"
+    conversation = db.conversations.find_one()
+    assert conversation["title"] == "Consulta"
+    assert "title" not in conversation["background_jobs"]
+
+
+def test_summary_covers_only_new_messages(db, monkeypatch):
+    seen = []
+
+    def summarize(previous, messages):
+        seen.append((previous, [m["text"] for m in messages]))
+        return f"resumo {len(seen)}"
+    monkeypatch.setattr(service, "generate_rolling_summary", summarize)
+
+    conversation_id = _conversation(db, messages=4)
+    service._schedule(conversation_id, "summary", db.summary_task, 0)
+    assert service.apply_rolling_summary(
+        conversation_id, _token(db, conversation_id, "summary")) == "resumo 1"
+    assert db.conversations.find_one()["summary_message_count"] == 4
+
+    db.conversations.update_one({}, {"$push": {"history": {"$each": _messages(2, start=4)}}})
+    service._schedule(conversation_id, "summary", db.summary_task, 0)
+    assert service.apply_rolling_summary(
+        conversation_id, _token(db, conversation_id, "summary")) == "resumo 2"
+    assert seen == [(None, ["m0", "m1", "m2", "m3"]), ("resumo 1", ["m4", "m5"])]
+    assert db.conversations.find_one()["summary_message_count"] == 6
+
+
+def test_summary_discarded_when_history_cleared_meanwhile(db, monkeypatch):
+    conversation_id = _conversation(db, messages=4)
+    service._schedule(conversation_id, "summary", db.summary_task, 0)
+    token = _token(db, conversation_id, "summary")
+
+    def clear_then_summarize(previous, messages):
+        db.conversations.update_one({}, {"$set": {"history": []},
+                                         "$unset": {"background_jobs": ""}})
+        return "resumo antigo"
+    monkeypatch.setattr(service, "generate_rolling_summary", clear_then_summarize)
+
+    assert service.apply_rolling_summary(conversation_id, token) is None
+    assert "summary" not in db.conversations.find_one()
+
+
+def test_clear_messages_resets_summary(mongo, monkeypatch):
+    from app.routes import chat_routes
+    db = mongo(chat_routes)
+    conversation_id = _conversation(
+        db, messages=4, summary="resumo", summary_message_count=4,
+        summary_updated_at=utcnow(), background_jobs={"summary": {"token": "t"}})
+
+    app = Flask(__name__)
+    app.register_blueprint(chat_routes.chat_bp, url_prefix="/api")
+    response = app.test_client().delete(f"/api/conversations/{conversation_id}/messages")
+
+    assert response.status_code == 200
+    conversation = db.conversations.find_one()
+    assert conversation["history"] == []
+    for field in ("summary", "summary_message_count", "summary_updated_at", "background_jobs"):
+        assert field not in conversation
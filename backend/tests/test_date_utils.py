@@ -0,0 +1,45 @@
+import calendar
+from datetime import datetime
+
+import pytest
+from werkzeug.datastructures import MultiDict
+
+from app.utils.date_utils import to_datetime, parse_range_args, build_range_filter
+
+
+def test_to_datetime_formats():
+    expected = datetime(2024, 1, 2, 3, 4, 5)
+    assert to_datetime("2024-01-02T03:04:05Z") == expected
+    assert to_datetime("2024-01-02T00:04:05-03:00") == expected
+    assert to_datetime(calendar.timegm(expected.utctimetuple())) == expected
+    assert to_datetime(None) is None
+    assert to_datetime("amanhã") is None
+    assert to_datetime(True) is None
+
+
+def test_to_datetime_milliseconds():
+    assert to_datetime(1704164645000) == datetime(2024, 1, 2, 3, 4, 5)
+
+
+@pytest.mark.parametrize("value", ["inf", "-inf", "nan", "1e300", float("inf"), 10 ** 20])
+def test_to_datetime_out_of_range(value):
+    assert to_datetime(value) is None
+
+
+def test_parse_range_args():
+    since, until = parse_range_args(MultiDict({"since": "2024-01-01", "until": "2024-02-01"}))
+    assert since == datetime(2024, 1, 1)
+    assert until == datetime(2024, 2, 1)
+    assert build_range_filter(since, until) == {"$gte": since, "$lte": until}
+    assert parse_range_args(MultiDict()) == (None, None)
+
+
+@pytest.mark.parametrize("args", [
+    {"since": "inf"},
+    {"until": "1e300"},
+    {"since": "ontem"},
+    {"since": "2024-02-01", "until": "2024-01-01"},
+])
+def test_parse_range_args_invalid(args):
+    with pytest.raises(ValueError):
+        parse_range_args(MultiDict(args))
@@ -0,0 +1,158 @@
+from datetime import timedelta
+
+import pytest
+
+from app.services import document_index_service as service
+from app.utils.date_utils import utcnow
+
+
+@pytest.fixture
+def db(mongo, monkeypatch):
+    from app.tasks import document_tasks
+    queued = []
+    monkeypatch.setattr(document_tasks.index_document_task, "delay",
+                        lambda *args: queued.append(args))
+    database = mongo(service)
+    database.queued = queued
+    return database
+
+
+def _upload(content_hash="h1", path="/tmp/notas.txt"):
+    return {"content_hash": content_hash, "upload_type": "file",
+            "file_path": path, "original_filename": "notas.txt"}
+
+
+def _documents(db):
+    return db[service.DOCUMENT_COLLECTION]
+
+
+def test_split_chunks_respects_size_and_overlap():
+    text = "\n\n".join(f"paragrafo {i} " + "palavra " * 20 for i in range(10))
+    chunks = service.split_chunks(text, size=200, overlap=40)
+    assert len(chunks) > 1
+    assert all(len(chunk) <= 200 for chunk in chunks)
+    for previous, current in zip(chunks, chunks[1:]):
+        # O trecho seguinte repete o final do anterior
+        assert current.split("\n\n", 1)[0] in previous[-40:]
+
+
+def test_split_chunks_breaks_long_paragraphs_at_words():
+    chunks = service.split_chunks("abc " * 100, size=100, overlap=20)
+    assert all(len(chunk) <= 100 for chunk in chunks)
+    assert all(not chunk.startswith(" ") and not chunk.endswith(" ") for chunk in chunks)
+    assert "".join(chunks).count("abc") >= 100
+
+
+def test_split_chunks_empty_text():
+    assert service.split_chunks("") == []
+    assert service.split_chunks(None) == []
+    assert service.split_chunks("curto") == ["curto"]
+
+
+def test_schedule_document_queues_new_content_once(db):
+    service.schedule_document(_upload())
+    service.schedule_document(_upload())
+    assert db.queued == [("h1", "/tmp/notas.txt", "txt")]
+    assert _documents(db).find_one({"_id": "h1"})["status"] == "pendente"
+
+
+def test_failed_document_is_requeued_after_backoff(db, monkeypatch):
+    def broken(path, ext):
+        raise ValueError("arquivo corrompido")
+    monkeypatch.setattr(service, "extract_text", broken)
+
+    service.schedule_document(_upload())
+    assert service.index_document("h1", "/tmp/notas.txt", "txt")["error"]
+    document = _documents(db).find_one({"_id": "h1"})
+    assert document["status"] == "falha" and document["attempts"] == 1
+
+    # Ainda dentro do backoff
+    service.schedule_document(_upload())
+    assert service.reschedule_documents() == 0
+    assert len(db.queued) == 1
+
+    _documents(db).update_one({"_id": "h1"}, {"$set": {"retry_at": utcnow()}})
+    service.schedule_document(_upload(path="/tmp/novo.txt"))
+    assert db.queued[-1] == ("h1", "/tmp/novo.txt", "txt")
+    assert _documents(db).find_one({"_id": "h1"})["status"] == "pendente"
+
+
+def test_failed_document_stops_after_max_attempts(db):
+    _documents(db).insert_one({"_id": "h1", "status": "falha", "path": "/tmp/a.txt",
+                               "ext": "txt", "attempts": service.INDEX_MAX_ATTEMPTS,
+                               "retry_at": utcnow() - timedelta(hours=1)})
+    assert service.reschedule_documents() == 0
+    assert db.queued == []
+
+
+def test_pending_document_is_recovered_when_queueing_failed(db, monkeypatch):
+    from app.tasks import document_tasks
+
+    def unavailable(*args):
+        raise ConnectionError("broker indisponível")
+    monkeypatch.setattr(document_tasks.index_document_task, "delay", unavailable)
+    service.schedule_document(_upload())
+    assert "scheduled_at" not in _documents(db).find_one({"_id": "h1"})
+
+    monkeypatch.setattr(document_tasks.index_document_task, "delay",
+                        lambda *args: db.queued.append(args))
+    assert service.reschedule_documents() == 1
+    assert db.queued == [("h1", "/tmp/notas.txt", "txt")]
+    # Agendado recentemente: não é reagendado de novo
+    assert service.reschedule_documents() == 0
+
+
+def test_expired_lease_is_requeued(db):
+    service.schedule_document(_upload())
+    assert service._claim(db, "h1")["attempts"] == 1
+    assert service.reschedule_documents() == 0
+
+    _documents(db).update_one({"_id": "h1"},
+                              {"$set": {"lease_until": utcnow() - timedelta(seconds=1)}})
+    assert service.reschedule_documents() == 1
+    assert _documents(db).find_one({"_id": "h1"})["status"] == "pendente"
+    assert len(db.queued) == 2
+
+
+def test_expired_lease_without_attempts_left_fails(db):
+    _documents(db).insert_one({"_id": "h1", "status": "em_andamento", "path": "/tmp/a.txt",
+                               "attempts": service.INDEX_MAX_ATTEMPTS,
+                               "lease_until": utcnow() - timedelta(seconds=1)})
+    assert service._claim(db, "h1") is None
+    assert service.reschedule_documents() == 0
+    assert _documents(db).find_one({"_id": "h1"})["status"] == "falha"
+
+
+def test_unsupported_format_is_not_queued(db):
+    upload = dict(_upload(path="/tmp/antigo.doc"), original_filename="antigo.doc")
+    service.schedule_document(upload)
+    service.schedule_document(upload)
+    assert db.queued == []
+    assert _documents(db).find_one({"_id": "h1"})["status"] == "nao_suportado"
+    assert service.reschedule_documents() == 0
+
+
+def test_unsupported_format_fails_without_retry(db):
+    service.schedule_document(_upload())
+    assert service.index_document("h1", "/tmp/antigo.doc", "doc")["error"]
+    document = _documents(db).find_one({"_id": "h1"})
+    assert document["status"] == "nao_suportado" and "retry_at" not in document
+
+    _documents(db).update_one({"_id": "h1"}, {"$set": {"attempts": 0}})
+    service.schedule_document(_upload())
+    assert service.reschedule_documents() == 0
+    assert len(db.queued) == 1
+
+
+def test_large_documents_are_truncated_to_fit(db, tmp_path, monkeypatch):
+    path = tmp_path / "notas.txt"
+    path.write_text("\n\n".join(f"paragrafo {i} " + "palavra " * 100 for i in range(20)),
+                    encoding="utf-8")
+    service.schedule_document(_upload(path=str(path)))
+    row_bytes = service.HASHING_DIM * 4
+    monkeypatch.setattr(service, "MAX_DOCUMENT_BYTES", 3 * (row_bytes + service.CHUNK_CHARS))
+
+    assert service.index_document("h1", str(path), "txt")["trechos"] == 3
+    document = _documents(db).find_one({"_id": "h1"})
+    assert document["truncated"] is True and len(document["chunks"]) == 3
+    assert len(document["embeddings"]) == 3 * row_bytes
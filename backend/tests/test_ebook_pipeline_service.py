@@ -0,0 +1,74 @@
+import pytest
+
+from app.services import ebook_pipeline_service as pipeline_service
+from app.services import ebook_service, export_service
+
+
+@pytest.fixture
+def db(mongo):
+    database = mongo(pipeline_service, ebook_service, export_service)
+    database.ebooks.insert_one({
+        "ebook_id": "e1",
+        "metadata": {"titulo": "Livro"},
+        "etapas": [{"etapa": name, "status": "pendente"} for _, name in pipeline_service.STAGES],
+    })
+    return database
+
+
+@pytest.fixture
+def canva_export(db, monkeypatch):
+    """export_ebook que deixa a exportação aguardando o Canva"""
+    def export_ebook(ebook_id, formato="pdf", options=None):
+        export = {"export_id": f"x-{formato}", "ebook_id": ebook_id,
+                  "format": formato, "status": "em_andamento"}
+        db.exports.insert_one(dict(export))
+        return export
+
+    monkeypatch.setattr(export_service, "export_ebook", export_ebook)
+
+
+def _stage_status(db, stage):
+    return db.ebooks.find_one({"ebook_id": "e1"})["pipeline"]["stages"][stage]["status"]
+
+
+def test_pipeline_and_chapter_generation_are_exclusive(db):
+    assert ebook_service.claim_chapter_generation("e1")
+    assert pipeline_service.start_pipeline("e1") is None
+
+    ebook_service.release_chapter_generation("e1", "concluido")
+    assert pipeline_service.start_pipeline("e1") is not None
+    assert not ebook_service.claim_chapter_generation("e1")
+
+
+def test_export_stage_waits_for_remote_export(db, canva_export):
+    pipeline_service.start_pipeline("e1", {"formatos": ["pdf", "epub"]})
+
+    checkpoint = pipeline_service.run_stage("e1", "exportacao")
+    assert checkpoint["status"] == pipeline_service.STAGE_WAITING
+    assert not pipeline_service.finish_pipeline("e1")
+    assert pipeline_service.get_pipeline("e1")["status"] == pipeline_service.STAGE_RUNNING
+
+    # Uma exportação concluída não fecha a etapa sozinha
+    db.exports.update_one({"export_id": "x-pdf"}, {"$set": {"status": "concluido"}})
+    assert pipeline_service.complete_export_stage("e1") is None
+
+    db.exports.update_one({"export_id": "x-epub"}, {"$set": {"status": "concluido"}})
+    export_service._notify_pipeline("e1")
+    assert _stage_status(db, "exportacao") == pipeline_service.STAGE_DONE
+    assert pipeline_service.get_pipeline("e1")["status"] == pipeline_service.STAGE_DONE
+
+
+def test_failed_remote_export_fails_the_pipeline(db, canva_export):
+    pipeline_service.start_pipeline("e1")
+    pipeline_service.run_stage("e1", "exportacao")
+
+    db.exports.update_one({"export_id": "x-pdf"},
+                          {"$set": {"status": "falha", "error": "Canva indisponível"}})
+    export_service._notify_pipeline("e1")
+
+    pipeline = pipeline_service.get_pipeline("e1")
+    assert pipeline["status"] == pipeline_service.STAGE_FAILED
+    assert "Canva indisponível" in pipeline["erro"]
+    # A última tarefa da cadeia não sobrescreve a falha
+    assert not pipeline_service.finish_pipeline("e1")
+    assert pipeline_service.get_pipeline("e1")["status"] == pipeline_service.STAGE_FAILED
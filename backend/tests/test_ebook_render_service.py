@@ -0,0 +1,99 @@
+import io
+import os
+
+import pytest
+
+from app.services import ebook_render_service as render_service
+
+PIL = pytest.importorskip("PIL.Image")
+
+
+@pytest.fixture
+def images(tmp_path, monkeypatch):
+    directory = tmp_path / "static" / "images"
+    directory.mkdir(parents=True)
+    monkeypatch.setattr(render_service, "IMAGE_STORAGE_PATH", str(directory))
+    return directory
+
+
+def _jpeg(path):
+    buffer = io.BytesIO()
+    PIL.new("RGB", (4, 4), "red").save(buffer, "JPEG")
+    path.write_bytes(buffer.getvalue())
+    return str(path)
+
+
+def _document(tmp_path, image):
+    chapter_html = tmp_path / "chapter-000.html"
+    chapter_html.write_text('<p>Texto <img src="file:///etc/passwd"/></p>', encoding="utf-8")
+    return {"titulo": "Livro", "tema": "Tema", "autor": "Autor", "idioma": "pt-BR",
+            "capitulos": [{"indice": 0, "titulo": "Um", "markdown": None,
+                           "html": str(chapter_html), "imagem": image}]}
+
+
+def test_image_outside_storage_is_ignored(images, tmp_path):
+    inside = _jpeg(images / "a.jpg")
+    outside = _jpeg(tmp_path / "b.jpg")
+    assert render_service._image_file(inside) == os.path.realpath(inside)
+    assert render_service._image_file(outside) is None
+    assert render_service._image_file(str(images / ".." / ".." / "b.jpg")) is None
+
+
+def test_image_type_comes_from_content(images):
+    # Extensão enganosa: o conteúdo é JPEG
+    path = _jpeg(images / "foto.png")
+    assert render_service._image_type(path) == ("image/jpeg", ".jpg")
+
+
+def test_html_embeds_images(images, tmp_path):
+    image = _jpeg(images / "a.jpg")
+    output = tmp_path / "livro.html"
+    render_service.write_html(_document(tmp_path, image), str(output))
+    content = output.read_text(encoding="utf-8")
+    assert 'src="data:image/jpeg;base64,' in content
+    assert f"file://{image}" not in content
+
+
+def test_url_fetcher_refuses_other_urls(images):
+    image = _jpeg(images / "a.jpg")
+    fetcher = render_service._url_fetcher({os.path.realpath(image)})
+    for url in ("file:///etc/passwd", "file://" + str(images / ".." / "a.jpg"),
+                "http://169.254.169.254/latest/meta-data/"):
+        with pytest.raises(ValueError):
+            fetcher(url)
+
+
+def test_epub_uses_the_image_media_type(images, tmp_path):
+    epub = pytest.importorskip("ebooklib.epub")
+    image = _jpeg(images / "a.png")
+    output = tmp_path / "livro.epub"
+    render_service.write_epub(_document(tmp_path, image), str(output))
+
+    book = epub.read_epub(str(output))
+    items = [item for item in book.get_items() if item.file_name.startswith("images/")]
+    assert [(item.file_name, item.media_type) for item in items] == [("images/cap-0.jpg", "image/jpeg")]
+
+
+def test_in_memory_formats_skip_large_images(images, tmp_path, monkeypatch):
+    image = _jpeg(images / "a.jpg")
+    document = _document(tmp_path, image)
+    assert render_service._in_memory_chapters(document, "html")[0][1] == image
+
+    monkeypatch.setattr(render_service, "IN_MEMORY_MAX_IMAGE_BYTES", os.path.getsize(image) - 1)
+    chapters = render_service._in_memory_chapters(document, "html")
+    assert chapters == [(document["capitulos"][0], None)]
+
+
+def test_in_memory_formats_refuse_large_chapters_and_books(images, tmp_path, monkeypatch):
+    document = _document(tmp_path, None)
+    size = os.path.getsize(document["capitulos"][0]["html"])
+
+    monkeypatch.setattr(render_service, "IN_MEMORY_MAX_CHAPTER_BYTES", size - 1)
+    with pytest.raises(ValueError):
+        render_service.write_epub(document, str(tmp_path / "livro.epub"))
+
+    monkeypatch.setattr(render_service, "IN_MEMORY_MAX_CHAPTER_BYTES", size)
+    monkeypatch.setattr(render_service, "IN_MEMORY_MAX_BOOK_BYTES", size * 2 - 1)
+    document["capitulos"].append(dict(document["capitulos"][0], indice=1))
+    with pytest.raises(ValueError):
+        render_service._in_memory_chapters(document, "html")
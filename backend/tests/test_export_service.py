@@ -0,0 +1,138 @@
+from datetime import timedelta
+
+import pytest
+
+from app.services import ebook_pipeline_service, ebook_service
+from app.services import export_cache_service, export_service
+from app.utils.date_utils import utcnow
+
+
+@pytest.fixture
+def db(mongo, tmp_path, monkeypatch):
+    monkeypatch.setattr(export_service, "EXPORT_STORAGE_PATH", str(tmp_path))
+    return mongo(export_service, export_cache_service, ebook_service, ebook_pipeline_service)
+
+
+def _artifact(db, tmp_path, key):
+    path = tmp_path / f"{key}.pdf"
+    path.write_bytes(b"%PDF")
+    db.export_cache.insert_one({"_id": key, "format": "pdf", "path": str(path),
+                                "size": 4, "refcount": 0, "hits": 0})
+    return db.export_cache.find_one({"_id": key})
+
+
+def _export(db, export_id, key):
+    db.exports.insert_one({"export_id": export_id, "ebook_id": "e1", "format": "pdf",
+                           "status": "pendente", "cache_key": key})
+    export_service._complete_export(
+        db, export_id, "e1", "pdf", db.export_cache.find_one({"_id": key}))
+
+
+def _refcount(db, key):
+    return db.export_cache.find_one({"_id": key})["refcount"]
+
+
+def test_new_export_releases_the_superseded_one(db, tmp_path):
+    _artifact(db, tmp_path, "a" * 64)
+    _artifact(db, tmp_path, "b" * 64)
+
+    _export(db, "x1", "a" * 64)
+    assert _refcount(db, "a" * 64) == 1
+
+    _export(db, "x2", "b" * 64)
+    assert _refcount(db, "a" * 64) == 0
+    assert _refcount(db, "b" * 64) == 1
+    # A exportação anterior continua baixável enquanto o artefato existir
+    previous = db.exports.find_one({"export_id": "x1"})
+    assert previous["status"] == "concluido"
+    assert previous["superseded_by"] == "x2"
+
+
+def test_delete_export_releases_once(db, tmp_path):
+    _artifact(db, tmp_path, "a" * 64)
+    _export(db, "x1", "a" * 64)
+    _export(db, "x2", "a" * 64)
+    assert _refcount(db, "a" * 64) == 1
+
+    assert export_service.delete_export("x1")
+    assert _refcount(db, "a" * 64) == 1
+    assert export_service.delete_export("x2")
+    assert _refcount(db, "a" * 64) == 0
+    assert not export_service.delete_export("x2")
+
+
+@pytest.fixture
+def queued(monkeypatch):
+    from app.tasks import export_tasks
+    calls = []
+    monkeypatch.setattr(export_tasks.run_export_task, "delay", calls.append)
+    return calls
+
+
+def _pending(db, export_id, **fields):
+    document = {"export_id": export_id, "ebook_id": "e1", "format": "pdf",
+                "status": "pendente", "cache_key": "c" * 64, "created_at": utcnow()}
+    document.update(fields)
+    db.exports.insert_one(document)
+
+
+def test_export_fails_when_it_cannot_be_queued(db, monkeypatch):
+    from flask import Flask
+    from app.routes import export_routes
+    from app.tasks import export_tasks
+
+    db.ebooks.insert_one({"ebook_id": "e1", "metadata": {}, "etapas": []})
+
+    def unavailable(export_id):
+        raise ConnectionError("broker indisponível")
+    monkeypatch.setattr(export_tasks.run_export_task, "delay", unavailable)
+    monkeypatch.setattr(export_service, "_notify_pipeline", lambda ebook_id: None)
+
+    app = Flask(__name__)
+    app.register_blueprint(export_routes.export_bp, url_prefix="/api")
+    response = app.test_client().post("/api/export/ebook/e1", json={"format": "pdf"})
+
+    assert response.status_code == 500
+    assert db.exports.find_one()["status"] == "falha"
+
+
+def test_run_claims_with_a_lease(db, monkeypatch):
+    _pending(db, "x1")
+    seen = []
+
+    def render(ebook, filepath, formato, options=None):
+        seen.append(db.exports.find_one({"export_id": "x1"}))
+        return False
+    monkeypatch.setattr(export_service, "get_ebook", lambda ebook_id: {"ebook_id": ebook_id})
+    monkeypatch.setattr(export_service, "export_ebook_local", render)
+    monkeypatch.setattr(export_service, "_notify_pipeline", lambda ebook_id: None)
+
+    assert export_service.run_export("x1") is None
+    assert seen[0]["status"] == "em_andamento" and seen[0]["attempts"] == 1
+    assert seen[0]["lease_until"] > utcnow()
+    export = db.exports.find_one({"export_id": "x1"})
+    assert export["status"] == "falha" and "lease_until" not in export
+
+
+def test_reschedule_stale_and_interrupted_exports(db, queued, monkeypatch):
+    monkeypatch.setattr(export_service, "_notify_pipeline", lambda ebook_id: None)
+    old = utcnow() - timedelta(hours=1)
+    _pending(db, "recente")
+    _pending(db, "parada", created_at=old)
+    _pending(db, "interrompida", status="em_andamento", attempts=1,
+             lease_until=utcnow() - timedelta(seconds=1))
+    _pending(db, "rodando", status="em_andamento", attempts=1,
+             lease_until=utcnow() + timedelta(minutes=5))
+    _pending(db, "esgotada", status="em_andamento", attempts=export_service.EXPORT_MAX_ATTEMPTS,
+             lease_until=utcnow() - timedelta(seconds=1))
+    # Aguardando o Canva: sem reserva, acompanhada por canva_export_service
+    _pending(db, "canva", status="em_andamento", attempts=1, canva_export_id="cv1")
+
+    assert export_service.reschedule_exports() == 2
+    assert sorted(queued) == ["interrompida", "parada"]
+    assert db.exports.find_one({"export_id": "esgotada"})["status"] == "falha"
+    assert db.exports.find_one({"export_id": "canva"})["status"] == "em_andamento"
+
+    # A reserva vencida pode ser retomada por run_export
+    assert export_service._claim(db, "interrompida")["attempts"] == 2
+    assert export_service._claim(db, "rodando") is None
@@ -0,0 +1,54 @@
+import os
+
+import pytest
+from flask import Flask
+
+from app.utils import file_serving
+
+
+@pytest.fixture
+def accel(tmp_path, monkeypatch):
+    root = tmp_path / "backend"
+    for directory in ("static/images", "uploads", "app"):
+        (root / directory).mkdir(parents=True)
+    monkeypatch.setattr(file_serving, "ACCEL_REDIRECT", True)
+    monkeypatch.setattr(file_serving, "ACCEL_ROOT", str(root))
+    monkeypatch.setattr(file_serving, "ACCEL_DIRS",
+                        [str(root / "static"), str(root / "uploads")])
+    return root
+
+
+def test_accel_path_only_inside_file_directories(accel):
+    image = accel / "static" / "images" / "a b.png"
+    image.write_bytes(b"png")
+    config = accel / "app" / "config.py"
+    config.write_text("SECRET = 1")
+
+    assert file_serving._accel_path(str(image)) == "/_protected/static/images/a%20b.png"
+    assert file_serving._accel_path(str(config)) is None
+    assert file_serving._accel_path(str(accel / "static" / ".." / "app" / "config.py")) is None
+    assert file_serving._accel_path("/etc/passwd") is None
+
+
+def test_accel_path_does_not_follow_symlinks_out(accel):
+    (accel / "app" / "config.py").write_text("SECRET = 1")
+    link = accel / "uploads" / "link.py"
+    os.symlink(accel / "app" / "config.py", link)
+    assert file_serving._accel_path(str(link)) is None
+
+
+def test_redirect_only_through_the_proxy(accel):
+    image = accel / "static" / "images" / "a.png"
+    image.write_bytes(b"png")
+    app = Flask(__name__)
+
+    with app.test_request_context(headers={file_serving.ACCEL_HEADER: "1"}):
+        response = file_serving.serve_file(str(image))
+        assert response.headers["X-Accel-Redirect"] == "/_protected/static/images/a.png"
+
+    # Acesso direto ao backend: o próprio Flask envia o arquivo
+    with app.test_request_context():
+        response = file_serving.serve_file(str(image))
+        response.direct_passthrough = False
+        assert "X-Accel-Redirect" not in response.headers
+        assert response.get_data() == b"png"
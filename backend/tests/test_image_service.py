@@ -0,0 +1,67 @@
+import pytest
+
+from app.services import blob_store, image_service
+
+
+@pytest.fixture
+def db(mongo, tmp_path, monkeypatch):
+    def call_provider(description, service, size):
+        if description == "falha":
+            raise RuntimeError("provedor indisponível")
+        blob = blob_store.write_bytes(
+            image_service.IMAGE_NAMESPACE, description.encode(), str(tmp_path), "png")
+        return blob, f"/{blob['path']}"
+
+    monkeypatch.setattr(image_service, "_call_provider", call_provider)
+    monkeypatch.setattr(image_service, "_schedule_variants", lambda record: None)
+    return mongo(image_service, blob_store)
+
+
+def test_build_batch_jobs():
+    assert image_service.build_batch_jobs(["a", "", "b"]) == [(0, "a"), (1, "b")]
+    assert image_service.build_batch_jobs(prompt="a", n=3) == [(0, "a"), (1, "a"), (2, "a")]
+
+
+@pytest.mark.parametrize("kwargs", [
+    {},
+    {"prompts": ["", None]},
+    {"prompt": "a", "n": 0},
+    {"prompt": "a", "n": "2"},
+    {"prompt": "a", "n": image_service.MAX_BATCH_IMAGES + 1},
+])
+def test_build_batch_jobs_rejects_invalid_batches(kwargs):
+    with pytest.raises(ValueError):
+        image_service.build_batch_jobs(**kwargs)
+
+
+def test_streamed_ids_are_already_saved(db):
+    jobs = image_service.build_batch_jobs(["a", "b", "falha"])
+    results = []
+    for result in image_service.generate_images_batch(jobs):
+        if "image_id" in result:
+            # O registro existe antes de o ID chegar ao cliente
+            assert db.images.find_one({"image_id": result["image_id"]})
+        results.append(result)
+
+    assert results[-1] == {"done": True, "total": 3, "saved": 2}
+    errors = [result for result in results if "error" in result]
+    assert [(result["index"], result["error"]) for result in errors] == [(2, "provedor indisponível")]
+
+
+def test_failed_insert_releases_blobs(db, monkeypatch):
+    def insert_many(*args, **kwargs):
+        raise RuntimeError("banco indisponível")
+
+    monkeypatch.setattr(type(db.images), "insert_many", insert_many)
+    results = list(image_service.generate_images_batch([(0, "a")]))
+
+    assert results[0]["error"] == "Falha ao gravar imagem."
+    assert results[-1]["saved"] == 0
+    assert db[blob_store.BLOB_COLLECTION].count_documents({}) == 0
+
+
+def test_closed_stream_still_saves_the_batch(db):
+    stream = image_service.generate_images_batch(image_service.build_batch_jobs(["a", "b", "c"]))
+    next(stream)
+    stream.close()
+    assert db.images.count_documents({}) == 3
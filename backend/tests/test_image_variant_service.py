@@ -0,0 +1,47 @@
+from flask import Flask
+
+from app.routes import image_routes
+from app.services.image_variant_service import select_variant
+
+IMAGE = {
+    "image_id": "img1",
+    "path": "static/images/ab/cd/original.png",
+    "variants": [
+        {"format": "webp", "width": 320, "url": "/static/images/variants/v-320.webp"},
+        {"format": "webp", "width": 1280, "url": "/static/images/variants/v-1280.webp"},
+        {"format": "avif", "width": 640, "url": "/static/images/variants/v-640.avif"},
+    ],
+}
+
+
+def test_prefers_avif_when_accepted():
+    assert select_variant(IMAGE, 320, "image/avif,image/webp,*/*") == \
+        ("static/images/variants/v-640.avif", "image/avif")
+
+
+def test_smallest_variant_covering_the_width():
+    assert select_variant(IMAGE, 600, "image/webp")[0] == "static/images/variants/v-1280.webp"
+    assert select_variant(IMAGE, 100, "image/webp")[0] == "static/images/variants/v-320.webp"
+    # Sem largura (ou maior que todas): a maior variante
+    assert select_variant(IMAGE, None, "image/webp")[0] == "static/images/variants/v-1280.webp"
+    assert select_variant(IMAGE, 4000, "image/webp")[0] == "static/images/variants/v-1280.webp"
+
+
+def test_falls_back_to_the_original():
+    assert select_variant(IMAGE, 320, "image/jpeg") == (IMAGE["path"], "image/png")
+    assert select_variant({"image_id": "img2"}, None, "image/webp")[1] == "image/png"
+
+
+def test_image_file_route_is_not_immutable(tmp_path, monkeypatch):
+    original = tmp_path / "original.png"
+    original.write_bytes(b"\x89PNG\r\n\x1a\n")
+    monkeypatch.setattr(image_routes, "get_image",
+                        lambda image_id: {"image_id": image_id, "path": str(original)})
+
+    app = Flask(__name__)
+    app.register_blueprint(image_routes.image_bp)
+    response = app.test_client().get("/image/img1/file", headers={"Accept": "image/webp"})
+
+    assert response.status_code == 200
+    assert response.headers["Cache-Control"] == f"public, max-age={image_routes.IMAGE_FILE_MAX_AGE}"
+    assert response.headers["Vary"] == "Accept"
@@ -0,0 +1,171 @@
+import hashlib
+import os
+import uuid
+from types import SimpleNamespace
+
+import pytest
+from flask import Flask
+
+from app.utils.sharding import shard_path
+
+DIGEST = hashlib.sha256(b"conteudo").hexdigest()
+
+
+@pytest.fixture
+def migration(tmp_path, monkeypatch):
+    # O script registra migration.log no diretório atual
+    monkeypatch.chdir(tmp_path)
+    from app.utils import migrate_sharded_storage
+    return migrate_sharded_storage
+
+
+@pytest.fixture
+def areas(migration):
+    app = SimpleNamespace(config={"LOCAL_UPLOAD_FOLDER": "armazenamento"})
+    return {area["name"]: area for area in migration.get_areas(app)}
+
+
+def _legacy(directory, name):
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, name)
+    with open(path, "w") as f:
+        f.write(name)
+    return path
+
+
+def test_rewrite_refs_plain_fields_and_array_urls(migration, mongo):
+    db = mongo.db
+    db.images.insert_one({"_id": 1, "path": "static/images/a.png", "url": "/static/images/a.png",
+                          "variants": [{"url": "/static/images/variants/a-640.webp"},
+                                       {"url": "/outro/b.webp"}]})
+    db.images.insert_one({"_id": 2, "path": "static/images/z.png"})
+    moves = {"static/images/a.png": "static/images/ab/cd/a.png",
+             "static/images/variants/a-640.webp": "static/images/variants/ab/cd/a-640.webp"}
+
+    refs = [("images", "path", "path"), ("images", "url", "url"),
+            ("images", "variants.url", "url")]
+    assert migration._rewrite_refs(db, refs, moves) == 3
+
+    image = db.images.find_one({"_id": 1})
+    assert image["path"] == "static/images/ab/cd/a.png"
+    assert image["url"] == "/static/images/ab/cd/a.png"
+    assert [v["url"] for v in image["variants"]] == [
+        "/static/images/variants/ab/cd/a-640.webp", "/outro/b.webp"]
+    assert db.images.find_one({"_id": 2})["path"] == "static/images/z.png"
+
+
+def test_rewrite_sql_updates_storage_items(migration):
+    from app.extensions import db as sql
+    from app.models import payment, subscription, user, video  # noqa: F401
+    from app.models.storage import StorageItem
+
+    app = Flask(__name__)
+    app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite://"
+    app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+    sql.init_app(app)
+    with app.app_context():
+        sql.create_all()
+        sql.session.add(StorageItem("a.png", "/srv/a.png", "image", 1, 1))
+        sql.session.add(StorageItem("b.png", "/srv/b.png", "image", 1, 1))
+        sql.session.commit()
+
+        assert migration._rewrite_sql({"/srv/a.png": "/srv/ab/cd/a.png"}) == 1
+        paths = sorted(item.storage_path for item in StorageItem.query.all())
+        assert paths == ["/srv/ab/cd/a.png", "/srv/b.png"]
+        sql.session.remove()
+        sql.drop_all()
+
+
+def test_link_then_rewrite_then_unlink(migration, areas, mongo, monkeypatch):
+    db = mongo.db
+    area = areas["upload_files"]
+    source = _legacy(area["directory"], "notas.txt")
+    target = shard_path(area["directory"], "notas.txt")
+    db.uploads.insert_one({"file_path": source})
+
+    seen = []
+    original = migration._rewrite_refs
+
+    def rewrite(db, refs, moves):
+        # Durante a reescrita os dois caminhos existem
+        seen.append((os.path.exists(source), os.path.exists(target)))
+        return original(db, refs, moves)
+    monkeypatch.setattr(migration, "_rewrite_refs", rewrite)
+
+    assert migration.migrate_area(db, area) == 1
+    assert seen == [(True, True)]
+    assert not os.path.exists(source) and os.path.exists(target)
+    assert db.uploads.find_one()["file_path"] == target
+
+
+def test_rerun_after_interruption_completes_the_move(migration, areas, mongo):
+    db = mongo.db
+    area = areas["upload_files"]
+    source = _legacy(area["directory"], "notas.txt")
+    target = shard_path(area["directory"], "notas.txt")
+    db.uploads.insert_one({"file_path": source})
+    # Execução anterior interrompida depois do link, antes da reescrita
+    migration._link(source, target)
+
+    assert migration.migrate_area(db, area) == 1
+    assert not os.path.exists(source)
+    assert db.uploads.find_one()["file_path"] == target
+    assert migration.migrate_area(db, area) == 0
+    assert migration.validate_migration([area]) == 0
+
+
+def test_every_area_moves_its_files_and_references(migration, areas, mongo, monkeypatch):
+    db = mongo.db
+    monkeypatch.setattr(migration, "_rewrite_sql", lambda moves: 0)
+    image_id = str(uuid.uuid4())
+
+    image = _legacy(areas["images"]["directory"], f"{image_id}.png")
+    variant = _legacy(areas["variants"]["directory"], f"{image_id}-640.webp")
+    db.images.insert_one({"path": image, "url": "/" + image,
+                          "thumbnail_url": "/" + variant, "variants": [{"url": "/" + variant}]})
+    upload_file = _legacy(areas["upload_files"]["directory"], "a.txt")
+    upload_image = _legacy(areas["upload_images"]["directory"], "b.png")
+    blob = _legacy(areas["uploads"]["directory"], f"{DIGEST}.txt")
+    thumbnail = _legacy(areas["thumbnails"]["directory"], f"{DIGEST}.webp")
+    db.uploads.insert_many([{"file_path": upload_file}, {"file_path": upload_image},
+                            {"file_path": blob, "thumbnail_path": thumbnail}])
+    stored = _legacy(areas["storage"]["directory"], f"{DIGEST}.bin")
+    db.blobs.insert_many([{"path": blob}, {"path": stored}])
+    artifact = _legacy(areas["exports"]["directory"], f"{DIGEST}.pdf")
+    working = _legacy(areas["exports"]["directory"], "export1.pdf")
+    db.export_cache.insert_one({"path": artifact})
+    db.exports.insert_one({"filepath": artifact, "download_url": "/" + artifact})
+
+    for area in areas.values():
+        migration.migrate_area(db, area, batch_size=1)
+
+    assert migration.validate_migration(
+        [area for name, area in areas.items() if name != "exports"]) == 0
+    # Arquivos de trabalho das exportações ficam na raiz
+    assert os.path.exists(working)
+
+    def moved(area, path):
+        return shard_path(areas[area]["directory"], os.path.basename(path),
+                          areas[area]["key_of"](os.path.basename(path)))
+
+    new_image, new_variant = moved("images", image), moved("variants", variant)
+    # Variantes ficam no diretório distribuído da imagem original
+    assert os.path.relpath(os.path.dirname(new_variant), areas["variants"]["directory"]) == \
+        os.path.relpath(os.path.dirname(new_image), areas["images"]["directory"])
+    document = db.images.find_one()
+    assert (document["path"], document["url"]) == (new_image, "/" + new_image)
+    assert document["thumbnail_url"] == document["variants"][0]["url"] == "/" + new_variant
+
+    assert sorted(u["file_path"] for u in db.uploads.find()) == sorted([
+        moved("upload_files", upload_file), moved("upload_images", upload_image),
+        moved("uploads", blob)])
+    assert db.uploads.find_one({"thumbnail_path": {"$exists": True}})["thumbnail_path"] == \
+        moved("thumbnails", thumbnail)
+    assert sorted(b["path"] for b in db.blobs.find()) == sorted([
+        moved("uploads", blob), moved("storage", stored)])
+    new_artifact = moved("exports", artifact)
+    assert db.export_cache.find_one()["path"] == new_artifact
+    export = db.exports.find_one()
+    assert (export["filepath"], export["download_url"]) == (new_artifact, "/" + new_artifact)
+    for path in (image, variant, upload_file, upload_image, blob, thumbnail, stored, artifact):
+        assert not os.path.exists(path)
@@ -0,0 +1,88 @@
+import pytest
+
+from app.services import prompt_template_service as pts
+from app.services.prompt_template_service import (
+    PromptTemplateError, compile_agent_template, render_agent_prompt, fit_context)
+
+
+def _agent(**fields):
+    agent = dict(fields)
+    agent.update(compile_agent_template(agent))
+    return agent
+
+
+def test_legacy_template_appends_message():
+    agent = _agent(prompt_template="Você é um médico.")
+    assert render_agent_prompt(agent, "dor de cabeça") == "Você é um médico.\n\ndor de cabeça"
+    assert render_agent_prompt(_agent(), "oi") == pts.LEGACY_PREFIX + "oi"
+
+
+def test_legacy_agent_keeps_context_and_files():
+    agent = _agent(description="Você é um médico.")
+    prompt = render_agent_prompt(agent, "msg", context="trecho do laudo", files=["laudo.pdf"])
+    assert prompt == ("Você é um médico.\n\nTrechos dos documentos anexados:\n\n"
+                      "trecho do laudo\n\nArquivos anexados: laudo.pdf\n\nmsg")
+
+
+def test_missing_context_slot_is_appended():
+    agent = _agent(prompt_template="Olá {{ message }}")
+    assert render_agent_prompt(agent, "mundo") == "Olá mundo"
+    assert render_agent_prompt(agent, "mundo", context="ctx") == \
+        "Olá mundo\n\nTrechos dos documentos anexados:\n\nctx"
+
+
+def test_slots_variables_and_few_shots():
+    agent = _agent(
+        prompt_template=("Tom: {{ tom }}\n{% for shot in few_shots %}"
+                         "{{ shot.input }}={{ shot.output }}\n{% endfor %}"
+                         "{{ context }}|{{ files | join(',') }}|{{ message }}"),
+        few_shots=[{"input": "a", "output": "b"}],
+        variables={"tom": "formal"})
+    assert agent["template_variables"] == ["tom"]
+    prompt = render_agent_prompt(agent, "msg", context="ctx", files=["x.pdf"],
+                                 variables={"tom": "informal"})
+    assert prompt == "Tom: informal\na=b\nctx|x.pdf|msg"
+
+
+def test_variables_without_default_are_rejected():
+    with pytest.raises(PromptTemplateError):
+        compile_agent_template({"prompt_template": "{{ especialidade }} {{ message }}"})
+
+
+def test_invalid_syntax_is_rejected():
+    with pytest.raises(PromptTemplateError):
+        compile_agent_template({"prompt_template": "{% for x in %}"})
+
+
+@pytest.mark.parametrize("source", [
+    "{{ ''.__class__.__mro__[1].__subclasses__() }}{{ message }}",
+    "{{ few_shots.append(1) }}{{ message }}",
+])
+def test_sandbox_blocks_unsafe_templates(source):
+    with pytest.raises(PromptTemplateError):
+        compile_agent_template({"prompt_template": source})
+
+
+def test_render_uses_cached_template_without_parsing(monkeypatch):
+    agent = _agent(prompt_template="Olá {{ message }}")
+
+    def fail(*args, **kwargs):
+        raise AssertionError("template analisado novamente")
+
+    monkeypatch.setattr(pts, "normalize_source", fail)
+    assert render_agent_prompt(agent, "mundo") == "Olá mundo"
+
+
+def test_render_compiles_on_cache_miss():
+    agent = _agent(prompt_template="Oi {{ message }}")
+    pts._compiled.clear()
+    assert render_agent_prompt(agent, "ana") == "Oi ana"
+
+
+def test_fit_context_respects_budget(monkeypatch):
+    monkeypatch.setattr(pts, "PROMPT_MAX_TOKENS", 100)
+    context = "x" * 1000
+    assert fit_context(context, "", 0) == "x" * 400
+    assert fit_context(context, "m" * 40, 50) == "x" * 160
+    assert fit_context("curto", "", 0) == "curto"
+    assert fit_context(context, "", 200) == ""
@@ -0,0 +1,72 @@
+import hashlib
+import os
+
+from app.utils import sharding
+from app.utils.sharding import leaf_dirs, locate, relative_url, shard_key, shard_path
+
+CONTENT_HASH = "ab12" + "0" * 60
+
+
+def test_shard_key_strips_directory_and_extensions():
+    assert shard_key("/x/y/abc.tar.gz") == "abc"
+    assert shard_key("abc") == "abc"
+
+
+def test_content_addressed_names_use_their_own_prefix(tmp_path):
+    path = shard_path(str(tmp_path), f"{CONTENT_HASH}.png")
+    assert path == os.path.join(str(tmp_path), "ab", "12", f"{CONTENT_HASH}.png")
+
+
+def test_other_names_use_the_hash_of_the_key(tmp_path):
+    digest = hashlib.sha256(b"64f0c2a1").hexdigest()
+    path = shard_path(str(tmp_path), "64f0c2a1.pdf")
+    assert path == os.path.join(str(tmp_path), digest[:2], digest[2:4], "64f0c2a1.pdf")
+
+
+def test_explicit_key_groups_related_files(tmp_path):
+    # Variantes de uma imagem ficam no diretório da original
+    original = shard_path(str(tmp_path), "img1.png")
+    variant = shard_path(str(tmp_path), "img1-640.webp", "img1")
+    assert os.path.dirname(original) == os.path.dirname(variant)
+
+
+def test_shard_dirs_follow_levels_and_width(monkeypatch):
+    monkeypatch.setattr(sharding, "SHARD_LEVELS", 3)
+    assert sharding.shard_dirs(CONTENT_HASH) == ["ab", "12", "00"]
+
+
+def test_locate_prefers_sharded_path_and_falls_back_to_root(tmp_path):
+    directory = str(tmp_path)
+    assert locate(directory, "a.txt") is None
+
+    legacy = tmp_path / "a.txt"
+    legacy.write_text("legado")
+    assert locate(directory, "a.txt") == str(legacy)
+
+    sharded = shard_path(directory, "a.txt")
+    os.makedirs(os.path.dirname(sharded))
+    with open(sharded, "w") as f:
+        f.write("novo")
+    assert locate(directory, "a.txt") == sharded
+
+
+def test_locate_with_key(tmp_path):
+    path = shard_path(str(tmp_path), "img1-thumb.webp", "img1")
+    os.makedirs(os.path.dirname(path))
+    open(path, "w").close()
+    assert locate(str(tmp_path), "img1-thumb.webp", "img1") == path
+    assert locate(str(tmp_path), "img1-thumb.webp") is None
+
+
+def test_relative_url(tmp_path):
+    path = shard_path(str(tmp_path), f"{CONTENT_HASH}.png")
+    assert relative_url(str(tmp_path), path, "/static/images/") == \
+        f"/static/images/ab/12/{CONTENT_HASH}.png"
+
+
+def test_leaf_dirs_lists_root_then_shards(tmp_path):
+    for relative in ("cd/ef", "ab/12", "ab/zz", "outro/12"):
+        os.makedirs(tmp_path / relative)
+    (tmp_path / "ab" / "34").write_text("arquivo, não diretório")
+    assert list(leaf_dirs(str(tmp_path))) == ["", "ab/12", "cd/ef"]
+    assert list(leaf_dirs(str(tmp_path / "inexistente"))) == [""]
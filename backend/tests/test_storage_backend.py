@@ -0,0 +1,197 @@
+import io
+import os
+from types import SimpleNamespace
+
+import pytest
+
+from app.services import storage_backend
+
+
+def test_each_backend_has_its_own_namespace():
+    assert storage_backend.storage_namespace("local") == storage_backend.STORAGE_NAMESPACE
+    assert storage_backend.storage_namespace("s3") != storage_backend.storage_namespace("local")
+    assert storage_backend.storage_namespace_for_path("s3://bucket/ab/cd/x.png") == \
+        storage_backend.storage_namespace("s3")
+    assert storage_backend.storage_namespace_for_path("/srv/static/uploads/x.png") == \
+        storage_backend.storage_namespace("local")
+
+
+@pytest.fixture
+def s3(monkeypatch):
+    pytest.importorskip("boto3")
+    backend = storage_backend.S3StorageBackend(
+        "bucket", region="us-east-1", access_key="teste", secret_key="teste")
+    signed = []
+
+    def generate_presigned_url(operation, Params, ExpiresIn):
+        signed.append((Params["Key"], ExpiresIn))
+        return f"https://s3/{Params['Key']}?n={len(signed)}"
+
+    monkeypatch.setattr(backend.client, "generate_presigned_url", generate_presigned_url)
+    clock = [1000.0]
+    monkeypatch.setattr(storage_backend.time, "monotonic", lambda: clock[0])
+    backend.signed = signed
+    backend.clock = clock
+    return backend
+
+
+def test_presigned_url_is_reused_until_near_expiry(s3):
+    first = s3.url("s3://bucket/a.png", expiration=3600)
+    assert s3.url("s3://bucket/a.png", expiration=3600) == first
+    assert len(s3.signed) == 1
+
+    # Reaproveitada até faltar a margem (PRESIGNED_URL_MARGIN ou 10% da validade)
+    s3.clock[0] += 3600 - max(storage_backend.PRESIGNED_URL_MARGIN, 360) - 1
+    assert s3.url("s3://bucket/a.png", expiration=3600) == first
+    s3.clock[0] += 2
+    assert s3.url("s3://bucket/a.png", expiration=3600) != first
+    assert len(s3.signed) == 2
+
+
+def test_presigned_cache_is_per_expiration(s3):
+    s3.url("s3://bucket/a.png", expiration=3600)
+    s3.url("s3://bucket/a.png", expiration=7200)
+    assert s3.signed == [("a.png", 3600), ("a.png", 7200)]
+
+
+def test_short_lived_urls_are_not_cached(s3):
+    s3.url("s3://bucket/a.png", expiration=60)
+    s3.url("s3://bucket/a.png", expiration=60)
+    assert len(s3.signed) == 2
+
+
+def test_delete_drops_cached_urls(s3, monkeypatch):
+    monkeypatch.setattr(s3.client, "delete_object", lambda **kwargs: None)
+    s3.url("s3://bucket/a.png")
+    s3.delete("s3://bucket/a.png")
+    s3.url("s3://bucket/a.png")
+    assert len(s3.signed) == 2
+
+
+def test_presigned_cache_is_bounded(s3, monkeypatch):
+    monkeypatch.setattr(storage_backend, "PRESIGNED_CACHE_SIZE", 2)
+    for name in ("a", "b", "c"):
+        s3.url(f"s3://bucket/{name}.png")
+    # A entrada mais antiga foi descartada
+    s3.url("s3://bucket/a.png")
+    assert len(s3.signed) == 4
+    assert len(s3._presigned) == 2
+
+
+class FakeS3Client:
+    """Cliente S3 em memória (apenas as operações usadas pelo backend)"""
+
+    def __init__(self, **kwargs):
+        self.kwargs = kwargs
+        self.objects = {}
+        self.uploads = []
+        self.buckets = set()
+
+    def upload_fileobj(self, fileobj, bucket, key, ExtraArgs=None, Config=None):
+        self.uploads.append((bucket, key, ExtraArgs, Config))
+        self.objects[key] = fileobj.read()
+
+    def delete_object(self, Bucket, Key):
+        self.objects.pop(Key, None)
+
+    def head_object(self, Bucket, Key):
+        if Key not in self.objects:
+            raise storage_backend.ClientError({"Error": {"Code": "404"}}, "HeadObject")
+        return {"ContentLength": len(self.objects[Key])}
+
+    def head_bucket(self, Bucket):
+        if Bucket not in self.buckets:
+            raise storage_backend.ClientError({"Error": {"Code": "404"}}, "HeadBucket")
+
+    def create_bucket(self, Bucket):
+        self.buckets.add(Bucket)
+
+
+@pytest.fixture
+def clients(monkeypatch):
+    pytest.importorskip("boto3")
+    created = []
+
+    def client(service, **kwargs):
+        created.append(FakeS3Client(**kwargs))
+        return created[-1]
+
+    monkeypatch.setattr(storage_backend, "boto3", SimpleNamespace(client=client))
+    monkeypatch.setattr(storage_backend, "_backends", {})
+    return created
+
+
+def _s3_config(**overrides):
+    config = {"USE_S3": True, "S3_BUCKET": "bucket", "S3_REGION": "us-east-1",
+              "AWS_ACCESS_KEY": "a", "AWS_SECRET_KEY": "b"}
+    config.update(overrides)
+    return config
+
+
+def test_local_save_size_and_delete(tmp_path):
+    backend = storage_backend.LocalStorageBackend(str(tmp_path), "/arquivos")
+    path = backend.save(io.BytesIO(b"conteudo"), "abcd1234.txt")
+
+    assert path == backend.path_for("abcd1234.txt") and os.path.dirname(path) != str(tmp_path)
+    assert not os.path.exists(f"{path}.part")
+    assert backend.exists("abcd1234.txt") and backend.size(path) == 8
+    assert backend.url(path) == "/arquivos/abcd1234.txt"
+    assert backend.delete(path) is True
+    assert backend.delete(path) is False
+    assert backend.size(path) is None
+
+
+def test_s3_save_uses_multipart_transfer_config(clients):
+    backend = storage_backend.get_storage_backend(_s3_config(
+        S3_MULTIPART_THRESHOLD="1024", S3_MULTIPART_CHUNKSIZE=2048, S3_MAX_CONCURRENCY=4))
+    path = backend.save(io.BytesIO(b"conteudo"), "ab/cd/x.png", "image/png")
+
+    assert path == "s3://bucket/ab/cd/x.png"
+    bucket, key, extra_args, config = clients[0].uploads[0]
+    assert (bucket, key) == ("bucket", "ab/cd/x.png")
+    assert extra_args == {"ACL": "private", "ContentType": "image/png"}
+    assert config is backend.transfer_config
+    assert (config.multipart_threshold, config.multipart_chunksize, config.max_concurrency) == \
+        (1024, 2048, 4)
+    # Um pool de conexões por parte enviada em paralelo
+    assert clients[0].kwargs["config"].max_pool_connections == 4
+
+
+def test_s3_size_and_delete(clients):
+    backend = storage_backend.get_storage_backend(_s3_config())
+    path = backend.save(io.BytesIO(b"12345"), "x.bin")
+    assert backend.size(path) == 5 and backend.exists("x.bin")
+    assert backend.delete(path) is True
+    assert backend.size(path) is None and not backend.exists("x.bin")
+
+
+def test_backend_and_client_are_reused_per_config(clients):
+    first = storage_backend.get_storage_backend(_s3_config())
+    assert storage_backend.get_storage_backend(_s3_config()) is first
+    assert len(clients) == 1
+
+    other = storage_backend.get_storage_backend(_s3_config(S3_BUCKET="outro"))
+    assert other is not first and len(clients) == 2
+
+
+def test_endpoint_url_uses_path_addressing_and_creates_bucket(clients):
+    backend = storage_backend.get_storage_backend(_s3_config(
+        S3_ENDPOINT_URL="http://minio:9000", S3_CREATE_BUCKET="true"))
+    assert clients[0].kwargs["endpoint_url"] == "http://minio:9000"
+    assert clients[0].kwargs["config"].s3 == {"addressing_style": "path"}
+    assert clients[0].buckets == {backend.bucket}
+
+
+def test_backend_for_path_follows_the_stored_path(clients, tmp_path, monkeypatch):
+    monkeypatch.setattr(storage_backend, "LOCAL_STORAGE_FOLDER", str(tmp_path))
+    local_config = {"USE_S3": False, "LOCAL_UPLOAD_FOLDER": str(tmp_path)}
+    local = storage_backend.get_storage_backend(local_config)
+    s3 = storage_backend.get_storage_backend(_s3_config())
+
+    assert storage_backend.get_backend_for_path(str(tmp_path / "a.png"), local_config) is local
+    assert storage_backend.get_backend_for_path("s3://bucket/a.png", _s3_config()) is s3
+    # Arquivos do outro backend continuam acessíveis
+    assert storage_backend.get_backend_for_path(
+        "s3://bucket/a.png", dict(_s3_config(), USE_S3=False,
+                                  LOCAL_UPLOAD_FOLDER=str(tmp_path))) is s3
+    assert storage_backend.get_backend_for_path("/srv/a.png", _s3_config()).root == str(tmp_path)
@@ -0,0 +1,171 @@
+import hashlib
+import os
+import time
+import uuid
+from datetime import timedelta
+
+import pytest
+from bson import ObjectId
+
+from app.services import blob_store, storage_gc_service as gc, upload_service
+from app.utils.date_utils import utcnow
+from app.utils.sharding import shard_path
+
+OLD = time.time() - 2 * 24 * 3600
+
+DIRECTORIES = {
+    "IMAGE_STORAGE_PATH": "images", "VARIANT_STORAGE_PATH": "variants",
+    "BLOB_UPLOAD_FOLDER": "uploads", "THUMBNAIL_FOLDER": "thumbnails",
+    "TEMP_UPLOAD_FOLDER": "tmp", "LOCAL_STORAGE_FOLDER": "storage",
+    "EXPORT_STORAGE_PATH": "exports",
+}
+
+
+@pytest.fixture
+def db(mongo, tmp_path, monkeypatch):
+    for constant, name in DIRECTORIES.items():
+        monkeypatch.setattr(gc, constant, str(tmp_path / name))
+    monkeypatch.setattr(upload_service, "BLOB_UPLOAD_FOLDER", str(tmp_path / "uploads"))
+    monkeypatch.setattr(upload_service, "TEMP_UPLOAD_FOLDER", str(tmp_path / "tmp"))
+    monkeypatch.setattr(gc, "GC_BATCH_PAUSE_SECONDS", 0)
+    return mongo(gc, blob_store, upload_service)
+
+
+def _digest(text):
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
+def _file(directory, name, age=OLD, sharded=True):
+    path = shard_path(str(directory), name) if sharded else os.path.join(str(directory), name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(b"x" * 10)
+    os.utime(path, (age, age))
+    return path
+
+
+def test_orphan_files_respect_managed_names_and_references(db, tmp_path):
+    uploads = tmp_path / "uploads"
+    referenced = _file(uploads, f"{_digest('a')}.txt")
+    db[blob_store.BLOB_COLLECTION].insert_one(
+        {"_id": f"{upload_service.UPLOAD_NAMESPACE}:{_digest('a')}", "refcount": 1})
+    orphan = _file(uploads, f"{_digest('b')}.txt")
+    legacy = _file(uploads, "relatorio_antigo.txt", sharded=False)
+    partial = _file(uploads, f".{uuid.uuid4().hex}.part", sharded=False)
+
+    report = gc.collect_orphan_files(db)
+
+    assert os.path.exists(referenced) and os.path.exists(legacy)
+    assert not os.path.exists(orphan) and not os.path.exists(partial)
+    assert report["itens"] == 2 and report["bytes"] == 20
+
+
+def test_recent_files_are_never_orphans(db, tmp_path):
+    recent = _file(tmp_path / "uploads", f"{_digest('b')}.txt", age=time.time())
+    assert gc.collect_orphan_files(db)["itens"] == 0
+    assert os.path.exists(recent)
+
+
+def test_images_variants_and_thumbnails_of_known_records_are_kept(db, tmp_path):
+    image_id = str(uuid.uuid4())
+    db.images.insert_one({"image_id": image_id})
+    image = _file(tmp_path / "images", f"{image_id}.png")
+    variant = _file(tmp_path / "variants", f"{image_id}-640.webp")
+    thumb = _file(tmp_path / "variants", f"{image_id}-thumb.webp")
+    unknown_variant = _file(tmp_path / "variants", f"{uuid.uuid4()}-640.webp")
+
+    upload_hash = _digest("upload")
+    db[blob_store.BLOB_COLLECTION].insert_one(
+        {"_id": f"{upload_service.UPLOAD_NAMESPACE}:{upload_hash}", "refcount": 1})
+    thumbnail = _file(tmp_path / "thumbnails", f"{upload_hash}.webp")
+    orphan_thumbnail = _file(tmp_path / "thumbnails", f"{_digest('removido')}.webp")
+
+    gc.collect_orphan_files(db)
+
+    for path in (image, variant, thumb, thumbnail):
+        assert os.path.exists(path)
+    assert not os.path.exists(unknown_variant)
+    assert not os.path.exists(orphan_thumbnail)
+
+
+def test_scan_resumes_after_the_cursor(tmp_path):
+    names = [f"{_digest(str(i))}.bin" for i in range(7)]
+    for name in names:
+        _file(tmp_path, name)
+    _file(tmp_path, "raiz.txt", sharded=False)
+
+    seen, cursor = [], None
+    while True:
+        batch = gc._scan(str(tmp_path), cursor, 3)
+        seen.extend(batch)
+        if len(batch) < 3:
+            break
+        cursor = batch[-1]
+
+    assert seen[0] == "raiz.txt"
+    assert sorted(os.path.basename(s) for s in seen[1:]) == sorted(names)
+    assert len(set(seen)) == len(seen)
+
+
+def test_orphan_files_continue_from_cursor_between_runs(db, tmp_path, monkeypatch):
+    monkeypatch.setattr(gc, "GC_MAX_ITEMS_PER_RUN", 2)
+    paths = [_file(tmp_path / "uploads", f"{_digest(str(i))}.txt") for i in range(3)]
+
+    assert gc.collect_orphan_files(db)["itens"] == 2
+    assert gc._get_cursor(db, "dir:uploads")
+    assert sum(os.path.exists(p) for p in paths) == 1
+
+    assert gc.collect_orphan_files(db)["itens"] == 1
+    assert gc._get_cursor(db, "dir:uploads") is None
+    assert not any(os.path.exists(p) for p in paths)
+
+
+def test_orphan_uploads_are_removed_in_cursor_batches(db, monkeypatch):
+    monkeypatch.setattr(gc, "GC_MAX_ITEMS_PER_RUN", 2)
+    live = str(db.conversations.insert_one({"title": "ativa"}).inserted_id)
+    released = []
+    monkeypatch.setattr(gc, "delete_upload_file", released.append)
+    db.uploads.insert_many([
+        {"_id": ObjectId(), "conversation_id": live, "file_size": 1},
+        {"_id": ObjectId(), "conversation_id": str(ObjectId()), "file_size": 2},
+        {"_id": ObjectId(), "conversation_id": str(ObjectId()), "file_size": 3},
+    ])
+
+    assert gc.collect_orphan_uploads(db) == {"itens": 1, "bytes": 2}
+    assert gc._get_cursor(db, "uploads")
+    assert gc.collect_orphan_uploads(db) == {"itens": 1, "bytes": 3}
+    assert gc._get_cursor(db, "uploads") is None
+    assert [u["conversation_id"] for u in db.uploads.find()] == [live]
+    assert len(released) == 2
+
+
+def test_expired_sessions_skip_finalizing_ones(db, tmp_path):
+    past = utcnow() - timedelta(hours=1)
+    blob = blob_store.write_bytes(upload_service.UPLOAD_NAMESPACE, b"publicado",
+                                  str(tmp_path / "uploads"), "txt")
+    db.upload_sessions.insert_many([
+        {"_id": "vencida", "status": "em_andamento", "expires_at": past,
+         "blob": {"hash": blob["hash"]}},
+        {"_id": "finalizando", "status": "finalizando", "expires_at": past},
+        {"_id": "ativa", "status": "em_andamento", "expires_at": utcnow() + timedelta(hours=1)},
+    ])
+    partial = _file(tmp_path / "tmp", "vencida.part", sharded=False)
+
+    assert gc.collect_expired_sessions(db)["itens"] == 1
+    assert sorted(s["_id"] for s in db.upload_sessions.find()) == ["ativa", "finalizando"]
+    assert not os.path.exists(partial)
+    assert blob_store.get_blob(upload_service.UPLOAD_NAMESPACE, blob["hash"]) is None
+    assert not os.path.exists(blob["path"])
+
+
+def test_unreferenced_blobs_are_removed_only_at_zero(db, tmp_path):
+    kept = blob_store.write_bytes(upload_service.UPLOAD_NAMESPACE, b"usado",
+                                  str(tmp_path / "uploads"), "txt")
+    dropped = blob_store.write_bytes(upload_service.UPLOAD_NAMESPACE, b"solto",
+                                     str(tmp_path / "uploads"), "txt")
+    db[blob_store.BLOB_COLLECTION].update_one(
+        {"_id": f"{upload_service.UPLOAD_NAMESPACE}:{dropped['hash']}"},
+        {"$set": {"refcount": 0}})
+
+    assert gc.collect_unreferenced_blobs(db)["itens"] == 1
+    assert os.path.exists(kept["path"]) and not os.path.exists(dropped["path"])
@@ -0,0 +1,99 @@
+import pytest
+from flask import Flask
+
+from app.extensions import db as sql
+from app.models import payment, storage, subscription, user, video  # noqa: F401
+from app.models.storage import StorageItem, StorageUsage
+from app.services import storage_usage_service as service
+
+
+@pytest.fixture
+def db():
+    app = Flask(__name__)
+    app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite://"
+    app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+    sql.init_app(app)
+    with app.app_context():
+        sql.create_all()
+        yield sql
+        sql.session.remove()
+        sql.drop_all()
+
+
+def _item(user_id=1, content_type="image", size=100, deleted=False):
+    item = StorageItem("a.png", "a.png", content_type, size, user_id)
+    item.deleted = deleted
+    sql.session.add(item)
+    service.track_item_added(item)
+    sql.session.commit()
+    return item
+
+
+def _usage(user_id=1, content_type="image"):
+    row = StorageUsage.query.get((user_id, content_type))
+    return (row.file_count, row.total_bytes) if row else None
+
+
+def test_apply_creates_then_increments_the_row(db):
+    service._apply(1, "image", 1, 100)
+    service._apply(1, "image", 2, 50)
+    db.session.commit()
+    assert _usage() == (3, 150)
+
+
+def test_apply_never_creates_negative_rows(db):
+    service._apply(1, "video", -1, -100)
+    db.session.commit()
+    assert _usage(content_type="video") == (0, 0)
+
+
+def test_track_item_removed_skips_logically_deleted_items(db):
+    item = _item()
+    _item(size=30)
+    service.track_item_removed(item)
+    db.session.commit()
+    assert _usage() == (1, 30)
+
+    deleted = _item(size=20, deleted=True)
+    service.track_item_removed(deleted)
+    db.session.commit()
+    assert _usage() == (2, 50)
+
+
+def test_get_usage_hides_empty_types(db):
+    _item(size=10)
+    _item(content_type="video", size=5)
+    service._apply(1, "audio", 0, 0)
+    db.session.commit()
+    usage = service.get_usage(1)
+    assert usage["total_files"] == 2 and usage["storage_usage_bytes"] == 15
+    assert {stat["content_type"] for stat in usage["type_stats"]} == {"image", "video"}
+
+
+def test_reconcile_fixes_drift_per_user(db):
+    _item(user_id=1, size=10)
+    _item(user_id=1, size=20)
+    _item(user_id=2, content_type="video", size=5)
+    _item(user_id=2, content_type="video", size=7, deleted=True)
+    # Divergências: contador adulterado, linha ausente e linha sem itens
+    StorageUsage.query.get((1, "image")).file_count = 9
+    db.session.delete(StorageUsage.query.get((2, "video")))
+    db.session.add(StorageUsage(3, "audio", 4, 400))
+    db.session.commit()
+
+    assert service.reconcile_usage() == {"verificados": 3, "corrigidos": 3}
+    assert _usage(1) == (2, 30)
+    assert _usage(2, "video") == (1, 5)
+    assert _usage(3, "audio") == (0, 0)
+    assert service.reconcile_usage() == {"verificados": 3, "corrigidos": 0}
+
+
+def test_reconcile_single_user(db):
+    _item(user_id=1, size=10)
+    _item(user_id=2, size=10)
+    StorageUsage.query.get((1, "image")).total_bytes = 0
+    StorageUsage.query.get((2, "image")).total_bytes = 0
+    db.session.commit()
+
+    assert service.reconcile_usage(1) == {"verificados": 1, "corrigidos": 1}
+    assert _usage(1) == (1, 10) and _usage(2) == (1, 0)
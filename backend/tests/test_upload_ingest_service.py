@@ -0,0 +1,218 @@
+import io
+import zipfile
+from datetime import timedelta
+
+import pytest
+from PIL import Image
+
+from app.services import upload_ingest_service as service
+from app.utils.date_utils import utcnow
+
+
+class FakeScanner:
+    name = "fake"
+
+    def __init__(self, status="limpo"):
+        self.status = status
+        self.calls = 0
+
+    def scan(self, path):
+        self.calls += 1
+        if self.status == "erro":
+            raise ConnectionError("clamd indisponível")
+        return self.status, "Sig" if self.status == "infectado" else None
+
+
+@pytest.fixture
+def db(mongo, tmp_path, monkeypatch):
+    monkeypatch.setattr(service, "THUMBNAIL_FOLDER", str(tmp_path / "thumbnails"))
+    monkeypatch.setattr(service, "schedule_document", lambda upload: None)
+    service.set_scanner(None)
+    yield mongo(service)
+    service.set_scanner(None)
+
+
+def _file(tmp_path, name, data):
+    path = tmp_path / name
+    path.write_bytes(data)
+    return str(path)
+
+
+def _image_bytes(fmt):
+    buffer = io.BytesIO()
+    Image.new("RGB", (4, 4), "red").save(buffer, fmt)
+    return buffer.getvalue()
+
+
+def _zip_bytes(names):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as package:
+        for name in names:
+            package.writestr(name, "<xml/>")
+    return buffer.getvalue()
+
+
+@pytest.mark.parametrize("data, expected", [
+    (_image_bytes("PNG"), "image/png"),
+    (_image_bytes("JPEG"), "image/jpeg"),
+    (_image_bytes("GIF"), "image/gif"),
+    (_image_bytes("WEBP"), "image/webp"),
+    (b"%PDF-1.7\n", "application/pdf"),
+    (b"MZ\x90\x00", "application/x-msdownload"),
+    (b"\x7fELF\x02\x01", "application/x-executable"),
+    (b"\xcf\xfa\xed\xfe\x07", "application/x-mach-binary"),
+    (b"<?xml version='1.0'?><svg xmlns='http://www.w3.org/2000/svg'/>", "image/svg+xml"),
+    (b"\x00\x01\x02\xff\xfe binario", "application/octet-stream"),
+])
+def test_sniff_type_by_magic_bytes(tmp_path, data, expected):
+    assert service.sniff_type(_file(tmp_path, "arquivo", data)) == expected
+
+
+def test_sniff_type_office_packages(tmp_path):
+    docx = _file(tmp_path, "a.docx", _zip_bytes(["word/document.xml"]))
+    xlsx = _file(tmp_path, "a.xlsx", _zip_bytes(["xl/workbook.xml"]))
+    other = _file(tmp_path, "a.zip", _zip_bytes(["leia.txt"]))
+    assert service.sniff_type(docx).endswith("wordprocessingml.document")
+    assert service.sniff_type(xlsx).endswith("spreadsheetml.sheet")
+    assert service.sniff_type(other) == "application/zip"
+
+
+def test_sniff_type_text_uses_extension(tmp_path):
+    path = _file(tmp_path, "dados", "nome;valor\ncafé;1\n".encode("utf-8"))
+    assert service.sniff_type(path, "csv") == "text/csv"
+    assert service.sniff_type(path, "pdf") == "text/plain"
+
+
+def test_sniff_type_accepts_utf8_cut_at_block_end(tmp_path):
+    data = b"a" * (service.SNIFF_BYTES - 1) + "é".encode("utf-8")
+    assert service.sniff_type(_file(tmp_path, "texto", data), "txt") == "text/plain"
+
+
+def test_type_mismatch():
+    assert service._type_mismatch("application/x-msdownload", "pdf")
+    assert not service._type_mismatch("text/plain", "csv")
+    assert not service._type_mismatch("image/png", None)
+
+
+def _upload(db, tmp_path, data=b"ola mundo", content_hash="h1", name="notas.txt"):
+    path = _file(tmp_path, f"{content_hash}-{name}", data)
+    result = db.uploads.insert_one({
+        "file_path": path, "original_filename": name, "content_hash": content_hash,
+        "upload_type": "file", "ingest_status": "pendente", "created_at": utcnow()})
+    return str(result.inserted_id)
+
+
+def test_ingest_annotates_and_releases_lease(db, tmp_path):
+    upload_id = _upload(db, tmp_path)
+    result = service.ingest_upload(upload_id)
+    assert result["detected_type"] == "text/plain"
+    upload = db.uploads.find_one()
+    assert upload["ingest_status"] == "concluido"
+    assert "ingest_lease_until" not in upload
+    # Já concluído
+    assert service.ingest_upload(upload_id) is None
+
+
+def test_ingest_recovers_expired_lease(db, tmp_path):
+    upload_id = _upload(db, tmp_path)
+    db.uploads.update_one({}, {"$set": {"ingest_status": "em_andamento",
+                                        "ingest_lease_until": utcnow() + timedelta(minutes=5)}})
+    assert service.ingest_upload(upload_id) is None
+
+    db.uploads.update_one({}, {"$set": {"ingest_lease_until": utcnow() - timedelta(seconds=1)}})
+    assert service.ingest_upload(upload_id)["detected_type"] == "text/plain"
+
+
+def test_scanner_error_is_retried_with_backoff(db, tmp_path, monkeypatch):
+    from app.tasks import upload_tasks
+    queued = []
+    monkeypatch.setattr(upload_tasks.ingest_upload_task, "delay", queued.append)
+
+    scanner = FakeScanner("erro")
+    service.set_scanner(scanner)
+    upload_id = _upload(db, tmp_path)
+    assert service.ingest_upload(upload_id) is None
+    upload = db.uploads.find_one()
+    assert upload["ingest_status"] == "falha" and upload["ingest_attempts"] == 1
+    # Ainda com tentativas: o download aguarda
+    assert service.verification_status(upload) == "pendente"
+
+    assert service.reschedule_ingests() == 0
+    db.uploads.update_one({}, {"$set": {"ingest_retry_at": utcnow()}})
+    assert service.reschedule_ingests() == 1
+    assert queued == [upload_id]
+
+    scanner.status = "limpo"
+    assert service.ingest_upload(upload_id)["scan_status"] == "limpo"
+    upload = db.uploads.find_one()
+    assert "ingest_retry_at" not in upload and "ingest_error" not in upload
+    assert service.verification_status(upload) is None
+
+
+def test_scanner_error_without_attempts_left_fails(db, tmp_path):
+    service.set_scanner(FakeScanner("erro"))
+    _upload(db, tmp_path)
+    db.uploads.update_one({}, {"$set": {"ingest_status": "falha",
+                                        "ingest_attempts": service.INGEST_MAX_ATTEMPTS,
+                                        "ingest_retry_at": utcnow()}})
+    assert service.reschedule_ingests() == 0
+    assert service.verification_status(db.uploads.find_one()) == "falha"
+
+
+def test_reuse_requires_final_scan_from_current_scanner(db, tmp_path):
+    scanner = FakeScanner()
+    service.set_scanner(scanner)
+    # Resultado antigo sem varredura conclusiva não é reaproveitado
+    first = _upload(db, tmp_path)
+    db.uploads.update_one({}, {"$set": {"ingest_status": "concluido", "scan_status": "erro",
+                                        "scan_engine": "fake"}})
+    second = _upload(db, tmp_path)
+    assert service.ingest_upload(second)["scan_status"] == "limpo"
+    assert scanner.calls == 1
+    assert service.ingest_upload(first) is None
+
+    third = _upload(db, tmp_path)
+    assert service.ingest_upload(third)["scan_engine"] == "fake"
+    assert scanner.calls == 1
+
+    # Outro antivírus não reaproveita o resultado
+    other = FakeScanner("infectado")
+    other.name = "outro"
+    service.set_scanner(other)
+    fourth = _upload(db, tmp_path)
+    assert service.ingest_upload(fourth)["quarantined"] is True
+    assert other.calls == 1
+
+
+def test_verification_status(db):
+    assert service.verification_status({"ingest_status": "pendente"}) is None
+    service.set_scanner(FakeScanner())
+    assert service.verification_status({}) is None
+    assert service.verification_status({"ingest_status": "em_andamento"}) == "pendente"
+    assert service.verification_status({"ingest_status": "falha"}) == "pendente"
+    assert service.verification_status(
+        {"ingest_status": "falha", "ingest_attempts": service.INGEST_MAX_ATTEMPTS}) == "falha"
+    assert service.verification_status(
+        {"ingest_status": "concluido", "scan_status": "erro"}) == "falha"
+    assert service.verification_status(
+        {"ingest_status": "concluido", "scan_status": "limpo"}) is None
+
+
+def test_reschedule_ingests(db, tmp_path, monkeypatch):
+    from app.tasks import upload_tasks
+    queued = []
+    monkeypatch.setattr(upload_tasks.ingest_upload_task, "delay", queued.append)
+
+    recent = _upload(db, tmp_path, content_hash="h1")
+    stale = _upload(db, tmp_path, content_hash="h2")
+    db.uploads.update_one({"content_hash": "h2"},
+                          {"$set": {"created_at": utcnow() - timedelta(hours=1)}})
+    assert service.reschedule_ingests() == 1
+    assert queued == [stale]
+
+    db.uploads.update_one({"content_hash": "h1"},
+                          {"$set": {"ingest_status": "em_andamento",
+                                    "ingest_lease_until": utcnow() - timedelta(seconds=1)}})
+    queued.clear()
+    assert service.reschedule_ingests() == 2
+    assert recent in queued
@@ -0,0 +1,53 @@
+import pytest
+from flask import Flask
+
+from app.routes import upload_routes
+from app.services import blob_store, upload_service
+
+
+@pytest.fixture
+def client(mongo, tmp_path, monkeypatch):
+    monkeypatch.setattr(upload_service, "BLOB_UPLOAD_FOLDER", str(tmp_path))
+    mongo(upload_routes, upload_service, blob_store)
+    app = Flask(__name__)
+    app.register_blueprint(upload_routes.upload_bp, url_prefix="/api")
+    return app.test_client()
+
+
+def _upload(db, data):
+    blob = blob_store.write_bytes(upload_service.UPLOAD_NAMESPACE, data,
+                                  upload_service.BLOB_UPLOAD_FOLDER, "txt")
+    result = db.uploads.insert_one({"content_hash": blob["hash"], "file_path": blob["path"]})
+    return str(result.inserted_id), blob
+
+
+def test_delete_releases_the_blob_once(client, mongo):
+    first, blob = _upload(mongo.db, b"abc")
+    _upload(mongo.db, b"abc")
+
+    assert client.delete(f"/api/uploads/{first}").status_code == 200
+    # Repetir a exclusão não libera a referência do outro upload
+    assert client.delete(f"/api/uploads/{first}").status_code == 404
+    assert blob_store.get_blob(upload_service.UPLOAD_NAMESPACE, blob["hash"])["refcount"] == 1
+
+
+def test_download_waits_for_verification(client, mongo):
+    from app.services import upload_ingest_service
+
+    upload_id, _ = _upload(mongo.db, b"abc")
+    mongo.db.uploads.update_many({}, {"$set": {"ingest_status": "em_andamento"}})
+    upload_ingest_service.set_scanner(upload_ingest_service.LocalScanner())
+    try:
+        response = client.get(f"/api/uploads/{upload_id}/download")
+        assert response.status_code == 202
+        assert response.headers["Retry-After"]
+        assert client.get(f"/api/uploads/{upload_id}/thumbnail").status_code == 202
+
+        mongo.db.uploads.update_many(
+            {}, {"$set": {"ingest_status": "concluido", "scan_status": "erro"}})
+        assert client.get(f"/api/uploads/{upload_id}/download").status_code == 409
+
+        mongo.db.uploads.update_many({}, {"$set": {"scan_status": "limpo"}})
+        assert client.get(f"/api/uploads/{upload_id}/download").status_code == 200
+    finally:
+        upload_ingest_service.set_scanner(None)
@@ -0,0 +1,135 @@
+import base64
+import hashlib
+import io
+import os
+
+import pytest
+
+from app.services import blob_store, upload_service
+from app.services.upload_service import UploadError, UploadOffsetError
+
+
+@pytest.fixture
+def db(mongo, tmp_path, monkeypatch):
+    monkeypatch.setattr(upload_service, "TEMP_UPLOAD_FOLDER", str(tmp_path / "tmp"))
+    monkeypatch.setattr(upload_service, "BLOB_UPLOAD_FOLDER", str(tmp_path / "blobs"))
+    monkeypatch.setattr(upload_service, "FILE_UPLOAD_FOLDER", str(tmp_path / "files"))
+    monkeypatch.setattr(upload_service, "IMAGE_UPLOAD_FOLDER", str(tmp_path / "images"))
+    upload_service._hashers.clear()
+    # Sem broker: a ingestão não é agendada
+    from app.tasks import upload_tasks
+    monkeypatch.setattr(upload_tasks.ingest_upload_task, "delay", lambda upload_id: None)
+    return mongo(upload_service, blob_store)
+
+
+def _session(size=10):
+    return upload_service.create_session("u1", "notas.txt", size)
+
+
+def _append(session, offset, data, checksum=None):
+    return upload_service.append_chunk(
+        session["_id"], offset, io.BytesIO(data), len(data), checksum)
+
+
+def _checksum(data):
+    return "sha256 " + base64.b64encode(hashlib.sha256(data).digest()).decode()
+
+
+def test_chunks_must_follow_the_offset(db):
+    session = _session()
+    assert _append(session, 0, b"01234")["offset"] == 5
+
+    with pytest.raises(UploadOffsetError) as error:
+        _append(session, 0, b"01234")
+    assert error.value.offset == 5
+    with pytest.raises(UploadError):
+        _append(session, 5, b"0123456789")
+
+
+def test_each_chunk_extends_the_session_expiry(db):
+    session = _session()
+    db.upload_sessions.update_one({"_id": session["_id"]},
+                                  {"$set": {"expires_at": session["created_at"]}})
+    _append(session, 0, b"01234")
+    stored = upload_service.get_session(session["_id"])
+    assert stored["expires_at"] > session["created_at"]
+
+
+def test_checksum_mismatch_discards_the_chunk(db):
+    session = _session()
+    with pytest.raises(UploadError):
+        _append(session, 0, b"01234", _checksum(b"outra coisa"))
+
+    stored = upload_service.get_session(session["_id"])
+    assert stored["offset"] == 0 and "writer" not in stored
+    assert os.path.getsize(upload_service._temp_path(session["_id"])) == 0
+
+    _append(session, 0, b"01234", _checksum(b"01234"))
+    assert upload_service.get_session(session["_id"])["offset"] == 5
+
+
+def test_chunk_being_written_is_not_accepted_twice(db):
+    session = _session()
+    writer = upload_service._claim_chunk(session["_id"], 0)
+    with pytest.raises(UploadOffsetError, match="sendo gravado"):
+        _append(session, 0, b"01234")
+
+    upload_service._release_chunk(session["_id"], writer)
+    assert _append(session, 0, b"01234")["offset"] == 5
+
+
+def test_finalize_publishes_the_file(db):
+    session = _session()
+    _append(session, 0, b"0123456789")
+    upload = upload_service.finalize_session(session["_id"])
+
+    assert upload["content_hash"] == hashlib.sha256(b"0123456789").hexdigest()
+    stored = upload_service.get_session(session["_id"])
+    assert stored["status"] == "concluido" and "blob" not in stored
+
+
+def test_known_hash_skips_the_transfer_only_for_the_same_user(db):
+    session = _session()
+    _append(session, 0, b"0123456789")
+    digest = upload_service.finalize_session(session["_id"])["content_hash"]
+
+    again = upload_service.create_session("u1", "copia.txt", 10, sha256=digest.upper())
+    assert again["status"] == "concluido" and again["upload"]["content_hash"] == digest
+
+    # Outro usuário conhece apenas o hash: precisa enviar os bytes
+    other = upload_service.create_session("u2", "copia.txt", 10, sha256=digest)
+    assert other["status"] == "em_andamento" and "upload" not in other
+    blob = blob_store.get_blob(upload_service.UPLOAD_NAMESPACE, digest)
+    assert blob["refcount"] == 2
+
+
+def test_failed_finalize_can_be_retried(db, monkeypatch):
+    session = _session()
+    _append(session, 0, b"0123456789")
+
+    original = upload_service.record_blob_upload
+
+    def failing(*args, **kwargs):
+        raise RuntimeError("banco indisponível")
+
+    monkeypatch.setattr(upload_service, "record_blob_upload", failing)
+    with pytest.raises(RuntimeError):
+        upload_service.finalize_session(session["_id"])
+    assert upload_service.get_session(session["_id"])["status"] == "em_andamento"
+
+    monkeypatch.setattr(upload_service, "record_blob_upload", original)
+    upload = upload_service.finalize_session(session["_id"])
+    blob = blob_store.get_blob(upload_service.UPLOAD_NAMESPACE, upload["content_hash"])
+    assert blob["refcount"] == 1
+
+
+def test_cancel_releases_a_published_blob(db, monkeypatch):
+    session = _session()
+    _append(session, 0, b"0123456789")
+    monkeypatch.setattr(upload_service, "record_blob_upload",
+                        lambda *args, **kwargs: (_ for _ in ()).throw(RuntimeError()))
+    with pytest.raises(RuntimeError):
+        upload_service.finalize_session(session["_id"])
+
+    assert upload_service.cancel_session(session["_id"])
+    assert db[blob_store.BLOB_COLLECTION].count_documents({}) == 0